@@ -5,7 +5,7 @@
 import argparse
 from textwrap import dedent
 
-from ._const import TcCommandOutput, TrafficDirection
+from ._const import ExecutionBackend, ProfileFormat, TcCommandOutput, TrafficDirection
 from ._logger import LogLevel
 
 
@@ -42,6 +42,24 @@ class ArgparseWrapper:
             --debug option is required to see the debug print.
             """,
         )
+        group.add_argument(
+            "--profile",
+            dest="profile_path",
+            metavar="PATH",
+            help="""write a report of wall times of processing phases, subprocesses,
+            parse steps and SQL queries to the file.
+            """,
+        )
+        group.add_argument(
+            "--profile-format",
+            choices=[profile_format.value for profile_format in ProfileFormat],
+            default=ProfileFormat.JSON.value,
+            help="""format of the --profile report.
+            'json': spans with start times/durations and totals per category.
+            'trace-event': Chrome trace event format that can be loaded to chrome://tracing.
+            (default = %(default)s)
+            """,
+        )
 
     def add_routing_group(self):
         group = self.parser.add_argument_group("Routing")
@@ -92,6 +110,24 @@ class ArgparseWrapper:
 
         return group
 
+    def add_execution_backend_group(self):
+        group = self.parser.add_argument_group("Execution")
+        group.add_argument(
+            "--backend",
+            choices=[backend.value for backend in ExecutionBackend],
+            default=ExecutionBackend.TC.value,
+            help="""backend to access traffic control configurations.
+            'tc': execute a tc/ip command for each operation.
+            'batch': execute tc/ip commands at once with the batch mode of the commands.
+            'netlink': send requests to the kernel via a netlink socket without forking commands.
+            operations that not supported by the netlink backend are executed by tc/ip commands.
+            this option has no effect with --tc-command/--tc-script options.
+            (default = %(default)s)
+            """,
+        )
+
+        return group
+
     def _add_log_level_argument_group(self):
         dest = "log_level"
 
@@ -5,14 +5,27 @@
 import errno
 import os
 import re
+import struct
 import sys
 
-import subprocrunner as spr
-
-from ._common import find_bin_path
+from ._common import find_bin_path, is_bin_dir_command
+from ._journal import CommandKind, JournaledRunner
 from ._logger import logger
 
 
+# capability numbers: defined at linux/capability.h
+_CAPABILITY_NUMBER_MAP = {
+    "cap_net_admin": 12,
+    "cap_net_raw": 13,
+}
+
+_VFS_CAP_REVISION_MASK = 0xFF000000
+_VFS_CAP_REVISION_1 = 0x01000000
+_VFS_CAP_FLAGS_EFFECTIVE = 0x000001
+
+_execution_authority_cache = {}
+
+
 def get_required_capabilities(command):
     required_capabilities_map = {
         "tc": ["cap_net_admin"],
@@ -39,6 +52,113 @@ def get_permission_error_message(command):
     )
 
 
+def _to_capability_mask(capabilities):
+    mask = 0
+    for capability in capabilities:
+        mask |= 1 << _CAPABILITY_NUMBER_MAP[capability]
+
+    return mask
+
+
+def _read_process_capabilities(name):
+    """
+    :param str name: Name of a capability set at ``/proc/self/status`` (e.g. ``CapAmb``).
+    :return: Bit mask of the capability set of the process. ``None`` if failed to read.
+    """
+
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key == name:
+                    return int(value.strip(), 16)
+    except (OSError, ValueError) as e:
+        logger.debug(f"failed to read {name:s} of the process: {e}")
+
+    return None
+
+
+def _parse_file_capabilities(xattr_value):
+    """
+    :param bytes xattr_value: Value of the ``security.capability`` extended attribute.
+    :return:
+        Bit mask of permitted capabilities of the file.
+        Always ``0`` if the effective flag of the file capabilities is not set.
+    :raises ValueError: if the attribute value is malformed.
+    """
+
+    if len(xattr_value) < 12:
+        raise ValueError(f"invalid file capabilities length: {len(xattr_value):d}")
+
+    magic_etc, permitted_lo, _inheritable_lo = struct.unpack_from("<III", xattr_value)
+    if not magic_etc & _VFS_CAP_FLAGS_EFFECTIVE:
+        return 0
+
+    if magic_etc & _VFS_CAP_REVISION_MASK == _VFS_CAP_REVISION_1:
+        return permitted_lo
+
+    if len(xattr_value) < 20:
+        raise ValueError(f"invalid file capabilities length: {len(xattr_value):d}")
+
+    (permitted_hi,) = struct.unpack_from("<I", xattr_value, 12)
+
+    return permitted_lo | (permitted_hi << 32)
+
+
+def _read_file_capabilities(bin_path):
+    """
+    :return:
+        Bit mask of effective capabilities that granted to processes of the binary file.
+        ``None`` if failed to read file capabilities.
+    """
+
+    try:
+        xattr_value = os.getxattr(bin_path, "security.capability")
+    except OSError as e:
+        if e.errno == errno.ENODATA:
+            return 0
+
+        logger.debug(f"failed to read file capabilities of {bin_path:s}: {e}")
+        return None
+    except AttributeError:
+        # os.getxattr is not available on the platform
+        return None
+
+    try:
+        return _parse_file_capabilities(xattr_value)
+    except ValueError as e:
+        logger.debug(f"failed to parse file capabilities of {bin_path:s}: {e}")
+        return None
+
+
+def _has_capabilies_in_process(bin_path, capabilities):
+    """
+    :return:
+        ``True`` if processes of the binary have the capabilities.
+        ``None`` if capabilities could not be determined without the getcap command.
+    """
+
+    bin_path = os.path.realpath(bin_path)
+    required_mask = _to_capability_mask(capabilities)
+
+    file_capabilities = _read_file_capabilities(bin_path)
+    if file_capabilities is None:
+        return None
+
+    # ambient capabilities of this process are inherited by the child process
+    # in addition to the file capabilities of the binary
+    ambient_capabilities = _read_process_capabilities("CapAmb") or 0
+
+    granted_mask = file_capabilities | ambient_capabilities
+    for capability in capabilities:
+        if granted_mask & _to_capability_mask([capability]):
+            logger.debug(f"{bin_path:s} has {capability:s} capability")
+        else:
+            logger.debug(f"{bin_path:s} has no {capability:s} capability")
+
+    return granted_mask & required_mask == required_mask
+
+
 def _has_capabilies(bin_path, capabilities):
     getcap_bin_path = find_bin_path("getcap")
 
@@ -48,7 +168,7 @@ def _has_capabilies(bin_path, capabilities):
         return True
 
     bin_path = os.path.realpath(bin_path)
-    proc = spr.SubprocessRunner(f"{getcap_bin_path:s} {bin_path:s}")
+    proc = JournaledRunner(f"{getcap_bin_path:s} {bin_path:s}", CommandKind.QUERY)
     if proc.run() != 0:
         logger.error(proc.stderr)
         sys.exit(proc.returncode)
@@ -84,10 +204,23 @@ def has_execution_authority(command):
 
     check_command_installation(command)
 
-    if os.getuid() == 0:
-        return True
+    if command in _execution_authority_cache:
+        return _execution_authority_cache[command]
+
+    if os.getuid() == 0 or is_bin_dir_command(command):
+        # substitutes of commands (e.g. simulators) require no privileges
+        result = True
+    else:
+        bin_path = find_bin_path(command)
+        capabilities = get_required_capabilities(command)
+
+        result = _has_capabilies_in_process(bin_path, capabilities)
+        if result is None:
+            result = _has_capabilies(bin_path, capabilities)
+
+    _execution_authority_cache[command] = result
 
-    return _has_capabilies(find_bin_path(command), get_required_capabilities(command))
+    return result
 
 
 def check_execution_authority(command):
@@ -7,17 +7,21 @@ import sys
 
 import subprocrunner as spr
 
-from ._common import normalize_tc_value
+from ._common import is_execute_tc_command, normalize_tc_value
 from ._const import Tc
 from ._error import NetworkInterfaceNotFoundError
 from ._logger import LogLevel, logger
 from ._main import Main
-from .parser._model import Filter
 from .traffic_control import TrafficControl
 
 
 class TcDelMain(Main):
     def run(self, is_delete_all: bool) -> int:
+        if not is_execute_tc_command(self._options.tc_command_output) and not (
+            self._options.filter_id
+        ):
+            return self.__dump_tc_commands()
+
         return_code_list: list[int] = []
 
         for tc_target in self._fetch_tc_targets():
@@ -39,23 +43,31 @@ class TcDelMain(Main):
 
         return self._get_return_code(return_code_list)
 
-    def __create_tc_obj(self, tc_target: str) -> TrafficControl:
-        from simplesqlite.query import Where
+    def __dump_tc_commands(self) -> int:
+        from ._tc_plan import TcCommandPlanner
 
-        from .parser.shaping_rule import TcShapingRuleParser
+        for tc_target in self._fetch_tc_targets():
+            self._dump_tc_commands(
+                TcCommandPlanner(tc_target).make_delete_commands(), Tc.Command.TCDEL, None
+            )
 
+        return 0
+
+    def __create_tc_obj(self, tc_target: str) -> TrafficControl:
         options = self._options
 
         if options.filter_id:
+            from .parser.shaping_rule import get_shaping_rule_parser
+
             ip_version: int = 6 if options.is_ipv6 else 4
-            shaping_rule_parser = TcShapingRuleParser(
+            shaping_rule_parser = get_shaping_rule_parser(
                 device=tc_target,
                 ip_version=ip_version,
                 tc_command_output=options.tc_command_output,
                 logger=logger,
             )
             shaping_rule_parser.parse()
-            for record in Filter.select(where=Where(Tc.Param.FILTER_ID, options.filter_id)):
+            for record in shaping_rule_parser.store.select_filters(filter_id=options.filter_id):
                 dst_network: str = record.dst_network
                 src_network: str = record.src_network
                 dst_port: int = record.dst_port
@@ -0,0 +1,141 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import re
+import time
+
+import subprocrunner as spr
+
+from ._common import invalidate_device_state_cache
+from ._journal import CommandKind, get_command_journal
+from ._logger import LogLevel, logger
+
+
+class CommandBatch:
+    """
+    Queue tc/ip commands and execute them at once with the batch mode of iproute2
+    commands (``tc -batch -``/``ip -batch -``).
+    Consecutive commands for the same binary are executed by a single process.
+
+    A batch stops at the first failed command. The result of each command is passed to
+    the result handler of the command. The remaining commands are executed after the
+    result handler returned, and discarded if the result handler raised an exception.
+    """
+
+    __RE_COMMAND_FAILED = re.compile(r"^Command failed -:(?P<line_no>\d+)$", re.MULTILINE)
+
+    def __init__(self):
+        self.__bin_path = None
+        self.__command_queue = []
+
+    def add(self, command, result_handler):
+        """
+        :param str command: Command line to execute.
+        :param result_handler:
+            Function that called with a return code and stderr output of the command.
+        """
+
+        bin_path, args = command.split(maxsplit=1)
+        if bin_path != self.__bin_path:
+            self.flush()
+            self.__bin_path = bin_path
+
+        self.__command_queue.append((command, args, result_handler))
+
+    def flush(self):
+        try:
+            while self.__command_queue:
+                self.__execute()
+        finally:
+            self.__command_queue = []
+
+    def __execute(self):
+        command_queue = self.__command_queue
+        self.__command_queue = []
+
+        runner = spr.SubprocessRunner(
+            f"{self.__bin_path:s} -batch -", error_log_level=LogLevel.QUIET
+        )
+        start_time = time.perf_counter()
+        runner.run(input="\n".join(args for _command, args, _handler in command_queue) + "\n")
+        # commands in a batch share the execution time of the batch
+        duration = (time.perf_counter() - start_time) / len(command_queue)
+        invalidate_device_state_cache(self.__bin_path)
+
+        def record(command, returncode):
+            get_command_journal().record(
+                command, CommandKind.MUTATION, duration=duration, returncode=returncode
+            )
+
+        if runner.returncode == 0:
+            for command, _args, result_handler in command_queue:
+                record(command, 0)
+                result_handler(0, "")
+            return
+
+        match = self.__RE_COMMAND_FAILED.search(runner.stderr)
+        if match is None:
+            # the batch itself failed to execute
+            for command, _args, result_handler in command_queue:
+                record(command, runner.returncode)
+                result_handler(runner.returncode, runner.stderr)
+            return
+
+        failed_idx = int(match.group("line_no")) - 1
+        for command, _args, result_handler in command_queue[:failed_idx]:
+            record(command, 0)
+            result_handler(0, "")
+
+        command, _args, result_handler = command_queue[failed_idx]
+        record(command, runner.returncode)
+        self.__command_queue = command_queue[failed_idx + 1 :]
+        result_handler(runner.returncode, runner.stderr[: match.start()].strip())
+
+
+class BatchCommandRunner:
+    """
+    Runner class that adds a command to a ``CommandBatch`` instead of executing the command.
+    A failure of the command is logged when the batch is flushed.
+    ``returncode``/``stderr`` are ``None`` until the batch is flushed.
+    """
+
+    @property
+    def command(self):
+        return self.__command
+
+    @property
+    def command_str(self):
+        return self.__command
+
+    @property
+    def returncode(self):
+        return self.__returncode
+
+    @property
+    def stderr(self):
+        return self.__stderr
+
+    def __init__(self, batch, command, error_log_level=None):
+        self.__batch = batch
+        self.__command = command
+        self.__error_log_level = error_log_level
+        self.__returncode = None
+        self.__stderr = None
+
+    def run(self):
+        self.__batch.add(self.__command, self.__handle_result)
+
+        return 0
+
+    def __handle_result(self, returncode, stderr):
+        self.__returncode = returncode
+        self.__stderr = stderr
+
+        if returncode == 0 or self.__error_log_level == LogLevel.QUIET:
+            return
+
+        logger.log(
+            self.__error_log_level or "WARNING",
+            f"command='{self.__command}', returncode={returncode}, stderr={stderr!r}",
+        )
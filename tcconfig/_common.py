@@ -7,38 +7,87 @@ import errno
 import os
 import re
 import sys
+import time
 
 import msgfy
 import subprocrunner as spr
 import typepy
 from humanreadable import ParameterError
-from path import Path
-from simplesqlite import SimpleSQLite
 
-from ._const import IPV6_OPTION_ERROR_MSG_FORMAT, TcCommandOutput
+from ._const import (
+    BIN_DIR_ENV_NAME,
+    IPV6_OPTION_ERROR_MSG_FORMAT,
+    ExecutionBackend,
+    TcCommandOutput,
+)
+from ._journal import CommandKind, JournaledRunner, get_command_journal
 from ._logger import LogLevel, logger, set_log_level
+from ._profiler import SpanCategory, profile_span
 
 
 _bin_path_cache = {}
+_execution_backend = ExecutionBackend.TC
+_command_batch = None
+_device_state_cache = None
 
 
 @contextlib.contextmanager
 def logging_context(name):
+    """
+    Bracket a phase of processing: the wall time of the phase is logged at the completion,
+    and recorded as a timing span when profiling (``--profile`` option).
+    """
+
     logger.debug("|---- {:s}: {:s} -----".format("start", name))
+    start_time = time.perf_counter()
     try:
-        yield
+        with profile_span(name, SpanCategory.PHASE):
+            yield
     finally:
-        logger.debug("----- {:s}: {:s} ----|".format("complete", name))
+        logger.debug(
+            "----- {:s}: {:s} ({:.1f} ms) ----|".format(
+                "complete", name, (time.perf_counter() - start_time) * 1000
+            )
+        )
+
+
+def get_bin_dir():
+    """
+    :return:
+        Directory that specified by the ``TCCONFIG_BIN_DIR`` environment variable.
+        Commands in the directory take precedence over the commands installed in the system:
+        e.g. simulators of ``tc``/``ip``/``iptables`` to run tcconfig without privileges.
+        ``None`` if the environment variable is not set.
+    """
+
+    return os.environ.get(BIN_DIR_ENV_NAME) or None
+
+
+def is_bin_dir_command(command):
+    """
+    :return: ``True`` if the command is substituted by a command in ``get_bin_dir()``.
+    """
+
+    bin_dir = get_bin_dir()
+    if bin_dir is None:
+        return False
+
+    return os.path.isfile(os.path.join(bin_dir, command))
 
 
 def find_bin_path(command: str) -> str:
     def _to_regular_bin_path(file_path):
+        from path import Path
+
         path_obj = Path(file_path)
         if path_obj.islink():
             return path_obj.readlinkabs()
 
         return file_path
 
+    if is_bin_dir_command(command):
+        return os.path.abspath(os.path.join(get_bin_dir(), command))
+
     if command in _bin_path_cache:
         return _bin_path_cache.get(command)
 
@@ -65,20 +114,156 @@ def check_command_installation(command):
 
 
 def initialize_cli(options):
+    if options.debug_query or options.log_level == LogLevel.DEBUG:
+        # load simplesqlite in advance to enable the logger of simplesqlite
+        from simplesqlite import SimpleSQLite
+
+        SimpleSQLite.global_debug_query = options.debug_query
+
     set_log_level(options.log_level)
 
-    spr.SubprocessRunner.is_save_history = True
+    if not is_execute_tc_command(options.tc_command_output):
+        # outputs of tc commands must include all of the executed commands
+        get_command_journal().resize(None)
 
     if options.is_output_stacktrace:
         spr.SubprocessRunner.is_output_stacktrace = options.is_output_stacktrace
 
-    SimpleSQLite.global_debug_query = options.debug_query
-
 
 def is_execute_tc_command(tc_command_output):
     return tc_command_output == TcCommandOutput.NOT_SET
 
 
+def get_execution_backend():
+    return _execution_backend
+
+
+def set_execution_backend(backend):
+    global _execution_backend
+
+    _execution_backend = ExecutionBackend(backend)
+
+
+@contextlib.contextmanager
+def command_batch_context():
+    """
+    Defer commands that executed via ``make_command_runner``/``run_command_helper``
+    within the context, and execute them with the batch mode of tc/ip commands
+    at the end of the context. Has no effect unless the execution backend is batch.
+    """
+
+    global _command_batch
+
+    if _execution_backend != ExecutionBackend.BATCH or _command_batch is not None:
+        yield
+        return
+
+    from ._iproute2 import get_iproute2_features
+
+    if not get_iproute2_features().is_batch_supported:
+        logger.debug("batch mode is not supported by iproute2: execute commands one by one")
+        yield
+        return
+
+    from ._command_batch import CommandBatch
+
+    _command_batch = CommandBatch()
+    try:
+        yield
+        _command_batch.flush()
+    finally:
+        _command_batch = None
+
+
+@contextlib.contextmanager
+def device_state_cache_context():
+    """
+    Share tc configurations of devices that read within the context
+    (outputs of ``tc show`` commands and parsed shaping rules), so that the configurations
+    of a device are read once unless the configurations are changed.
+    The cache is invalidated when executing commands via ``make_command_runner``/
+    ``run_command_helper``.
+    """
+
+    global _device_state_cache
+
+    if _device_state_cache is not None:
+        yield
+        return
+
+    from ._device_state_cache import DeviceStateCache
+
+    _device_state_cache = DeviceStateCache()
+    try:
+        yield
+    finally:
+        _device_state_cache = None
+
+
+def get_device_state_cache():
+    """
+    :return: ``DeviceStateCache`` of the current context. ``None`` if out of the context.
+    """
+
+    return _device_state_cache
+
+
+def invalidate_device_state_cache(command=None):
+    if _device_state_cache is not None:
+        _device_state_cache.invalidate(command)
+
+
+def get_device_inventory():
+    """
+    :return:
+        ``DeviceInventory`` of the current context.
+        A new inventory is created for each call when out of the context.
+    """
+
+    if _device_state_cache is None:
+        from ._device_inventory import DeviceInventory
+
+        return DeviceInventory()
+
+    return _device_state_cache.device_inventory
+
+
+def make_command_runner(command, error_log_level=None):
+    """
+    Create a runner object to execute a command that changes tc/ip configurations.
+    The returned object has the same interface as ``subprocrunner.SubprocessRunner``.
+    """
+
+    # the command is going to change configurations
+    invalidate_device_state_cache(command)
+
+    if _command_batch is not None:
+        from ._command_batch import BatchCommandRunner
+
+        return BatchCommandRunner(_command_batch, command, error_log_level=error_log_level)
+
+    if _execution_backend == ExecutionBackend.NETLINK:
+        from ._netlink import NetlinkCommandRunner
+
+        return NetlinkCommandRunner(command, error_log_level=error_log_level)
+
+    return JournaledRunner(command, CommandKind.MUTATION, error_log_level=error_log_level)
+
+
+def is_null_string(value):
+    """
+    Equivalent to ``typepy.is_null_string`` for ``None`` and ``str`` values.
+    The first call of typepy string checks imports chardet, which dominates the execution
+    time of short-lived commands such as ``tcset --tc-command``.
+    """
+
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def is_not_null_string(value):
+    return isinstance(value, str) and bool(value.strip())
+
+
 def validate_within_min_max(param_name, value, min_value, max_value, unit):
     from dataproperty import DataProperty
 
@@ -125,24 +310,45 @@ def run_command_helper(
     msg_log_level="WARNING",
     exception_class=None,
 ):
-    runner = spr.SubprocessRunner(command, error_log_level=LogLevel.QUIET)
+    def handle_result(returncode, stderr):
+        return _handle_command_result(
+            command,
+            returncode,
+            stderr,
+            ignore_error_msg_regexp,
+            notice_msg,
+            msg_log_level,
+            exception_class,
+        )
+
+    if _command_batch is not None:
+        # the result is handled when the batch is flushed
+        _command_batch.add(command, handle_result)
+        return 0
+
+    runner = make_command_runner(command, error_log_level=LogLevel.QUIET)
     runner.run()
 
-    returncode = runner.returncode
+    return handle_result(runner.returncode, runner.stderr)
+
+
+def _handle_command_result(
+    command, returncode, stderr, ignore_error_msg_regexp, notice_msg, msg_log_level, exception_class
+):
     if returncode == 0:
         return 0
 
-    if ignore_error_msg_regexp and runner.stderr:
-        if ignore_error_msg_regexp.search(runner.stderr) is None:
+    if ignore_error_msg_regexp and stderr:
+        if ignore_error_msg_regexp.search(stderr) is None:
             error_msg = "\n".join(
                 [
                     "command execution failed",
                     f"  command={command}",
-                    f"  stderr={runner.stderr}",
+                    f"  stderr={stderr}",
                 ]
             )
 
-            if re.search("RTNETLINK answers: Operation not permitted", runner.stderr):
+            if re.search("RTNETLINK answers: Operation not permitted", stderr):
                 logger.error(error_msg)
                 sys.exit(returncode)
 
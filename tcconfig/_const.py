@@ -10,6 +10,9 @@ LIST_MANGLE_TABLE_OPTION: Final = "-t mangle --line-numbers -L"
 IPV6_OPTION_ERROR_MSG_FORMAT: Final = "{}. --ipv6 option required to use IPv6 address."
 DELAY_DISTRIBUTIONS = ("normal", "pareto", "paretonormal")
 
+# environment variable to specify a directory that has substitutes of tc/ip/iptables commands
+BIN_DIR_ENV_NAME: Final = "TCCONFIG_BIN_DIR"
+
 
 @enum.unique
 class TcSubCommand(enum.Enum):
@@ -32,6 +35,19 @@ class ShapingAlgorithm(enum.Enum):
     TBF = "tbf"
 
 
+@enum.unique
+class FilterClassifier(enum.Enum):
+    U32 = "u32"
+    FLOWER = "flower"
+
+
+@enum.unique
+class HtbLayout(enum.Enum):
+    FLAT = "flat"
+    HASH = "hash"
+    PREFIX = "prefix"
+
+
 class Tc:
     class Command:
         TCSET: Final = "tcset"
@@ -43,6 +59,7 @@ class Tc:
         DIRECTION: Final = "direction"
         FILTER_ID: Final = "filter_id"
         CLASS_ID: Final = "classid"
+        CLASSIFIER: Final = "classifier"
         DST_NETWORK: Final = "dst_network"
         DST_PORT: Final = "dst_port"
         FLOW_ID: Final = "flowid"
@@ -65,6 +82,19 @@ class Tc:
         LATENCY_TIME: Final = "60min"
 
 
+@enum.unique
+class ExecutionBackend(enum.Enum):
+    TC = "tc"
+    BATCH = "batch"
+    NETLINK = "netlink"
+
+
+@enum.unique
+class ProfileFormat(enum.Enum):
+    JSON = "json"
+    TRACE_EVENT = "trace-event"
+
+
 class TcCommandOutput:
     NOT_SET: Final = None
     STDOUT: Final = "STDOUT"
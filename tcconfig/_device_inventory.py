@@ -0,0 +1,121 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+import re
+
+import subprocrunner as spr
+
+from ._common import find_bin_path, is_bin_dir_command
+from ._logger import LogLevel, logger
+
+
+# a line of 'ip -o link show' output: e.g.
+# 2: eth0: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 ...
+_RE_IP_LINK = re.compile(r"^(?P<ifindex>\d+): (?P<name>[^:@\s]+)(@\S+)?: ")
+
+_SYSFS_NET_DIR = "/sys/class/net"
+
+
+def _read_iface_speed(tc_device):
+    with open(os.path.join(_SYSFS_NET_DIR, tc_device, "speed")) as f:
+        return int(f.read().strip())
+
+
+class DeviceInventory:
+    """
+    Snapshot of network interfaces of the host:
+
+    - existence of a device: checked by a stat of the sysfs entry of the device
+    - names of devices: listed from sysfs only when requested.
+      Loaded by a netlink link dump instead if sysfs is not available
+    - link speed of devices: read from sysfs at the first lookup of each device
+
+    The snapshot must be discarded after executing commands that add/delete links.
+
+    Devices are loaded from the output of the ``ip`` command instead when the command is
+    substituted by ``TCCONFIG_BIN_DIR`` (e.g. simulators): the kernel not knows such devices.
+    """
+
+    def __init__(self):
+        self.__device_names = None
+        self.__speeds = {}
+        self.__is_load_from_ip_command = is_bin_dir_command("ip")
+
+    def has_device(self, device):
+        if self.__is_load_from_ip_command or not os.path.isdir(_SYSFS_NET_DIR):
+            return device in self.__get_device_names()
+
+        if not device or os.sep in device or device in (os.curdir, os.pardir):
+            return False
+
+        return os.path.exists(os.path.join(_SYSFS_NET_DIR, device))
+
+    def get_device_names(self):
+        """
+        :return: List of device names.
+        """
+
+        return list(self.__get_device_names())
+
+    def get_speed(self, device):
+        """
+        :return: Link speed of the device [Mbps]. ``None`` if failed to read the speed.
+        """
+
+        if self.__is_load_from_ip_command:
+            return None
+
+        if device not in self.__speeds:
+            try:
+                self.__speeds[device] = _read_iface_speed(device)
+            except OSError:
+                self.__speeds[device] = None
+
+        return self.__speeds[device]
+
+    def __get_device_names(self):
+        if self.__device_names is not None:
+            return self.__device_names
+
+        if self.__is_load_from_ip_command:
+            self.__device_names = self.__load_from_ip_command()
+        else:
+            try:
+                self.__device_names = sorted(os.listdir(_SYSFS_NET_DIR))
+            except OSError as e:
+                logger.debug(f"failed to load devices from sysfs: {e}")
+                self.__device_names = self.__load_from_netlink()
+
+        logger.debug(f"load device inventory: {len(self.__device_names):d} devices")
+
+        return self.__device_names
+
+    @staticmethod
+    def __load_from_netlink():
+        # pyroute2 takes long time to load: load only when sysfs is not available
+        from pyroute2 import IPRoute
+
+        with IPRoute() as ipr:
+            return [link.get_attr("IFLA_IFNAME") for link in ipr.get_links()]
+
+    @staticmethod
+    def __load_from_ip_command():
+        runner = spr.SubprocessRunner(
+            f"{find_bin_path('ip'):s} -o link show",
+            error_log_level=LogLevel.DEBUG,
+            dry_run=False,
+        )
+        runner.is_save_history = False
+        runner.run()
+
+        device_names = []
+        for line in (runner.stdout or "").splitlines():
+            match = _RE_IP_LINK.search(line)
+            if match is None:
+                continue
+
+            device_names.append(match.group("name"))
+
+        return device_names
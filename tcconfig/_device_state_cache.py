@@ -0,0 +1,64 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+
+from ._logger import logger
+
+
+class DeviceStateCache:
+    """
+    Cache of tc configurations of devices that read within an invocation of a command:
+
+    - outputs of ``tc show`` commands
+    - shaping rule parsers (``TcShapingRuleParser``) that hold parsed configurations
+    - network interfaces of the host (``DeviceInventory``)
+
+    The cache must be invalidated each time after executing commands that change
+    the configurations.
+    """
+
+    @property
+    def device_inventory(self):
+        from ._device_inventory import DeviceInventory
+
+        if self.__device_inventory is None:
+            self.__device_inventory = DeviceInventory()
+
+        return self.__device_inventory
+
+    def __init__(self):
+        self.__tc_show_outputs = {}
+        self.__rule_parsers = {}
+        self.__device_inventory = None
+
+    def get_tc_show_output(self, subcommand, device, is_json):
+        return self.__tc_show_outputs.get((subcommand, device, is_json))
+
+    def set_tc_show_output(self, subcommand, device, is_json, output):
+        self.__tc_show_outputs[(subcommand, device, is_json)] = output
+
+    def get_rule_parser(self, key):
+        return self.__rule_parsers.get(key)
+
+    def set_rule_parser(self, key, rule_parser):
+        self.__rule_parsers[key] = rule_parser
+
+    def invalidate(self, command=None):
+        """
+        :param str command:
+            Executed command. The device inventory is kept when the command is a
+            ``tc`` command since ``tc`` commands not add/delete network interfaces.
+        """
+
+        if command is None or os.path.basename(command.split()[0]) != "tc":
+            self.__device_inventory = None
+
+        if not self.__tc_show_outputs and not self.__rule_parsers:
+            return
+
+        logger.debug("invalidate device state cache")
+
+        self.__tc_show_outputs = {}
+        self.__rule_parsers = {}
@@ -15,11 +15,11 @@ from path import Path
 from simplesqlite import OperationalError, connect_memdb
 from simplesqlite.model import Integer, Model, Text
 from simplesqlite.query import And, Where
-from subprocrunner import SubprocessRunner
 
 from ._common import is_execute_tc_command
 from ._const import TcCommandOutput
 from ._error import ContainerNotFoundError
+from ._journal import CommandKind, JournaledRunner
 from ._logger import logger
 
 
@@ -176,8 +176,9 @@ class DockerClient:
 
         IfIndex.create()
 
-        proc = SubprocessRunner(
+        proc = JournaledRunner(
             f"ip netns exec {container_name} ip link show type veth",
+            CommandKind.QUERY,
             dry_run=False,
         )
         if proc.run() != 0:
@@ -204,7 +205,7 @@ class DockerClient:
                     )
                 )
 
-            proc = SubprocessRunner("ip link show type veth", dry_run=False)
+            proc = JournaledRunner("ip link show type veth", CommandKind.QUERY, dry_run=False)
             if proc.run() != 0:
                 logger.error(proc.stderr)
                 return proc.returncode
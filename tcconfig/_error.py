@@ -4,8 +4,6 @@
 
 import abc
 
-from pyroute2 import IPRoute
-
 
 class TargetNotFoundError(Exception):
     @property
@@ -39,10 +37,10 @@ class NetworkInterfaceNotFoundError(TargetNotFoundError):
         return "network interface"
 
     def __str__(self, *args, **kwargs):
-        item_list = [super().__str__(*args, **kwargs)]
+        from ._common import get_device_inventory
 
-        with IPRoute() as ipr:
-            avail_interfaces = [link.get_attr("IFLA_IFNAME") for link in ipr.get_links()]
+        item_list = [super().__str__(*args, **kwargs)]
+        avail_interfaces = get_device_inventory().get_device_names()
 
         item_list.append("(available interfaces: {})".format(", ".join(avail_interfaces)))
 
@@ -91,3 +89,15 @@ class TcAlreadyExist(TcCommandExecutionError):
     """
     Exception raised when a traffic shaping rule already exist.
     """
+
+
+class ClassIdExhaustedError(Exception):
+    """
+    Exception raised when no class id is left for a new class of a qdisc.
+    """
+
+
+class QdiscIdExhaustedError(Exception):
+    """
+    Exception raised when no major id is left for a new qdisc of a device.
+    """
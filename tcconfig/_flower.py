@@ -0,0 +1,55 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+
+Keys of flower filters.
+
+flower classifies packets with a masked hash lookup of flow keys instead of comparing packets
+with filters one by one, and an IPv6 address is a single key (u32 filters require four 32 bit
+keys for an IPv6 address).
+Ports can be matched only with an L4 protocol: a filter is added for each of TCP and UDP to
+match ports as same as u32 filters, which match ports of any protocols.
+"""
+
+from typing import Optional, Union
+
+from ._common import is_null_string
+from ._network import is_anywhere_network
+
+
+#: L4 protocols of flower filters that match ports
+PORT_IP_PROTOCOLS = ("tcp", "udp")
+
+
+def make_flower_keys_list(
+    ip_version: int,
+    dst_network: Optional[str] = None,
+    src_network: Optional[str] = None,
+    dst_port: Union[int, str, None] = None,
+    src_port: Union[int, str, None] = None,
+) -> list[list[str]]:
+    """
+    :return:
+        List of flower keys for each filter to add
+        (e.g. ``[["dst_ip", "10.0.0.0/8", "ip_proto", "tcp", "dst_port", "80"], ...]``).
+        Anywhere networks are not included in keys: flower matches any addresses without keys.
+    """
+
+    keys = []
+
+    for name, network in (("dst_ip", dst_network), ("src_ip", src_network)):
+        if is_null_string(network) or is_anywhere_network(network, ip_version):
+            continue
+
+        keys.extend([name, network])
+
+    port_keys = []
+    for name, port in (("dst_port", dst_port), ("src_port", src_port)):
+        if not port:
+            continue
+
+        port_keys.extend([name, str(port)])
+
+    if not port_keys:
+        return [keys]
+
+    return [keys + ["ip_proto", ip_proto] + port_keys for ip_proto in PORT_IP_PROTOCOLS]
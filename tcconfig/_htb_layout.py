@@ -0,0 +1,364 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+
+Hierarchical layouts of HTB classes of shaping rules (``tcset --htb-layout``).
+
+With the flat layout, classes of shaping rules are children of the root HTB qdisc of a device.
+The number of the classes is limited by the minor id space of the qdisc, and the dequeue of
+an HTB qdisc slows down with a large number of sibling classes.
+With hierarchical layouts, shaping rules are distributed into buckets. A bucket consists of
+a class of the root qdisc and a child HTB qdisc of the class:
+
+- ``<root>:b0NN``: the bucket class, a child of the root qdisc
+- ``b0NN:``: the bucket qdisc, an HTB qdisc attached to the bucket class
+- ``b0NN:<minor>``: classes of shaping rules, the parents of netem qdiscs of the rules
+
+Buckets of rules are decided by bits of destination addresses, so that the kernel can find
+the bucket of a packet with a u32 hash table (``hashkey``):
+
+- ``HtbLayout.PREFIX``: the lowest six bits of the ``/16`` (IPv4) or ``/32`` (IPv6) prefix
+- ``HtbLayout.HASH``: the lowest six bits of the address: destination hosts only
+
+Rules of destinations that are not placed into a bucket (e.g. rules of larger networks)
+are set to the root qdisc as same as the flat layout.
+
+The root qdisc hands off packets to buckets with a hash table of ``NUM_BUCKETS`` buckets
+for each layout and protocol. The table, the filter that links packets to the table, and
+a filter for each bucket that classifies packets into the bucket class are added once
+with the buckets: filters at the root qdisc do not increase with the number of rules.
+Filters of rules at a bucket qdisc are placed into a u32 hash table of the bucket, so that
+ids of the filters (``bNN::800``) are unique among the buckets of a device.
+
+The hand-off tables of all layouts match every packet at the same priority: rules of
+different layouts, including the flat layout, can not be added to a device at the same time.
+
+Minor ids of bucket classes include hexadecimal letters, and tcset writes minor ids of classes
+of the flat layout in decimal digits: bucket classes never conflict with classes of the flat
+layout. Ids of buckets are fixed, so that buckets can be identified without parsing qdiscs.
+"""
+
+import ipaddress
+import re
+from collections.abc import Iterable
+from typing import Optional
+
+from ._common import find_bin_path
+from ._const import HtbLayout, Tc
+from ._id_allocator import HTB_DEFAULT_CLASS_MINOR_ID
+
+
+NUM_BUCKETS = 64
+
+#: the minor id of the bucket class and the major id of the bucket qdisc of the first bucket
+BUCKET_ID_BASE = 0xB000
+BUCKET_TABLE_ID_BASE = 0xB00
+HANDOFF_TABLE_ID_BASE = 0xB80
+
+#: priorities of the filters of the root qdisc that hand off packets to buckets:
+#: evaluated after the filters of rules of the flat layout
+HANDOFF_FILTER_PRIOS = {"ip": 7, "ipv6": 8}
+
+# masks and offsets of the 32 bit words of destination addresses that buckets are keyed on
+_HASHKEYS = {
+    (HtbLayout.PREFIX, 4): (0x003F0000, 16),
+    (HtbLayout.PREFIX, 6): (0x0000003F, 24),
+    (HtbLayout.HASH, 4): (0x0000003F, 16),
+    (HtbLayout.HASH, 6): (0x0000003F, 36),
+}
+
+# offsets of destination addresses in IP headers
+_DST_OFFSETS = {4: 16, 6: 24}
+
+# 'fh' of u32 filters and hash tables in outputs of 'tc filter show'
+_RE_U32_TABLE = re.compile(r"\bfh (?P<table_id>[0-9a-f]+): ht divisor ")
+_RE_U32_HANDLE = re.compile(r"^(?P<table_id>[0-9a-f]+):(?P<bucket>[0-9a-f]*):(?P<node>[0-9a-f]+)$")
+
+
+def get_bucket(layout: HtbLayout, ip_version: int, dst_network: Optional[str]) -> Optional[int]:
+    """
+    :return:
+        Bucket of a shaping rule: bits of the destination address that the hash table of
+        the root qdisc is keyed on. ``None`` if packets of the destination may be placed into
+        different buckets: the rule is set to the root qdisc.
+    """
+
+    hashkey = _HASHKEYS.get((layout, ip_version))
+    if hashkey is None or not dst_network:
+        return None
+
+    try:
+        network = ipaddress.ip_network(dst_network, strict=False)
+    except ValueError:
+        return None
+
+    if network.version != ip_version:
+        return None
+
+    mask, offset = hashkey
+    word_idx = (offset - _DST_OFFSETS[ip_version]) // 4
+    shift = (mask & -mask).bit_length() - 1
+    if network.prefixlen < (word_idx + 1) * 32 - shift:
+        # the key includes bits of hosts of the network
+        return None
+
+    word = int.from_bytes(network.network_address.packed[word_idx * 4 : (word_idx + 1) * 4], "big")
+
+    return (word & mask) >> shift
+
+
+def get_bucket_qdisc_major_id(bucket: int) -> int:
+    return BUCKET_ID_BASE + bucket
+
+
+def is_bucket_qdisc_major_id(major_id: int) -> bool:
+    return BUCKET_ID_BASE <= major_id < BUCKET_ID_BASE + NUM_BUCKETS
+
+
+def make_bucket_classid(qdisc_major_id: int, bucket: int) -> str:
+    return f"{qdisc_major_id:x}:{get_bucket_qdisc_major_id(bucket):x}"
+
+
+def get_bucket_table_id(bucket: int, protocol: str) -> int:
+    # hash tables are shared among priorities (protocols) of a qdisc
+    offset = NUM_BUCKETS if protocol == "ipv6" else 0
+
+    return BUCKET_TABLE_ID_BASE + offset + bucket
+
+
+def get_handoff_table_id(layout: HtbLayout, ip_version: int) -> int:
+    return HANDOFF_TABLE_ID_BASE + list(_HASHKEYS).index((layout, ip_version))
+
+
+def get_handoff_table_layout(table_id: int) -> HtbLayout:
+    return list(_HASHKEYS)[table_id - HANDOFF_TABLE_ID_BASE][0]
+
+
+def find_htb_layouts(
+    handoff_slots: Iterable[tuple[int, int]], class_minor_ids: Iterable[int]
+) -> set[HtbLayout]:
+    """
+    :param handoff_slots: Hand-off slots of the root qdisc of a device (``extract_handoff_slots``).
+    :param class_minor_ids: Minor ids of the classes of the root qdisc of the device.
+    :return: Layouts of the existing shaping rules of the device.
+    """
+
+    layouts = {get_handoff_table_layout(table_id) for table_id, _bucket in handoff_slots}
+    if not layouts and any(minor_id != HTB_DEFAULT_CLASS_MINOR_ID for minor_id in class_minor_ids):
+        layouts.add(HtbLayout.FLAT)
+
+    return layouts
+
+
+def make_htb_layout_conflict_message(device: str, layouts: Iterable[HtbLayout]) -> str:
+    return (
+        "failed to add shaping rules: shaping rules of a different HTB layout exist "
+        f"(dev {device:s}, layout={', '.join(sorted(layout.value for layout in layouts)):s}). "
+        "filters of the root qdisc that hand off packets to buckets match every packet, so that "
+        "rules of different layouts can not be mixed in a device. "
+        "use the same --htb-layout option, or --overwrite option to replace the existing rules."
+    )
+
+
+def get_bucket_of_bucket_class(classid: Optional[str]) -> Optional[int]:
+    """
+    :return: Bucket if the class is a bucket class (``<root>:b0NN``). ``None`` otherwise.
+    """
+
+    return _to_bucket(classid, 1)
+
+
+def get_bucket_of_rule_class(classid: Optional[str]) -> Optional[int]:
+    """
+    :return:
+        Bucket if the class belongs to a bucket qdisc (``b0NN:<minor>``). ``None`` otherwise.
+    """
+
+    return _to_bucket(classid, 0)
+
+
+def _to_bucket(classid: Optional[str], idx: int) -> Optional[int]:
+    if not classid:
+        return None
+
+    ids = classid.split(":")
+    if len(ids) != 2:
+        return None
+
+    try:
+        bucket_id = int(ids[idx], 16)
+    except ValueError:
+        return None
+
+    if not is_bucket_qdisc_major_id(bucket_id):
+        return None
+
+    return bucket_id - BUCKET_ID_BASE
+
+
+def extract_buckets(class_params: Iterable[dict]) -> list[int]:
+    """
+    :param class_params: Parsed classes of a device.
+    :return: Buckets that exist in the device.
+    """
+
+    return sorted(
+        {
+            bucket
+            for bucket in (
+                get_bucket_of_bucket_class(class_param.get(Tc.Param.CLASS_ID))
+                for class_param in class_params
+            )
+            if bucket is not None
+        }
+    )
+
+
+def make_bucket_commands(
+    class_command: str, qdisc_command: str, device: str, qdisc_major_id: int, bucket: int, rate
+) -> list[str]:
+    """
+    :param class_command: ``tc class add`` command.
+    :param qdisc_command: ``tc qdisc add`` command.
+    :param rate: Rate of the bucket class: the upper limit rate of the device.
+    :return: Commands to add the bucket class and the bucket qdisc.
+    """
+
+    classid = make_bucket_classid(qdisc_major_id, bucket)
+
+    return [
+        (
+            f"{class_command:s} dev {device:s} parent {qdisc_major_id:x}: classid {classid:s} "
+            f"htb rate {rate.kilo_bps}kbit"
+        ),
+        (
+            f"{qdisc_command:s} dev {device:s} parent {classid:s} "
+            f"handle {get_bucket_qdisc_major_id(bucket):x}: htb"
+        ),
+    ]
+
+
+def extract_bucket_tables(filter_output: str) -> list[tuple[int, str]]:
+    """
+    :param filter_output: Output of ``tc filter show`` of bucket qdiscs.
+    :return: Pairs of a bucket and a protocol of the hash tables of buckets in the output.
+    """
+
+    bucket_tables = []
+
+    for match in _RE_U32_TABLE.finditer(filter_output):
+        offset = int(match.group("table_id"), 16) - BUCKET_TABLE_ID_BASE
+        if not 0 <= offset < NUM_BUCKETS * 2:
+            continue
+
+        bucket_tables.append((offset % NUM_BUCKETS, "ipv6" if offset >= NUM_BUCKETS else "ip"))
+
+    return sorted(set(bucket_tables))
+
+
+def extract_handoff_slots(filter_ids: Iterable[Optional[str]]) -> list[tuple[int, int]]:
+    """
+    :param filter_ids: Ids of filters of the root qdisc (e.g. ``b80:26:1``).
+    :return:
+        Pairs of a hand-off table id and a bucket of the filters that hand off packets
+        to buckets.
+    """
+
+    handoff_slots = []
+
+    for filter_id in filter_ids:
+        match = _RE_U32_HANDLE.search(filter_id or "")
+        if match is None:
+            continue
+
+        table_id = int(match.group("table_id"), 16)
+        if not HANDOFF_TABLE_ID_BASE <= table_id < HANDOFF_TABLE_ID_BASE + len(_HASHKEYS):
+            continue
+
+        handoff_slots.append((table_id, int(match.group("bucket") or "0", 16)))
+
+    return sorted(set(handoff_slots))
+
+
+def make_bucket_table_query_command(device: str, bucket: int, protocol: str, prio: int) -> str:
+    """
+    :return: Command that succeeds only if the hash table of the bucket exists.
+    """
+
+    return "{:s} filter get dev {:s} parent {:x}: protocol {:s} prio {:d} handle {:x}: u32".format(
+        find_bin_path("tc"),
+        device,
+        get_bucket_qdisc_major_id(bucket),
+        protocol,
+        prio,
+        get_bucket_table_id(bucket, protocol),
+    )
+
+
+def make_bucket_table_commands(filter_command: str, bucket: int, protocol: str) -> list[str]:
+    """
+    :param filter_command:
+        Beginning of ``tc filter add`` commands of the bucket qdisc until the priority
+        (e.g. ``tc filter add dev eth0 protocol ip parent b000: prio 5``).
+    :return:
+        Commands to add the hash table of the bucket and the filter that links packets to
+        the table. The commands must be executed once for a bucket and a protocol:
+        the link filter is added for each execution.
+    """
+
+    table_id = get_bucket_table_id(bucket, protocol)
+
+    return [
+        f"{filter_command:s} handle {table_id:x}: u32 divisor 1",
+        f"{filter_command:s} u32 link {table_id:x}: match u32 0 0",
+    ]
+
+
+def make_bucket_table_option(bucket: int, protocol: str) -> str:
+    """
+    :return: ``ht`` option of a u32 filter to add the filter to the hash table of the bucket.
+    """
+
+    return f"ht {get_bucket_table_id(bucket, protocol):x}:"
+
+
+def make_handoff_table_commands(
+    filter_command: str, layout: HtbLayout, ip_version: int
+) -> list[str]:
+    """
+    :param filter_command:
+        Beginning of ``tc filter add`` commands of the root qdisc until the priority
+        (e.g. ``tc filter add dev eth0 protocol ip parent 1a1a: prio 7``).
+    :return:
+        Commands to add the hash table that hands off packets to buckets and the filter
+        that links packets to the table with the hash key of the layout.
+        The commands must be executed once for a layout and a protocol:
+        the link filter is added for each execution.
+    """
+
+    table_id = get_handoff_table_id(layout, ip_version)
+    mask, offset = _HASHKEYS[(layout, ip_version)]
+
+    return [
+        f"{filter_command:s} handle {table_id:x}: u32 divisor {NUM_BUCKETS:d}",
+        (
+            f"{filter_command:s} u32 link {table_id:x}: hashkey mask 0x{mask:08x} at {offset:d} "
+            "match u32 0 0"
+        ),
+    ]
+
+
+def make_handoff_slot_command(
+    filter_command: str, layout: HtbLayout, ip_version: int, qdisc_major_id: int, bucket: int
+) -> str:
+    """
+    :return:
+        Command to add the filter that classifies packets of a bucket of the hash table into
+        the bucket class. The command fails with 'File exists' if the filter already exists.
+    """
+
+    table_id = get_handoff_table_id(layout, ip_version)
+
+    return (
+        f"{filter_command:s} handle {table_id:x}:{bucket:x}:1 u32 ht {table_id:x}:{bucket:x}: "
+        f"match u32 0 0 flowid {make_bucket_classid(qdisc_major_id, bucket):s}"
+    )
@@ -0,0 +1,135 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+from collections.abc import Iterable
+
+from ._const import Tc
+from ._error import ClassIdExhaustedError, QdiscIdExhaustedError
+
+
+#: minor id of the default class of HTB qdiscs: classes of shaping rules are allocated after it
+HTB_DEFAULT_CLASS_MINOR_ID = 1
+
+#: Minor ids of classes are written in decimal digits to tc commands, and tc reads them
+#: as hexadecimal numbers: 0x9999 is the largest id that fits in the 16-bit minor space
+#: with the notation.
+MAX_CLASS_MINOR_ID = 9999
+
+#: the largest major id of qdiscs that shaping rules can use: ffff: is the handle of
+#: ingress qdiscs
+MAX_QDISC_MAJOR_ID = 0xFFFE
+
+
+def extract_class_minor_ids(class_params: Iterable[dict], qdisc_major_id: int) -> list[int]:
+    """
+    :param class_params: Parsed classes of a device.
+    :return: Minor ids of the classes of the qdisc.
+    """
+
+    minor_ids = []
+
+    for class_param in class_params:
+        major_id, _, minor_id = class_param.get(Tc.Param.CLASS_ID, "").partition(":")
+
+        try:
+            if int(major_id, 16) == qdisc_major_id:
+                minor_ids.append(int(minor_id))
+        except ValueError:
+            continue
+
+    return minor_ids
+
+
+class ClassMinorIdAllocator:
+    """
+    Allocator of minor ids of classes of a qdisc.
+    Ids in use are kept in a bitmap, so that an unused id is found without
+    comparing to each of the ids in use.
+
+    :param used_ids: Minor ids of the existing classes of the qdisc.
+    """
+
+    @property
+    def num_free_ids(self) -> int:
+        return self.__bitmap.count(0)
+
+    def __init__(self, used_ids: Iterable[int] = (), max_id: int = MAX_CLASS_MINOR_ID):
+        self.__max_id = max_id
+
+        # minor id 0 is not a valid class id
+        self.__bitmap = bytearray(max_id + 1)
+        self.__bitmap[0] = 1
+
+        for used_id in used_ids:
+            if 0 < used_id <= max_id:
+                self.__bitmap[used_id] = 1
+
+    def allocate(self, min_id: int = HTB_DEFAULT_CLASS_MINOR_ID + 1) -> int:
+        return self.allocate_many(1, min_id)[0]
+
+    def allocate_many(self, count: int, min_id: int = HTB_DEFAULT_CLASS_MINOR_ID + 1) -> list[int]:
+        """
+        Allocate unused minor ids in ascending order.
+        No ids are allocated if ``count`` ids are not available.
+
+        :raises ClassIdExhaustedError: If unused ids are less than ``count``.
+        """
+
+        minor_ids = []
+        pos = max(min_id, 1)
+
+        while len(minor_ids) < count:
+            pos = self.__bitmap.find(0, pos)
+            if pos < 0:
+                raise ClassIdExhaustedError(
+                    f"no class minor ids left: {count:d} ids required, but only "
+                    f"{len(minor_ids):d} ids are unused between {min_id:d} and {self.__max_id:d}"
+                )
+
+            minor_ids.append(pos)
+            pos += 1
+
+        for minor_id in minor_ids:
+            self.__bitmap[minor_id] = 1
+
+        return minor_ids
+
+
+class QdiscMajorIdAllocator:
+    """
+    Allocator of major ids of qdiscs of a device (handles of netem qdiscs of shaping rules).
+    An unused id is searched upward from a base id, and then from the smallest id.
+
+    :param used_ids: Major ids of the existing qdiscs of the device and reserved ids.
+    """
+
+    @property
+    def num_free_ids(self) -> int:
+        return self.__bitmap.count(0)
+
+    def __init__(self, used_ids: Iterable[int] = ()):
+        # major id 0 is not a valid qdisc handle
+        self.__bitmap = bytearray(MAX_QDISC_MAJOR_ID + 1)
+        self.__bitmap[0] = 1
+
+        for used_id in used_ids:
+            if 0 < used_id <= MAX_QDISC_MAJOR_ID:
+                self.__bitmap[used_id] = 1
+
+    def allocate(self, base_id: int) -> int:
+        """
+        :raises QdiscIdExhaustedError: If all of the major ids are in use.
+        """
+
+        major_id = self.__bitmap.find(0, base_id)
+        if major_id < 0:
+            major_id = self.__bitmap.find(0)
+        if major_id < 0:
+            raise QdiscIdExhaustedError(
+                f"no qdisc major ids left: all of the ids up to {MAX_QDISC_MAJOR_ID:x} are in use"
+            )
+
+        self.__bitmap[major_id] = 1
+
+        return major_id
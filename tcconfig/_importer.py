@@ -8,9 +8,9 @@ from typing import Optional
 
 import msgfy
 import pyparsing as pp
-import subprocrunner as spr
 
 from ._const import Network, Tc, TcCommandOutput, TrafficDirection
+from ._journal import CommandKind, JournaledRunner
 
 
 try:
@@ -180,7 +180,7 @@ def set_tc_from_file(
         return errno.EIO
 
     for tcconfig_command in loader.get_tcconfig_commands():
-        runner = spr.SubprocessRunner(tcconfig_command)
+        runner = JournaledRunner(tcconfig_command, CommandKind.MUTATION)
         return_code |= runner.run()
 
         if return_code != 0:
@@ -0,0 +1,231 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import json
+import os
+import re
+
+import subprocrunner as spr
+
+from ._common import find_bin_path
+from ._logger import LogLevel, logger
+
+
+_CACHE_FORMAT_VERSION = 1
+
+# iproute2 versions are printed as "iproute2-6.1.0". old versions are printed as
+# snapshot dates (e.g. "iproute2-ss170905") that not match the pattern.
+_RE_VERSION = re.compile(r"iproute2-(?P<version>\d+(?:\.\d+)*)")
+
+# tc from iproute2 version 6.14 and earlier has a rounding bug of burst sizes
+_BURST_ROUNDING_FIXED_VERSION = (6, 15)
+
+_iproute2_features = None
+
+
+class Iproute2Features:
+    """
+    Features of ``tc``/``ip`` commands (iproute2) that installed in the system.
+    Features of a command are probed by executing the command, and cached to a file
+    with keys of the path and the modification time of the command binary.
+    """
+
+    @property
+    def tc_version(self):
+        """
+        :return: Version of the ``tc`` command. ``None`` if the version is unknown.
+        :rtype: tuple
+        """
+
+        return parse_version(self.__tc_features.get("version"))
+
+    @property
+    def ip_version(self):
+        return parse_version(self.__ip_features.get("version"))
+
+    @property
+    def is_json_output_supported(self):
+        return self.__tc_features.get("json", False)
+
+    @property
+    def is_batch_supported(self):
+        return self.__tc_features.get("batch", False) and self.__ip_features.get("batch", False)
+
+    @property
+    def is_flower_supported(self):
+        return self.__tc_features.get("flower", False)
+
+    @property
+    def is_clsact_supported(self):
+        return self.__tc_features.get("clsact", False)
+
+    @property
+    def is_burst_rounding_fixed(self):
+        return is_burst_rounding_fixed(self.tc_version)
+
+    def __init__(self, tc_features, ip_features):
+        self.__tc_features = tc_features
+        self.__ip_features = ip_features
+
+    def __repr__(self):
+        return f"Iproute2Features(tc={self.__tc_features}, ip={self.__ip_features})"
+
+
+def parse_version(version_str):
+    """
+    :param str version_str: Version of iproute2 (e.g. ``6.15.0``).
+    :return: Tuple of the version numbers. ``None`` if the version is unknown.
+    :rtype: tuple
+    :raises ValueError: If the string is not a version.
+    """
+
+    if not version_str:
+        return None
+
+    return tuple(int(number) for number in version_str.split("."))
+
+
+def is_burst_rounding_fixed(tc_version):
+    """
+    :param tuple tc_version: Version of the ``tc`` command. ``None`` if the version is unknown.
+    :return: ``True`` if the ``tc`` command rounds burst sizes correctly.
+    """
+
+    if tc_version is None:
+        return False
+
+    return tc_version >= _BURST_ROUNDING_FIXED_VERSION
+
+
+def _make_probe_runner(command, error_log_level=LogLevel.QUIET):
+    runner = spr.SubprocessRunner(command, error_log_level=error_log_level, dry_run=False)
+    # probes are not part of the configurations
+    runner.is_save_history = False
+
+    return runner
+
+
+def _probe_version(bin_path):
+    runner = _make_probe_runner(f"{bin_path:s} -V")
+    if runner.run() != 0:
+        return None
+
+    match = _RE_VERSION.search(runner.stdout)
+    if match is None:
+        return None
+
+    return match.group("version")
+
+
+def _probe_batch(bin_path):
+    runner = _make_probe_runner(f"{bin_path:s} -force -batch -")
+
+    return runner.run(input="") == 0
+
+
+def _probe_help(bin_path, args, object_name):
+    # help of a tc object is printed as "Usage: ... <object name> ..." when the
+    # object is supported: the command returns non-zero even in that case
+    runner = _make_probe_runner(f"{bin_path:s} {args:s} help")
+    runner.run()
+
+    return f"Usage: ... {object_name:s}" in f"{runner.stdout}{runner.stderr}"
+
+
+def _probe_tc(bin_path):
+    json_runner = _make_probe_runner(f"{bin_path:s} -j qdisc show dev lo")
+
+    return {
+        "version": _probe_version(bin_path),
+        "json": json_runner.run() == 0 and json_runner.stdout.lstrip().startswith("["),
+        "batch": _probe_batch(bin_path),
+        "flower": _probe_help(bin_path, "filter add dev lo flower", "flower"),
+        "clsact": _probe_help(bin_path, "qdisc add dev lo clsact", "clsact"),
+    }
+
+
+def _probe_ip(bin_path):
+    return {"version": _probe_version(bin_path), "batch": _probe_batch(bin_path)}
+
+
+def _get_cache_file_path():
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(cache_dir, "tcconfig", "iproute2.json")
+
+
+def _load_cache(cache_file_path):
+    try:
+        with open(cache_file_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(cache, dict) or cache.get("format_version") != _CACHE_FORMAT_VERSION:
+        return {}
+
+    return cache.get("binaries", {})
+
+
+def _save_cache(cache_file_path, binaries):
+    tmp_file_path = f"{cache_file_path:s}.{os.getpid():d}.tmp"
+
+    try:
+        os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
+        with open(tmp_file_path, "w") as f:
+            json.dump({"format_version": _CACHE_FORMAT_VERSION, "binaries": binaries}, f)
+        os.replace(tmp_file_path, cache_file_path)
+    except OSError as e:
+        logger.debug(f"failed to write the iproute2 feature cache: {e}")
+
+
+def _get_features(binaries, command, probe):
+    """
+    :return:
+        Tuple of features of the command and a flag that indicates whether the features
+        are newly probed.
+    """
+
+    bin_path = os.path.realpath(find_bin_path(command))
+
+    try:
+        mtime_ns = os.stat(bin_path).st_mtime_ns
+    except OSError:
+        return (probe(bin_path), False)
+
+    entry = binaries.get(bin_path)
+    if entry is not None and entry.get("mtime_ns") == mtime_ns:
+        return (entry["features"], False)
+
+    features = probe(bin_path)
+    binaries[bin_path] = {"mtime_ns": mtime_ns, "features": features}
+    logger.debug(f"probe {command:s} features: {features}")
+
+    return (features, True)
+
+
+def get_iproute2_features():
+    """
+    :return: Features of iproute2 commands. The result is cached in the process.
+    :rtype: Iproute2Features
+    """
+
+    global _iproute2_features
+
+    if _iproute2_features is not None:
+        return _iproute2_features
+
+    cache_file_path = _get_cache_file_path()
+    binaries = _load_cache(cache_file_path)
+
+    tc_features, is_tc_probed = _get_features(binaries, "tc", _probe_tc)
+    ip_features, is_ip_probed = _get_features(binaries, "ip", _probe_ip)
+
+    if is_tc_probed or is_ip_probed:
+        _save_cache(cache_file_path, binaries)
+
+    _iproute2_features = Iproute2Features(tc_features, ip_features)
+    logger.debug(f"iproute2 features: {_iproute2_features}")
+
+    return _iproute2_features
@@ -6,12 +6,12 @@ import errno
 import re
 
 import typepy
-from subprocrunner import SubprocessRunner
 from typepy import Integer
 
 from ._common import find_bin_path
 from ._const import LIST_MANGLE_TABLE_OPTION, Network
-from ._logger import logger
+from ._journal import CommandKind, JournaledRunner
+from ._logger import is_debug_enabled, logger
 from ._network import sanitize_network
 from ._split_line_list import split_line_list
 
@@ -160,14 +160,16 @@ class IptablesMangleController:
         self.__check_execution_authority()
 
         for mangle in self.parse():
-            proc = SubprocessRunner(mangle.to_delete_command())
+            proc = JournaledRunner(mangle.to_delete_command(), CommandKind.MUTATION)
             if proc.run() != 0:
                 raise OSError(proc.returncode, proc.stderr)
 
     def get_iptables(self):
         self.__check_execution_authority()
 
-        proc = SubprocessRunner(f"{get_iptables_base_command():s} {LIST_MANGLE_TABLE_OPTION:s}")
+        proc = JournaledRunner(
+            f"{get_iptables_base_command():s} {LIST_MANGLE_TABLE_OPTION:s}", CommandKind.QUERY
+        )
         if proc.run() != 0:
             raise OSError(proc.returncode, proc.stderr)
 
@@ -177,7 +179,8 @@ class IptablesMangleController:
         self.__check_execution_authority()
 
         mark_id_list = [mangle.mark_id for mangle in self.parse()]
-        logger.debug(f"mangle mark list: {mark_id_list}")
+        if is_debug_enabled():
+            logger.debug(f"mangle mark list: {mark_id_list}")
 
         unique_mark_id = 1 + self.__MARK_ID_OFFSET
         while unique_mark_id < self.__MAX_MARK_ID:
@@ -235,12 +238,22 @@ class IptablesMangleController:
 
     @classmethod
     def add(cls, mangling_mark):
+        return cls.append(mangling_mark.to_append_command())
+
+    @classmethod
+    def append(cls, append_command):
+        """
+        :param str append_command:
+            Command that appends a mangle table entry
+            (``IptablesMangleMarkEntry.to_append_command``).
+        """
+
         if not cls.enable:
             return 0
 
         cls.__check_execution_authority()
 
-        return SubprocessRunner(mangling_mark.to_append_command()).run()
+        return JournaledRunner(append_command, CommandKind.MUTATION).run()
 
     @staticmethod
     def __check_execution_authority():
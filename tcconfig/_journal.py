@@ -0,0 +1,177 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import enum
+import time
+from collections import deque, namedtuple
+
+import subprocrunner as spr
+
+
+JournalEntry = namedtuple("JournalEntry", "command kind duration returncode")
+
+
+@enum.unique
+class CommandKind(enum.Enum):
+    #: commands that change configurations (e.g. ``tc qdisc add``)
+    MUTATION = "mutation"
+
+    #: commands that only read configurations (e.g. ``tc qdisc show``)
+    QUERY = "query"
+
+
+class CommandJournal:
+    """
+    Journal of commands that executed by tcconfig.
+    Entries are kept in a ring buffer: the oldest entries are discarded when the number of
+    entries exceeds the size of the journal.
+    Counters are accumulated for all of the recorded commands, including discarded entries.
+    """
+
+    DEFAULT_SIZE = 512
+
+    @property
+    def size(self):
+        """
+        :return: Maximum number of entries. ``None`` if the journal is unbounded.
+        """
+
+        return self.__entries.maxlen
+
+    @property
+    def num_executions(self):
+        return self.__num_executions
+
+    @property
+    def num_failures(self):
+        return self.__num_failures
+
+    @property
+    def total_exec_time(self):
+        """
+        :return: Total execution time of the recorded commands in seconds.
+        """
+
+        return self.__total_exec_time
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.__entries = deque(maxlen=size)
+        self.__reset_counters()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def record(self, command, kind, duration=0.0, returncode=0):
+        """
+        :param str command: Executed command line.
+        :param CommandKind kind: Kind of the command.
+        :param float duration: Execution time of the command in seconds.
+        :param int returncode:
+            Return code of the command. ``None`` if failed to execute the command.
+        """
+
+        self.__entries.append(
+            JournalEntry(command=command, kind=kind, duration=duration, returncode=returncode)
+        )
+
+        self.__num_executions += 1
+        self.__total_exec_time += duration
+        if returncode != 0:
+            self.__num_failures += 1
+
+    def get_entries(self, kind=None):
+        """
+        :param CommandKind kind: Limit entries to the kind of commands if specified.
+        :return: List of ``JournalEntry``, in the order of the executions.
+        """
+
+        if kind is None:
+            return list(self.__entries)
+
+        return [entry for entry in self.__entries if entry.kind == kind]
+
+    def get_commands(self, kind=None):
+        return [entry.command for entry in self.get_entries(kind)]
+
+    def resize(self, size):
+        """
+        :param int size:
+            Maximum number of entries. The journal is unbounded if ``None``.
+            The newest entries are kept when shrinking the journal.
+        """
+
+        self.__entries = deque(self.__entries, maxlen=size)
+
+    def clear(self):
+        self.__entries.clear()
+        self.__reset_counters()
+
+    def __reset_counters(self):
+        self.__num_executions = 0
+        self.__num_failures = 0
+        self.__total_exec_time = 0.0
+
+
+_command_journal = CommandJournal()
+
+
+def get_command_journal():
+    return _command_journal
+
+
+class JournaledRunner:
+    """
+    Wrapper class of ``subprocrunner.SubprocessRunner`` that records executions of the command
+    to the command journal.
+    The interface of the class is compatible with ``subprocrunner.SubprocessRunner``.
+    """
+
+    @property
+    def command(self):
+        return self.__command
+
+    @property
+    def command_str(self):
+        if isinstance(self.__command, (list, tuple)):
+            return " ".join(str(item) for item in self.__command)
+
+        return self.__command
+
+    @property
+    def kind(self):
+        return self.__kind
+
+    @property
+    def stdout(self):
+        return self.__runner.stdout
+
+    @property
+    def stderr(self):
+        return self.__runner.stderr
+
+    @property
+    def returncode(self):
+        return self.__runner.returncode
+
+    def __init__(self, command, kind, **kwargs):
+        """
+        :param CommandKind kind: Kind of the command.
+        :param kwargs: Keyword arguments for ``subprocrunner.SubprocessRunner``.
+        """
+
+        self.__command = command
+        self.__kind = kind
+        self.__runner = spr.SubprocessRunner(command, **kwargs)
+
+    def run(self, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return self.__runner.run(**kwargs)
+        finally:
+            _command_journal.record(
+                self.command_str,
+                self.__kind,
+                duration=time.perf_counter() - start_time,
+                returncode=self.__runner.returncode,
+            )
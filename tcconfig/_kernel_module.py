@@ -0,0 +1,86 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+import platform
+
+import msgfy
+import subprocrunner as spr
+
+from ._common import get_bin_dir
+from ._journal import CommandKind, JournaledRunner
+from ._logger import logger
+
+
+_SYS_MODULE_DIR = "/sys/module"
+
+_loaded_module_set = set()
+
+
+def _read_builtin_modules():
+    builtin_list_path = os.path.join("/lib/modules", platform.release(), "modules.builtin")
+
+    try:
+        with open(builtin_list_path) as f:
+            # each line is a path to a module: e.g. kernel/net/sched/sch_netem.ko
+            return {os.path.basename(line.strip()).split(".")[0].replace("-", "_") for line in f}
+    except OSError:
+        return set()
+
+
+def is_module_loaded(name):
+    """
+    Check whether a kernel module is loaded (or built-in to the kernel) via sysfs.
+    Positive results are cached in the process.
+
+    :param str name: Kernel module name (e.g. ``sch_netem``).
+    :return:
+        ``True`` if the module is loaded. ``None`` if failed to determine
+        (e.g. sysfs is not mounted in a container).
+    """
+
+    name = name.replace("-", "_")
+
+    if name in _loaded_module_set:
+        return True
+
+    if get_bin_dir() is not None:
+        # substitutes of commands (e.g. simulators) are independent of kernel modules
+        return True
+
+    if not os.path.isdir(_SYS_MODULE_DIR):
+        logger.debug(f"{_SYS_MODULE_DIR:s} not found: failed to check the {name:s} module")
+        return None
+
+    # built-in modules that have no parameters not appear under /sys/module
+    if os.path.isdir(os.path.join(_SYS_MODULE_DIR, name)) or name in _read_builtin_modules():
+        _loaded_module_set.add(name)
+        return True
+
+    return False
+
+
+def load_module(name):
+    """
+    Load a kernel module with ``modprobe`` if the module is not loaded yet.
+    ``modprobe`` is always output when commands are not executed (``--tc-command``/
+    ``--tc-script``): the output commands are executed at another time or on another host.
+
+    :return: Return code of ``modprobe``. ``0`` if the module already loaded.
+    """
+
+    if not spr.SubprocessRunner.default_is_dry_run and is_module_loaded(name):
+        logger.debug(f"{name:s} module already loaded")
+        return 0
+
+    modprobe_proc = JournaledRunner(f"modprobe {name:s}", CommandKind.MUTATION)
+
+    try:
+        if modprobe_proc.run() != 0:
+            logger.error(modprobe_proc.stderr)
+    except spr.CommandError as e:
+        logger.debug(msgfy.to_debug_message(e))
+        return 0
+
+    return modprobe_proc.returncode
@@ -4,7 +4,6 @@
 
 import sys
 
-import simplesqlite
 import subprocrunner
 from loguru import logger
 
@@ -13,6 +12,9 @@ MODULE_NAME = "tcconfig"
 
 logger.disable(MODULE_NAME)
 
+_is_logger_enabled = False
+_is_debug_level = True  # the default sink of loguru outputs debug messages
+
 
 class LogLevel:
     DEBUG = "DEBUG"
@@ -20,21 +22,43 @@ class LogLevel:
     QUIET = "QUIET"
 
 
+def is_debug_enabled():
+    """
+    :return: ``True`` if debug messages of the module are output.
+
+    Arguments of ``logger.debug`` are formatted even if the message is discarded:
+    check this before building debug messages in hot loops.
+    """
+
+    return _is_logger_enabled and _is_debug_level
+
+
 def set_logger(is_enable):
+    global _is_logger_enabled
+
+    _is_logger_enabled = is_enable
+
     if is_enable:
         logger.enable(MODULE_NAME)
     else:
         logger.disable(MODULE_NAME)
 
-    simplesqlite.set_logger(is_enable)
+    if "simplesqlite" in sys.modules:
+        # simplesqlite takes long time to load: configure the logger only if already loaded
+        sys.modules["simplesqlite"].set_logger(is_enable)
     subprocrunner.set_logger(is_enable)
 
 
 def set_log_level(log_level):
+    global _is_debug_level, _is_logger_enabled
+
     if log_level == LogLevel.QUIET:
         logger.disable(MODULE_NAME)
+        _is_logger_enabled = False
         return
 
+    _is_debug_level = logger.level(log_level).no <= logger.level(LogLevel.DEBUG).no
+
     if log_level == LogLevel.DEBUG:
         log_format = (
             "<level>{level: <8}</level> | "
@@ -1,24 +1,33 @@
 import sys
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import msgfy
-from docker.errors import DockerException
 
 from ._const import TcCommandOutput
-from ._docker import DockerClient
+from ._journal import get_command_journal
 from ._logger import logger
 from ._tc_script import write_tc_script
 from .traffic_control import TrafficControl
 
 
+if TYPE_CHECKING:
+    from ._docker import DockerClient
+    from ._netem_param import NetemParameter
+
+
 class Main:
     def __init__(self, options) -> None:
         self._options = options
 
         self._dclient: Optional[DockerClient] = None
         if self._options.use_docker:
+            # docker package takes long time to load: load only when required
+            from docker.errors import DockerException
+
+            from . import _docker
+
             try:
-                self._dclient = DockerClient(options.tc_command_output)
+                self._dclient = _docker.DockerClient(options.tc_command_output)
             except DockerException as e:
                 logger.error(msgfy.to_error_message(e))
                 sys.exit(1)
@@ -58,20 +67,35 @@ class Main:
         return error_return_code
 
     def _dump_history(self, tc: TrafficControl, tc_command: str) -> None:
+        if self._options.tc_command_output in (TcCommandOutput.STDOUT, TcCommandOutput.SCRIPT):
+            self._dump_tc_commands(tc.get_command_history(), tc_command, tc.netem_param)
+            return
+
         command_history = "\n".join(tc.get_command_history())
-        command_output = self._options.tc_command_output
+        logger.debug(f"command history\n{command_history}")
 
-        if command_output == TcCommandOutput.STDOUT:
+        journal = get_command_journal()
+        logger.debug(
+            f"executed {journal.num_executions:d} commands ({journal.num_failures:d} failed) "
+            f"in {journal.total_exec_time * 1000:.1f} ms"
+        )
+
+    def _dump_tc_commands(
+        self, commands: list[str], tc_command: str, netem_param: Optional["NetemParameter"]
+    ) -> None:
+        """
+        Output commands in accordance with ``--tc-command``/``--tc-script`` options.
+        """
+
+        command_history = "\n".join(commands)
+
+        if self._options.tc_command_output == TcCommandOutput.STDOUT:
             print(command_history)
             return
 
         try:
-            filename_suffix = tc.netem_param.make_param_name()
+            filename_suffix = netem_param.make_param_name()
         except AttributeError:
             filename_suffix = None
 
-        if command_output == TcCommandOutput.SCRIPT:
-            write_tc_script(tc_command, command_history, filename_suffix=filename_suffix)
-            return
-
-        logger.debug(f"command history\n{command_history}")
+        write_tc_script(tc_command, command_history, filename_suffix=filename_suffix)
@@ -0,0 +1,602 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import ipaddress
+import os
+import re
+import time
+from socket import htons
+from typing import ClassVar
+
+import subprocrunner as spr
+from pyroute2 import IPRoute, NetlinkError, protocols
+from pyroute2.netlink.rtnl import TC_H_INGRESS, TC_H_ROOT
+
+from ._journal import CommandKind, JournaledRunner, get_command_journal
+from ._logger import LogLevel, logger
+from ._profiler import SpanCategory, profile_span
+
+
+class UnsupportedCommandError(ValueError):
+    """
+    Exception raised when a command can not be translated to a netlink request.
+    """
+
+
+class _DeviceNotFoundError(Exception):
+    pass
+
+
+_PROTOCOL_MAP = {
+    "ip": protocols.ETH_P_IP,
+    "ipv6": protocols.ETH_P_IPV6,
+    "all": protocols.ETH_P_ALL,
+}
+
+_RATE_UNIT_MAP = {
+    "bit": 1,
+    "kbit": 1000,
+    "mbit": 1000**2,
+    "gbit": 1000**3,
+    "tbit": 1000**4,
+}
+
+_TIME_UNIT_MAP = {"s": 1000**2, "ms": 1000, "us": 1}  # [microseconds]
+
+_RE_VALUE_UNIT = re.compile(r"^(?P<value>[0-9.]+)(?P<unit>[a-zA-Z%]*)$")
+
+_NETEM_PERCENTAGE_PARAM_MAP = {
+    "loss": "loss",
+    "duplicate": "duplicate",
+    "corrupt": "prob_corrupt",
+    "reorder": "prob_reorder",
+}
+
+
+class _U32MatchOffset:
+    class Ipv4:
+        SRC = 12
+        DST = 16
+        PORT = 20
+
+    class Ipv6:
+        SRC = 8
+        DST = 24
+        PORT = 40
+
+
+def _split_value_unit(text):
+    match = _RE_VALUE_UNIT.search(text)
+    if match is None:
+        raise UnsupportedCommandError(f"invalid value: {text}")
+
+    return (float(match.group("value")), match.group("unit"))
+
+
+def to_tc_handle(text):
+    """
+    Convert a tc handle string (e.g. ``1a1a:``, ``1a1a:2``) to an integer.
+    Both major and minor numbers are hexadecimal, as same as the tc command.
+    """
+
+    if text == "root":
+        return TC_H_ROOT
+
+    major, _, minor = text.partition(":")
+
+    return (int(major or "0", 16) << 16) | int(minor or "0", 16)
+
+
+def to_u32_handle(text):
+    # u32 filter handle format: <htid>:<hash>:<node>
+    items = (text.split(":") + ["", ""])[:3]
+    htid, hash_value, node = (int(item or "0", 16) for item in items)
+
+    return (htid << 20) | (hash_value << 12) | node
+
+
+def to_byte_per_sec(text):
+    value, unit = _split_value_unit(text)
+
+    try:
+        return int(value * _RATE_UNIT_MAP[unit.lower() or "bit"] / 8)
+    except KeyError:
+        raise UnsupportedCommandError(f"unknown rate unit: {text}")
+
+
+def to_microseconds(text):
+    value, unit = _split_value_unit(text)
+
+    try:
+        return int(value * _TIME_UNIT_MAP[unit or "us"])
+    except KeyError:
+        raise UnsupportedCommandError(f"unknown time unit: {text}")
+
+
+def to_percentage(text):
+    value, unit = _split_value_unit(text)
+    if unit not in ("", "%"):
+        raise UnsupportedCommandError(f"unknown percentage unit: {text}")
+
+    return value
+
+
+def to_byte_size(text):
+    value, unit = _split_value_unit(text)
+    if unit not in ("", "b"):
+        raise UnsupportedCommandError(f"unknown size unit: {text}")
+
+    return int(value)
+
+
+def _make_u32_key(value, mask, offset):
+    if mask and not mask & 0xFF000000:
+        # pyroute2 moves a key to the first non-zero mask byte, that makes
+        # the key offset differ from the one that the tc command creates.
+        raise UnsupportedCommandError(
+            f"unaligned u32 key: value=0x{value:08x}, mask=0x{mask:08x}, at={offset}"
+        )
+
+    return f"0x{value:x}/0x{mask:x}+{offset:d}"
+
+
+def _make_u32_network_keys(network, offset):
+    network = ipaddress.ip_network(network, strict=False)
+
+    if network.version == 4:
+        return [_make_u32_key(int(network.network_address), int(network.netmask), offset=offset)]
+
+    key_list = []
+    address_bytes = network.network_address.packed
+    mask_bytes = network.netmask.packed
+    for i in range(0, 16, 4):
+        mask = int.from_bytes(mask_bytes[i : i + 4], "big")
+        if mask == 0:
+            break
+
+        key_list.append(
+            _make_u32_key(int.from_bytes(address_bytes[i : i + 4], "big"), mask, offset=offset + i)
+        )
+
+    return key_list
+
+
+def _make_u32_keys(match_list):
+    """
+    Make pyroute2 u32 keys from ``match`` items of a tc filter command.
+    port matches for the same offset merged into a key as same as the tc command.
+    """
+
+    key_list = []
+    port_value = 0
+    port_mask = 0
+    port_offset = None
+
+    for match in match_list:
+        if match[0] == "u32":
+            value, mask = int(match[1], 0), int(match[2], 0)
+            offset = int(match[4]) if len(match) > 4 and match[3] == "at" else 0
+            key_list.append(f"0x{value:x}/0x{mask:x}+{offset:d}")
+            continue
+
+        if match[0] == "ip":
+            offset_class = _U32MatchOffset.Ipv4
+        elif match[0] == "ip6":
+            offset_class = _U32MatchOffset.Ipv6
+        else:
+            raise UnsupportedCommandError(f"unsupported match: {' '.join(match)}")
+
+        field = match[1]
+        if field in ("src", "dst"):
+            key_list.extend(
+                _make_u32_network_keys(
+                    match[2], offset_class.SRC if field == "src" else offset_class.DST
+                )
+            )
+        elif field in ("sport", "dport"):
+            shift = 16 if field == "sport" else 0
+            port_value |= int(match[2], 0) << shift
+            port_mask |= int(match[3], 0) << shift
+            port_offset = offset_class.PORT
+        else:
+            raise UnsupportedCommandError(f"unsupported match: {' '.join(match)}")
+
+    if port_offset is not None:
+        key_list.append(_make_u32_key(port_value, port_mask, offset=port_offset))
+
+    if not key_list:
+        # e.g. 'match ip6 dst ::/0' does not produce any key
+        key_list.append("0x0/0x0+0")
+
+    return key_list
+
+
+def _parse_tc_options(arg_list, option_names):
+    """
+    Extract leading '<name> <value>' pairs (and flag names) from a tc command argument list.
+
+    :return: Tuple of the extracted options and the remaining arguments.
+    """
+
+    options = {}
+    idx = 0
+
+    while idx < len(arg_list):
+        name = arg_list[idx]
+
+        if name in ("root", "ingress"):
+            options[name] = True
+            idx += 1
+            continue
+
+        if name not in option_names:
+            break
+
+        options[name] = arg_list[idx + 1]
+        idx += 2
+
+    return (options, arg_list[idx:])
+
+
+def _translate_qdisc(verb, arg_list, get_ifindex):
+    options, remain_args = _parse_tc_options(arg_list, ("dev", "parent", "handle"))
+    ifindex = get_ifindex(options["dev"])
+
+    if verb == "del":
+        if options.get("ingress"):
+            return (
+                "tc",
+                ("del",),
+                {"index": ifindex, "handle": 0xFFFF0000, "parent": TC_H_INGRESS},
+            )
+
+        if options.get("root"):
+            return ("tc", ("del",), {"index": ifindex, "handle": 0, "parent": TC_H_ROOT})
+
+        raise UnsupportedCommandError("unsupported qdisc deletion")
+
+    if verb not in ("add", "change"):
+        raise UnsupportedCommandError(f"unsupported qdisc command: {verb}")
+
+    if options.get("ingress"):
+        return ("tc", (verb, "ingress", ifindex, 0xFFFF0000), {})
+
+    kind, params = remain_args[0], remain_args[1:]
+    handle = to_tc_handle(options.get("handle", "0:"))
+    kwargs = {}
+    if not options.get("root"):
+        kwargs["parent"] = to_tc_handle(options["parent"])
+
+    if kind == "htb":
+        param_map = dict(zip(params[::2], params[1::2]))
+        if set(param_map) - {"default"}:
+            raise UnsupportedCommandError(f"unsupported htb parameters: {params}")
+        if "default" in param_map:
+            kwargs["default"] = int(param_map["default"], 16)
+
+        return ("tc", (verb, kind, ifindex, handle), kwargs)
+
+    if kind == "netem":
+        kwargs.update(_make_netem_params(params))
+
+        return ("tc", (verb, kind, ifindex, handle), kwargs)
+
+    raise UnsupportedCommandError(f"unsupported qdisc: {kind}")
+
+
+def _make_netem_params(param_list):
+    kwargs = {}
+    idx = 0
+
+    while idx < len(param_list):
+        name = param_list[idx]
+        value = param_list[idx + 1]
+        idx += 2
+
+        if name in _NETEM_PERCENTAGE_PARAM_MAP:
+            kwargs[_NETEM_PERCENTAGE_PARAM_MAP[name]] = to_percentage(value)
+        elif name == "limit":
+            kwargs["limit"] = int(float(value))
+        elif name == "delay":
+            kwargs["delay"] = to_microseconds(value)
+
+            if idx < len(param_list) and param_list[idx][0].isdigit():
+                kwargs["jitter"] = to_microseconds(param_list[idx])
+                idx += 1
+        else:
+            # e.g. 'distribution' requires loading a distribution table from iproute2
+            raise UnsupportedCommandError(f"unsupported netem parameter: {name}")
+
+    return kwargs
+
+
+def _translate_class(verb, arg_list, get_ifindex):
+    if verb not in ("add", "change"):
+        raise UnsupportedCommandError(f"unsupported class command: {verb}")
+
+    options, remain_args = _parse_tc_options(arg_list, ("dev", "parent", "classid"))
+    kind, params = remain_args[0], remain_args[1:]
+    if kind != "htb":
+        raise UnsupportedCommandError(f"unsupported class: {kind}")
+
+    kwargs = {"parent": to_tc_handle(options["parent"])}
+    for name, value in zip(params[::2], params[1::2]):
+        if name in ("rate", "ceil"):
+            kwargs[name] = to_byte_per_sec(value)
+        elif name in ("burst", "cburst", "mtu"):
+            kwargs[name] = to_byte_size(value)
+        else:
+            raise UnsupportedCommandError(f"unsupported htb class parameter: {name}")
+
+    return (
+        "tc",
+        (f"{verb}-class", kind, get_ifindex(options["dev"]), to_tc_handle(options["classid"])),
+        kwargs,
+    )
+
+
+def _translate_filter(verb, arg_list, get_ifindex):
+    options, remain_args = _parse_tc_options(
+        arg_list, ("dev", "protocol", "parent", "prio", "handle")
+    )
+    ifindex = get_ifindex(options["dev"])
+    protocol = _PROTOCOL_MAP[options.get("protocol", "all")]
+    prio = int(options.get("prio", "0"))
+    parent = to_tc_handle(options["parent"])
+    kind = remain_args[0]
+
+    if verb == "del":
+        if kind != "u32":
+            raise UnsupportedCommandError(f"unsupported filter: {kind}")
+
+        return (
+            "tc",
+            ("del-filter",),
+            {
+                "index": ifindex,
+                "parent": parent,
+                "handle": to_u32_handle(options["handle"]),
+                "info": htons(protocol) | (prio << 16),
+            },
+        )
+
+    if verb != "add":
+        raise UnsupportedCommandError(f"unsupported filter command: {verb}")
+
+    kwargs = {"parent": parent, "prio": prio, "protocol": protocol}
+    match_list = []
+    action = None
+    flowid = None
+    idx = 1
+
+    while idx < len(remain_args):
+        token = remain_args[idx]
+
+        if token == "match":
+            match_end = idx + 1
+            while match_end < len(remain_args) and remain_args[match_end] not in (
+                "match",
+                "flowid",
+                "action",
+            ):
+                match_end += 1
+            match_list.append(remain_args[idx + 1 : match_end])
+            idx = match_end
+        elif token == "flowid":
+            flowid = to_tc_handle(remain_args[idx + 1])
+            idx += 2
+        elif remain_args[idx : idx + 4] == ["action", "mirred", "egress", "redirect"]:
+            action = {
+                "kind": "mirred",
+                "direction": "egress",
+                "action": "redirect",
+                "ifindex": get_ifindex(remain_args[idx + 5]),
+            }
+            idx += 6
+        else:
+            raise UnsupportedCommandError(f"unsupported filter argument: {token}")
+
+    if kind == "u32":
+        kwargs.update({"target": flowid, "keys": _make_u32_keys(match_list)})
+        if action:
+            kwargs["action"] = action
+
+        return ("tc", ("add-filter", kind, ifindex), kwargs)
+
+    if kind == "fw":
+        kwargs.update({"handle": int(options["handle"], 0), "classid": flowid})
+
+        return ("tc", ("add-filter", kind, ifindex), kwargs)
+
+    raise UnsupportedCommandError(f"unsupported filter: {kind}")
+
+
+def _translate_ip(arg_list, get_ifindex):
+    if arg_list[:2] == ["link", "add"] and arg_list[3:] == ["type", "ifb"]:
+        return ("link", ("add",), {"ifname": arg_list[2], "kind": "ifb"})
+
+    if arg_list[:3] == ["link", "set", "dev"] and arg_list[4:] in (["up"], ["down"]):
+        return ("link", ("set",), {"index": get_ifindex(arg_list[3]), "state": arg_list[4]})
+
+    if arg_list[:2] == ["link", "delete"] and arg_list[3:] == ["type", "ifb"]:
+        return ("link", ("del",), {"index": get_ifindex(arg_list[2])})
+
+    raise UnsupportedCommandError("unsupported ip command: {}".format(" ".join(arg_list)))
+
+
+def translate_command(command, get_ifindex):
+    """
+    Translate a ``tc``/``ip`` command line that generated by tcconfig to
+    an ``IPRoute`` method call.
+
+    :param str command: Command line to translate.
+    :param get_ifindex: Function that returns the interface index of a device name.
+    :return: Tuple of the ``IPRoute`` method name, positional arguments, and keyword arguments.
+    :raises UnsupportedCommandError:
+        If the command includes features that can not be translated.
+    """
+
+    token_list = command.split()
+    program = os.path.basename(token_list[0])
+
+    try:
+        if program == "ip":
+            return _translate_ip(token_list[1:], get_ifindex)
+
+        if program != "tc":
+            raise UnsupportedCommandError(f"unsupported command: {program}")
+
+        tc_object, verb, arg_list = token_list[1], token_list[2], token_list[3:]
+
+        if tc_object == "qdisc":
+            return _translate_qdisc(verb, arg_list, get_ifindex)
+
+        if tc_object == "class":
+            return _translate_class(verb, arg_list, get_ifindex)
+
+        if tc_object == "filter":
+            return _translate_filter(verb, arg_list, get_ifindex)
+    except (IndexError, KeyError) as e:
+        raise UnsupportedCommandError(f"failed to translate '{command}': {e}")
+
+    raise UnsupportedCommandError(f"unsupported tc object: {tc_object}")
+
+
+_ipr = None
+
+
+def get_iproute():
+    """
+    :return: rtnetlink socket that shared in the process.
+    :rtype: pyroute2.IPRoute
+    """
+
+    global _ipr
+
+    if _ipr is None:
+        _ipr = IPRoute()
+
+    return _ipr
+
+
+def close_iproute():
+    global _ipr
+
+    if _ipr is not None:
+        _ipr.close()
+        _ipr = None
+
+
+class NetlinkCommandRunner:
+    """
+    Execute a ``tc``/``ip`` command line that generated by tcconfig through
+    a rtnetlink socket instead of forking the command.
+    The interface of the class is compatible with ``subprocrunner.SubprocessRunner``.
+    Commands that can not be translated to netlink requests are executed as subprocesses.
+    """
+
+    __ifindex_cache: ClassVar[dict] = {}
+
+    @property
+    def command(self):
+        return self.__command
+
+    @property
+    def command_str(self):
+        return self.__command
+
+    @property
+    def stdout(self):
+        return self.__stdout
+
+    @property
+    def stderr(self):
+        return self.__stderr
+
+    @property
+    def returncode(self):
+        return self.__returncode
+
+    def __init__(self, command, error_log_level=None):
+        self.__command = command
+        self.__error_log_level = error_log_level
+        self.__stdout = None
+        self.__stderr = None
+        self.__returncode = None
+
+    @classmethod
+    def close(cls):
+        close_iproute()
+        cls.__ifindex_cache = {}
+
+    def run(self):
+        if spr.SubprocessRunner.default_is_dry_run:
+            return self.__run_subprocess()
+
+        try:
+            method_name, args, kwargs = translate_command(self.__command, self.__get_ifindex)
+        except UnsupportedCommandError as e:
+            logger.debug(f"fallback to subprocess: {e}")
+            return self.__run_subprocess()
+        except _DeviceNotFoundError as e:
+            return self.__set_result(1, f'Cannot find device "{e}"')
+
+        logger.debug(f"netlink: {self.__command}")
+
+        returncode, stderr = 0, ""
+        start_time = time.perf_counter()
+        try:
+            with profile_span(method_name, SpanCategory.NETLINK, command=self.__command):
+                getattr(get_iproute(), method_name)(*args, **kwargs)
+        except NetlinkError as e:
+            # make the same error message as iproute2 to process errors in the same way
+            returncode, stderr = 2, f"RTNETLINK answers: {os.strerror(e.code)}"
+
+        get_command_journal().record(
+            self.__command,
+            CommandKind.MUTATION,
+            duration=time.perf_counter() - start_time,
+            returncode=returncode,
+        )
+
+        if returncode == 0 and method_name == "link":
+            self.__ifindex_cache.clear()
+
+        return self.__set_result(returncode, stderr)
+
+    def __run_subprocess(self):
+        runner = JournaledRunner(
+            self.__command, CommandKind.MUTATION, error_log_level=self.__error_log_level
+        )
+        runner.run()
+
+        self.__stdout = runner.stdout
+        self.__stderr = runner.stderr
+        self.__returncode = runner.returncode
+
+        return self.__returncode
+
+    def __set_result(self, returncode, stderr):
+        self.__stdout = ""
+        self.__stderr = stderr
+        self.__returncode = returncode
+
+        if returncode != 0 and self.__error_log_level != LogLevel.QUIET:
+            logger.log(
+                self.__error_log_level or "WARNING",
+                f"command='{self.__command}', returncode={returncode}, stderr={stderr!r}",
+            )
+
+        return returncode
+
+    @classmethod
+    def __get_ifindex(cls, device):
+        if device not in cls.__ifindex_cache:
+            index_list = get_iproute().link_lookup(ifname=device)
+            if not index_list:
+                raise _DeviceNotFoundError(device)
+
+            cls.__ifindex_cache[device] = index_list[0]
+
+        return cls.__ifindex_cache[device]
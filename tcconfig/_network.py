@@ -2,10 +2,12 @@
 .. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
 """
 
+import functools
+
 import humanreadable as hr
 import typepy
-from pyroute2 import IPRoute
 
+from ._common import is_null_string
 from ._const import Network
 from ._error import NetworkInterfaceNotFoundError
 
@@ -22,6 +24,7 @@ def get_anywhere_network(ip_version):
     raise ValueError(f"unknown ip version: {ip_version}")
 
 
+@functools.lru_cache(maxsize=None)
 def _get_iproute2_upper_limite_rate():
     """
     :return: Upper bandwidth rate limit of iproute2 [Kbps].
@@ -35,18 +38,14 @@ def _get_iproute2_upper_limite_rate():
     return hr.BitsPerSecond("32Gbps")
 
 
-def _read_iface_speed(tc_device):
-    with open(f"/sys/class/net/{tc_device:s}/speed") as f:
-        return int(f.read().strip())
-
-
 def get_upper_limit_rate(tc_device):
-    if typepy.is_null_string(tc_device):
+    from ._common import get_device_inventory
+
+    if is_null_string(tc_device):
         return _get_iproute2_upper_limite_rate()
 
-    try:
-        speed_value = _read_iface_speed(tc_device)
-    except OSError:
+    speed_value = get_device_inventory().get_speed(tc_device)
+    if speed_value is None:
         return _get_iproute2_upper_limite_rate()
 
     if speed_value < 0:
@@ -84,7 +83,7 @@ def sanitize_network(network, ip_version):
 
     import ipaddress
 
-    if typepy.is_null_string(network) or network.casefold() == "anywhere":
+    if is_null_string(network) or network.casefold() == "anywhere":
         return get_anywhere_network(ip_version)
 
     try:
@@ -109,13 +108,10 @@ def sanitize_network(network, ip_version):
 
 
 def verify_network_interface(device, tc_command_output):
-    from ._common import is_execute_tc_command
+    from ._common import get_device_inventory, is_execute_tc_command
 
     if not is_execute_tc_command(tc_command_output):
         return
 
-    with IPRoute() as ipr:
-        avail_interfaces = [link.get_attr("IFLA_IFNAME") for link in ipr.get_links()]
-
-    if device not in avail_interfaces:
+    if not get_device_inventory().has_device(device):
         raise NetworkInterfaceNotFoundError(target=device)
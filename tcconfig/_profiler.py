@@ -0,0 +1,272 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import contextlib
+import enum
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+import subprocrunner as spr
+
+from ._const import ProfileFormat
+from ._logger import logger
+
+
+Span = namedtuple("Span", "name category start duration depth args")
+
+_profiler = None
+
+
+@enum.unique
+class SpanCategory(enum.Enum):
+    COMMAND = "command"
+    PHASE = "phase"
+    SUBPROCESS = "subprocess"
+    NETLINK = "netlink"
+    PARSE = "parse"
+    QUERY = "query"
+
+
+class Profiler:
+    """
+    Recorder of timing spans (wall times) of processing within an invocation of a command.
+    Spans may be nested: the depth of a span is the number of spans that enclose the span.
+    """
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def spans(self):
+        """
+        :return: List of ``Span`` that completed, in the order of the start times.
+        """
+
+        return sorted(self.__spans, key=lambda span: (span.start, span.depth))
+
+    def __init__(self, name):
+        self.__name = name
+        self.__origin = time.perf_counter()
+        self.__spans = []
+        self.__depth = 0
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        """
+        Record the wall time of the context as a span.
+
+        :param SpanCategory category: Category of the span.
+        :param args: Additional information of the span.
+        :return:
+            Dictionary of the additional information.
+            Items added to the dictionary within the context are recorded with the span.
+        """
+
+        start = time.perf_counter()
+        depth = self.__depth
+        self.__depth += 1
+
+        try:
+            yield args
+        finally:
+            self.__depth -= 1
+            self.__spans.append(
+                Span(
+                    name=name,
+                    category=category.value,
+                    start=start - self.__origin,
+                    duration=time.perf_counter() - start,
+                    depth=depth,
+                    args=args,
+                )
+            )
+
+    def to_report(self):
+        """
+        :return:
+            Dictionary of spans and totals of the spans per category.
+            Times are in milliseconds from the start of the profiling.
+        """
+
+        spans = self.spans
+        summary = {}
+
+        for span in spans:
+            category_summary = summary.setdefault(span.category, {"count": 0, "total_ms": 0.0})
+            category_summary["count"] += 1
+            category_summary["total_ms"] += span.duration * 1000
+
+        return {
+            "name": self.name,
+            "total_ms": max((span.start + span.duration for span in spans), default=0) * 1000,
+            "summary": summary,
+            "spans": [
+                {
+                    "name": span.name,
+                    "category": span.category,
+                    "start_ms": span.start * 1000,
+                    "duration_ms": span.duration * 1000,
+                    "depth": span.depth,
+                    "args": span.args,
+                }
+                for span in spans
+            ],
+        }
+
+    def to_trace_events(self):
+        """
+        :return:
+            Dictionary of the Chrome trace event format:
+            can be loaded to ``chrome://tracing`` or https://ui.perfetto.dev/.
+        """
+
+        pid = os.getpid()
+        events = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": pid,
+                "args": {"name": self.name},
+            }
+        ]
+
+        for span in self.spans:
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": span.start * 1_000_000,
+                    "dur": span.duration * 1_000_000,
+                    "pid": pid,
+                    "tid": pid,
+                    "args": span.args,
+                }
+            )
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, output_path, output_format=ProfileFormat.JSON):
+        output_format = ProfileFormat(output_format)
+
+        if output_format == ProfileFormat.TRACE_EVENT:
+            report = self.to_trace_events()
+        else:
+            report = self.to_report()
+
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=4, default=str)
+
+        logger.debug(f"write a profile report to {output_path:s}")
+
+
+def get_profiler():
+    """
+    :return: ``Profiler`` of the current context. ``None`` if out of the context.
+    """
+
+    return _profiler
+
+
+def profile_span(name, category, **args):
+    """
+    Record the wall time of the context as a span if within a ``profile_context``.
+    Has no effect out of the context.
+    """
+
+    if _profiler is None:
+        return contextlib.nullcontext(args)
+
+    return _profiler.span(name, category, **args)
+
+
+@contextlib.contextmanager
+def profile_context(name, output_path, output_format=ProfileFormat.JSON):
+    """
+    Profile processing within the context and write a report to ``output_path``
+    at the end of the context. Subprocesses and SQL queries are recorded in addition to
+    spans that recorded with ``profile_span``.
+    Has no effect if ``output_path`` is not specified.
+
+    :param str name: Name of the profiling target (e.g. ``tcset``).
+    """
+
+    global _profiler
+
+    if not output_path or _profiler is not None:
+        yield
+        return
+
+    profiler = Profiler(name)
+    unhooks = [_hook_subprocess(profiler), _hook_sql_query(profiler)]
+    _profiler = profiler
+
+    try:
+        with profiler.span(name, SpanCategory.COMMAND, argv=sys.argv[1:]):
+            yield
+    finally:
+        _profiler = None
+        for unhook in unhooks:
+            unhook()
+
+        try:
+            profiler.write(output_path, output_format)
+        except OSError as e:
+            logger.error(f"failed to write a profile report: {e}")
+
+
+def _hook_subprocess(profiler):
+    original_run = spr.SubprocessRunner.run
+
+    def run(runner, *args, **kwargs):
+        command = runner.command_str
+
+        with profiler.span(
+            os.path.basename(command.split()[0]),
+            SpanCategory.SUBPROCESS,
+            command=command,
+            dry_run=runner.dry_run,
+        ) as span_args:
+            returncode = original_run(runner, *args, **kwargs)
+            span_args["returncode"] = returncode
+
+        return returncode
+
+    spr.SubprocessRunner.run = run
+
+    def unhook():
+        spr.SubprocessRunner.run = original_run
+
+    return unhook
+
+
+def _hook_sql_query(profiler):
+    from simplesqlite import SimpleSQLite
+
+    original_execute_query = SimpleSQLite.execute_query
+    original_insert_many = SimpleSQLite.insert_many
+
+    def execute_query(con, query, *args, **kwargs):
+        with profiler.span("execute_query", SpanCategory.QUERY, query=str(query)):
+            return original_execute_query(con, query, *args, **kwargs)
+
+    def insert_many(con, table_name, records, *args, **kwargs):
+        with profiler.span(
+            "insert_many", SpanCategory.QUERY, table=table_name, num_records=len(records)
+        ):
+            return original_insert_many(con, table_name, records, *args, **kwargs)
+
+    SimpleSQLite.execute_query = execute_query
+    SimpleSQLite.insert_many = insert_many
+
+    def unhook():
+        SimpleSQLite.execute_query = original_execute_query
+        SimpleSQLite.insert_many = original_insert_many
+
+    return unhook
@@ -0,0 +1,470 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+
+Set shaping rules of a rules file to a device at once (``tcset --rules-file``).
+
+Setting N rules with N ``tcset --add`` executions reads the configuration of the device
+and allocates identifiers for each rule. A rule set reads the configuration once, plans
+the commands of all of the rules with identifiers allocated in a single pass, and then
+executes the commands at once with the batch mode of tc.
+"""
+
+import csv
+import errno
+import json
+import re
+from typing import Any
+
+from humanreadable import ParameterError
+
+from ._common import command_batch_context, logging_context, make_command_runner
+from ._const import FilterClassifier, HtbLayout, TcSubCommand, TrafficDirection
+from ._error import ClassIdExhaustedError, QdiscIdExhaustedError
+from ._htb_layout import (
+    NUM_BUCKETS,
+    extract_bucket_tables,
+    extract_buckets,
+    extract_handoff_slots,
+    find_htb_layouts,
+    get_bucket_of_bucket_class,
+    get_bucket_qdisc_major_id,
+    make_htb_layout_conflict_message,
+)
+from ._id_allocator import HTB_DEFAULT_CLASS_MINOR_ID, MAX_CLASS_MINOR_ID, extract_class_minor_ids
+from ._kernel_module import load_module
+from ._logger import LogLevel, logger
+from ._tc_command_helper import run_tc_filter_show_batch, run_tc_show
+from ._tc_plan import PlanState, PlanStep, read_host_facts
+from .traffic_control import TrafficControl
+
+
+#: keys of rules in rules files: tcset option names without leading hyphens
+RULE_KEY_DEST_MAP = {
+    "network": "dst_network",
+    "dst-network": "dst_network",
+    "port": "dst_port",
+    "dst-port": "dst_port",
+    "src-port": "src_port",
+    "exclude-dst-network": "exclude_dst_network",
+    "exclude-src-network": "exclude_src_network",
+    "exclude-dst-port": "exclude_dst_port",
+    "exclude-src-port": "exclude_src_port",
+    "rate": "bandwidth_rate",
+    "bandwidth-rate": "bandwidth_rate",
+    "delay": "latency_time",
+    "delay-distro": "latency_distro_time",
+    "delay-distribution": "latency_distribution",
+    "loss": "packet_loss_rate",
+    "duplicate": "packet_duplicate_rate",
+    "corrupt": "corruption_rate",
+    "reordering": "reordering_rate",
+    "limit": "packet_limit_count",
+}
+
+_INTEGER_DESTS = ("dst_port", "src_port")
+
+# a root qdisc line of 'tc qdisc show' output: e.g.
+# qdisc htb 1a1a: root refcnt 2 r2q 10 default 0x1 direct_packets_stat 0
+_RE_ROOT_QDISC = re.compile(r"^qdisc (?P<kind>\S+) (?P<handle>[0-9a-f]+:) root", re.MULTILINE)
+
+# steps of objects that are shared among the rules: existing objects are reused
+_SETUP_STEPS = (
+    PlanStep.IFB_DEVICE,
+    PlanStep.INGRESS_QDISC,
+    PlanStep.ROOT_QDISC,
+    PlanStep.DEFAULT_CLASS,
+    PlanStep.BUCKET,
+    PlanStep.HASH_TABLE,
+)
+
+
+def _to_rule(values, line_no):
+    rule = {}
+
+    for key, value in values.items():
+        if value is None or (isinstance(value, str) and not value.strip()):
+            continue
+
+        dest = RULE_KEY_DEST_MAP.get(str(key).strip().replace("_", "-"))
+        if dest is None:
+            raise ParameterError(
+                f"unknown key of a rule at line {line_no:d}",
+                expected=list(RULE_KEY_DEST_MAP),
+                value=key,
+            )
+
+        if dest in _INTEGER_DESTS:
+            try:
+                value = int(value)
+            except ValueError:
+                raise ParameterError(
+                    f"invalid value of a rule at line {line_no:d}: expected an integer for {key}",
+                    value=value,
+                )
+        elif isinstance(value, str):
+            value = value.strip()
+
+        rule[dest] = value
+
+    return rule
+
+
+def load_rules(file_path: str) -> list[dict[str, Any]]:
+    """
+    Load shaping rules from a JSON Lines file, or a CSV file with a header row
+    (``.csv`` extension). Keys of rules are the names of tcset options without leading
+    hyphens: e.g. ``network``, ``port``, ``rate``, ``delay``, ``loss``.
+    Underscores are also accepted instead of hyphens (e.g. ``dst_network``).
+
+    :return: Rules: mappings of destinations of tcset options to the values.
+    :raises ParameterError: If a rule includes an invalid key or value.
+    """
+
+    rules = []
+
+    with open(file_path, encoding="utf-8", newline="") as f:
+        if file_path.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            for values in reader:
+                if None in values:
+                    raise ParameterError(
+                        f"too many columns at line {reader.line_num:d}",
+                        expected=reader.fieldnames,
+                        value=values[None],
+                    )
+
+                rules.append(_to_rule(values, reader.line_num))
+
+            return rules
+
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            try:
+                values = json.loads(line)
+            except ValueError as e:
+                raise ParameterError(f"invalid JSON at line {line_no:d}: {e}")
+
+            if not isinstance(values, dict):
+                raise ParameterError(
+                    f"a rule must be a JSON object at line {line_no:d}", value=values
+                )
+
+            rules.append(_to_rule(values, line_no))
+
+    return rules
+
+
+class TcRuleSet:
+    """
+    Shaping rules of a device that set at once with the HTB algorithm.
+
+    :param planners: ``TcCommandPlanner`` instances of the rules.
+    """
+
+    def __init__(
+        self, device, planners, direction, is_add_shaping_rule, tc_command_output, is_ipv6=False
+    ):
+        self.__device = device
+        self.__planners = planners
+        self.__direction = direction
+        self.__is_add_shaping_rule = is_add_shaping_rule
+        self.__tc_command_output = tc_command_output
+        self.__ip_version = 6 if is_ipv6 else 4
+
+    def validate(self) -> None:
+        """
+        :raises ParameterError:
+            If multiple rules have the same network/port, or the number of rules exceeds
+            the number of classes or netem qdiscs that a device can have.
+        """
+
+        max_rules = MAX_CLASS_MINOR_ID - HTB_DEFAULT_CLASS_MINOR_ID
+        if not self.__is_flat_layout():
+            # a bucket that is assigned more rules than the classes of a qdisc
+            # fails at the allocation of the class ids
+            max_rules *= NUM_BUCKETS
+
+        # a netem qdisc of each rule requires a major id that is unique in the device
+        max_rules = min(max_rules, self.__make_empty_plan_state().num_free_qdisc_major_ids)
+
+        if len(self.__planners) > max_rules:
+            raise ParameterError(
+                f"too many rules: up to {max_rules:d} rules can be set to a device",
+                value=len(self.__planners),
+            )
+
+        filter_keys = set()
+
+        for rule_no, filter_key in enumerate(self.__make_filter_keys(), start=1):
+            if filter_key in filter_keys:
+                raise ParameterError(
+                    f"rule #{rule_no:d} has the same network/port as a previous rule",
+                    value=self.__to_filter_string(filter_key),
+                )
+
+            filter_keys.add(filter_key)
+
+    def make_set_commands(self, host_facts, is_overwrite: bool = False) -> list[str]:
+        """
+        :param HostFacts host_facts: Facts of the host that executes the commands.
+        :return: Commands that set the rules to a device that has no shaping rules.
+        """
+
+        commands = []
+
+        if is_overwrite:
+            commands.extend(self.__planners[0].make_delete_commands())
+
+        if self.__direction == TrafficDirection.INCOMING:
+            commands.append("modprobe ifb")
+
+        commands.extend(
+            command
+            for _step, command in self.__make_steps(host_facts, self.__make_empty_plan_state())
+        )
+
+        return commands
+
+    def set_rules(self) -> int:
+        """
+        Read the configuration of the device, and set the rules in addition to
+        the existing rules.
+
+        :return: ``0`` if all of the rules are set.
+        """
+
+        with logging_context("read the configuration"):
+            plan_state, store, parsed_device, root_qdisc_handle = self.__read_plan_state()
+
+        if root_qdisc_handle is not None:
+            if not self.__is_add_shaping_rule:
+                logger.error(
+                    TrafficControl.EXISTS_MSG_TEMPLATE.format(
+                        f"failed to set shaping rules: qdisc already exists ({self.__device:s})."
+                    )
+                )
+                return errno.EINVAL
+
+            if root_qdisc_handle != f"{self.__planners[0].qdisc_major_id:x}:":
+                logger.error(
+                    "failed to add shaping rules: the root qdisc of the device is not set by "
+                    f"tcconfig ({parsed_device:s}, handle={root_qdisc_handle:s})."
+                )
+                return errno.EINVAL
+
+        htb_layouts = plan_state.htb_layouts - {self.__planners[0].htb_layout}
+        if htb_layouts:
+            logger.error(make_htb_layout_conflict_message(parsed_device, htb_layouts))
+            return errno.EINVAL
+
+        for filter_key in self.__make_filter_keys():
+            if store.find_filters(parsed_device, *filter_key):
+                logger.error(
+                    "adding shaping rules failed. a shaping rule for the same network/port "
+                    f"already exists: {self.__to_filter_string(filter_key):s}"
+                )
+                return errno.EINVAL
+
+        if self.__direction == TrafficDirection.INCOMING:
+            load_module("ifb")
+
+        with logging_context("plan shaping rules"):
+            try:
+                steps = self.__make_steps(read_host_facts(self.__planners[0].tc_device), plan_state)
+            except (ClassIdExhaustedError, QdiscIdExhaustedError) as e:
+                logger.error(f"failed to set shaping rules ({self.__device:s}): {e}")
+                return errno.ENOSPC
+
+        with logging_context("apply shaping rules"):
+            return self.__run_steps(steps)
+
+    def __is_flat_layout(self):
+        return self.__planners[0].htb_layout == HtbLayout.FLAT
+
+    def __make_empty_plan_state(self):
+        """
+        :return: ``PlanState`` of the device that has no configurations.
+        """
+
+        return PlanState(qdisc_major_ids=[self.__planners[0].qdisc_major_id])
+
+    def __make_filter_keys(self):
+        return [
+            (
+                planner.protocol,
+                planner.dst_network,
+                planner.src_network,
+                planner.dst_port,
+                planner.src_port,
+            )
+            for planner in self.__planners
+        ]
+
+    @staticmethod
+    def __to_filter_string(filter_key):
+        return ", ".join(
+            f"{key:s}={value}"
+            for key, value in zip(
+                ("protocol", "dst_network", "src_network", "dst_port", "src_port"), filter_key
+            )
+            if value is not None
+        )
+
+    def __make_steps(self, host_facts, plan_state):
+        steps = []
+
+        if not plan_state.is_qdisc_exist:
+            steps.extend(self.__planners[0].make_qdisc_steps(host_facts))
+
+        if not self.__is_flat_layout():
+            # classes are allocated from the bucket qdisc of each rule
+            for planner in self.__planners:
+                steps.extend(planner.make_rule_steps(host_facts, plan_state))
+
+            return steps
+
+        # classes of all of the rules are allocated at once
+        class_minor_ids = plan_state.allocate_class_minor_ids(len(self.__planners))
+        for planner, class_minor_id in zip(self.__planners, class_minor_ids):
+            steps.extend(planner.make_rule_steps(host_facts, plan_state, class_minor_id))
+
+        return steps
+
+    def __read_plan_state(self):
+        from .parser.shaping_rule import get_shaping_rule_parser
+
+        parser = get_shaping_rule_parser(
+            device=self.__device,
+            ip_version=self.__ip_version,
+            logger=logger,
+            tc_command_output=self.__tc_command_output,
+        )
+        parser.parse()
+
+        if self.__direction == TrafficDirection.INCOMING:
+            parsed_device = parser.ifb_device
+        else:
+            parsed_device = parser.device
+
+        store = parser.store
+        if parsed_device is None:
+            # the ifb device does not exist yet
+            return (self.__make_empty_plan_state(), store, parsed_device, None)
+
+        qdisc_major_id = self.__planners[0].qdisc_major_id
+        root_qdisc_handle = self.__find_root_qdisc_handle(parsed_device)
+        if root_qdisc_handle != f"{qdisc_major_id:x}:":
+            # classes of qdiscs other than tcconfig are not used
+            return (PlanState(), store, parsed_device, root_qdisc_handle)
+
+        class_params = store.select_classes(parsed_device)
+        class_minor_ids = extract_class_minor_ids(class_params, qdisc_major_id)
+
+        buckets = extract_buckets(class_params)
+        bucket_class_minor_ids = {
+            bucket: extract_class_minor_ids(class_params, get_bucket_qdisc_major_id(bucket))
+            for bucket in buckets
+        }
+
+        qdisc_major_ids = [qdisc_major_id]
+        qdisc_major_ids.extend(get_bucket_qdisc_major_id(bucket) for bucket in buckets)
+        for qdisc in store.select_all_qdiscs():
+            if qdisc.device != parsed_device or not qdisc.handle:
+                continue
+
+            try:
+                qdisc_major_ids.append(int(qdisc.handle.split(":")[0], 16))
+            except ValueError:
+                continue
+
+        handoff_slots = extract_handoff_slots(
+            record.filter_id
+            for record in store.select_filters(device=parsed_device)
+            if get_bucket_of_bucket_class(record.flowid) is not None
+        )
+        flower_handles = [
+            int(record.filter_id, 16)
+            for record in store.select_filters(device=parsed_device)
+            if record.classifier == FilterClassifier.FLOWER.value
+        ]
+
+        return (
+            PlanState(
+                class_minor_ids=class_minor_ids,
+                qdisc_major_ids=qdisc_major_ids,
+                flower_handles=flower_handles,
+                # the qdisc is set up again if the default class does not exist
+                is_qdisc_exist=HTB_DEFAULT_CLASS_MINOR_ID in class_minor_ids,
+                bucket_class_minor_ids=bucket_class_minor_ids,
+                bucket_tables=self.__find_bucket_tables(parsed_device, buckets),
+                handoff_slots=handoff_slots,
+                htb_layouts=find_htb_layouts(handoff_slots, class_minor_ids),
+            ),
+            store,
+            parsed_device,
+            root_qdisc_handle,
+        )
+
+    def __find_root_qdisc_handle(self, parsed_device):
+        """
+        :return:
+            Handle of the root qdisc of the device. ``None`` if the device has the default
+            qdisc only (handle ``0:``).
+        """
+
+        match = _RE_ROOT_QDISC.search(
+            run_tc_show(TcSubCommand.QDISC, parsed_device, self.__tc_command_output)
+        )
+        if match is None or int(match.group("handle")[:-1], 16) == 0:
+            return None
+
+        return match.group("handle")
+
+    def __find_bucket_tables(self, parsed_device, buckets):
+        if self.__is_flat_layout():
+            return []
+
+        return extract_bucket_tables(
+            run_tc_filter_show_batch(
+                parsed_device, [f"{get_bucket_qdisc_major_id(bucket):x}:" for bucket in buckets]
+            )
+        )
+
+    @staticmethod
+    def __run_steps(steps):
+        runners = []
+        with command_batch_context():
+            for step, command in steps:
+                runner = make_command_runner(command, error_log_level=LogLevel.QUIET)
+                runner.run()
+                runners.append((step, runner))
+
+        result = 0
+        num_failures = 0
+
+        for step, runner in runners:
+            if runner.returncode == 0:
+                continue
+
+            stderr = runner.stderr or ""
+            if (
+                step in _SETUP_STEPS
+                and TrafficControl.REGEXP_FILE_EXISTS.search(stderr) is not None
+            ):
+                # objects that are shared among the rules already exist
+                logger.debug(f"ignore the error: command={runner.command_str}, stderr={stderr}")
+                continue
+
+            num_failures += 1
+            logger.error(f"command execution failed: command={runner.command_str}, stderr={stderr}")
+
+            if result == 0:
+                result = runner.returncode
+
+        if num_failures:
+            logger.error(f"failed to execute {num_failures:d} of {len(runners):d} commands")
+
+        return result
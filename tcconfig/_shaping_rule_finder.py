@@ -2,17 +2,28 @@
 .. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
 """
 
-from simplesqlite.query import And, Where
-
-from ._const import Tc, TrafficDirection
+from ._common import get_device_state_cache, invalidate_device_state_cache
+from ._const import FilterClassifier, Tc, TrafficDirection
+from ._htb_layout import extract_buckets, extract_handoff_slots, get_bucket_of_bucket_class
+from ._id_allocator import extract_class_minor_ids
 from ._network import is_anywhere_network
-from .parser._model import Filter, Qdisc
-from .parser.shaping_rule import TcShapingRuleParser
 
 
 class TcShapingRuleFinder:
     @property
     def _parser(self):
+        if self.__shaping_rule_parser is None or get_device_state_cache() is not None:
+            # the parser (and simplesqlite) loaded only when rules need to be parsed
+            from .parser.shaping_rule import get_shaping_rule_parser
+
+            # finders share a parser of the device within a device state cache context
+            self.__shaping_rule_parser = get_shaping_rule_parser(
+                device=self.__tc.device,
+                ip_version=self.__tc.ip_version,
+                logger=self.__logger,
+                tc_command_output=self.__tc.tc_command_output,
+            )
+
         self.__shaping_rule_parser.parse()
 
         return self.__shaping_rule_parser
@@ -20,38 +31,103 @@ class TcShapingRuleFinder:
     def __init__(self, logger, tc):
         self.__logger = logger
         self.__tc = tc
-        self.__shaping_rule_parser = TcShapingRuleParser(
-            device=self.__tc.device,
-            ip_version=self.__tc.ip_version,
-            tc_command_output=self.__tc.tc_command_output,
-            logger=self.__logger,
-        )
+        self.__shaping_rule_parser = None
 
     def clear(self):
-        self.__shaping_rule_parser.clear()
+        invalidate_device_state_cache()
+
+        if self.__shaping_rule_parser is not None:
+            self.__shaping_rule_parser.clear()
 
     def find_qdisc_handle(self, parent):
-        for qdisc in Qdisc.select(where=Where(Tc.Param.PARENT, parent)):
+        for qdisc in self._parser.store.select_qdiscs(self.get_parsed_device(), parent):
             return qdisc.handle
 
         return None
 
     def find_filter_param(self):
-        where_query = And(self.__get_filter_conditions())
-        table_name = Filter.get_table_name()
-        self.__logger.debug(f"find filter param: table={table_name}, where={where_query}")
+        filter_conditions = self.__get_filter_conditions()
+        self.__logger.debug(f"find filter param: conditions={filter_conditions}")
 
-        for record in Filter.select(where=where_query):
+        for record in self._parser.store.find_filters(**filter_conditions):
             return record.as_dict()
 
-        self.__logger.debug(
-            f"find filter param: empty result (table={table_name}, where={where_query})"
-        )
+        self.__logger.debug(f"find filter param: empty result (conditions={filter_conditions})")
 
         return None
 
+    def find_filter_params(self):
+        """
+        :return:
+            Parameters of the filters of the shaping rule: filters that matched to the
+            conditions and classify packets into the same class.
+        """
+
+        records = self.__find_filters()
+        if not records:
+            return []
+
+        flowid = records[0].flowid
+
+        return [record.as_dict() for record in records if record.flowid == flowid]
+
+    def find_flower_handles(self):
+        """
+        :return: List of handles of flower filters of the device.
+        """
+
+        return [
+            int(record.filter_id, 16)
+            for record in self._parser.store.select_filters(device=self.get_parsed_device())
+            if record.classifier == FilterClassifier.FLOWER.value
+        ]
+
+    def find_class_minor_ids(self, qdisc_major_id=None):
+        """
+        :param int qdisc_major_id:
+            Major id of the qdisc. Defaults to the root qdisc of the shaping rules.
+        :return: Minor ids of the classes of the qdisc.
+        """
+
+        device = self.get_parsed_device()
+        if not device:
+            return []
+
+        if qdisc_major_id is None:
+            qdisc_major_id = self.__tc.qdisc_major_id
+
+        return extract_class_minor_ids(self._parser.store.select_classes(device), qdisc_major_id)
+
+    def find_buckets(self):
+        """
+        :return: Buckets of hierarchical HTB layouts that exist in the device.
+        """
+
+        device = self.get_parsed_device()
+        if not device:
+            return []
+
+        return extract_buckets(self._parser.store.select_classes(device))
+
+    def find_handoff_slots(self):
+        """
+        :return:
+            Pairs of a hand-off table id and a bucket of the filters that hand off packets
+            to buckets of hierarchical HTB layouts.
+        """
+
+        device = self.get_parsed_device()
+        if not device:
+            return []
+
+        return extract_handoff_slots(
+            record.filter_id
+            for record in self._parser.store.select_filters(device=device)
+            if get_bucket_of_bucket_class(record.flowid) is not None
+        )
+
     def find_parent(self):
-        for record in Filter.select(where=And(self.__get_filter_conditions())):
+        for record in self.__find_filters():
             return record.flowid
 
         return None
@@ -60,7 +136,16 @@ class TcShapingRuleFinder:
         return self.find_parent() is not None
 
     def is_any_filter(self):
-        return Filter.fetch_num_records() > 0
+        """
+        :return:
+            ``True`` if filters of shaping rules exist: filters that hand off packets to
+            buckets are not filters of shaping rules.
+        """
+
+        return any(
+            get_bucket_of_bucket_class(record.flowid) is None
+            for record in self._parser.store.select_filters()
+        )
 
     def is_empty_filter_condition(self):
         from typepy import is_null_string
@@ -83,21 +168,30 @@ class TcShapingRuleFinder:
         return device
 
     def get_filter_string(self):
+        from simplesqlite.query import Where
+
         return ", ".join(
-            [where.to_query() for where in self.__get_filter_conditions() if where.value]
+            [
+                Where(key, value).to_query()
+                for key, value in self.__get_filter_conditions().items()
+                if value
+            ]
         )
 
-    def __get_filter_conditions(self):
-        if self.__tc.direction == TrafficDirection.OUTGOING:
-            device = self._parser.device
-        elif self.__tc.direction == TrafficDirection.INCOMING:
-            device = self._parser.ifb_device
-
+    def __find_filters(self):
+        # filters that hand off packets to buckets are shared among shaping rules
         return [
-            Where(Tc.Param.DEVICE, device),
-            Where(Tc.Param.PROTOCOL, self.__tc.protocol),
-            Where(Tc.Param.DST_NETWORK, self.__tc.dst_network),
-            Where(Tc.Param.SRC_NETWORK, self.__tc.src_network),
-            Where(Tc.Param.DST_PORT, self.__tc.dst_port),
-            Where(Tc.Param.SRC_PORT, self.__tc.src_port),
+            record
+            for record in self._parser.store.find_filters(**self.__get_filter_conditions())
+            if get_bucket_of_bucket_class(record.flowid) is None
         ]
+
+    def __get_filter_conditions(self):
+        return {
+            Tc.Param.DEVICE: self.get_parsed_device(),
+            Tc.Param.PROTOCOL: self.__tc.protocol,
+            Tc.Param.DST_NETWORK: self.__tc.dst_network,
+            Tc.Param.SRC_NETWORK: self.__tc.src_network,
+            Tc.Param.DST_PORT: self.__tc.dst_port,
+            Tc.Param.SRC_PORT: self.__tc.src_port,
+        }
@@ -2,11 +2,16 @@
 .. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
 """
 
-import subprocrunner as spr
+import re
 
-from ._common import find_bin_path
+from ._common import find_bin_path, get_device_state_cache
 from ._const import TcSubCommand
 from ._error import NetworkInterfaceNotFoundError
+from ._journal import CommandKind, JournaledRunner
+from ._logger import LogLevel
+
+
+_RE_BATCH_COMMAND_FAILED = re.compile(r"^Command failed -:(?P<line_no>\d+)$", re.MULTILINE)
 
 
 def get_tc_base_command(tc_subcommand):
@@ -16,15 +21,164 @@ def get_tc_base_command(tc_subcommand):
     return "{:s} {:s}".format(find_bin_path("tc"), tc_subcommand.value)
 
 
-def run_tc_show(subcommand, device, tc_command_output):
+def is_json_output_supported():
+    """
+    :return:
+        ``True`` if the tc command can print configurations in JSON format (``tc -j``).
+    """
+
+    from ._iproute2 import get_iproute2_features
+
+    return get_iproute2_features().is_json_output_supported
+
+
+def run_tc_show(subcommand, device, tc_command_output, is_json=False):
+    """
+    :param bool is_json: Print the configurations in JSON format (``tc -j``) if ``True``.
+    """
+
     from ._network import verify_network_interface
 
+    cache = get_device_state_cache()
+    if cache is not None:
+        output = cache.get_tc_show_output(subcommand, device, is_json)
+        if output is not None:
+            return output
+
     verify_network_interface(device, tc_command_output)
 
-    runner = spr.SubprocessRunner(f"{get_tc_base_command(subcommand):s} show dev {device:s}")
+    if is_json:
+        base_command = "{:s} -j {:s}".format(find_bin_path("tc"), subcommand.value)
+    else:
+        base_command = get_tc_base_command(subcommand)
+
+    runner = JournaledRunner(f"{base_command:s} show dev {device:s}", CommandKind.QUERY)
     if runner.run() != 0 and runner.stderr.find("Cannot find device") != -1:
         # reach here if the device does not exist at the system and netiface
         # not installed.
         raise NetworkInterfaceNotFoundError(target=device)
 
+    if cache is not None and runner.returncode == 0:
+        cache.set_tc_show_output(subcommand, device, is_json, runner.stdout)
+
     return runner.stdout
+
+
+def get_device_qdisc_major_id(device):
+    import hashlib
+
+    base_device_hash = hashlib.md5(device.encode("latin-1")).hexdigest()[:3]
+    device_hash_prefix = "1"
+
+    return int(device_hash_prefix + base_device_hash, 16)
+
+
+def run_tc_show_batch(show_items):
+    """
+    Execute multiple ``tc <subcommand> show`` commands with a single ``tc -batch`` process.
+
+    The combined output is split into each command output by the object name at the
+    head of lines (``qdisc``/``class``/``filter``), and by root qdisc lines for qdisc commands.
+    Thus, adjacent items must be different subcommands except for qdisc.
+
+    :param list show_items:
+        List of tuples of a ``TcSubCommand`` and arguments of the show command
+        (e.g. ``(TcSubCommand.FILTER, "dev eth0 root")``).
+    :return:
+        List of outputs of each command. ``None`` for the commands that failed
+        (e.g. a device does not exist).
+    """
+
+    runner = JournaledRunner(
+        "{:s} -force -batch -".format(find_bin_path("tc")),
+        CommandKind.QUERY,
+        error_log_level=LogLevel.QUIET,
+    )
+    runner.run(
+        input="".join(f"{subcommand.value:s} show {args:s}\n" for subcommand, args in show_items)
+    )
+
+    failed_idx_set = {
+        int(match.group("line_no")) - 1
+        for match in _RE_BATCH_COMMAND_FAILED.finditer(runner.stderr or "")
+    }
+    lines = (runner.stdout or "").splitlines()
+    line_idx = 0
+    outputs = []
+
+    for idx, (subcommand, _args) in enumerate(show_items):
+        if idx in failed_idx_set:
+            outputs.append(None)
+            continue
+
+        start_idx = line_idx
+        while line_idx < len(lines):
+            line = lines[line_idx]
+            object_name = line.split(" ", 1)[0]
+
+            if object_name not in (
+                TcSubCommand.QDISC.value,
+                TcSubCommand.CLASS.value,
+                TcSubCommand.FILTER.value,
+            ):
+                # continuation lines of the previous object
+                line_idx += 1
+                continue
+
+            if object_name != subcommand.value:
+                break
+
+            if subcommand == TcSubCommand.QDISC and line_idx > start_idx and " root " in line:
+                # root qdisc of the next device
+                break
+
+            line_idx += 1
+
+        outputs.append("\n".join(lines[start_idx:line_idx]))
+
+    return outputs
+
+
+def run_tc_filter_show_batch(device, parents):
+    """
+    Execute ``tc filter show`` commands of multiple qdiscs of a device with a single
+    ``tc -batch`` process. Unlike ``run_tc_show_batch``, outputs of the commands are not split:
+    filters of the qdiscs are distinguished by the parents of the filters in the output.
+
+    :param list parents: Handles of the qdiscs (e.g. ``b026:``).
+    :return: Concatenated outputs of the commands.
+    """
+
+    from ._iproute2 import get_iproute2_features
+
+    show_args_list = [f"dev {device:s} parent {parent:s}" for parent in parents]
+    if not show_args_list:
+        return ""
+
+    base_command = get_tc_base_command(TcSubCommand.FILTER)
+
+    if not get_iproute2_features().is_batch_supported:
+        outputs = []
+        for show_args in show_args_list:
+            runner = JournaledRunner(
+                f"{base_command:s} show {show_args:s}",
+                CommandKind.QUERY,
+                error_log_level=LogLevel.QUIET,
+            )
+            runner.run()
+            outputs.append(runner.stdout or "")
+
+        return "\n".join(output for output in outputs if output)
+
+    runner = JournaledRunner(
+        f"{find_bin_path('tc'):s} -force -batch -",
+        CommandKind.QUERY,
+        error_log_level=LogLevel.QUIET,
+    )
+    runner.run(
+        input="".join(
+            f"{TcSubCommand.FILTER.value:s} show {show_args:s}\n" for show_args in show_args_list
+        )
+    )
+
+    return runner.stdout or ""
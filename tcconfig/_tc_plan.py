@@ -0,0 +1,1181 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import enum
+import itertools
+from collections import namedtuple
+from typing import Optional
+
+from humanreadable import ParameterError
+
+from ._common import (
+    find_bin_path,
+    is_not_null_string,
+    is_null_string,
+    validate_within_min_max,
+)
+from ._const import FilterClassifier, HtbLayout, ShapingAlgorithm, TcSubCommand, TrafficDirection
+from ._flower import make_flower_keys_list
+from ._htb_layout import (
+    HANDOFF_FILTER_PRIOS,
+    NUM_BUCKETS,
+    get_bucket,
+    get_bucket_qdisc_major_id,
+    get_handoff_table_id,
+    make_bucket_commands,
+    make_bucket_table_commands,
+    make_bucket_table_option,
+    make_handoff_slot_command,
+    make_handoff_table_commands,
+)
+from ._id_allocator import (
+    HTB_DEFAULT_CLASS_MINOR_ID,
+    ClassMinorIdAllocator,
+    QdiscMajorIdAllocator,
+)
+from ._iptables import IptablesMangleMarkEntry
+from ._logger import logger
+from ._netem_param import NetemParameter
+from ._network import get_anywhere_network, get_upper_limit_rate, sanitize_network
+from ._tc_command_helper import get_device_qdisc_major_id, get_tc_base_command
+from ._u32_hash import (
+    HASH_FILTER_PRIO,
+    get_hash_key,
+    make_hash_bucket_option,
+    make_octet3_table_commands,
+    make_octet4_table_commands,
+)
+
+
+#: Facts of the host that commands of shaping rules depend on (``read_host_facts``).
+HostFacts = namedtuple("HostFacts", "upper_limit_rate is_burst_rounding_fixed")
+
+
+def read_host_facts(tc_device):
+    """
+    :param str tc_device:
+        Device that shaping rules are set to: the ifb device for incoming packets.
+    :return: ``HostFacts`` of the device.
+    """
+
+    from ._iproute2 import get_iproute2_features
+
+    return HostFacts(
+        upper_limit_rate=get_upper_limit_rate(tc_device),
+        is_burst_rounding_fixed=get_iproute2_features().is_burst_rounding_fixed,
+    )
+
+
+def make_output_host_facts(tc_device, iproute2_version=None):
+    """
+    Facts of the host that executes the commands of ``--tc-command``/``--tc-script`` output.
+    The output may be executed at other hosts: iproute2 of the local host is not probed.
+
+    :param str tc_device:
+        Device that shaping rules are set to: the ifb device for incoming packets.
+    :param str iproute2_version:
+        iproute2 version of the host that executes the commands (e.g. ``6.15.0``).
+        ``None`` if unknown: burst sizes are adjusted for the rounding bug of tc from
+        iproute2 version 6.14 and earlier, which are also valid for later versions.
+    :return: ``HostFacts`` of the device.
+    :raises ParameterError: If ``iproute2_version`` is not a version.
+    """
+
+    from ._iproute2 import is_burst_rounding_fixed, parse_version
+
+    try:
+        tc_version = parse_version(iproute2_version)
+    except ValueError:
+        raise ParameterError(
+            "invalid iproute2 version", expected="e.g. 6.15.0", value=iproute2_version
+        )
+
+    return HostFacts(
+        upper_limit_rate=get_upper_limit_rate(tc_device),
+        is_burst_rounding_fixed=is_burst_rounding_fixed(tc_version),
+    )
+
+
+@enum.unique
+class PlanStep(enum.Enum):
+    """
+    Kinds of planned commands. Executors of plans handle failures of commands by the kinds:
+    e.g. commands that add objects shared among shaping rules fail if the objects exist.
+    """
+
+    IFB_DEVICE = "ifb device"
+    INGRESS_QDISC = "ingress qdisc"
+    ROOT_QDISC = "qdisc"
+    DEFAULT_CLASS = "default class"
+    BUCKET = "bucket"
+    HASH_TABLE = "hash table"
+    RATE = "rate"
+    NETEM = "netem qdisc"
+    MANGLE = "iptables mangle entry"
+    FILTER = "filter"
+
+
+class PlanState:
+    """
+    Identifiers that are in use in the configuration of a device.
+    Plans of shaping rules allocate identifiers from a shared state, so that multiple
+    shaping rules of a device can be planned in a single pass (``tcset --rules-file``).
+    """
+
+    # same value as IptablesMangleController
+    __FIRST_MARK_ID = 101
+
+    @property
+    def is_qdisc_exist(self):
+        return self.__is_qdisc_exist
+
+    @property
+    def htb_layouts(self):
+        return self.__htb_layouts
+
+    @property
+    def num_free_qdisc_major_ids(self):
+        return self.__qdisc_major_id_allocator.num_free_ids
+
+    def __init__(
+        self,
+        class_minor_ids=(),
+        qdisc_major_ids=(),
+        flower_handles=(),
+        is_qdisc_exist=False,
+        bucket_class_minor_ids=None,
+        bucket_tables=(),
+        handoff_slots=(),
+        htb_layouts=(),
+        hash_table_keys=(),
+        mark_ids=(),
+    ):
+        """
+        :param class_minor_ids: Minor ids of existing classes of the qdisc.
+        :param qdisc_major_ids: Major ids of existing qdiscs of the device.
+        :param flower_handles: Handles of existing flower filters of the qdisc.
+        :param bool is_qdisc_exist: ``True`` if the root qdisc of shaping rules already exists.
+        :param dict bucket_class_minor_ids:
+            Minor ids of existing classes of bucket qdiscs of hierarchical HTB layouts
+            for each existing bucket.
+        :param bucket_tables:
+            Pairs of a bucket and a protocol of existing hash tables of bucket qdiscs.
+        :param handoff_slots:
+            Pairs of a hand-off table id and a bucket of existing filters of the root qdisc
+            that hand off packets to buckets.
+        :param htb_layouts: Layouts of HTB classes of existing shaping rules (``HtbLayout``).
+        :param hash_table_keys: Keys of existing hash tables of the qdisc (``add_hash_table``).
+        :param mark_ids: Mark ids of existing iptables mangle table entries.
+        """
+
+        self.__class_minor_id_allocator = ClassMinorIdAllocator(class_minor_ids)
+        # major ids of bucket qdiscs are reserved regardless of the layout:
+        # bucket qdiscs are added on demand by plans of rules
+        self.__qdisc_major_id_allocator = QdiscMajorIdAllocator(
+            itertools.chain(
+                qdisc_major_ids,
+                (get_bucket_qdisc_major_id(bucket) for bucket in range(NUM_BUCKETS)),
+            )
+        )
+        self.__flower_handle_counter = itertools.count(max(flower_handles, default=0) + 1)
+        self.__hash_table_keys = set(hash_table_keys)
+        self.__mark_ids = set(mark_ids)
+        self.__is_qdisc_exist = is_qdisc_exist
+        self.__htb_layouts = frozenset(htb_layouts)
+
+        bucket_class_minor_ids = bucket_class_minor_ids or {}
+        self.__buckets = set(bucket_class_minor_ids)
+        self.__bucket_class_minor_id_allocators = {
+            bucket: ClassMinorIdAllocator(minor_ids)
+            for bucket, minor_ids in bucket_class_minor_ids.items()
+        }
+        self.__bucket_tables = set(bucket_tables)
+        self.__handoff_slots = set(handoff_slots)
+        # hand-off tables are added with the first filter that hands off packets to a bucket
+        self.__handoff_tables = {table_id for table_id, _bucket in self.__handoff_slots}
+
+    def allocate_class_minor_id(self, min_id=HTB_DEFAULT_CLASS_MINOR_ID + 1, bucket=None):
+        """
+        :param int bucket:
+            Bucket of hierarchical HTB layouts to allocate a minor id of a class of
+            the bucket qdisc. ``None`` to allocate from the root qdisc.
+        :raises ClassIdExhaustedError: If no minor ids are left.
+        """
+
+        if bucket is None:
+            return self.__class_minor_id_allocator.allocate(min_id)
+
+        allocator = self.__bucket_class_minor_id_allocators.get(bucket)
+        if allocator is None:
+            allocator = ClassMinorIdAllocator()
+            self.__bucket_class_minor_id_allocators[bucket] = allocator
+
+        return allocator.allocate(min_id)
+
+    def allocate_class_minor_ids(self, count, min_id=HTB_DEFAULT_CLASS_MINOR_ID + 1):
+        """
+        :raises ClassIdExhaustedError: If unused minor ids are less than ``count``.
+        """
+
+        return self.__class_minor_id_allocator.allocate_many(count, min_id)
+
+    def allocate_qdisc_major_id(self, base_id):
+        """
+        :raises QdiscIdExhaustedError: If no major ids are left.
+        """
+
+        return self.__qdisc_major_id_allocator.allocate(base_id)
+
+    def allocate_flower_handle(self):
+        return next(self.__flower_handle_counter)
+
+    def allocate_mark_id(self):
+        mark_id = self.__FIRST_MARK_ID
+        while mark_id in self.__mark_ids:
+            mark_id += 1
+
+        self.__mark_ids.add(mark_id)
+
+        return mark_id
+
+    def add_hash_table(self, key):
+        """
+        :param key:
+            Third octet value of a second level hash table. ``None`` for the first level table.
+        :return: ``True`` if the table does not exist and is not added by the plan yet.
+        """
+
+        if key in self.__hash_table_keys:
+            return False
+
+        self.__hash_table_keys.add(key)
+
+        return True
+
+    def add_bucket(self, bucket):
+        """
+        :return: ``True`` if the bucket does not exist and is not added by the plan yet.
+        """
+
+        if bucket in self.__buckets:
+            return False
+
+        self.__buckets.add(bucket)
+
+        return True
+
+    def add_bucket_table(self, bucket, protocol):
+        """
+        :return: ``True`` if the hash table of the bucket for the protocol is not added yet.
+        """
+
+        if (bucket, protocol) in self.__bucket_tables:
+            return False
+
+        self.__bucket_tables.add((bucket, protocol))
+
+        return True
+
+    def add_handoff_table(self, table_id):
+        """
+        :return: ``True`` if the hand-off table of the root qdisc is not added yet.
+        """
+
+        if table_id in self.__handoff_tables:
+            return False
+
+        self.__handoff_tables.add(table_id)
+
+        return True
+
+    def add_handoff_slot(self, table_id, bucket):
+        """
+        :return:
+            ``True`` if the filter that hands off packets of the hash bucket of the hand-off
+            table to the bucket is not added yet.
+        """
+
+        if (table_id, bucket) in self.__handoff_slots:
+            return False
+
+        self.__handoff_slots.add((table_id, bucket))
+
+        return True
+
+
+class TcCommandPlanner:
+    """
+    Generator of commands that set shaping rules. ``TrafficControl`` executes the planned
+    commands to a device, and tcset outputs them for ``--tc-command``/``--tc-script`` options.
+    No commands are executed by the planner: existing configurations of a device and facts of
+    the host are given to the methods that plan commands.
+    """
+
+    __MIN_PORT = 0
+    __MAX_PORT = 65535
+
+    __HTB_DEFAULT_CLASS_MINOR_ID = HTB_DEFAULT_CLASS_MINOR_ID
+    __TBF_NETEM_QDISC_MAJOR_ID_OFFSET = 10
+    __TBF_MIN_BUFFER_BYTE = 1600
+    __TBF_OUT_DEVICE_QDISC_MINOR_ID = 1
+    __TBF_IN_DEVICE_QDISC_MINOR_ID = 3
+
+    @property
+    def device(self):
+        return self.__device
+
+    @property
+    def tc_device(self):
+        """
+        :return: Device that shaping rules are set to: the ifb device for incoming packets.
+        """
+
+        if self.__direction == TrafficDirection.INCOMING:
+            return self.ifb_device
+
+        return self.__device
+
+    @property
+    def netem_param(self):
+        return self.__netem_param
+
+    @property
+    def dst_network(self):
+        return self.__dst_network
+
+    @property
+    def src_network(self):
+        return self.__src_network
+
+    @property
+    def dst_port(self):
+        return self.__dst_port
+
+    @property
+    def src_port(self):
+        return self.__src_port
+
+    @property
+    def ip_version(self):
+        return 6 if self.__is_ipv6 else 4
+
+    @property
+    def protocol(self):
+        return "ipv6" if self.__is_ipv6 else "ip"
+
+    @property
+    def protocol_match(self):
+        return "ip6" if self.__is_ipv6 else "ip"
+
+    @property
+    def ifb_device(self):
+        return f"ifb{self.__qdisc_major_id:d}"
+
+    @property
+    def qdisc_major_id(self):
+        return self.__qdisc_major_id
+
+    @property
+    def shaping_algorithm(self):
+        return self.__shaping_algorithm
+
+    @property
+    def htb_layout(self):
+        return self.__htb_layout
+
+    @property
+    def filter_prio(self):
+        return self.__get_filter_prio(is_exclude_filter=False)
+
+    @property
+    def bucket(self):
+        """
+        :return:
+            Bucket of the shaping rule with hierarchical HTB layouts.
+            ``None`` for the flat layout and for changes of rules.
+        """
+
+        if self.__htb_layout == HtbLayout.FLAT or self.__is_change_shaping_rule:
+            return None
+
+        return get_bucket(self.__htb_layout, self.ip_version, self.__dst_network)
+
+    @property
+    def hash_key(self):
+        """
+        :return:
+            Key of the hash bucket (the third and the fourth octets of the destination address)
+            to add the filter if hashed filters are enabled. ``None`` if the filter is added to
+            the list of non-hashed filters.
+        """
+
+        if not self.__is_hash_filter or self.is_use_iptables():
+            return None
+
+        hash_key = get_hash_key(self.__dst_network, self.ip_version)
+        if hash_key is None:
+            logger.debug(
+                "add a non-hashed filter: hashed filters support IPv4 destination hosts only "
+                f"(dst-network={self.__dst_network})"
+            )
+
+        return hash_key
+
+    def __init__(
+        self,
+        device: str,
+        direction: Optional[str] = TrafficDirection.OUTGOING,
+        netem_param: Optional[NetemParameter] = None,
+        dst_network: Optional[str] = None,
+        exclude_dst_network: Optional[str] = None,
+        src_network: Optional[str] = None,
+        exclude_src_network: Optional[str] = None,
+        dst_port: Optional[int] = None,
+        exclude_dst_port: Optional[str] = None,
+        src_port: Optional[int] = None,
+        exclude_src_port: Optional[str] = None,
+        is_ipv6: bool = False,
+        is_change_shaping_rule: bool = False,
+        is_enable_iptables: bool = False,
+        shaping_algorithm: ShapingAlgorithm = ShapingAlgorithm.HTB,
+        is_hash_filter: bool = False,
+        classifier: FilterClassifier = FilterClassifier.U32,
+        htb_layout: HtbLayout = HtbLayout.FLAT,
+    ):
+        if shaping_algorithm not in (ShapingAlgorithm.HTB, ShapingAlgorithm.TBF):
+            raise ParameterError(
+                "unknown shaping algorithm",
+                expected=list(ShapingAlgorithm),
+                value=shaping_algorithm,
+            )
+
+        self.__device = device
+        self.__direction = direction
+        self.__netem_param = netem_param
+        self.__dst_network = dst_network
+        self.__exclude_dst_network = exclude_dst_network
+        self.__src_network = src_network
+        self.__exclude_src_network = exclude_src_network
+        self.__dst_port = dst_port
+        self.__exclude_dst_port = exclude_dst_port
+        self.__src_port = src_port
+        self.__exclude_src_port = exclude_src_port
+        self.__is_ipv6 = is_ipv6
+        self.__is_change_shaping_rule = is_change_shaping_rule
+        self.__is_enable_iptables = is_enable_iptables
+        self.__shaping_algorithm = shaping_algorithm
+        self.__is_hash_filter = is_hash_filter
+        self.__classifier = classifier
+        self.__htb_layout = htb_layout
+
+        self.__qdisc_major_id = get_device_qdisc_major_id(device)
+        self.__plan_state = PlanState()
+        self.__host_facts = None
+
+    def validate(self) -> None:
+        """
+        Validate the parameters. Existence of the device is not verified.
+        """
+
+        if self.__netem_param:
+            self.__netem_param.validate_netem_parameter()
+
+        if is_not_null_string(self.__src_network) and not self.__is_enable_iptables:
+            raise ParameterError(
+                "--iptables option required to use --src-network option",
+                value=self.__is_enable_iptables,
+            )
+
+        if self.__is_hash_filter and self.__classifier != FilterClassifier.U32:
+            raise ParameterError(
+                "--hash-filter option is only available for the u32 classifier",
+                value=self.__classifier.value,
+            )
+
+        if self.__htb_layout != HtbLayout.FLAT:
+            if self.__shaping_algorithm != ShapingAlgorithm.HTB:
+                raise ParameterError(
+                    "--htb-layout option is only available for the htb shaping algorithm",
+                    value=self.__shaping_algorithm.value,
+                )
+
+            if self.__classifier != FilterClassifier.U32:
+                raise ParameterError(
+                    "--htb-layout option is only available for the u32 classifier",
+                    value=self.__classifier.value,
+                )
+
+            if self.__is_enable_iptables:
+                raise ParameterError(
+                    "--htb-layout option is not available with --iptables option",
+                    value=self.__is_enable_iptables,
+                )
+
+        validate_within_min_max(
+            "src_port", self.__src_port, self.__MIN_PORT, self.__MAX_PORT, unit=None
+        )
+        validate_within_min_max(
+            "dst_port", self.__dst_port, self.__MIN_PORT, self.__MAX_PORT, unit=None
+        )
+
+    def sanitize(self):
+        self.__dst_network = sanitize_network(self.__dst_network, self.ip_version)
+        self.__src_network = sanitize_network(self.__src_network, self.ip_version)
+
+    def is_use_iptables(self):
+        return self.__is_enable_iptables and self.__direction == TrafficDirection.OUTGOING
+
+    def make_set_commands(self, host_facts, is_overwrite=False):
+        """
+        :param HostFacts host_facts: Facts of the host that executes the commands.
+        :param bool is_overwrite: Delete existing shaping rules before setting the rule.
+        :return: List of commands that set the shaping rule to a device that has no rules.
+        """
+
+        commands = []
+
+        if is_overwrite:
+            commands.extend(self.make_delete_commands())
+
+        if self.__direction == TrafficDirection.INCOMING:
+            commands.append("modprobe ifb")
+
+        commands.extend(command for _step, command in self.make_set_steps(host_facts))
+
+        return commands
+
+    def make_set_steps(self, host_facts, plan_state=None, classid=None, netem_handle=None):
+        """
+        :param HostFacts host_facts: Facts of the host that executes the commands.
+        :param PlanState plan_state:
+            Identifiers in use of the device. Identifiers of the rule are allocated from
+            the state. ``None`` to plan commands for a device that has no shaping rules:
+            identifiers are derived from the parameters.
+        :param str classid: Class id of the existing shaping rule to change.
+        :param str netem_handle: Handle of the netem qdisc of the existing shaping rule to change.
+        :return: List of pairs of a ``PlanStep`` and a command that set the shaping rule.
+        :raises ClassIdExhaustedError: If no class ids are left in ``plan_state``.
+        :raises QdiscIdExhaustedError: If no qdisc major ids are left in ``plan_state``.
+        """
+
+        self.__host_facts = host_facts
+        self.__plan_state = PlanState() if plan_state is None else plan_state
+        steps = []
+
+        if self.__direction == TrafficDirection.INCOMING:
+            steps.extend(self.__make_ifb_setup_steps())
+
+        if self.__shaping_algorithm == ShapingAlgorithm.TBF:
+            steps.extend(self.__make_tbf_steps(classid, netem_handle))
+            return steps
+
+        if not self.__is_change_shaping_rule:
+            steps.extend(self.__make_htb_qdisc_steps())
+
+        if classid is None:
+            if plan_state is None:
+                class_minor_id = (
+                    int(self.__netem_param.calc_hash(self.__make_srcdst_text())[-2:], 16) + 1
+                )
+            else:
+                class_minor_id = plan_state.allocate_class_minor_id(
+                    self.__HTB_DEFAULT_CLASS_MINOR_ID + 1, bucket=self.bucket
+                )
+            classid = self.__make_rule_classid(class_minor_id)
+
+        if netem_handle is None:
+            netem_handle = self.__make_netem_handle(plan_state)
+
+        steps.extend(self.__make_htb_rule_steps(classid, netem_handle))
+
+        return steps
+
+    def make_qdisc_steps(self, host_facts):
+        """
+        :param HostFacts host_facts: Facts of the host that executes the commands.
+        :return:
+            List of pairs of a ``PlanStep`` and a command that add the root HTB qdisc and
+            the default class of the device, which ``make_rule_steps`` add shaping rules to.
+            Includes commands to set up the ifb device for incoming packets: the ifb kernel
+            module is required to be loaded in advance.
+        """
+
+        self.__host_facts = host_facts
+        steps = []
+
+        if self.__direction == TrafficDirection.INCOMING:
+            steps.extend(self.__make_ifb_setup_steps())
+
+        steps.extend(self.__make_htb_qdisc_steps())
+
+        return steps
+
+    def make_rule_steps(self, host_facts, plan_state, class_minor_id=None):
+        """
+        :param HostFacts host_facts: Facts of the host that executes the commands.
+        :param PlanState plan_state:
+            Identifiers in use of the device. Identifiers of the rule are allocated from
+            the state.
+        :param int class_minor_id:
+            Minor id of the class of the rule that allocated from ``plan_state`` in advance.
+            Allocated by the plan if ``None``: classes of hierarchical HTB layouts are
+            allocated from the bucket qdisc of the rule.
+        :return:
+            List of pairs of a ``PlanStep`` and a command that add the shaping rule to
+            the root HTB qdisc of the device (``make_qdisc_steps``).
+        :raises ClassIdExhaustedError: If no class ids are left in ``plan_state``.
+        :raises QdiscIdExhaustedError: If no qdisc major ids are left in ``plan_state``.
+        """
+
+        if self.__shaping_algorithm != ShapingAlgorithm.HTB:
+            raise ParameterError(
+                "shaping rules can be planned with a plan state only for the htb algorithm",
+                value=self.__shaping_algorithm.value,
+            )
+
+        self.__host_facts = host_facts
+        self.__plan_state = plan_state
+
+        if class_minor_id is None:
+            class_minor_id = plan_state.allocate_class_minor_id(
+                self.__HTB_DEFAULT_CLASS_MINOR_ID + 1, bucket=self.bucket
+            )
+
+        return self.__make_htb_rule_steps(
+            self.__make_rule_classid(class_minor_id), self.__make_netem_handle(plan_state)
+        )
+
+    def make_delete_commands(self):
+        """
+        :return: List of commands that delete all of the shaping rules of the device.
+        """
+
+        return [
+            self.make_qdisc_delete_command(),
+            self.make_ingress_qdisc_delete_command(),
+        ] + self.make_ifb_delete_commands()
+
+    def make_qdisc_delete_command(self):
+        return f"{get_tc_base_command(TcSubCommand.QDISC):s} del dev {self.__device:s} root"
+
+    def make_ingress_qdisc_delete_command(self):
+        return f"{get_tc_base_command(TcSubCommand.QDISC):s} del dev {self.__device:s} ingress"
+
+    def make_ifb_delete_commands(self):
+        ip_command = find_bin_path("ip")
+
+        return [
+            f"{get_tc_base_command(TcSubCommand.QDISC):s} del dev {self.ifb_device:s} root",
+            f"{ip_command:s} link set dev {self.ifb_device:s} down",
+            f"{ip_command:s} link delete {self.ifb_device:s} type ifb",
+        ]
+
+    @property
+    def __dev(self):
+        return f"dev {self.tc_device:s}"
+
+    @property
+    def __qdisc_major_id_str(self):
+        return f"{self.__qdisc_major_id:x}"
+
+    @property
+    def __upper_limit_rate(self):
+        return self.__host_facts.upper_limit_rate
+
+    def __get_tc_command(self, subcommand):
+        action = "change" if self.__is_change_shaping_rule else "add"
+
+        return f"{get_tc_base_command(subcommand):s} {action:s}"
+
+    def __get_filter_prio(self, is_exclude_filter, is_hash_filter=False):
+        if is_hash_filter:
+            return HASH_FILTER_PRIO
+
+        offset = 0 if is_exclude_filter else 4
+
+        if self.protocol == "ip":
+            return 1 + offset
+
+        return 2 + offset
+
+    def __make_srcdst_text(self):
+        return "".join(
+            [
+                str(item)
+                for item in [
+                    self.__dst_network,
+                    self.__exclude_dst_network,
+                    self.__src_network,
+                    self.__exclude_src_network,
+                    self.__src_port,
+                    self.__exclude_src_port,
+                    self.__dst_port,
+                    self.__exclude_dst_port,
+                ]
+            ]
+        )
+
+    def __make_rule_classid(self, class_minor_id):
+        bucket = self.bucket
+        if bucket is None:
+            major_id = self.__qdisc_major_id_str
+        else:
+            major_id = f"{get_bucket_qdisc_major_id(bucket):x}"
+
+        return f"{major_id:s}:{class_minor_id:d}"
+
+    def __make_netem_handle(self, plan_state):
+        netem_major_id = self.__netem_param.calc_device_qdisc_major_id()
+        if plan_state is not None:
+            netem_major_id = plan_state.allocate_qdisc_major_id(netem_major_id)
+
+        return f"{netem_major_id:x}:"
+
+    def __make_ifb_setup_steps(self):
+        ip_command = find_bin_path("ip")
+
+        return [
+            (PlanStep.IFB_DEVICE, f"{ip_command:s} link add {self.ifb_device:s} type ifb"),
+            (PlanStep.IFB_DEVICE, f"{ip_command:s} link set dev {self.ifb_device:s} up"),
+            (
+                PlanStep.INGRESS_QDISC,
+                f"{get_tc_base_command(TcSubCommand.QDISC):s} add dev {self.__device:s} ingress",
+            ),
+            (
+                PlanStep.FILTER,
+                " ".join(
+                    [
+                        f"{get_tc_base_command(TcSubCommand.FILTER):s} add",
+                        f"dev {self.__device:s}",
+                        f"parent ffff: protocol {self.protocol:s} u32 match u32 0 0",
+                        f"flowid {self.__qdisc_major_id:x}:",
+                        "action mirred egress redirect",
+                        f"dev {self.ifb_device:s}",
+                    ]
+                ),
+            ),
+        ]
+
+    def __make_netem_command(self, parent, handle):
+        return " ".join(
+            [
+                self.__get_tc_command(TcSubCommand.QDISC),
+                self.__dev,
+                f"parent {parent:s}",
+                f"handle {handle:s}",
+                self.__netem_param.make_netem_command_parts(),
+            ]
+        )
+
+    def __make_htb_qdisc_steps(self):
+        major_id = self.__qdisc_major_id_str
+
+        return [
+            (
+                PlanStep.ROOT_QDISC,
+                " ".join(
+                    [
+                        self.__get_tc_command(TcSubCommand.QDISC),
+                        self.__dev,
+                        "root",
+                        f"handle {major_id:s}:",
+                        ShapingAlgorithm.HTB.value,
+                        f"default {self.__HTB_DEFAULT_CLASS_MINOR_ID:d}",
+                    ]
+                ),
+            ),
+            (
+                PlanStep.DEFAULT_CLASS,
+                " ".join(
+                    [
+                        self.__get_tc_command(TcSubCommand.CLASS),
+                        self.__dev,
+                        f"parent {major_id:s}:",
+                        f"classid {major_id:s}:{self.__HTB_DEFAULT_CLASS_MINOR_ID:d}",
+                        ShapingAlgorithm.HTB.value,
+                        f"rate {self.__upper_limit_rate.kilo_bps}kbit",
+                    ]
+                ),
+            ),
+        ]
+
+    def __make_htb_rule_steps(self, classid, netem_handle):
+        from .shaper.htb import get_burst_size
+
+        steps = []
+        default_classid = f"{self.__qdisc_major_id_str:s}:{self.__HTB_DEFAULT_CLASS_MINOR_ID:d}"
+
+        bucket = self.bucket
+        if bucket is not None:
+            steps.extend(self.__make_bucket_steps(bucket))
+
+        bandwidth = self.__netem_param.bandwidth_rate
+        if bandwidth is None:
+            bandwidth = self.__upper_limit_rate
+
+        rate_command_items = [
+            self.__get_tc_command(TcSubCommand.CLASS),
+            self.__dev,
+            f"parent {classid.split(':')[0]:s}:",
+            f"classid {classid:s}",
+            ShapingAlgorithm.HTB.value,
+            f"rate {bandwidth.kilo_bps}Kbit",
+            f"ceil {bandwidth.kilo_bps}Kbit",
+        ]
+
+        mtu = self.__netem_param.mtu
+        if mtu:
+            rate_command_items.append(f"mtu {mtu:d}")
+
+        if bandwidth != self.__upper_limit_rate:
+            burst = get_burst_size(
+                bandwidth.byte_per_sec,
+                mtu,
+                self.__netem_param.burst,
+                self.__host_facts.is_burst_rounding_fixed,
+            )
+            if burst:
+                rate_command_items.extend([f"burst {burst}b", f"cburst {burst}b"])
+
+        steps.append((PlanStep.RATE, " ".join(rate_command_items)))
+        steps.append((PlanStep.NETEM, self.__make_netem_command(classid, netem_handle)))
+        steps.extend(self.__make_htb_exclude_filter_steps(default_classid))
+
+        if bucket is None:
+            steps.extend(self.__make_filter_steps(classid))
+        else:
+            # packets are handed off to the bucket by the filters that are added with the bucket
+            steps.append(
+                (
+                    PlanStep.FILTER,
+                    " ".join(
+                        [
+                            self.__make_bucket_filter_command(bucket),
+                            "u32",
+                            make_bucket_table_option(bucket, self.protocol),
+                        ]
+                        + self.__make_u32_match_items()
+                        + [f"flowid {classid:s}"]
+                    ),
+                )
+            )
+
+        return steps
+
+    def __make_bucket_filter_command(self, bucket):
+        return " ".join(
+            [
+                self.__get_tc_command(TcSubCommand.FILTER),
+                self.__dev,
+                f"protocol {self.protocol:s}",
+                f"parent {get_bucket_qdisc_major_id(bucket):x}:",
+                f"prio {self.__get_filter_prio(is_exclude_filter=False):d}",
+            ]
+        )
+
+    def __make_bucket_steps(self, bucket):
+        commands = []
+
+        if self.__plan_state.add_bucket(bucket):
+            commands.extend(
+                make_bucket_commands(
+                    self.__get_tc_command(TcSubCommand.CLASS),
+                    self.__get_tc_command(TcSubCommand.QDISC),
+                    self.tc_device,
+                    self.__qdisc_major_id,
+                    bucket,
+                    self.__upper_limit_rate,
+                )
+            )
+
+        if self.__plan_state.add_bucket_table(bucket, self.protocol):
+            commands.extend(
+                make_bucket_table_commands(
+                    self.__make_bucket_filter_command(bucket), bucket, self.protocol
+                )
+            )
+
+        table_id = get_handoff_table_id(self.__htb_layout, self.ip_version)
+        handoff_filter_command = " ".join(
+            [
+                self.__get_tc_command(TcSubCommand.FILTER),
+                self.__dev,
+                f"protocol {self.protocol:s}",
+                f"parent {self.__qdisc_major_id_str:s}:",
+                f"prio {HANDOFF_FILTER_PRIOS[self.protocol]:d}",
+            ]
+        )
+
+        if self.__plan_state.add_handoff_table(table_id):
+            commands.extend(
+                make_handoff_table_commands(
+                    handoff_filter_command, self.__htb_layout, self.ip_version
+                )
+            )
+
+        if self.__plan_state.add_handoff_slot(table_id, bucket):
+            commands.append(
+                make_handoff_slot_command(
+                    handoff_filter_command,
+                    self.__htb_layout,
+                    self.ip_version,
+                    self.__qdisc_major_id,
+                    bucket,
+                )
+            )
+
+        return [(PlanStep.BUCKET, command) for command in commands]
+
+    def __make_htb_exclude_filter_steps(self, flowid):
+        if all(
+            is_null_string(param)
+            for param in (
+                self.__exclude_dst_network,
+                self.__exclude_src_network,
+                self.__exclude_dst_port,
+                self.__exclude_src_port,
+            )
+        ):
+            return []
+
+        command_items = [
+            self.__get_tc_command(TcSubCommand.FILTER),
+            self.__dev,
+            f"protocol {self.protocol:s}",
+            f"parent {self.__qdisc_major_id_str:s}:",
+            f"prio {self.__get_filter_prio(is_exclude_filter=True):d}",
+        ]
+
+        if self.__classifier == FilterClassifier.FLOWER:
+            return self.__make_flower_filter_steps(
+                command_items,
+                make_flower_keys_list(
+                    self.ip_version,
+                    dst_network=self.__exclude_dst_network,
+                    src_network=self.__exclude_src_network,
+                    dst_port=self.__exclude_dst_port,
+                    src_port=self.__exclude_src_port,
+                ),
+                flowid,
+            )
+
+        command_items.append("u32")
+
+        for key, value in (
+            ("dst", self.__exclude_dst_network),
+            ("src", self.__exclude_src_network),
+        ):
+            if is_not_null_string(value):
+                command_items.append(f"match {self.protocol_match:s} {key:s} {value:s}")
+
+        for key, value in (
+            ("dport", self.__exclude_dst_port),
+            ("sport", self.__exclude_src_port),
+        ):
+            if is_not_null_string(value):
+                command_items.append(f"match {self.protocol_match:s} {key:s} {value:s} 0xffff")
+
+        command_items.append(f"flowid {flowid:s}")
+
+        return [(PlanStep.FILTER, " ".join(command_items))]
+
+    def __make_tbf_steps(self, classid, netem_handle):
+        major_id = self.__qdisc_major_id_str
+
+        if self.__direction == TrafficDirection.INCOMING:
+            minor_id = self.__TBF_IN_DEVICE_QDISC_MINOR_ID
+            netem_major_id = self.__qdisc_major_id + self.__TBF_NETEM_QDISC_MAJOR_ID_OFFSET + 1
+        else:
+            minor_id = self.__TBF_OUT_DEVICE_QDISC_MINOR_ID
+            netem_major_id = self.__qdisc_major_id + self.__TBF_NETEM_QDISC_MAJOR_ID_OFFSET
+
+        if classid is None:
+            classid = f"{major_id:s}:{minor_id:d}"
+        if netem_handle is None:
+            netem_handle = f"{netem_major_id:x}:"
+
+        steps = [
+            (
+                PlanStep.ROOT_QDISC,
+                " ".join(
+                    [
+                        self.__get_tc_command(TcSubCommand.QDISC),
+                        self.__dev,
+                        "root",
+                        f"handle {major_id:s}:",
+                        "prio",
+                    ]
+                ),
+            ),
+            (PlanStep.NETEM, self.__make_netem_command(classid, netem_handle)),
+        ]
+
+        try:
+            self.__netem_param.validate_bandwidth_rate()
+        except ParameterError:
+            is_valid_rate = False
+        else:
+            is_valid_rate = True
+
+        if is_valid_rate:
+            bandwidth = self.__netem_param.bandwidth_rate
+            if bandwidth is None:
+                bandwidth = self.__upper_limit_rate
+
+            rate_command_items = [
+                self.__get_tc_command(TcSubCommand.QDISC),
+                self.__dev,
+                f"parent {netem_major_id:x}:{minor_id:d}",
+                "handle 20:",
+                ShapingAlgorithm.TBF.value,
+                f"rate {bandwidth.kilo_bps}kbit",
+                f"buffer {max(int(bandwidth.kilo_bps), self.__TBF_MIN_BUFFER_BYTE):d}",  # [byte]
+                "limit 10000",
+            ]
+
+            mtu = self.__netem_param.mtu
+            if mtu:
+                rate_command_items.append(f"mtu {mtu:d}")
+
+            steps.append((PlanStep.RATE, " ".join(rate_command_items)))
+
+            if not self.is_use_iptables():
+                steps.append(
+                    (PlanStep.FILTER, self.__make_tbf_pre_network_filter_command(minor_id))
+                )
+
+        steps.extend(self.__make_filter_steps(f"{major_id:s}:{minor_id:d}"))
+
+        return steps
+
+    def __make_tbf_pre_network_filter_command(self, minor_id):
+        if all(
+            [
+                is_null_string(self.__dst_network),
+                not isinstance(self.__dst_port, int),
+            ]
+        ):
+            flowid = f"{self.__qdisc_major_id_str:s}:{minor_id:d}"
+        else:
+            flowid = f"{self.__qdisc_major_id_str:s}:2"
+
+        if self.__direction == TrafficDirection.INCOMING:
+            network_direction = "src"
+        else:
+            network_direction = "dst"
+
+        return " ".join(
+            [
+                self.__get_tc_command(TcSubCommand.FILTER),
+                self.__dev,
+                f"protocol {self.protocol:s}",
+                f"parent {self.__qdisc_major_id_str:s}:",
+                f"prio 2 u32 match {self.protocol:s} {network_direction:s}",
+                get_anywhere_network(self.ip_version),
+                f"flowid {flowid:s}",
+            ]
+        )
+
+    def __make_filter_steps(self, flowid):
+        if self.__is_change_shaping_rule:
+            return []
+
+        steps = []
+        hash_key = self.hash_key
+        filter_prio = self.__get_filter_prio(
+            is_exclude_filter=False, is_hash_filter=hash_key is not None
+        )
+        command_items = [
+            self.__get_tc_command(TcSubCommand.FILTER),
+            self.__dev,
+            f"protocol {self.protocol:s}",
+            f"parent {self.__qdisc_major_id_str:s}:",
+            f"prio {filter_prio:d}",
+        ]
+
+        if self.is_use_iptables():
+            mark_id = self.__plan_state.allocate_mark_id()
+            steps.append((PlanStep.MANGLE, self.__make_mangle_mark_command(mark_id)))
+            command_items.append(f"handle {mark_id:d} fw")
+        elif self.__classifier == FilterClassifier.FLOWER:
+            return self.__make_flower_filter_steps(
+                command_items,
+                make_flower_keys_list(
+                    self.ip_version,
+                    dst_network=self.__dst_network,
+                    src_network=self.__src_network,
+                    dst_port=self.__dst_port,
+                    src_port=self.__src_port,
+                ),
+                flowid,
+            )
+        else:
+            command_items.append("u32")
+
+            if hash_key is not None:
+                filter_command = " ".join(command_items[:-1])
+                table_commands = []
+                if self.__plan_state.add_hash_table(None):
+                    table_commands.extend(make_octet3_table_commands(filter_command))
+                if self.__plan_state.add_hash_table(hash_key[0]):
+                    table_commands.extend(make_octet4_table_commands(filter_command, hash_key[0]))
+                steps.extend((PlanStep.HASH_TABLE, command) for command in table_commands)
+                command_items.append(make_hash_bucket_option(*hash_key))
+
+            command_items.extend(self.__make_u32_match_items())
+
+        command_items.append(f"flowid {flowid:s}")
+        steps.append((PlanStep.FILTER, " ".join(command_items)))
+
+        return steps
+
+    def __make_u32_match_items(self):
+        if is_null_string(self.__dst_network):
+            dst_network = get_anywhere_network(self.ip_version)
+        else:
+            dst_network = self.__dst_network
+
+        match_items = [f"match {self.protocol_match:s} dst {dst_network:s}"]
+
+        if is_not_null_string(self.__src_network):
+            match_items.append(f"match {self.protocol_match:s} src {self.__src_network:s}")
+
+        if self.__src_port:
+            match_items.append(f"match {self.protocol_match:s} sport {self.__src_port:d} 0xffff")
+
+        if self.__dst_port:
+            match_items.append(f"match {self.protocol_match:s} dport {self.__dst_port:d} 0xffff")
+
+        return match_items
+
+    def __make_flower_filter_steps(self, command_items, flower_keys_list, classid):
+        return [
+            (
+                PlanStep.FILTER,
+                " ".join(
+                    command_items
+                    + [f"handle 0x{self.__plan_state.allocate_flower_handle():x}", "flower"]
+                    + flower_keys
+                    + [f"classid {classid:s}"]
+                ),
+            )
+            for flower_keys in flower_keys_list
+        ]
+
+    def __make_mangle_mark_command(self, mark_id):
+        # iptables are used only for outgoing packets
+        if is_null_string(self.__src_network):
+            src_network = None
+            chain = "OUTPUT"
+        else:
+            src_network = self.__src_network
+            chain = "PREROUTING"
+
+        return IptablesMangleMarkEntry(
+            ip_version=self.ip_version,
+            mark_id=mark_id,
+            source=src_network,
+            destination=self.__dst_network,
+            chain=chain,
+        ).to_append_command()
@@ -0,0 +1,123 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+
+Hashed u32 filters for shaping rules of IPv4 destination hosts.
+
+u32 filters at the same priority are compared with packets one by one. Thus, the cost of
+the classification grows linearly with the number of rules.
+With hashed filters, filters of rules are placed into buckets of two levels of u32 hash tables:
+
+- a filter at the root hash table of the priority links all of the packets to the first level
+  table, which is keyed on the third octet of destination addresses
+- each bucket of the first level table links to a second level table, which is keyed on
+  the fourth octet of destination addresses: a table for each value of the third octet
+- filters of rules are added to buckets of second level tables
+
+A packet is compared with filters of rules that have the same last two octets of
+the destination address only.
+Handles of hash tables are fixed, so that the tables can be added without parsing
+existing filters.
+"""
+
+import ipaddress
+from typing import Optional
+
+from ._common import find_bin_path
+
+
+#: priority of hashed filters: evaluated prior to non-hashed filters of IPv4 rules
+HASH_FILTER_PRIO = 4
+
+DIVISOR = 256
+OCTET3_TABLE_ID = 0x1
+OCTET4_TABLE_ID_BASE = 0x100
+
+# offset of destination addresses in IPv4 headers
+_IPV4_DST_OFFSET = 16
+
+
+def get_hash_key(dst_network: Optional[str], ip_version: int) -> Optional[tuple[int, int]]:
+    """
+    :return:
+        Tuple of the third and the fourth octets of the destination address if a filter of
+        the destination can be placed into a hash bucket (an IPv4 host address).
+        ``None`` otherwise.
+    """
+
+    if ip_version != 4 or not dst_network:
+        return None
+
+    try:
+        network = ipaddress.IPv4Network(dst_network)
+    except ValueError:
+        return None
+
+    if network.prefixlen != network.max_prefixlen:
+        return None
+
+    octets = network.network_address.packed
+
+    return (octets[2], octets[3])
+
+
+def get_octet4_table_id(octet3: int) -> int:
+    return OCTET4_TABLE_ID_BASE + octet3
+
+
+def make_hash_table_query_command(device: str, parent: str, protocol: str) -> str:
+    """
+    :return: Command that succeeds only if the first level hash table exists.
+    """
+
+    return (
+        f"{find_bin_path('tc'):s} filter get dev {device:s} parent {parent:s} "
+        f"protocol {protocol:s} prio {HASH_FILTER_PRIO:d} handle {OCTET3_TABLE_ID:x}: u32"
+    )
+
+
+def make_octet3_table_commands(filter_command: str) -> list[str]:
+    """
+    :param filter_command:
+        Beginning of ``tc filter add`` commands until the priority
+        (e.g. ``tc filter add dev eth0 protocol ip parent 1a1a: prio 4``).
+    :return:
+        Commands to add the first level hash table and the filter that links packets to
+        the table. The commands must be executed once for a qdisc: the link filter is added
+        for each execution.
+    """
+
+    return [
+        f"{filter_command:s} handle {OCTET3_TABLE_ID:x}: u32 divisor {DIVISOR:d}",
+        (
+            f"{filter_command:s} u32 link {OCTET3_TABLE_ID:x}: "
+            f"hashkey mask 0x0000ff00 at {_IPV4_DST_OFFSET:d} match u32 0 0"
+        ),
+    ]
+
+
+def make_octet4_table_commands(filter_command: str, octet3: int) -> list[str]:
+    """
+    :return:
+        Commands to add a second level hash table for the third octet value and
+        the filter that links the bucket of the first level table to the table.
+        The commands fail with 'File exists' if the table already exists.
+    """
+
+    table_id = get_octet4_table_id(octet3)
+
+    return [
+        f"{filter_command:s} handle {table_id:x}: u32 divisor {DIVISOR:d}",
+        (
+            f"{filter_command:s} handle {OCTET3_TABLE_ID:x}:{octet3:x}:1 "
+            f"u32 ht {OCTET3_TABLE_ID:x}:{octet3:x}: link {table_id:x}: "
+            f"hashkey mask 0x000000ff at {_IPV4_DST_OFFSET:d} match u32 0 0"
+        ),
+    ]
+
+
+def make_hash_bucket_option(octet3: int, octet4: int) -> str:
+    """
+    :return: ``ht`` option of a u32 filter to add the filter to the bucket.
+    """
+
+    return f"ht {get_octet4_table_id(octet3):x}:{octet4:x}:"
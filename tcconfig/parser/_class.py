@@ -7,7 +7,8 @@ import re
 import typepy
 
 from .._const import ShapingAlgorithm, Tc, TcSubCommand
-from .._logger import logger
+from .._logger import is_debug_enabled, logger
+from ._format import sprint_rate
 from ._interface import AbstractParser
 
 
@@ -34,6 +35,49 @@ class TcClassParser(AbstractParser):
         return TcSubCommand.CLASS.value
 
     def parse(self, device, text):
+        objects = self._load_json(text)
+        if objects is not None:
+            entry_list = self.__parse_json(device, objects)
+        else:
+            entry_list = self.__parse_text(device, text)
+
+        if entry_list:
+            self._store.insert_classes(entry_list)
+
+        if is_debug_enabled():
+            logger.debug(
+                f"tc {self._tc_subcommand:s} parse result: {json.dumps(entry_list, indent=4)}"
+            )
+
+        return entry_list
+
+    def _clear(self):
+        self.__parsed_param = {}
+
+    def __parse_json(self, device, objects):
+        entry_list = []
+
+        for tc_class in objects:
+            self._clear()
+
+            self.__parsed_param[self.Key.DEVICE] = device
+            self.__parsed_param[self.Key.CLASS_ID] = None
+            self.__parsed_param[self.Key.RATE] = None
+
+            if tc_class.get("class") == ShapingAlgorithm.HTB.value:
+                self.__parsed_param[self.Key.CLASS_ID] = tc_class.get("handle")
+
+                rate = tc_class.get("rate")
+                if rate is not None:
+                    self.__parsed_param[self.Key.RATE] = sprint_rate(rate).rstrip("bit") + "bps"
+
+            if is_debug_enabled():
+                logger.debug(f"parse a class entry: {self.__parsed_param}")
+            entry_list.append(self.__parsed_param)
+
+        return entry_list
+
+    def __parse_text(self, device, text):
         entry_list = []
 
         for line in text.splitlines():
@@ -48,19 +92,12 @@ class TcClassParser(AbstractParser):
             self.__parse_classid(line)
             self.__parse_rate(line)
 
-            logger.debug(f"parse a class entry: {self.__parsed_param}")
+            if is_debug_enabled():
+                logger.debug(f"parse a class entry: {self.__parsed_param}")
             entry_list.append(self.__parsed_param)
 
-        if entry_list:
-            self._con.create_table_from_data_matrix(self._tc_subcommand, self.Key.LIST, entry_list)
-
-        logger.debug(f"tc {self._tc_subcommand:s} parse result: {json.dumps(entry_list, indent=4)}")
-
         return entry_list
 
-    def _clear(self):
-        self.__parsed_param = {}
-
     def __parse_classid(self, line):
         self.__parsed_param[self.Key.CLASS_ID] = None
         tag = f"class {ShapingAlgorithm.HTB.value:s} "
@@ -70,7 +107,7 @@ class TcClassParser(AbstractParser):
             return
 
         self.__parsed_param[self.Key.CLASS_ID] = re.search(
-            self.Pattern.CLASS_ID, match.group().lstrip(tag)
+            self.Pattern.CLASS_ID, match.group()[len(tag) :]
         ).group()
 
     def __parse_rate(self, line):
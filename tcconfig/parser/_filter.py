@@ -4,12 +4,12 @@
 
 import ipaddress
 import re
+from typing import ClassVar
 
-import pyparsing as pp
 import typepy
 
-from .._const import Tc, TcSubCommand
-from .._logger import logger
+from .._const import FilterClassifier, Tc, TcSubCommand
+from .._logger import is_debug_enabled, logger
 from .._network import sanitize_network
 from ._interface import AbstractParser
 from ._model import Filter
@@ -26,28 +26,27 @@ class TcFilterParser(AbstractParser):
         OUTGOING_NETWORK_LIST = [24, 28, 32, 36]
         PORT = 40
 
-    __FILTER_FLOWID_PATTERN = (
-        pp.Literal("filter parent") + pp.SkipTo("flowid", include=True) + pp.Word(pp.hexnums + ":")
-    )
-    __FILTER_PROTOCOL_PATTERN = (
-        pp.Literal("filter parent") + pp.SkipTo("protocol", include=True) + pp.Word(pp.alphanums)
-    )
-    __FILTER_PRIORITY_PATTERN = (
-        pp.Literal("filter parent") + pp.SkipTo("pref", include=True) + pp.Word(pp.nums)
-    )
-    __FILTER_ID_PATTERN = (
-        pp.Literal("filter parent") + pp.SkipTo("fh", include=True) + pp.Word(pp.hexnums + ":")
-    )
-    __FILTER_MATCH_PATTERN = (
-        pp.Literal("match") + pp.Word(pp.alphanums + "/") + pp.Literal("at") + pp.Word(pp.nums)
-    )
-    __FILTER_MANGLE_MARK_PATTERN = (
-        pp.Literal("filter parent")
-        + pp.SkipTo("handle", include=True)
-        + pp.Word(pp.hexnums)
-        + pp.SkipTo("classid", include=True)
-        + pp.Word(pp.hexnums + ":")
-    )
+    class LineType:
+        FILTER = "filter"
+        FLOWER = "flower"
+        FLOWER_KEY = "flower_key"
+        MANGLE_MARK = "mangle_mark"
+        MATCH = "match"
+        OTHER = "other"
+
+    # patterns of values that follow parameter names at filter lines
+    __FILTER_PARAM_REGEXPS: ClassVar[dict] = {
+        "flowid": re.compile("[0-9a-fA-F:]+"),
+        "protocol": re.compile("[0-9a-zA-Z]+"),
+        "pref": re.compile("[0-9]+"),
+        "fh": re.compile("[0-9a-fA-F:]+"),
+        "handle": re.compile("(0x)?[0-9a-fA-F]+"),
+        "classid": re.compile("[0-9a-fA-F:]+"),
+    }
+    # flower keys that tcconfig uses
+    __FLOWER_KEY_NAMES = ("eth_type", "ip_proto", "dst_ip", "src_ip", "dst_port", "src_port")
+    __RE_MATCH_VALUE = re.compile("(?P<value>[0-9a-zA-Z]+)/(?P<mask>[0-9a-zA-Z]+)$")
+    __RE_MATCH_OFFSET = re.compile("[0-9]+")
 
     @property
     def protocol(self):
@@ -57,8 +56,8 @@ class TcFilterParser(AbstractParser):
     def _tc_subcommand(self):
         return TcSubCommand.FILTER.value
 
-    def __init__(self, con, ip_version):
-        super().__init__(con)
+    def __init__(self, store, ip_version):
+        super().__init__(store)
 
         self.__ip_version = ip_version
         self.__buffer = None
@@ -85,13 +84,18 @@ class TcFilterParser(AbstractParser):
                 continue
 
             self.__device = device
+            line_type, params = self.lex(line)
+
+            if line_type == self.LineType.MANGLE_MARK:
+                self.__classid = params["classid"]
+                self.__handle = int(params["handle"], 16)
+                if is_debug_enabled():
+                    logger.debug(
+                        f"succeed to parse mangle mark: classid={self.__classid}, "
+                        f"handle={self.__handle}, line={line}"
+                    )
 
-            try:
-                self.__parse_mangle_mark(line)
-            except pp.ParseException:
-                logger.debug(f"failed to parse mangle: {line}")
-            else:
-                Filter.insert(
+                self._store.insert_filter(
                     Filter(
                         **{
                             Tc.Param.DEVICE: self.__device,
@@ -101,43 +105,34 @@ class TcFilterParser(AbstractParser):
                     )
                 )
                 self._clear()
-                continue
-
-            tc_filter = self.__get_filter()
-
-            try:
-                self.__parse_flow_id(line)
-                self.__parse_protocol(line)
-                self.__parse_priority(line)
-                self.__parse_filter_id(line)
-
-                if tc_filter.flowid:
-                    logger.debug(f"store filter: {tc_filter}")
-                    Filter.insert(tc_filter)
+            elif line_type in (self.LineType.FILTER, self.LineType.FLOWER):
+                if self.__flow_id:
+                    tc_filter = self.__get_filter()
+                    if is_debug_enabled():
+                        logger.debug(f"store filter: {tc_filter}")
+                    self._store.insert_filter(tc_filter)
                     self._clear()
 
                     self.__device = device
-                    self.__parse_flow_id(line)
-                    self.__parse_protocol(line)
-                    self.__parse_priority(line)
-                    self.__parse_filter_id(line)
 
-                continue
-            except pp.ParseException:
-                logger.debug(f"failed to parse flow id: {line}")
-
-            try:
+                self.__set_filter_params(params, line)
+                if line_type == self.LineType.FLOWER:
+                    self.__classifier = FilterClassifier.FLOWER.value
+            elif line_type == self.LineType.FLOWER_KEY:
+                if self.__classifier == FilterClassifier.FLOWER.value:
+                    self.__parse_flower_key(line, *params)
+            elif line_type == self.LineType.MATCH:
                 if self.__ip_version == 4:
-                    self.__parse_filter_ipv4(line)
+                    self.__parse_filter_ipv4(line, *params)
                 elif self.__ip_version == 6:
-                    self.__parse_filter_ipv6(line)
+                    self.__parse_filter_ipv6(line, *params)
                 else:
                     raise ValueError(f"unknown ip version: {self.__ip_version}")
-            except pp.ParseException:
-                logger.debug(f"failed to parse filter: {line}")
+            elif is_debug_enabled():
+                logger.debug(f"skip a line: {line}")
 
         if self.__flow_id:
-            Filter.insert(self.__get_filter())
+            self._store.insert_filter(self.__get_filter())
 
     def parse_incoming_device(self, text):
         if typepy.is_null_string(text):
@@ -164,6 +159,7 @@ class TcFilterParser(AbstractParser):
 
         self.__handle = None
         self.__classid = None
+        self.__classifier = None
 
     def __get_filter(self):
         return Filter(
@@ -176,44 +172,128 @@ class TcFilterParser(AbstractParser):
             dst_network=sanitize_network(self.__filter_dst_network, self.__ip_version),
             src_port=self.__filter_src_port,
             dst_port=self.__filter_dst_port,
+            classifier=self.__classifier,
         )
 
-    def __parse_flow_id(self, line):
-        parsed_list = self.__FILTER_FLOWID_PATTERN.parseString(line)
-        self.__flow_id = parsed_list[-1]
-        logger.debug(f"succeed to parse flow id: flow-id={self.__flow_id}, line={line}")
-
-    def __parse_protocol(self, line):
-        parsed_list = self.__FILTER_PROTOCOL_PATTERN.parseString(line)
-        self.__protocol = parsed_list[-1]
-        logger.debug(f"succeed to parse protocol: protocol={self.__protocol}, line={line}")
-
-    def __parse_priority(self, line):
-        parsed_list = self.__FILTER_PRIORITY_PATTERN.parseString(line)
-        self.__priority = int(parsed_list[-1])
-        logger.debug(f"succeed to parse priority: priority={self.__priority}, line={line}")
-
-    def __parse_filter_id(self, line):
-        parsed_list = self.__FILTER_ID_PATTERN.parseString(line)
-        self.__filter_id = parsed_list[-1]
-        logger.debug(f"succeed to parse filter id: filter-id={self.__filter_id}, line={line}")
-
-    def __parse_mangle_mark(self, line):
-        parsed_list = self.__FILTER_MANGLE_MARK_PATTERN.parseString(line)
-        self.__classid = parsed_list[-1]
-        self.__handle = int("0" + parsed_list[-3], 16)
-        logger.debug(
-            "succeed to parse mangle mark: classid={}, handle={}, line={}".format(
-                self.__classid, self.__handle, line
+    @classmethod
+    def lex(cls, line):
+        """
+        Classify a line of ``tc filter show`` output and extract the values of the line
+        with a single scan.
+
+        :return:
+            Tuple of a line type (``LineType``) and values of the line:
+
+            - ``LineType.MANGLE_MARK``: dictionary of ``handle`` and ``classid``
+            - ``LineType.FILTER``: dictionary of ``flowid``, ``protocol``, ``pref`` and ``fh``
+            - ``LineType.FLOWER``: same as ``LineType.FILTER``: ``classid`` and ``handle`` of
+              the flower filter are extracted as ``flowid`` and ``fh``
+            - ``LineType.MATCH``: tuple of value hex, mask hex and offset of the match
+            - ``LineType.FLOWER_KEY``: tuple of the name and the value of a flower key
+            - ``LineType.OTHER``: ``None``
+        """
+
+        tokens = line.split()
+
+        if tokens[:1] == ["match"]:
+            if len(tokens) < 4 or tokens[2] != "at":
+                return (cls.LineType.OTHER, None)
+
+            value_match = cls.__RE_MATCH_VALUE.match(tokens[1])
+            offset_match = cls.__RE_MATCH_OFFSET.match(tokens[3])
+            if value_match is None or offset_match is None:
+                return (cls.LineType.OTHER, None)
+
+            return (
+                cls.LineType.MATCH,
+                (value_match.group("value"), value_match.group("mask"), int(offset_match.group())),
             )
-        )
 
-    def __parse_filter_ip_line(self, line):
-        parsed_list = self.__FILTER_MATCH_PATTERN.parseString(line)
-        value_hex, mask_hex = parsed_list[1].split("/")
-        match_id = int(parsed_list[3])
+        if tokens[:1] and tokens[0] in cls.__FLOWER_KEY_NAMES:
+            if len(tokens) != 2:
+                return (cls.LineType.OTHER, None)
+
+            return (cls.LineType.FLOWER_KEY, (tokens[0], tokens[1]))
+
+        if tokens[:2] != ["filter", "parent"]:
+            return (cls.LineType.OTHER, None)
+
+        params = {}
+        for i, token in enumerate(tokens[2:-1], start=2):
+            name = token.lstrip("*")
+            if name in params:
+                continue
+
+            regexp = cls.__FILTER_PARAM_REGEXPS.get(name)
+            if regexp is None:
+                continue
 
-        return (value_hex, mask_hex, match_id)
+            match = regexp.match(tokens[i + 1])
+            if match is not None:
+                params[name] = match.group()
+
+        if "handle" in params and "classid" in params:
+            if FilterClassifier.FLOWER.value in tokens:
+                if not all(name in params for name in ("protocol", "pref")):
+                    return (cls.LineType.OTHER, None)
+
+                return (
+                    cls.LineType.FLOWER,
+                    {
+                        "flowid": params["classid"],
+                        "protocol": params["protocol"],
+                        "pref": params["pref"],
+                        "fh": params["handle"],
+                    },
+                )
+
+            return (
+                cls.LineType.MANGLE_MARK,
+                {"handle": params["handle"], "classid": params["classid"]},
+            )
+
+        if all(name in params for name in ("flowid", "protocol", "pref", "fh")):
+            return (
+                cls.LineType.FILTER,
+                {name: params[name] for name in ("flowid", "protocol", "pref", "fh")},
+            )
+
+        return (cls.LineType.OTHER, None)
+
+    def __set_filter_params(self, params, line):
+        self.__flow_id = params["flowid"]
+        self.__protocol = params["protocol"]
+        self.__priority = int(params["pref"])
+        self.__filter_id = params["fh"]
+
+        if is_debug_enabled():
+            logger.debug(
+                f"succeed to parse filter: flow-id={self.__flow_id}, protocol={self.__protocol}, "
+                f"priority={self.__priority}, filter-id={self.__filter_id}, line={line}"
+            )
+
+    def __parse_flower_key(self, line, name, value):
+        if name in ("dst_ip", "src_ip"):
+            network = ipaddress.ip_network(value, strict=False)
+            if network.version != self.__ip_version:
+                if is_debug_enabled():
+                    logger.debug(f"skip a flower key of a different ip version: {line}")
+                return
+
+            if name == "dst_ip":
+                self.__filter_dst_network = network.compressed
+            else:
+                self.__filter_src_network = network.compressed
+        elif name == "dst_port":
+            self.__filter_dst_port = int(value)
+        elif name == "src_port":
+            self.__filter_src_port = int(value)
+        else:
+            # eth_type and ip_proto: filters are made for each protocol by tcconfig
+            return
+
+        if is_debug_enabled():
+            logger.debug(f"succeed to parse flower key: {name}={value}, line={line}")
 
     def __parse_filter_ipv4_network(self, value_hex, mask_hex, match_id):
         ipaddr = ".".join([str(int(value_hex[i : i + 2], 16)) for i in range(0, len(value_hex), 2)])
@@ -249,11 +329,12 @@ class TcFilterParser(AbstractParser):
             except IndexError:
                 break
 
-            try:
-                value_hex, mask_hex, match_id = self.__parse_filter_ip_line(line)
-            except pp.ParseException:
+            line_type, params = self.lex(line)
+            if line_type != self.LineType.MATCH:
                 break
 
+            value_hex, mask_hex, match_id = params
+
             if (
                 match_id in self.FilterMatchIdIpv6.INCOMING_NETWORK_LIST
                 or match_id in self.FilterMatchIdIpv6.OUTGOING_NETWORK_LIST
@@ -313,7 +394,10 @@ class TcFilterParser(AbstractParser):
         src_port_hex = value_hex[:4]
         dst_port_hex = value_hex[4:]
 
-        logger.debug(f"parse ipv4 port: src-port-hex={src_port_hex}, dst-port-hex={dst_port_hex}")
+        if is_debug_enabled():
+            logger.debug(
+                f"parse ipv4 port: src-port-hex={src_port_hex}, dst-port-hex={dst_port_hex}"
+            )
 
         src_port_decimal = int(src_port_hex, 16)
         self.__filter_src_port = src_port_decimal if src_port_decimal != 0 else None
@@ -321,8 +405,7 @@ class TcFilterParser(AbstractParser):
         dst_port_decimal = int(dst_port_hex, 16)
         self.__filter_dst_port = dst_port_decimal if dst_port_decimal != 0 else None
 
-    def __parse_filter_ipv4(self, line):
-        value_hex, mask_hex, match_id = self.__parse_filter_ip_line(line)
+    def __parse_filter_ipv4(self, line, value_hex, mask_hex, match_id):
 
         if match_id in [
             self.FilterMatchIdIpv4.INCOMING_NETWORK,
@@ -342,24 +425,25 @@ class TcFilterParser(AbstractParser):
             )
             return
         else:
-            logger.debug(f"unknown match id: {match_id}")
+            if is_debug_enabled():
+                logger.debug(f"unknown match id: {match_id}")
             return
 
-        logger.debug(
-            "succeed to parse ipv4 filter: "
-            + ", ".join(
-                [
-                    f"src_network={self.__filter_src_network}",
-                    f"dst_network={self.__filter_dst_network}",
-                    f"src_port={self.__filter_src_port}",
-                    f"dst_port={self.__filter_dst_port}",
-                    f"line={line}",
-                ]
+        if is_debug_enabled():
+            logger.debug(
+                "succeed to parse ipv4 filter: "
+                + ", ".join(
+                    [
+                        f"src_network={self.__filter_src_network}",
+                        f"dst_network={self.__filter_dst_network}",
+                        f"src_port={self.__filter_src_port}",
+                        f"dst_port={self.__filter_dst_port}",
+                        f"line={line}",
+                    ]
+                )
             )
-        )
 
-    def __parse_filter_ipv6(self, line):
-        value_hex, mask_hex, match_id = self.__parse_filter_ip_line(line)
+    def __parse_filter_ipv6(self, line, value_hex, mask_hex, match_id):
 
         if (
             match_id in self.FilterMatchIdIpv6.INCOMING_NETWORK_LIST
@@ -369,18 +453,20 @@ class TcFilterParser(AbstractParser):
         elif match_id == self.FilterMatchIdIpv6.PORT:
             self.__parse_filter_port(value_hex)
         else:
-            logger.debug(f"unknown match id: {match_id}")
+            if is_debug_enabled():
+                logger.debug(f"unknown match id: {match_id}")
             return
 
-        logger.debug(
-            "succeed to parse ipv6 filter: "
-            + ", ".join(
-                [
-                    f"src_network={self.__filter_src_network}",
-                    f"dst_network={self.__filter_dst_network}",
-                    f"src_port={self.__filter_src_port}",
-                    f"dst_port={self.__filter_dst_port}",
-                    f"line={line}",
-                ]
+        if is_debug_enabled():
+            logger.debug(
+                "succeed to parse ipv6 filter: "
+                + ", ".join(
+                    [
+                        f"src_network={self.__filter_src_network}",
+                        f"dst_network={self.__filter_dst_network}",
+                        f"src_port={self.__filter_src_port}",
+                        f"dst_port={self.__filter_dst_port}",
+                        f"line={line}",
+                    ]
+                )
             )
-        )
@@ -0,0 +1,89 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+_RATE_UNITS = ("", "K", "M", "G", "T")
+_UINT32_MAX = 0xFFFFFFFF
+_TC_H_ROOT = 0xFFFFFFFF  # handle of root qdiscs: TC_H_ROOT of the kernel
+
+
+def sprint_rate(byte_per_sec):
+    """
+    Make a rate string in the same format as iproute2 (e.g. ``1500Kbit``).
+    """
+
+    rate = byte_per_sec * 8
+    unit_idx = 0
+
+    while unit_idx < len(_RATE_UNITS) - 1:
+        if rate < 1000:
+            break
+        if rate % 1000 != 0 and rate < 1000**2:
+            break
+
+        rate //= 1000
+        unit_idx += 1
+
+    return f"{rate:d}{_RATE_UNITS[unit_idx]:s}bit"
+
+
+def sprint_time(nsec):
+    """
+    Make a time string in the same format as iproute2 (e.g. ``10ms``).
+    """
+
+    if nsec >= 1000**3:
+        return f"{nsec / 1000**3:.3g}s"
+    if nsec >= 1000**2:
+        return f"{nsec / 1000**2:.3g}ms"
+    if nsec >= 1000:
+        return f"{nsec / 1000:.3g}us"
+
+    return f"{nsec:d}ns"
+
+
+def sprint_percentage(value):
+    """
+    Make a percentage string from a probability that scaled to 32 bits (e.g. ``0.1%``).
+    """
+
+    return f"{100 * value / _UINT32_MAX:g}%"
+
+
+def sprint_tc_handle(handle):
+    """
+    Make a qdisc/class handle string in the same format as iproute2 (e.g. ``1a1a:2``).
+    """
+
+    if handle == _TC_H_ROOT:
+        return "root"
+
+    major = handle >> 16
+    minor = handle & 0xFFFF
+
+    if major == 0:
+        return f":{minor:x}"
+    if minor == 0:
+        return f"{major:x}:"
+
+    return f"{major:x}:{minor:x}"
+
+
+def sprint_u32_handle(handle):
+    """
+    Make a u32 filter handle string in the same format as iproute2 (e.g. ``800::800``).
+    """
+
+    htid = handle >> 20
+    hash_key = (handle >> 12) & 0xFF
+    node_id = handle & 0xFFF
+    text = ""
+
+    if htid:
+        text += f"{htid:x}:"
+    if hash_key:
+        text += f"{hash_key:x}"
+    if node_id:
+        text += f":{node_id:x}"
+
+    return text
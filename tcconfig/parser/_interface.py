@@ -5,6 +5,12 @@
 import abc
 
 
+try:
+    import ujson as json
+except ImportError:
+    import json  # type: ignore
+
+
 class ParserInterface(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def parse(self, device, text):  # pragma: no cover
@@ -12,13 +18,13 @@ class ParserInterface(metaclass=abc.ABCMeta):
 
 
 class AbstractParser(ParserInterface, metaclass=abc.ABCMeta):
-    def __init__(self, con):
-        self._con = con
+    def __init__(self, store):
+        self._store = store
         self._clear()
 
     @property
-    def con(self):
-        return self._con
+    def store(self):
+        return self._store
 
     @property
     @abc.abstractmethod
@@ -35,3 +41,20 @@ class AbstractParser(ParserInterface, metaclass=abc.ABCMeta):
             return text.decode("ascii")
         except AttributeError:
             return text
+
+    @staticmethod
+    def _load_json(text):
+        """
+        :return:
+            List of objects of a ``tc -j`` output.
+            ``None`` if the text is not in JSON format.
+        """
+
+        text = AbstractParser._to_unicode(text)
+        if not text or not text.lstrip().startswith("["):
+            return None
+
+        try:
+            return json.loads(text)
+        except ValueError:
+            return None
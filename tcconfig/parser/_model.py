@@ -14,6 +14,9 @@ class Filter(Model):
     src_port = Integer(attr_name=Tc.Param.SRC_PORT)
     dst_port = Integer(attr_name=Tc.Param.DST_PORT)
 
+    # None if the filter is a u32 filter
+    classifier = Text(attr_name=Tc.Param.CLASSIFIER)
+
     classid = Text(attr_name=Tc.Param.CLASS_ID)
     handle = Integer(attr_name=Tc.Param.HANDLE)
 
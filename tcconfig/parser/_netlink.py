@@ -0,0 +1,473 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import ipaddress
+import struct
+from socket import ntohs
+
+from pyroute2 import protocols
+from pyroute2.netlink.rtnl import TC_H_INGRESS
+from pyroute2.netlink.rtnl.tcmsg.common import tick_in_usec
+
+from .._const import FilterClassifier, ShapingAlgorithm, Tc
+from .._error import NetworkInterfaceNotFoundError
+from .._htb_layout import extract_buckets, get_bucket_qdisc_major_id
+from .._logger import is_debug_enabled, logger
+from .._network import sanitize_network
+from ._class import TcClassParser
+from ._filter import TcFilterParser
+from ._format import (
+    sprint_percentage,
+    sprint_rate,
+    sprint_tc_handle,
+    sprint_time,
+    sprint_u32_handle,
+)
+from ._model import Filter, Qdisc
+
+
+_PROTOCOL_NAME_MAP = {
+    protocols.ETH_P_IP: "ip",
+    protocols.ETH_P_IPV6: "ipv6",
+    protocols.ETH_P_ALL: "all",
+}
+
+_TCA_EGRESS_REDIR = 1
+
+_NLA_HEADER_SIZE = 4
+_NLA_ALIGNTO = 4
+_NLA_TYPE_MASK = 0x3FFF
+_U32_SEL_HEADER_SIZE = 16
+_U32_KEY_SIZE = 16
+
+
+class _FlowerAttr:
+    # TCA_FLOWER_* attribute types of linux/pkt_cls.h
+    CLASSID = 1
+    KEY_IPV4_SRC = 10
+    KEY_IPV4_SRC_MASK = 11
+    KEY_IPV4_DST = 12
+    KEY_IPV4_DST_MASK = 13
+    KEY_IPV6_SRC = 14
+    KEY_IPV6_SRC_MASK = 15
+    KEY_IPV6_DST = 16
+    KEY_IPV6_DST_MASK = 17
+    KEY_TCP_SRC = 18
+    KEY_TCP_DST = 19
+    KEY_UDP_SRC = 20
+    KEY_UDP_DST = 21
+
+
+def unpack_u32_keys(sel):
+    """
+    Unpack keys of a ``tc_u32_sel`` structure.
+
+    :param bytes sel: Payload of a ``TCA_U32_SEL`` attribute.
+    :return: List of ``(value, mask, offset)`` tuples.
+    """
+
+    nkeys = sel[2]
+    keys = []
+
+    for key_idx in range(nkeys):
+        key_offset = _U32_SEL_HEADER_SIZE + key_idx * _U32_KEY_SIZE
+        mask, value = struct.unpack_from(">II", sel, key_offset)
+        (offset,) = struct.unpack_from("=i", sel, key_offset + 8)
+        keys.append((value, mask, offset))
+
+    return keys
+
+
+def unpack_nested_attrs(payload):
+    """
+    Unpack netlink attributes that nested in an attribute.
+
+    :param bytes payload: Payload of the attribute.
+    :return: Dictionary of attribute types and payloads of the attributes.
+    """
+
+    attrs = {}
+    offset = 0
+
+    while offset + _NLA_HEADER_SIZE <= len(payload):
+        length, attr_type = struct.unpack_from("=HH", payload, offset)
+        if length < _NLA_HEADER_SIZE:
+            break
+
+        attrs[attr_type & _NLA_TYPE_MASK] = payload[offset + _NLA_HEADER_SIZE : offset + length]
+        offset += (length + _NLA_ALIGNTO - 1) & ~(_NLA_ALIGNTO - 1)
+
+    return attrs
+
+
+def _to_prefixlen(mask):
+    return bin(mask).count("1")
+
+
+class TcNetlinkParser:
+    """
+    Parse tc configurations of a device from rtnetlink dump messages
+    and store them in the same way as the text parsers of ``tc show`` outputs.
+    """
+
+    def __init__(self, store, ip_version, ipr):
+        self.__store = store
+        self.__ip_version = ip_version
+        self.__ipr = ipr
+
+    def parse_incoming_device(self, device):
+        """
+        :return: ifb device name that incoming packets of the device are redirected to.
+        """
+
+        for tc_filter in self.__ipr.get_filters(
+            index=self.__get_ifindex(device), parent=TC_H_INGRESS
+        ):
+            options = tc_filter.get_attr("TCA_OPTIONS")
+            if options is None:
+                continue
+
+            for action in (options.get_attr("TCA_U32_ACT") or {}).get("attrs", []):
+                action = action[1]
+                if action.get_attr("TCA_ACT_KIND") != "mirred":
+                    continue
+
+                parms = action.get_attr("TCA_ACT_OPTIONS").get_attr("TCA_MIRRED_PARMS")
+                if parms["eaction"] != _TCA_EGRESS_REDIR:
+                    continue
+
+                return self.__get_ifname(parms["ifindex"])
+
+        return None
+
+    def parse(self, device):
+        ifindex = self.__get_ifindex(device)
+
+        self.__parse_class(device, self.__ipr.get_classes(index=ifindex))
+        self.__parse_filter(device, self.__ipr.get_filters(index=ifindex))
+
+        # filters of bucket qdiscs of hierarchical HTB layouts are dumped for each qdisc
+        for bucket in extract_buckets(self.__store.select_classes(device)):
+            self.__parse_filter(
+                device,
+                self.__ipr.get_filters(
+                    index=ifindex, parent=get_bucket_qdisc_major_id(bucket) << 16
+                ),
+            )
+
+        self.__parse_qdisc(device, self.__ipr.get_qdiscs(index=ifindex))
+
+    def __get_ifindex(self, device):
+        index_list = self.__ipr.link_lookup(ifname=device)
+        if not index_list:
+            raise NetworkInterfaceNotFoundError(target=device)
+
+        return index_list[0]
+
+    def __get_ifname(self, ifindex):
+        for link in self.__ipr.get_links(ifindex):
+            return link.get_attr("IFLA_IFNAME")
+
+        return None
+
+    def __parse_class(self, device, tc_classes):
+        entry_list = []
+
+        for tc_class in tc_classes:
+            classid = None
+            rate = None
+
+            if tc_class.get_attr("TCA_KIND") == ShapingAlgorithm.HTB.value:
+                options = tc_class.get_attr("TCA_OPTIONS")
+                classid = sprint_tc_handle(tc_class["handle"])
+                byte_per_sec = options.get_attr("TCA_HTB_RATE64") or options.get_attr(
+                    "TCA_HTB_PARMS"
+                ).get("rate")
+                rate = sprint_rate(byte_per_sec).rstrip("bit") + "bps"
+
+            entry_list.append(
+                {
+                    TcClassParser.Key.DEVICE: device,
+                    TcClassParser.Key.CLASS_ID: classid,
+                    TcClassParser.Key.RATE: rate,
+                }
+            )
+
+        if is_debug_enabled():
+            logger.debug(f"netlink class parse result: {entry_list}")
+
+        if entry_list:
+            self.__store.insert_classes(entry_list)
+
+    def __parse_filter(self, device, tc_filters):
+        for tc_filter in tc_filters:
+            kind = tc_filter.get_attr("TCA_KIND")
+            options = tc_filter.get_attr("TCA_OPTIONS")
+            if options is None:
+                continue
+
+            if kind == "fw":
+                classid = options.get_attr("TCA_FW_CLASSID")
+                if classid is None:
+                    continue
+
+                self.__store.insert_filter(
+                    Filter(
+                        **{
+                            Tc.Param.DEVICE: device,
+                            Tc.Param.CLASS_ID: sprint_tc_handle(classid),
+                            Tc.Param.HANDLE: tc_filter["handle"],
+                        }
+                    )
+                )
+                continue
+
+            if kind == FilterClassifier.FLOWER.value:
+                # flower options are not decoded by pyroute2
+                self.__parse_flower_filter(
+                    device,
+                    tc_filter,
+                    unpack_nested_attrs(
+                        bytes(
+                            options.data[
+                                options.offset + _NLA_HEADER_SIZE : options.offset + options.length
+                            ]
+                        )
+                    ),
+                )
+                continue
+
+            if kind != "u32":
+                continue
+
+            flowid = options.get_attr("TCA_U32_CLASSID")
+            if flowid is None:
+                # hash table or divisor entries
+                continue
+
+            params = self.__make_u32_filter_params(self.__get_u32_keys(options))
+            protocol = ntohs(tc_filter["info"] & 0xFFFF)
+            filter_record = Filter(
+                device=device,
+                filter_id=sprint_u32_handle(tc_filter["handle"]),
+                flowid=sprint_tc_handle(flowid),
+                protocol=_PROTOCOL_NAME_MAP.get(protocol, f"{protocol:04x}"),
+                priority=tc_filter["info"] >> 16,
+                src_network=sanitize_network(params.get(Tc.Param.SRC_NETWORK), self.__ip_version),
+                dst_network=sanitize_network(params.get(Tc.Param.DST_NETWORK), self.__ip_version),
+                src_port=params.get(Tc.Param.SRC_PORT),
+                dst_port=params.get(Tc.Param.DST_PORT),
+            )
+            if is_debug_enabled():
+                logger.debug(f"store filter: {filter_record}")
+            self.__store.insert_filter(filter_record)
+
+    def __parse_flower_filter(self, device, tc_filter, attrs):
+        if _FlowerAttr.CLASSID not in attrs:
+            return
+
+        params = {}
+        if self.__ip_version == 4:
+            network_attrs = (
+                (Tc.Param.SRC_NETWORK, _FlowerAttr.KEY_IPV4_SRC, _FlowerAttr.KEY_IPV4_SRC_MASK),
+                (Tc.Param.DST_NETWORK, _FlowerAttr.KEY_IPV4_DST, _FlowerAttr.KEY_IPV4_DST_MASK),
+            )
+        else:
+            network_attrs = (
+                (Tc.Param.SRC_NETWORK, _FlowerAttr.KEY_IPV6_SRC, _FlowerAttr.KEY_IPV6_SRC_MASK),
+                (Tc.Param.DST_NETWORK, _FlowerAttr.KEY_IPV6_DST, _FlowerAttr.KEY_IPV6_DST_MASK),
+            )
+
+        for key, value_attr, mask_attr in network_attrs:
+            if value_attr not in attrs:
+                continue
+
+            address = ipaddress.ip_address(attrs[value_attr])
+            prefixlen = _to_prefixlen(int.from_bytes(attrs[mask_attr], "big"))
+            params[key] = ipaddress.ip_network(f"{address}/{prefixlen:d}", strict=False).compressed
+
+        for key, port_attrs in (
+            (Tc.Param.SRC_PORT, (_FlowerAttr.KEY_TCP_SRC, _FlowerAttr.KEY_UDP_SRC)),
+            (Tc.Param.DST_PORT, (_FlowerAttr.KEY_TCP_DST, _FlowerAttr.KEY_UDP_DST)),
+        ):
+            for port_attr in port_attrs:
+                if port_attr in attrs:
+                    params[key] = struct.unpack(">H", attrs[port_attr])[0]
+
+        (classid,) = struct.unpack("=I", attrs[_FlowerAttr.CLASSID])
+        protocol = ntohs(tc_filter["info"] & 0xFFFF)
+        filter_record = Filter(
+            device=device,
+            filter_id=f"0x{tc_filter['handle']:x}",
+            flowid=sprint_tc_handle(classid),
+            protocol=_PROTOCOL_NAME_MAP.get(protocol, f"{protocol:04x}"),
+            priority=tc_filter["info"] >> 16,
+            src_network=sanitize_network(params.get(Tc.Param.SRC_NETWORK), self.__ip_version),
+            dst_network=sanitize_network(params.get(Tc.Param.DST_NETWORK), self.__ip_version),
+            src_port=params.get(Tc.Param.SRC_PORT),
+            dst_port=params.get(Tc.Param.DST_PORT),
+            classifier=FilterClassifier.FLOWER.value,
+        )
+        if is_debug_enabled():
+            logger.debug(f"store filter: {filter_record}")
+        self.__store.insert_filter(filter_record)
+
+    @staticmethod
+    def __get_u32_keys(options):
+        for name, sel in options["attrs"]:
+            if name != "TCA_U32_SEL":
+                continue
+
+            # decode the attribute by ourselves since keys are not decoded properly
+            # by some versions of pyroute2
+            return unpack_u32_keys(
+                bytes(sel.data[sel.offset + _NLA_HEADER_SIZE : sel.offset + sel.length])
+            )
+
+        return []
+
+    def __make_u32_filter_params(self, keys):
+        if self.__ip_version == 4:
+            return self.__make_u32_filter_params_ipv4(keys)
+
+        if self.__ip_version == 6:
+            return self.__make_u32_filter_params_ipv6(keys)
+
+        raise ValueError(f"unknown ip version: {self.__ip_version}")
+
+    @staticmethod
+    def __make_port_params(value):
+        # the upper half represents the source port and
+        # the bottom half represents the destination port.
+        src_port = value >> 16
+        dst_port = value & 0xFFFF
+
+        return {
+            Tc.Param.SRC_PORT: src_port if src_port != 0 else None,
+            Tc.Param.DST_PORT: dst_port if dst_port != 0 else None,
+        }
+
+    def __make_u32_filter_params_ipv4(self, keys):
+        params = {}
+        match_id = TcFilterParser.FilterMatchIdIpv4
+        ipv6_match_ids = (
+            TcFilterParser.FilterMatchIdIpv6.INCOMING_NETWORK_LIST
+            + TcFilterParser.FilterMatchIdIpv6.OUTGOING_NETWORK_LIST
+            + [TcFilterParser.FilterMatchIdIpv6.PORT]
+        )
+
+        for value, mask, offset in keys:
+            network = f"{ipaddress.IPv4Address(value)}/{_to_prefixlen(mask):d}"
+
+            if offset == match_id.INCOMING_NETWORK:
+                params[Tc.Param.SRC_NETWORK] = network
+            elif offset == match_id.OUTGOING_NETWORK:
+                params[Tc.Param.DST_NETWORK] = network
+            elif offset == match_id.PORT:
+                params.update(self.__make_port_params(value))
+            elif offset in ipv6_match_ids:
+                logger.warning(
+                    "unknown match id for an IPv4 filter: might be an IPv6 filter. "
+                    f"try to use --ipv6 option. (id={offset})"
+                )
+            elif is_debug_enabled():
+                logger.debug(f"unknown match id: {offset}")
+
+        return params
+
+    def __make_u32_filter_params_ipv6(self, keys):
+        params = {}
+        match_id = TcFilterParser.FilterMatchIdIpv6
+        src_words = [0] * 4
+        dst_words = [0] * 4
+        src_prefixlen = 0
+        dst_prefixlen = 0
+        has_network = False
+
+        for value, mask, offset in keys:
+            if offset in match_id.INCOMING_NETWORK_LIST:
+                src_words[match_id.INCOMING_NETWORK_LIST.index(offset)] = value
+                src_prefixlen += _to_prefixlen(mask)
+                has_network = True
+            elif offset in match_id.OUTGOING_NETWORK_LIST:
+                dst_words[match_id.OUTGOING_NETWORK_LIST.index(offset)] = value
+                dst_prefixlen += _to_prefixlen(mask)
+                has_network = True
+            elif offset == match_id.PORT:
+                params.update(self.__make_port_params(value))
+            elif is_debug_enabled():
+                logger.debug(f"unknown match id: {offset}")
+
+        if has_network:
+            for key, words, prefixlen in (
+                (Tc.Param.SRC_NETWORK, src_words, src_prefixlen),
+                (Tc.Param.DST_NETWORK, dst_words, dst_prefixlen),
+            ):
+                address = ipaddress.IPv6Address(struct.pack(">4I", *words))
+                params[key] = ipaddress.IPv6Network(
+                    f"{address}/{prefixlen:d}", strict=False
+                ).compressed
+
+        return params
+
+    def __parse_qdisc(self, device, qdiscs):
+        for qdisc in qdiscs:
+            kind = qdisc.get_attr("TCA_KIND")
+            options = qdisc.get_attr("TCA_OPTIONS")
+
+            if kind == ShapingAlgorithm.TBF.value:
+                params = {
+                    Tc.Param.DEVICE: device,
+                    "rate": self.__strip_rate_unit(options.get_attr("TCA_TBF_PARMS").get("rate")),
+                }
+            elif kind == "netem":
+                params = self.__make_netem_params(options)
+                params.update(
+                    {
+                        Tc.Param.DEVICE: device,
+                        Tc.Param.PARENT: sprint_tc_handle(qdisc["parent"]),
+                        Tc.Param.HANDLE: sprint_tc_handle(qdisc["handle"]),
+                    }
+                )
+            else:
+                continue
+
+            if is_debug_enabled():
+                logger.debug(f"parse a qdisc entry: {params}")
+            self.__store.insert_qdisc(Qdisc(**params))
+
+    @staticmethod
+    def __strip_rate_unit(byte_per_sec):
+        # the text parser strips the 'bit' suffix of rates
+        return sprint_rate(byte_per_sec).rstrip("bit")
+
+    def __make_netem_params(self, options):
+        params = {"limit": options.get("limit")}
+
+        delay = options.get("delay")
+        if delay:
+            params["delay"] = sprint_time(self.__tick_to_nsec(delay))
+
+            jitter = options.get("jitter")
+            if jitter:
+                params["delay-distro"] = sprint_time(self.__tick_to_nsec(jitter))
+
+        for key, value in (
+            ("loss", options.get("loss")),
+            ("duplicate", options.get("duplicate")),
+            ("corrupt", (options.get_attr("TCA_NETEM_CORRUPT") or {}).get("prob_corrupt")),
+            ("reorder", (options.get_attr("TCA_NETEM_REORDER") or {}).get("prob_reorder")),
+        ):
+            if value:
+                params[key] = sprint_percentage(value)
+
+        netem_rate = options.get_attr("TCA_NETEM_RATE")
+        if netem_rate and netem_rate.get("rate"):
+            params["rate"] = self.__strip_rate_unit(netem_rate.get("rate"))
+
+        return params
+
+    @staticmethod
+    def __tick_to_nsec(tick):
+        return round(tick / tick_in_usec) * 1000
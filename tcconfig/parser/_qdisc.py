@@ -3,12 +3,13 @@
 """
 
 import re
+from typing import ClassVar
 
-import pyparsing as pp
 import typepy
 
-from .._const import Tc, TcSubCommand
-from .._logger import logger
+from .._const import ShapingAlgorithm, Tc, TcSubCommand
+from .._logger import is_debug_enabled, logger
+from ._format import sprint_rate, sprint_time
 from ._interface import AbstractParser
 from ._model import Qdisc
 
@@ -16,10 +17,66 @@ from ._model import Qdisc
 class TcQdiscParser(AbstractParser):
     __RE_DIRECT_QLEN = re.compile("direct_qlen (?P<number>[0-9]+)")
 
+    __PARAM_VALUE_REGEXPS: ClassVar[dict] = {
+        "parent": re.compile("[0-9a-fA-F:]+"),
+        "netem": re.compile("[0-9a-fA-F:]+"),
+        "delay": re.compile("[0-9.msu]+"),
+        "loss": re.compile("[0-9.%]+"),
+        "duplicate": re.compile("[0-9.%]+"),
+        "corrupt": re.compile("[0-9.%]+"),
+        "reorder": re.compile("[0-9.%]+"),
+        "limit": re.compile("[0-9]+"),
+        "rate": re.compile("[0-9a-zA-Z.:]+"),
+    }
+    __PARAM_KEYS: ClassVar[dict] = {"netem": Tc.Param.HANDLE}
+
     @property
     def _tc_subcommand(self):
         return TcSubCommand.QDISC.value
 
+    @classmethod
+    def tokenize_line(cls, line):
+        """
+        Extract netem/tbf parameters from a qdisc line of ``tc qdisc show`` output
+        with a single scan of the tokens of the line.
+        The value of a parameter is the head of the token that follows the parameter name,
+        and only the first occurrence of each parameter name is used.
+
+        :return: Mapping of parameter names to the values.
+        :rtype: dict
+        """
+
+        params = {}
+        is_netem = line.startswith("qdisc netem ")
+        tokens = line.split()
+        parsed_names = set()
+
+        for idx, token in enumerate(tokens[:-1]):
+            value_regexp = cls.__PARAM_VALUE_REGEXPS.get(token)
+            if value_regexp is None or token in parsed_names:
+                continue
+
+            parsed_names.add(token)
+
+            if token == "parent" and not is_netem:
+                continue
+
+            match = value_regexp.match(tokens[idx + 1])
+            if match is None:
+                continue
+
+            value = match.group()
+            if token == "rate":
+                value = value.rstrip("bit")
+            elif token == "delay" and idx + 2 < len(tokens):
+                distro_match = value_regexp.match(tokens[idx + 2])
+                if distro_match is not None:
+                    params["delay-distro"] = distro_match.group()
+
+            params[cls.__PARAM_KEYS.get(token, token)] = value
+
+        return params
+
     def __parse_direct_qlen(self, line):
         m = self.__RE_DIRECT_QLEN.search(line)
         if m is None:
@@ -33,6 +90,11 @@ class TcQdiscParser(AbstractParser):
         if typepy.is_null_string(text):
             return []
 
+        objects = self._load_json(text)
+        if objects is not None:
+            self.__parse_json(device, objects)
+            return
+
         text = text.strip()
 
         for line in text.splitlines():
@@ -41,71 +103,73 @@ class TcQdiscParser(AbstractParser):
 
             line = self._to_unicode(line.lstrip())
 
-            if re.search("^qdisc netem |^qdisc htb |^qdisc tbf ", line) is None:
-                continue
-
-            if re.search("^qdisc htb ", line) is not None:
+            if line.startswith("qdisc htb "):
                 self.__parse_direct_qlen(line)
                 continue
 
-            if re.search("^qdisc netem ", line) is not None:
-                self.__parse_netem_param(line, "parent", pp.hexnums + ":")
+            if not line.startswith(("qdisc netem ", "qdisc tbf ")):
+                continue
 
             self.__parsed_param[Tc.Param.DEVICE] = device
-            self.__parse_netem_param(line, "netem", pp.hexnums + ":", "handle")
-            self.__parse_netem_param(line, "delay", pp.nums + ".msu")
-            self.__parse_netem_delay_distro(line)
-            self.__parse_netem_param(line, "loss", pp.nums + ".%")
-            self.__parse_netem_param(line, "duplicate", pp.nums + ".%")
-            self.__parse_netem_param(line, "corrupt", pp.nums + ".%")
-            self.__parse_netem_param(line, "reorder", pp.nums + ".%")
-            self.__parse_netem_param(line, "limit", pp.nums)
-            self.__parse_bandwidth_rate(line)
+            self.__parsed_param.update(self.tokenize_line(line))
 
-            logger.debug(f"parse a qdisc entry: {self.__parsed_param}")
+            if is_debug_enabled():
+                logger.debug(f"parse a qdisc entry: {self.__parsed_param}")
 
-            Qdisc.insert(Qdisc(**self.__parsed_param))
+            self._store.insert_qdisc(Qdisc(**self.__parsed_param))
 
             self._clear()
 
     def _clear(self):
         self.__parsed_param = {}
 
-    def __parse_netem_delay_distro(self, line):
-        parse_param_name = "delay"
-        pattern = (
-            pp.SkipTo(parse_param_name, include=True)
-            + pp.Word(pp.nums + ".msu")
-            + pp.Word(pp.nums + ".msu")
-        )
-
-        try:
-            parsed_list = pattern.parseString(line)
-            self.__parsed_param[parse_param_name] = parsed_list[2]
-            self.__parsed_param["delay-distro"] = parsed_list[3]
-        except pp.ParseException:
-            pass
-
-    def __parse_netem_param(self, line, parse_param_name, word_pattern, key_name=None):
-        pattern = pp.SkipTo(parse_param_name, include=True) + pp.Word(word_pattern)
-        if not key_name:
-            key_name = parse_param_name
-
-        try:
-            result = pattern.parseString(line)[-1]
-            if typepy.is_not_null_string(result):
-                self.__parsed_param[key_name] = result
-        except pp.ParseException:
-            pass
-
-    def __parse_bandwidth_rate(self, line):
-        parse_param_name = "rate"
-        pattern = pp.SkipTo(parse_param_name, include=True) + pp.Word(pp.alphanums + "." + ":")
-
-        try:
-            result = pattern.parseString(line)[-1]
-            if typepy.is_not_null_string(result):
-                result = result.rstrip("bit")
-                self.__parsed_param[parse_param_name] = result
-        except pp.ParseException:
-            pass
+    def __parse_json(self, device, qdiscs):
+        for qdisc in qdiscs:
+            kind = qdisc.get("kind")
+            if kind not in ("netem", ShapingAlgorithm.TBF.value):
+                continue
+
+            options = qdisc.get("options", {})
+
+            self.__parsed_param[Tc.Param.DEVICE] = device
+            if kind == "netem":
+                self.__parsed_param[Tc.Param.PARENT] = qdisc.get("parent")
+                self.__parsed_param[Tc.Param.HANDLE] = qdisc.get("handle")
+                self.__parsed_param["limit"] = options.get("limit")
+                self.__parse_netem_json_options(options)
+            else:
+                self.__parse_json_rate(options.get("rate"))
+
+            if is_debug_enabled():
+                logger.debug(f"parse a qdisc entry: {self.__parsed_param}")
+
+            self._store.insert_qdisc(Qdisc(**self.__parsed_param))
+
+            self._clear()
+
+    def __parse_netem_json_options(self, options):
+        delay = options.get("delay", {})
+        if delay.get("delay"):
+            # times are in seconds
+            self.__parsed_param["delay"] = sprint_time(round(delay["delay"] * 1000**3))
+
+            if delay.get("jitter"):
+                self.__parsed_param["delay-distro"] = sprint_time(round(delay["jitter"] * 1000**3))
+
+        for key, json_key in (
+            ("loss", "loss-random"),
+            ("duplicate", "duplicate"),
+            ("corrupt", "corrupt"),
+            ("reorder", "reorder"),
+        ):
+            # probabilities are in the range of [0, 1]
+            probability = options.get(json_key, {}).get(key)
+            if probability:
+                self.__parsed_param[key] = f"{probability * 100:g}%"
+
+        self.__parse_json_rate(options.get("rate", {}).get("rate"))
+
+    def __parse_json_rate(self, rate):
+        if rate:
+            # rates are in bytes per second
+            self.__parsed_param["rate"] = sprint_rate(rate).rstrip("bit")
@@ -0,0 +1,319 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import abc
+import itertools
+from collections import defaultdict
+
+from simplesqlite import TableNotFoundError
+from simplesqlite.model import Integer
+from simplesqlite.query import And, Where
+
+from .._const import Tc, TcSubCommand
+from ._class import TcClassParser
+from ._model import Filter, Qdisc
+
+
+class RuleStoreInterface(metaclass=abc.ABCMeta):
+    """
+    Storage of parsed tc configurations (filters, qdiscs and classes) of devices.
+    """
+
+    @property
+    @abc.abstractmethod
+    def con(self):  # pragma: no cover
+        """
+        :return: SQLite database connection of the store. ``None`` if the store is not SQLite.
+        """
+
+    @abc.abstractmethod
+    def clear(self):  # pragma: no cover
+        ...
+
+    @abc.abstractmethod
+    def insert_filter(self, record):  # pragma: no cover
+        ...
+
+    @abc.abstractmethod
+    def insert_qdisc(self, record):  # pragma: no cover
+        ...
+
+    @abc.abstractmethod
+    def insert_classes(self, entry_list):  # pragma: no cover
+        ...
+
+    @abc.abstractmethod
+    def select_filters(self, device=None, filter_id=None):  # pragma: no cover
+        """
+        :return: List of ``Filter`` records that matched the conditions.
+        """
+
+    @abc.abstractmethod
+    def find_filters(
+        self, device, protocol, dst_network, src_network, dst_port, src_port
+    ):  # pragma: no cover
+        """
+        :return:
+            List of ``Filter`` records that exactly matched the conditions.
+            ``None`` values match to records that have no value for the attribute.
+        """
+
+    @abc.abstractmethod
+    def select_qdiscs(self, device, parent):  # pragma: no cover
+        """
+        :return:
+            List of ``Qdisc`` records that exactly matched the conditions.
+            ``None`` values match to records that have no value for the attribute.
+        """
+
+    @abc.abstractmethod
+    def select_all_qdiscs(self):  # pragma: no cover
+        ...
+
+    @abc.abstractmethod
+    def select_classes(self, device, classid_list=None):  # pragma: no cover
+        """
+        :return:
+            List of class entries (dictionaries) of the device.
+            Entries are limited to those which have a class id in the ``classid_list``
+            if the list is specified.
+        """
+
+    @abc.abstractmethod
+    def fetch_num_filters(self):  # pragma: no cover
+        ...
+
+
+def _to_integer(value):
+    # numeric strings are stored as integers to INTEGER columns of SQLite
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+
+    return value
+
+
+class HashRuleStore(RuleStoreInterface):
+    """
+    Rule store that holds records in memory with hash indexes of:
+
+    - ``(device, protocol, dst_network, src_network, dst_port, src_port)`` for filters
+    - ``(device, parent)`` for qdiscs
+    - ``(device, classid)`` for classes: looked up by flow ids/class ids of filters
+    """
+
+    @property
+    def con(self):
+        return None
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.__filters = []
+        self.__filter_device_index = defaultdict(list)
+        self.__filter_condition_index = defaultdict(list)
+        self.__qdiscs = []
+        self.__qdisc_index = defaultdict(list)
+        self.__class_index = defaultdict(list)
+        self.__class_device_index = defaultdict(list)
+        self.__class_seq = itertools.count()
+
+    def insert_filter(self, record):
+        record = self.__normalize(record)
+
+        self.__filters.append(record)
+        self.__filter_device_index[record.device].append(record)
+        self.__filter_condition_index[
+            self.__make_filter_key(
+                record.device,
+                record.protocol,
+                record.dst_network,
+                record.src_network,
+                record.dst_port,
+                record.src_port,
+            )
+        ].append(record)
+
+    def insert_qdisc(self, record):
+        record = self.__normalize(record)
+
+        self.__qdiscs.append(record)
+        self.__qdisc_index[(record.device, record.parent)].append(record)
+
+    def insert_classes(self, entry_list):
+        for entry in entry_list:
+            entry = (next(self.__class_seq), dict(entry))
+            device = entry[1].get(TcClassParser.Key.DEVICE)
+
+            self.__class_index[(device, entry[1].get(TcClassParser.Key.CLASS_ID))].append(entry)
+            self.__class_device_index[device].append(entry)
+
+    def select_filters(self, device=None, filter_id=None):
+        records = self.__filters if device is None else self.__filter_device_index.get(device, [])
+        if filter_id is None:
+            return list(records)
+
+        return [record for record in records if record.filter_id == filter_id]
+
+    def find_filters(self, device, protocol, dst_network, src_network, dst_port, src_port):
+        return list(
+            self.__filter_condition_index.get(
+                self.__make_filter_key(
+                    device, protocol, dst_network, src_network, dst_port, src_port
+                ),
+                [],
+            )
+        )
+
+    def select_qdiscs(self, device, parent):
+        return list(self.__qdisc_index.get((device, parent), []))
+
+    def select_all_qdiscs(self):
+        return list(self.__qdiscs)
+
+    def select_classes(self, device, classid_list=None):
+        if classid_list is None:
+            entries = self.__class_device_index.get(device, [])
+        else:
+            # keep the insertion order of entries as well as the SQLite store
+            entries = sorted(
+                itertools.chain.from_iterable(
+                    self.__class_index.get((device, classid), []) for classid in set(classid_list)
+                ),
+                key=lambda entry: entry[0],
+            )
+
+        return [dict(entry) for _seq, entry in entries]
+
+    def fetch_num_filters(self):
+        return len(self.__filters)
+
+    @staticmethod
+    def __make_filter_key(device, protocol, dst_network, src_network, dst_port, src_port):
+        return (
+            device,
+            protocol,
+            dst_network,
+            src_network,
+            _to_integer(dst_port),
+            _to_integer(src_port),
+        )
+
+    @staticmethod
+    def __normalize(record):
+        # convert values to the column types as SQLite does for the records
+        model = type(record)
+        values = {}
+
+        for attr_name in model.get_attr_names():
+            value = getattr(record, attr_name)
+
+            if value is not None:
+                if isinstance(model._get_col(attr_name, validate_name=False), Integer):
+                    value = _to_integer(value)
+                elif not isinstance(value, str):
+                    value = str(value)
+
+            values[attr_name] = value
+
+        return model(**values)
+
+
+class SqliteRuleStore(RuleStoreInterface):
+    """
+    Rule store that holds records in a SQLite database.
+    Used to dump parsed tc configurations to a database file.
+    """
+
+    @property
+    def con(self):
+        return self.__con
+
+    def __init__(self, con):
+        self.__con = con
+        self.__attach()
+        self.__create_tables()
+
+    def clear(self):
+        for table_name in (
+            Filter.get_table_name(),
+            Qdisc.get_table_name(),
+            TcSubCommand.CLASS.value,
+        ):
+            self.__con.drop_table(table_name)
+
+        self.__create_tables()
+
+    def insert_filter(self, record):
+        Filter.insert(record)
+
+    def insert_qdisc(self, record):
+        Qdisc.insert(record)
+
+    def insert_classes(self, entry_list):
+        self.__con.create_table_from_data_matrix(
+            TcSubCommand.CLASS.value, TcClassParser.Key.LIST, entry_list
+        )
+
+    def select_filters(self, device=None, filter_id=None):
+        where_list = []
+        if device is not None:
+            where_list.append(Where(Tc.Param.DEVICE, device))
+        if filter_id is not None:
+            where_list.append(Where(Tc.Param.FILTER_ID, filter_id))
+
+        return self.__select(Filter, where_list)
+
+    def find_filters(self, device, protocol, dst_network, src_network, dst_port, src_port):
+        return self.__select(
+            Filter,
+            [
+                Where(Tc.Param.DEVICE, device),
+                Where(Tc.Param.PROTOCOL, protocol),
+                Where(Tc.Param.DST_NETWORK, dst_network),
+                Where(Tc.Param.SRC_NETWORK, src_network),
+                Where(Tc.Param.DST_PORT, dst_port),
+                Where(Tc.Param.SRC_PORT, src_port),
+            ],
+        )
+
+    def select_qdiscs(self, device, parent):
+        return self.__select(
+            Qdisc, [Where(Tc.Param.DEVICE, device), Where(Tc.Param.PARENT, parent)]
+        )
+
+    def select_all_qdiscs(self):
+        return self.__select(Qdisc, [])
+
+    def select_classes(self, device, classid_list=None):
+        try:
+            entries = self.__con.select_as_dict(
+                table_name=TcSubCommand.CLASS.value, where=Where(Tc.Param.DEVICE, device)
+            )
+        except TableNotFoundError:
+            return []
+
+        if classid_list is None:
+            return entries
+
+        return [entry for entry in entries if entry.get(Tc.Param.CLASS_ID) in classid_list]
+
+    def fetch_num_filters(self):
+        return Filter.fetch_num_records()
+
+    def __attach(self):
+        # models are attached to a database per class. attaching models to another database
+        # closes the database that previously attached: only the latest store is available.
+        Filter.attach(self.__con)
+        Qdisc.attach(self.__con)
+
+    def __create_tables(self):
+        Filter.create()
+        Qdisc.create()
+
+    def __select(self, model, where_list):
+        try:
+            return list(model.select(where=And(where_list) if where_list else None))
+        except TableNotFoundError:
+            return []
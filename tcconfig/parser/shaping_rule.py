@@ -5,28 +5,77 @@
 import copy
 from collections import OrderedDict
 
-import subprocrunner
 import typepy
-from simplesqlite import SimpleSQLite, TableNotFoundError, connect_memdb
-from simplesqlite.query import And, Where
+from simplesqlite import SimpleSQLite, connect_memdb
 
-from .._common import is_execute_tc_command
-from .._const import Tc, TcSubCommand, TrafficDirection
+from .._common import get_device_state_cache, get_execution_backend, is_execute_tc_command
+from .._const import ExecutionBackend, Tc, TcSubCommand, TrafficDirection
 from .._error import NetworkInterfaceNotFoundError
+from .._htb_layout import extract_buckets, get_bucket_of_bucket_class, get_bucket_qdisc_major_id
+from .._iproute2 import get_iproute2_features
 from .._iptables import IptablesMangleController
-from .._logger import LogLevel
+from .._journal import CommandKind, JournaledRunner
+from .._logger import LogLevel, is_debug_enabled
 from .._network import is_anywhere_network
-from .._tc_command_helper import get_tc_base_command, run_tc_show
+from .._profiler import SpanCategory, profile_span
+from .._tc_command_helper import (
+    get_device_qdisc_major_id,
+    get_tc_base_command,
+    is_json_output_supported,
+    run_tc_filter_show_batch,
+    run_tc_show,
+    run_tc_show_batch,
+)
 from ._class import TcClassParser
 from ._filter import TcFilterParser
-from ._model import Filter, Qdisc
 from ._qdisc import TcQdiscParser
+from ._store import HashRuleStore, SqliteRuleStore
+
+
+def get_shaping_rule_parser(device, ip_version, logger, tc_command_output):
+    """
+    Get a ``TcShapingRuleParser`` instance of a device.
+    The instance is shared within a ``device_state_cache_context``
+    until the cache is invalidated.
+    """
+
+    cache = get_device_state_cache()
+    if cache is None:
+        return TcShapingRuleParser(
+            device=device,
+            ip_version=ip_version,
+            logger=logger,
+            tc_command_output=tc_command_output,
+        )
+
+    key = (device, ip_version, tc_command_output)
+    rule_parser = cache.get_rule_parser(key)
+    if rule_parser is None:
+        rule_parser = TcShapingRuleParser(
+            device=device,
+            ip_version=ip_version,
+            logger=logger,
+            tc_command_output=tc_command_output,
+        )
+        cache.set_rule_parser(key, rule_parser)
+
+    return rule_parser
 
 
 class TcShapingRuleParser:
     @property
     def con(self):
-        return self.__con
+        """
+        :return:
+            SQLite database connection that parsed tc configurations are stored.
+            ``None`` if neither ``export_path`` nor ``dump_db_path`` is specified.
+        """
+
+        return self.__store.con
+
+    @property
+    def store(self):
+        return self.__store
 
     @property
     def device(self):
@@ -46,16 +95,12 @@ class TcShapingRuleParser:
         is_parse_filter_id=True,
         dump_db_path=None,
     ):
-        if dump_db_path is None:
-            self.__con = connect_memdb()
+        if dump_db_path is not None:
+            self.__store = SqliteRuleStore(SimpleSQLite(dump_db_path, "w"))
+        elif export_path is not None:
+            self.__store = SqliteRuleStore(connect_memdb())
         else:
-            self.__con = SimpleSQLite(dump_db_path, "w")
-
-        Filter.attach(self.__con)
-        Filter.create()
-
-        Qdisc.attach(self.__con)
-        Qdisc.create()
+            self.__store = HashRuleStore()
 
         self.__device = device
         self.__ip_version = ip_version
@@ -64,15 +109,28 @@ class TcShapingRuleParser:
         self.__export_path = export_path
 
         self.clear()
-        self.__ifb_device = self.__get_ifb_from_device()
+        if self.__is_netlink_read():
+            self.__ifb_device = self.__netlink_parser.parse_incoming_device(self.device)
+        elif self.__is_batch_read():
+            self.__ifb_device = self.__prefetch_in_batch()
+        else:
+            self.__ifb_device = self.__get_ifb_from_device()
 
         self.__iptables_ctrl = IptablesMangleController(True, ip_version)
 
         self.is_parse_filter_id = is_parse_filter_id
 
     def clear(self):
-        self.__filter_parser = TcFilterParser(self.__con, self.__ip_version)
+        self.__store.clear()
+        self.__filter_parser = TcFilterParser(self.__store, self.__ip_version)
+        self.__netlink_parser = None
+        if self.__is_netlink_read():
+            from .._netlink import get_iproute
+            from ._netlink import TcNetlinkParser
+
+            self.__netlink_parser = TcNetlinkParser(self.__store, self.__ip_version, get_iproute())
         self.__parsed_mappings = {}
+        self.__show_outputs = {}
 
     def extract_export_parameters(self):
         _, out_rules = self.__get_shaping_rule(self.device)
@@ -118,18 +176,110 @@ class TcShapingRuleParser:
         if self.__parsed_mappings.get(device):
             return
 
+        if self.__netlink_parser is not None:
+            with profile_span("parse netlink", SpanCategory.PARSE, device=device):
+                self.__netlink_parser.parse(device)
+            self.__parsed_mappings[device] = True
+            return
+
+        if self.__is_batch_read() and device not in self.__show_outputs:
+            self.__fetch_in_batch(device)
+
         self.__parse_tc_class(device)
         self.__parse_tc_filter(device)
+        self.__parse_tc_bucket_filter(device)
         self.__parse_tc_qdisc(device)
 
         self.__parsed_mappings[device] = True
 
+    def __is_batch_read(self):
+        return (
+            is_execute_tc_command(self.__tc_command_output)
+            and get_execution_backend() == ExecutionBackend.BATCH
+            and get_iproute2_features().is_batch_supported
+        )
+
+    def __is_netlink_read(self):
+        return (
+            is_execute_tc_command(self.__tc_command_output)
+            and get_execution_backend() == ExecutionBackend.NETLINK
+        )
+
+    def __prefetch_in_batch(self):
+        """
+        Fetch tc configurations of the device and the ifb device that is expected to
+        be associated with the device with a single tc command execution.
+
+        :return: ifb device name associated with the device.
+        """
+
+        expected_ifb_device = f"ifb{get_device_qdisc_major_id(self.device):d}"
+        show_items = [(TcSubCommand.FILTER, f"dev {self.device:s} root")]
+        for device in (self.device, expected_ifb_device):
+            show_items.extend(self.__make_show_items(device))
+
+        outputs = run_tc_show_batch(show_items)
+        if outputs[0] is None:
+            raise NetworkInterfaceNotFoundError(target=self.device)
+
+        ifb_device = self.__filter_parser.parse_incoming_device(outputs[0])
+        self.__set_show_outputs(self.device, outputs[1:4])
+        if ifb_device == expected_ifb_device:
+            self.__set_show_outputs(ifb_device, outputs[4:])
+
+        return ifb_device
+
+    def __fetch_in_batch(self, device):
+        self.__set_show_outputs(device, run_tc_show_batch(self.__make_show_items(device)))
+
+    def __set_show_outputs(self, device, outputs):
+        if any(output is None for output in outputs):
+            raise NetworkInterfaceNotFoundError(target=device)
+
+        self.__show_outputs[device] = {
+            subcommand: output
+            for (subcommand, _args), output in zip(self.__make_show_items(device), outputs)
+        }
+
+        cache = get_device_state_cache()
+        if cache is not None:
+            for subcommand, output in self.__show_outputs[device].items():
+                cache.set_tc_show_output(subcommand, device, False, output)
+
+    @staticmethod
+    def __make_show_items(device):
+        return [
+            (TcSubCommand.QDISC, f"dev {device:s}"),
+            (TcSubCommand.CLASS, f"dev {device:s}"),
+            (TcSubCommand.FILTER, f"dev {device:s}"),
+        ]
+
+    def __run_tc_show(self, subcommand, device):
+        if device in self.__show_outputs:
+            return self.__show_outputs[device][subcommand]
+
+        return run_tc_show(
+            subcommand,
+            device,
+            self.__tc_command_output,
+            is_json=self.__is_json_read(subcommand),
+        )
+
+    def __is_json_read(self, subcommand):
+        # the filter parser only supports text outputs
+        return (
+            subcommand in (TcSubCommand.QDISC, TcSubCommand.CLASS)
+            and is_execute_tc_command(self.__tc_command_output)
+            and is_json_output_supported()
+        )
+
     def __get_ifb_from_device(self):
         if not is_execute_tc_command(self.__tc_command_output):
             return None
 
-        filter_runner = subprocrunner.SubprocessRunner(
+        filter_runner = JournaledRunner(
             f"{get_tc_base_command(TcSubCommand.FILTER):s} show dev {self.device:s} root",
+            CommandKind.QUERY,
             error_log_level=LogLevel.QUIET,
             dry_run=False,
         )
@@ -204,47 +354,48 @@ class TcShapingRuleParser:
             return ({}, [])
 
         self.__parse_device(device)
-        where_dev_query = Where(Tc.Param.DEVICE, device)
 
-        try:
-            class_params = self.__con.select_as_dict(
-                table_name=TcSubCommand.CLASS.value, where=where_dev_query
-            )
-        except TableNotFoundError:
-            class_params = []
+        with profile_span("make shaping rules", SpanCategory.PARSE, device=device):
+            return self.__make_shaping_rule(device)
 
-        try:
-            filter_params = Filter.select(where=where_dev_query)
-        except TableNotFoundError:
-            filter_params = []
+    def __make_shaping_rule(self, device):
+        filter_params = self.__store.select_filters(device=device)
 
         shaping_rule_mapping = {}
         shaping_rules = []
+        rule_class_set = set()
 
         for filter_param in filter_params:
             filter_param = filter_param.as_dict()
-            self.__logger.debug(f"{TcSubCommand.FILTER:s} param: {filter_param}")
+            if is_debug_enabled():
+                self.__logger.debug(f"{TcSubCommand.FILTER:s} param: {filter_param}")
             shaping_rule = {}
 
             filter_key, rule_with_keys = self.__get_filter_key(filter_param)
             if typepy.is_null_string(filter_key):
-                self.__logger.debug(f"empty filter key: {filter_param}")
+                if is_debug_enabled():
+                    self.__logger.debug(f"empty filter key: {filter_param}")
                 continue
 
             qdisc_id = filter_param.get(Tc.Param.FLOW_ID)
             if qdisc_id is None:
                 qdisc_id = filter_param.get(Tc.Param.CLASS_ID)
 
-            try:
-                qdisc_params = Qdisc.select(
-                    where=And([where_dev_query, Where(Tc.Param.PARENT, qdisc_id)])
-                )
-            except TableNotFoundError:
-                qdisc_params = []
+            if get_bucket_of_bucket_class(qdisc_id) is not None:
+                # filters that hand off packets to buckets of hierarchical HTB layouts:
+                # the rule is resolved by the filter of the bucket qdisc
+                continue
+
+            # filters that have the same conditions and class belong to the same rule:
+            # e.g. flower filters for each L4 protocol to match ports
+            if (filter_key, qdisc_id) in rule_class_set:
+                continue
+            rule_class_set.add((filter_key, qdisc_id))
 
-            for qdisc_param in qdisc_params:
+            for qdisc_param in self.__store.select_qdiscs(device, qdisc_id):
                 qdisc_param = qdisc_param.as_dict()
-                self.__logger.debug(f"{TcSubCommand.QDISC:s} param: {qdisc_param}")
+                if is_debug_enabled():
+                    self.__logger.debug(f"{TcSubCommand.QDISC:s} param: {qdisc_param}")
 
                 if self.is_parse_filter_id:
                     shaping_rule[Tc.Param.FILTER_ID] = filter_param.get(Tc.Param.FILTER_ID)
@@ -264,14 +415,17 @@ class TcShapingRuleParser:
                     )
                 )
 
-            for class_param in class_params:
-                self.__logger.debug(f"{TcSubCommand.CLASS:s} param: {class_param}")
-
-                if class_param.get(Tc.Param.CLASS_ID) not in (
+            classid_list = [
+                classid
+                for classid in (
                     filter_param.get(Tc.Param.FLOW_ID),
                     filter_param.get(Tc.Param.CLASS_ID),
-                ):
-                    continue
+                )
+                if classid is not None
+            ]
+            for class_param in self.__store.select_classes(device, classid_list):
+                if is_debug_enabled():
+                    self.__logger.debug(f"{TcSubCommand.CLASS:s} param: {class_param}")
 
                 if self.is_parse_filter_id:
                     shaping_rule[Tc.Param.FILTER_ID] = filter_param.get(Tc.Param.FILTER_ID)
@@ -284,10 +438,12 @@ class TcShapingRuleParser:
                 )
 
             if not shaping_rule:
-                self.__logger.debug(f"shaping rule not found for '{filter_param}'")
+                if is_debug_enabled():
+                    self.__logger.debug(f"shaping rule not found for '{filter_param}'")
                 continue
 
-            self.__logger.debug(f"shaping rule found: {filter_key} {shaping_rule}")
+            if is_debug_enabled():
+                self.__logger.debug(f"shaping rule found: {filter_key} {shaping_rule}")
 
             rule_with_keys.update(shaping_rule)
             shaping_rules.append(rule_with_keys)
@@ -297,19 +453,36 @@ class TcShapingRuleParser:
         return (shaping_rule_mapping, shaping_rules)
 
     def __parse_tc_qdisc(self, device):
-        TcQdiscParser(self.__con).parse(
-            device, run_tc_show(TcSubCommand.QDISC, device, self.__tc_command_output)
-        )
+        output = self.__run_tc_show(TcSubCommand.QDISC, device)
+
+        with profile_span("parse qdisc", SpanCategory.PARSE, device=device):
+            TcQdiscParser(self.__store).parse(device, output)
 
     def __parse_tc_filter(self, device):
-        self.__filter_parser.parse(
-            device, run_tc_show(TcSubCommand.FILTER, device, self.__tc_command_output)
+        output = self.__run_tc_show(TcSubCommand.FILTER, device)
+
+        with profile_span("parse filter", SpanCategory.PARSE, device=device):
+            self.__filter_parser.parse(device, output)
+
+    def __parse_tc_bucket_filter(self, device):
+        # filters of bucket qdiscs of hierarchical HTB layouts are not included in
+        # the output of the filters of the device
+        buckets = extract_buckets(self.__store.select_classes(device))
+        if not buckets or not is_execute_tc_command(self.__tc_command_output):
+            return
+
+        output = run_tc_filter_show_batch(
+            device, [f"{get_bucket_qdisc_major_id(bucket):x}:" for bucket in buckets]
         )
 
+        with profile_span("parse bucket filter", SpanCategory.PARSE, device=device):
+            self.__filter_parser.parse(device, output)
+
     def __parse_tc_class(self, device):
-        TcClassParser(self.__con).parse(
-            device, run_tc_show(TcSubCommand.CLASS, device, self.__tc_command_output)
-        )
+        output = self.__run_tc_show(TcSubCommand.CLASS, device)
+
+        with profile_span("parse class", SpanCategory.PARSE, device=device):
+            TcClassParser(self.__store).parse(device, output)
 
     @staticmethod
     def __strip_param(params, strip_params):
@@ -3,17 +3,23 @@
 """
 
 import abc
-
-import subprocrunner
-import typepy
-from humanreadable import ParameterError
-
-from .._common import run_command_helper
-from .._const import TcSubCommand, TrafficDirection
-from .._iptables import IptablesMangleMarkEntry
-from .._logger import logger
-from .._network import get_anywhere_network
+import errno
+
+from .._common import (
+    get_device_inventory,
+    is_execute_tc_command,
+    logging_context,
+    make_command_runner,
+    run_command_helper,
+)
+from .._const import FilterClassifier
+from .._error import ClassIdExhaustedError, QdiscIdExhaustedError, TcAlreadyExist
+from .._htb_layout import make_htb_layout_conflict_message
+from .._journal import CommandKind, JournaledRunner
+from .._logger import LogLevel, logger
 from .._shaping_rule_finder import TcShapingRuleFinder
+from .._tc_plan import PlanState, PlanStep, make_output_host_facts, read_host_facts
+from .._u32_hash import make_hash_table_query_command
 
 
 class ShaperInterface(metaclass=abc.ABCMeta):
@@ -28,22 +34,26 @@ class ShaperInterface(metaclass=abc.ABCMeta):
 
 
 class AbstractShaper(ShaperInterface):
-    @property
-    def _tc_device(self):
-        return f"{self._tc_obj.get_tc_device():s}"
-
-    @property
-    def _dev(self):
-        return f"dev {self._tc_device:s}"
+    """
+    Executor of the commands that ``TcCommandPlanner`` plans for a shaping rule:
+    identifiers in use are read from the configuration of the device, and failures of
+    the commands are handled by the kinds of the commands.
+    """
+
+    # objects that are shared among shaping rules: existing objects are reused with --add
+    _SHARED_STEPS = (
+        PlanStep.IFB_DEVICE,
+        PlanStep.INGRESS_QDISC,
+        PlanStep.ROOT_QDISC,
+        PlanStep.DEFAULT_CLASS,
+    )
+
+    # objects that are created on demand by shaping rules
+    _SILENT_STEPS = (PlanStep.BUCKET, PlanStep.HASH_TABLE)
 
     @property
-    def _existing_parent(self):
-        if self.__existing_parent:
-            return self.__existing_parent
-
-        self.__existing_parent = self._shaping_rule_finder.find_parent()
-
-        return self.__existing_parent
+    def _tc_device(self):
+        return self._planner.tc_device
 
     @property
     def _shaping_rule_finder(self):
@@ -54,198 +64,138 @@ class AbstractShaper(ShaperInterface):
 
         return self.__shaping_rule_finder
 
-    def __init__(self, tc_obj):
+    def __init__(self, tc_obj, planner):
         self._tc_obj = tc_obj
+        self._planner = planner
 
         self.__shaping_rule_finder = None
-        self.__existing_parent = None
 
-    def _set_netem(self):
-        base_command = self._tc_obj.get_tc_command(TcSubCommand.QDISC)
-        parent = self._get_tc_parent(
-            f"{self._tc_obj.qdisc_major_id_str:s}:{self._get_qdisc_minor_id():d}"
-        )
-        handle = self._get_tc_handle(
-            f"{self._get_netem_qdisc_major_id(self._tc_obj.qdisc_major_id):x}:"
-        )
+    def set_shaping(self):
+        with logging_context("read the configuration"):
+            plan_state = self._read_plan_state()
+            classid, netem_handle = self.__find_existing_rule()
 
-        command_item_list = [
-            base_command,
-            f"dev {self._tc_obj.get_tc_device():s}",
-            f"parent {parent:s}",
-            f"handle {handle:s}",
-            self._tc_obj.netem_param.make_netem_command_parts(),
-        ]
+        if plan_state is not None:
+            htb_layouts = plan_state.htb_layouts - {self._planner.htb_layout}
+            if htb_layouts:
+                logger.error(make_htb_layout_conflict_message(self._tc_device, htb_layouts))
+                return errno.EINVAL
 
-        return run_command_helper(
-            " ".join(command_item_list),
-            ignore_error_msg_regexp=self._tc_obj.REGEXP_FILE_EXISTS,
-            notice_msg=self._tc_obj.EXISTS_MSG_TEMPLATE.format(
-                "failed to '{command:s}': netem qdisc already exists "
-                "(dev={dev:s}, parent={parent:s}, handle={handle:s})".format(
-                    command=base_command,
-                    dev=self._tc_obj.get_tc_device(),
-                    parent=parent,
-                    handle=handle,
+        if is_execute_tc_command(self._tc_obj.tc_command_output):
+            host_facts = read_host_facts(self._tc_device)
+        else:
+            # the output may be executed at other hosts
+            host_facts = make_output_host_facts(self._tc_device)
+
+        with logging_context("plan the shaping rule"):
+            try:
+                steps = self._planner.make_set_steps(
+                    host_facts,
+                    plan_state,
+                    classid=classid,
+                    netem_handle=netem_handle,
                 )
-            ),
-        )
+            except ClassIdExhaustedError as e:
+                logger.error(f"failed to add a class (dev {self._tc_device:s}): {e}")
+                return errno.ENOSPC
+            except QdiscIdExhaustedError as e:
+                logger.error(f"failed to add a netem qdisc (dev {self._tc_device:s}): {e}")
+                return errno.ENOSPC
 
-    def _get_filter_prio(self, is_exclude_filter: bool) -> int:
-        offset = 4
-        if is_exclude_filter:
-            offset = 0
+        with logging_context("apply the shaping rule"):
+            try:
+                for step, command in steps:
+                    self._run_step(step, command)
+            except TcAlreadyExist:
+                return errno.EINVAL
 
-        if self._tc_obj.protocol == "ip":
-            return 1 + offset
+        return 0
 
-        if self._tc_obj.protocol == "ipv6":
-            return 2 + offset
+    def _read_plan_state(self):
+        """
+        :return:
+            ``PlanState`` of the device. ``None`` if commands are not executed:
+            configurations are considered as empty.
+        """
 
-        return 3 + offset
+        if not is_execute_tc_command(self._tc_obj.tc_command_output):
+            return None
 
-    def _add_filter(self):
-        if self._tc_obj.is_change_shaping_rule:
-            return 0
+        if not get_device_inventory().has_device(self._tc_device):
+            # the ifb device is created by the execution: no configurations exist
+            return PlanState()
 
-        command_item_list = [
-            self._tc_obj.get_tc_command(TcSubCommand.FILTER),
-            self._dev,
-            f"protocol {self._tc_obj.protocol:s}",
-            f"parent {self._tc_obj.qdisc_major_id_str:s}:",
-            f"prio {self._get_filter_prio(is_exclude_filter=False):d}",
-        ]
+        return PlanState(**self._make_plan_state_params())
 
-        if self._is_use_iptables():
-            command_item_list.append(f"handle {self._get_unique_mangle_mark_id():d} fw")
-        else:
-            if typepy.is_null_string(self._tc_obj.dst_network):
-                dst_network = get_anywhere_network(self._tc_obj.ip_version)
-            else:
-                dst_network = self._tc_obj.dst_network
-
-            command_item_list.extend(
-                [
-                    "u32",
-                    "match {:s} {:s} {:s}".format(self._tc_obj.protocol_match, "dst", dst_network),
-                ]
-            )
-
-            if typepy.is_not_null_string(self._tc_obj.src_network):
-                command_item_list.append(
-                    "match {:s} {:s} {:s}".format(
-                        self._tc_obj.protocol_match, "src", self._tc_obj.src_network
-                    )
-                )
+    def _make_plan_state_params(self):
+        params = {}
 
-            if self._tc_obj.src_port:
-                command_item_list.append(
-                    "match {:s} sport {:d} 0xffff".format(
-                        self._tc_obj.protocol_match, self._tc_obj.src_port
-                    )
-                )
+        if self._tc_obj.is_add_shaping_rule and self._tc_obj.classifier == FilterClassifier.FLOWER:
+            # handles of flower filters are allocated for each priority by the kernel:
+            # allocate unique handles among the qdisc to identify filters by handles
+            params["flower_handles"] = self._shaping_rule_finder.find_flower_handles()
 
-            if self._tc_obj.dst_port:
-                command_item_list.append(
-                    "match {:s} dport {:d} 0xffff".format(
-                        self._tc_obj.protocol_match, self._tc_obj.dst_port
-                    )
-                )
+        if self._planner.hash_key is not None and self.__is_hash_table_exist():
+            params["hash_table_keys"] = [None]
 
-        command_item_list.append(
-            f"flowid {self._tc_obj.qdisc_major_id_str:s}:{self._get_qdisc_minor_id():d}"
-        )
+        if self._planner.is_use_iptables():
+            params["mark_ids"] = [mangle.mark_id for mangle in self._tc_obj.iptables_ctrl.parse()]
 
-        return subprocrunner.SubprocessRunner(" ".join(command_item_list)).run()
+        return params
 
-    def _add_exclude_filter(self):
-        pass
+    def _get_exists_exception_class(self, step):
+        """
+        :return: Exception class to raise if the object of the step already exists.
+        """
 
-    def _is_use_iptables(self):
-        return all(
-            [
-                self._tc_obj.is_enable_iptables,
-                self._tc_obj.direction == TrafficDirection.OUTGOING,
-            ]
-        )
+    def _run_step(self, step, command):
+        if step == PlanStep.MANGLE:
+            return self._tc_obj.iptables_ctrl.append(command)
 
-    @abc.abstractmethod
-    def _get_qdisc_minor_id(self):  # pragma: no cover
-        ...
+        if step == PlanStep.FILTER:
+            return make_command_runner(command).run()
 
-    @abc.abstractmethod
-    def _get_netem_qdisc_major_id(self, base_id):  # pragma: no cover
-        ...
+        return run_command_helper(
+            command,
+            ignore_error_msg_regexp=self._tc_obj.REGEXP_FILE_EXISTS,
+            notice_msg=self.__make_exists_message(step, command),
+            exception_class=self._get_exists_exception_class(step),
+        )
 
-    def _get_network_direction_str(self):
-        if self._tc_obj.direction == TrafficDirection.OUTGOING:
-            return "dst"
+    def __make_exists_message(self, step, command):
+        if step in self._SILENT_STEPS:
+            return None
 
-        if self._tc_obj.direction == TrafficDirection.INCOMING:
-            return "src"
+        if step in self._SHARED_STEPS and (
+            self._tc_obj.is_add_shaping_rule or self._tc_obj.is_change_shaping_rule
+        ):
+            return None
 
-        raise ParameterError(
-            "unknown direction",
-            expected=TrafficDirection.LIST,
-            value=self._tc_obj.direction,
+        return self._tc_obj.EXISTS_MSG_TEMPLATE.format(
+            f"failed to '{command:s}': {step.value:s} already exists."
         )
 
-    def _get_tc_handle(self, default_handle):
-        handle = None
-        if self._tc_obj.is_change_shaping_rule:
-            handle = self._shaping_rule_finder.find_qdisc_handle(self._get_tc_parent(None))
-
-        if not handle:
-            handle = default_handle
+    def __find_existing_rule(self):
+        """
+        :return: Class id and the netem qdisc handle of the shaping rule to change.
+        """
 
-        return handle
-
-    def _get_tc_parent(self, default_parent):
-        parent = None
-        if self._tc_obj.is_change_shaping_rule:
-            parent = self._existing_parent
+        if not self._tc_obj.is_change_shaping_rule:
+            return (None, None)
 
+        parent = self._shaping_rule_finder.find_parent()
         if not parent:
-            parent = default_parent
-
-        return parent
+            return (None, None)
 
-    def _get_unique_mangle_mark_id(self):
-        mark_id = self._tc_obj.iptables_ctrl.get_unique_mark_id()
+        return (parent, self._shaping_rule_finder.find_qdisc_handle(parent) or None)
 
-        self.__add_mangle_mark(mark_id)
-
-        return mark_id
-
-    @abc.abstractmethod
-    def _make_qdisc(self):  # pragma: no cover
-        ...
-
-    @abc.abstractmethod
-    def _add_rate(self):  # pragma: no cover
-        ...
-
-    def __add_mangle_mark(self, mark_id):
-        dst_network = None
-        src_network = None
-
-        if self._tc_obj.direction == TrafficDirection.OUTGOING:
-            dst_network = self._tc_obj.dst_network
-            if typepy.is_null_string(self._tc_obj.src_network):
-                chain = "OUTPUT"
-            else:
-                src_network = self._tc_obj.src_network
-                chain = "PREROUTING"
-        elif self._tc_obj.direction == TrafficDirection.INCOMING:
-            src_network = self._tc_obj.dst_network
-            chain = "INPUT"
-
-        self._tc_obj.iptables_ctrl.add(
-            IptablesMangleMarkEntry(
-                ip_version=self._tc_obj.ip_version,
-                mark_id=mark_id,
-                source=src_network,
-                destination=dst_network,
-                chain=chain,
-            )
+    def __is_hash_table_exist(self):
+        runner = JournaledRunner(
+            make_hash_table_query_command(
+                self._tc_device, f"{self._planner.qdisc_major_id:x}:", self._planner.protocol
+            ),
+            CommandKind.QUERY,
+            error_log_level=LogLevel.QUIET,
         )
+
+        return runner.run() == 0
@@ -13,10 +13,18 @@ from .__version__ import __version__
 from ._argparse_wrapper import ArgparseWrapper
 from ._capabilities import check_execution_authority
 from ._command import TcDelMain
-from ._common import initialize_cli, is_execute_tc_command
+from ._common import (
+    device_state_cache_context,
+    initialize_cli,
+    is_execute_tc_command,
+    set_execution_backend,
+)
+from ._const import Tc
 from ._error import NetworkInterfaceNotFoundError
+from ._journal import get_command_journal
 from ._logger import logger, set_logger
 from ._network import verify_network_interface
+from ._profiler import profile_context
 
 
 def parse_option():
@@ -46,6 +54,7 @@ def parse_option():
 
     parser.add_routing_group()
     parser.add_docker_group()
+    parser.add_execution_backend_group()
 
     return parser.parser.parse_args()
 
@@ -55,25 +64,28 @@ def main():
 
     initialize_cli(options)
 
-    if is_execute_tc_command(options.tc_command_output):
-        check_execution_authority("tc")
+    with profile_context(Tc.Command.TCDEL, options.profile_path, options.profile_format):
+        if is_execute_tc_command(options.tc_command_output):
+            check_execution_authority("tc")
 
-        if not options.use_docker:
-            try:
-                verify_network_interface(options.device, options.tc_command_output)
-            except NetworkInterfaceNotFoundError as e:
-                logger.error(e)
-                return errno.EINVAL
+            if not options.use_docker:
+                try:
+                    verify_network_interface(options.device, options.tc_command_output)
+                except NetworkInterfaceNotFoundError as e:
+                    logger.error(e)
+                    return errno.EINVAL
 
-        is_delete_all = options.is_delete_all
-    else:
-        spr.SubprocessRunner.default_is_dry_run = True
-        is_delete_all = True
-        set_logger(False)
+            is_delete_all = options.is_delete_all
+            set_execution_backend(options.backend)
+        else:
+            spr.SubprocessRunner.default_is_dry_run = True
+            is_delete_all = True
+            set_logger(False)
 
-    spr.SubprocessRunner.clear_history()
+        get_command_journal().clear()
 
-    return TcDelMain(options).run(is_delete_all)
+        with device_state_cache_context():
+            return TcDelMain(options).run(is_delete_all)
 
 
 if __name__ == "__main__":
@@ -4,6 +4,7 @@
 .. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
 """
 
+import argparse
 import errno
 import ipaddress
 import sys
@@ -16,16 +17,26 @@ from loguru import logger
 from .__version__ import __version__
 from ._argparse_wrapper import ArgparseWrapper
 from ._capabilities import check_execution_authority
-from ._common import initialize_cli, is_execute_tc_command, normalize_tc_value
+from ._common import (
+    device_state_cache_context,
+    initialize_cli,
+    is_execute_tc_command,
+    normalize_tc_value,
+    set_execution_backend,
+)
 from ._const import (
     DELAY_DISTRIBUTIONS,
     IPV6_OPTION_ERROR_MSG_FORMAT,
+    ExecutionBackend,
+    FilterClassifier,
+    HtbLayout,
     ShapingAlgorithm,
     Tc,
     TrafficDirection,
 )
 from ._error import ContainerNotFoundError, ModuleNotFoundError, NetworkInterfaceNotFoundError
-from ._importer import set_tc_from_file
+from ._htb_layout import NUM_BUCKETS
+from ._journal import get_command_journal
 from ._logger import LogLevel, set_log_level
 from ._main import Main
 from ._netem_param import (
@@ -39,7 +50,10 @@ from ._netem_param import (
     MIN_REORDERING_RATE,
     NetemParameter,
 )
+from ._network import verify_network_interface
+from ._profiler import profile_context
 from ._shaping_rule_finder import TcShapingRuleFinder
+from ._tc_plan import TcCommandPlanner, make_output_host_facts
 from .traffic_control import TrafficControl
 
 
@@ -66,6 +80,19 @@ def get_arg_parser():
         default=False,
         help="import traffic control settings from a configuration file.",
     )
+    parser.parser.add_argument(
+        "--rules-file",
+        help="""set shaping rules in a file to the device at once: much faster than
+        executing tcset for each rule. the file is either a JSON Lines file (a JSON object
+        per line) or a CSV file with a header row (.csv extension).
+        keys of rules are the names of traffic control parameter/routing options
+        without leading hyphens: e.g. network, port, rate, delay, loss.
+        options specified with the command line are used as default values of the rules.
+        e.g. {"network": "192.168.0.0/24", "rate": "10Mbps", "delay": "10ms"}
+        the htb algorithm is used. can not be used with --change/--iptables options.
+        commands are executed with the batch mode of tc unless --backend netlink.
+        """,
+    )
 
     group = parser.parser.add_mutually_exclusive_group()
     group.add_argument(
@@ -193,6 +220,48 @@ def get_arg_parser():
         default=False,
         help="use iptables for traffic control.",
     )
+    group.add_argument(
+        "--hash-filter",
+        dest="is_hash_filter",
+        action="store_true",
+        default=False,
+        help="""place filters of IPv4 destination host rules (--dst-network with /32)
+        into u32 hash tables. the cost of packet classification does not grow
+        with the number of the rules. other rules use non-hashed filters.
+        """,
+    )
+    group.add_argument(
+        "--classifier",
+        dest="classifier",
+        choices=[classifier.value for classifier in FilterClassifier],
+        default=FilterClassifier.U32.value,
+        help="""classifier of filters to classify packets into shaping rules.
+        flower classifies packets with masked hash lookups of flow keys:
+        scales better than u32 for a large number of rules, especially for IPv6 rules.
+        ports are matched for TCP and UDP packets with flower.
+        all of the rules of a device should use the same classifier.
+        defaults to %(default)s.
+        """,
+    )
+    group.add_argument(
+        "--htb-layout",
+        dest="htb_layout",
+        choices=[layout.value for layout in HtbLayout],
+        default=HtbLayout.FLAT.value,
+        help=f"""layout of HTB classes of shaping rules.
+        flat: classes of shaping rules are children of the root qdisc of a device.
+        hash/prefix: shaping rules are distributed into {NUM_BUCKETS:d} buckets by
+        the lowest bits of destination hosts (hash), or by the lowest bits of
+        the /16 (IPv4) or /32 (IPv6) prefix of destination networks (prefix).
+        rules of other destinations are set as same as the flat layout.
+        each bucket has an HTB qdisc that has classes of the rules: a device can have
+        more rules than the classes of a qdisc, and a bucket qdisc dequeues packets
+        among a fraction of the rules. the root qdisc hands off packets to buckets
+        with a u32 hash table.
+        only available for the htb shaping algorithm with the u32 classifier.
+        defaults to %(default)s.
+        """,
+    )
     group.add_argument(
         "--mtu",
         dest="mtu",
@@ -205,6 +274,16 @@ def get_arg_parser():
         type=int,
         help="burst size to use for traffic shaping (htb only).",
     )
+    group.add_argument(
+        "--iproute2-version",
+        metavar="VERSION",
+        help="""iproute2 version of the host that executes the commands of
+        --tc-command/--tc-script output (e.g. 6.15.0).
+        burst sizes are adjusted for the rounding bug of tc from iproute2 version 6.14
+        and earlier unless the version is 6.15 or later.
+        iproute2 of the local host is not referred to for the output.
+        """,
+    )
 
     group = parser.add_routing_group()
     group.add_argument(
@@ -224,29 +303,28 @@ def get_arg_parser():
     )
 
     parser.add_docker_group()
+    parser.add_execution_backend_group()
 
     return parser.parser
 
 
 def verify_netem_module() -> None:
-    import re
+    from ._kernel_module import is_module_loaded
 
-    runner = spr.SubprocessRunner("lsmod")
-
-    try:
-        if runner.run() != 0:
-            raise OSError(runner.returncode, "failed to execute lsmod")
-    except spr.CommandError as e:
-        # reach here when the kmod package is not installed.
-        # this kind of environment could exist such as slim Docker containers.
-        logger.debug(msgfy.to_debug_message(e))
-    else:
-        if re.search(r"\bsch_netem\b", runner.stdout) is None:
-            raise ModuleNotFoundError("sch_netem module not found")
+    # the check is skipped when failed to determine the module state:
+    # this kind of environment could exist such as slim Docker containers.
+    if is_module_loaded("sch_netem") is False:
+        raise ModuleNotFoundError("sch_netem module not found")
 
 
 class TcSetMain(Main):
     def run(self) -> int:
+        if self._options.rules_file:
+            return self.__set_rules_file()
+
+        if not is_execute_tc_command(self._options.tc_command_output):
+            return self.__dump_tc_commands()
+
         return_code_list = []
 
         for device in self._fetch_tc_targets():
@@ -260,15 +338,7 @@ class TcSetMain(Main):
             normalize_tc_value(tc)
 
             if self._options.overwrite:
-                if self._options.log_level == LogLevel.INFO:
-                    set_log_level("ERROR")
-
-                try:
-                    tc.delete_all_rules()
-                except NetworkInterfaceNotFoundError:
-                    pass
-
-                set_log_level(self._options.log_level)
+                self.__delete_all_rules(tc)
 
             if (
                 self._options.is_add_shaping_rule
@@ -297,6 +367,140 @@ class TcSetMain(Main):
 
         return self._get_return_code(return_code_list)
 
+    def __set_rules_file(self) -> int:
+        from ._rule_set import TcRuleSet, load_rules
+
+        options = self._options
+
+        for is_specified, option_name in (
+            (options.is_change_shaping_rule, "--change"),
+            (options.is_enable_iptables, "--iptables"),
+            (
+                options.shaping_algorithm.strip().lower() != ShapingAlgorithm.HTB.value,
+                "--shaping-algo tbf",
+            ),
+        ):
+            if is_specified:
+                logger.error(f"--rules-file option can not be used with {option_name:s}")
+                return errno.EINVAL
+
+        try:
+            rules = load_rules(options.rules_file)
+        except OSError as e:
+            logger.error(msgfy.to_error_message(e))
+            return errno.EIO
+        except hr.ParameterError as e:
+            logger.error(f"{options.rules_file:s}: {msgfy.to_error_message(e):s}")
+            return errno.EINVAL
+
+        if not rules:
+            logger.error(f"no shaping rules found in {options.rules_file:s}")
+            return errno.EINVAL
+
+        return_code_list = []
+
+        for device in self._fetch_tc_targets():
+            planners = []
+            for rule in rules:
+                planner = self.__create_planner(device, rule)
+
+                return_code = self.__check_tc(planner)
+                if return_code != 0:
+                    return return_code
+
+                normalize_tc_value(planner)
+                planners.append(planner)
+
+            rule_set = TcRuleSet(
+                device,
+                planners,
+                direction=options.direction,
+                is_add_shaping_rule=options.is_add_shaping_rule,
+                tc_command_output=options.tc_command_output,
+                is_ipv6=options.is_ipv6,
+            )
+
+            try:
+                rule_set.validate()
+            except hr.ParameterError as e:
+                logger.error(f"{options.rules_file:s}: {msgfy.to_error_message(e):s}")
+                return errno.EINVAL
+
+            if not is_execute_tc_command(options.tc_command_output):
+                try:
+                    host_facts = make_output_host_facts(
+                        planners[0].tc_device, options.iproute2_version
+                    )
+                except hr.ParameterError as e:
+                    logger.error(msgfy.to_error_message(e))
+                    return errno.EINVAL
+
+                self._dump_tc_commands(
+                    rule_set.make_set_commands(host_facts, is_overwrite=options.overwrite),
+                    Tc.Command.TCSET,
+                    None,
+                )
+                return_code_list.append(0)
+                continue
+
+            # parameters of the rules are validated by the planners
+            tc = self.__create_tc(device)
+
+            try:
+                verify_network_interface(device, options.tc_command_output)
+
+                if options.overwrite:
+                    self.__delete_all_rules(tc)
+
+                return_code_list.append(rule_set.set_rules())
+            except NetworkInterfaceNotFoundError as e:
+                logger.error(e)
+                return errno.EINVAL
+
+            self._dump_history(tc, Tc.Command.TCSET)
+
+        return self._get_return_code(return_code_list)
+
+    def __dump_tc_commands(self) -> int:
+        options = self._options
+        return_code_list = []
+
+        for device in self._fetch_tc_targets():
+            planner = self.__create_planner(device, {})
+
+            return_code = self.__check_tc(planner)
+            if return_code != 0:
+                return_code_list.append(return_code)
+                continue
+
+            normalize_tc_value(planner)
+
+            try:
+                host_facts = make_output_host_facts(planner.tc_device, options.iproute2_version)
+            except hr.ParameterError as e:
+                logger.error(msgfy.to_error_message(e))
+                return errno.EINVAL
+
+            self._dump_tc_commands(
+                planner.make_set_commands(host_facts, is_overwrite=options.overwrite),
+                Tc.Command.TCSET,
+                planner.netem_param,
+            )
+            return_code_list.append(0)
+
+        return self._get_return_code(return_code_list)
+
+    def __delete_all_rules(self, tc: TrafficControl) -> None:
+        if self._options.log_level == LogLevel.INFO:
+            set_log_level("ERROR")
+
+        try:
+            tc.delete_all_rules()
+        except NetworkInterfaceNotFoundError:
+            pass
+
+        set_log_level(self._options.log_level)
+
     def __check_tc(self, tc: TrafficControl) -> None:
         try:
             tc.validate()
@@ -319,20 +523,7 @@ class TcSetMain(Main):
         return TrafficControl(
             device,
             direction=options.direction,
-            netem_param=NetemParameter(
-                device=device,
-                bandwidth_rate=options.bandwidth_rate,
-                latency_time=options.latency_time,
-                latency_distro_time=options.latency_distro_time,
-                latency_distribution=options.latency_distribution,
-                packet_loss_rate=options.packet_loss_rate,
-                packet_duplicate_rate=options.packet_duplicate_rate,
-                corruption_rate=options.corruption_rate,
-                reordering_rate=options.reordering_rate,
-                packet_limit_count=options.packet_limit_count,
-                mtu=options.mtu,
-                burst=options.burst,
-            ),
+            netem_param=self.__create_netem_param(device, options),
             dst_network=self._extract_dst_network(),
             exclude_dst_network=options.exclude_dst_network,
             src_network=self._extract_src_network(),
@@ -347,6 +538,57 @@ class TcSetMain(Main):
             is_enable_iptables=options.is_enable_iptables,
             shaping_algorithm=ShapingAlgorithm(shaping_algorithm),
             tc_command_output=options.tc_command_output,
+            is_hash_filter=options.is_hash_filter,
+            classifier=FilterClassifier(options.classifier),
+            htb_layout=HtbLayout(options.htb_layout),
+        )
+
+    def __create_planner(self, device: str, rule: dict):
+        """
+        :param rule: Parameters of a rule in a rules file that override the options.
+        """
+
+        options = argparse.Namespace(**{**vars(self._options), **rule})
+        if "dst_network" in rule:
+            dst_network = rule["dst_network"]
+        else:
+            dst_network = self._extract_dst_network()
+
+        return TcCommandPlanner(
+            device,
+            direction=options.direction,
+            netem_param=self.__create_netem_param(device, options),
+            dst_network=dst_network,
+            exclude_dst_network=options.exclude_dst_network,
+            src_network=self._extract_src_network(),
+            exclude_src_network=options.exclude_src_network,
+            src_port=options.src_port,
+            exclude_src_port=options.exclude_src_port,
+            dst_port=options.dst_port,
+            exclude_dst_port=options.exclude_dst_port,
+            is_ipv6=options.is_ipv6,
+            is_change_shaping_rule=options.is_change_shaping_rule,
+            is_enable_iptables=options.is_enable_iptables,
+            shaping_algorithm=ShapingAlgorithm(options.shaping_algorithm.strip().lower()),
+            is_hash_filter=options.is_hash_filter,
+            classifier=FilterClassifier(options.classifier),
+            htb_layout=HtbLayout(options.htb_layout),
+        )
+
+    def __create_netem_param(self, device: str, options: argparse.Namespace) -> NetemParameter:
+        return NetemParameter(
+            device=device,
+            bandwidth_rate=options.bandwidth_rate,
+            latency_time=options.latency_time,
+            latency_distro_time=options.latency_distro_time,
+            latency_distribution=options.latency_distribution,
+            packet_loss_rate=options.packet_loss_rate,
+            packet_duplicate_rate=options.packet_duplicate_rate,
+            corruption_rate=options.corruption_rate,
+            reordering_rate=options.reordering_rate,
+            packet_limit_count=options.packet_limit_count,
+            mtu=options.mtu,
+            burst=options.burst,
         )
 
 
@@ -355,28 +597,39 @@ def main():
 
     initialize_cli(options)
 
-    if is_execute_tc_command(options.tc_command_output):
-        check_execution_authority("tc")
+    with profile_context(Tc.Command.TCSET, options.profile_path, options.profile_format):
+        if is_execute_tc_command(options.tc_command_output):
+            check_execution_authority("tc")
 
-        if options.direction == TrafficDirection.INCOMING:
-            check_execution_authority("ip")
-    else:
-        if not options.import_setting:
-            spr.SubprocessRunner.default_is_dry_run = True
+            if options.direction == TrafficDirection.INCOMING:
+                check_execution_authority("ip")
 
-    try:
-        verify_netem_module()
-    except ModuleNotFoundError as e:
-        logger.debug(e)
+            backend = options.backend
+            if options.rules_file and backend == ExecutionBackend.TC.value:
+                # execute commands of the rules with a few tc processes
+                backend = ExecutionBackend.BATCH.value
 
-    if options.import_setting:
-        return set_tc_from_file(
-            logger, options.device, options.overwrite, options.tc_command_output
-        )
+            set_execution_backend(backend)
+        else:
+            if not options.import_setting:
+                spr.SubprocessRunner.default_is_dry_run = True
+
+        try:
+            verify_netem_module()
+        except ModuleNotFoundError as e:
+            logger.debug(e)
+
+        if options.import_setting:
+            from ._importer import set_tc_from_file
+
+            return set_tc_from_file(
+                logger, options.device, options.overwrite, options.tc_command_output
+            )
 
-    spr.SubprocessRunner.clear_history()
+        get_command_journal().clear()
 
-    return TcSetMain(options).run()
+        with device_state_cache_context():
+            return TcSetMain(options).run()
 
 
 if __name__ == "__main__":
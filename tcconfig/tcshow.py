@@ -8,18 +8,23 @@ import sys
 
 import msgfy
 import subprocrunner as spr
-from docker.errors import DockerException
 from simplesqlite import SimpleSQLite
 from simplesqlite.model import Integer, Model, Text
 
 from .__version__ import __version__
 from ._argparse_wrapper import ArgparseWrapper
-from ._common import check_command_installation, initialize_cli
+from ._common import (
+    check_command_installation,
+    device_state_cache_context,
+    initialize_cli,
+    set_execution_backend,
+)
 from ._const import Tc, TcCommandOutput
-from ._docker import DockerClient
 from ._error import TargetNotFoundError
+from ._journal import get_command_journal
 from ._logger import logger
 from ._network import verify_network_interface
+from ._profiler import profile_context
 from ._tc_script import write_tc_script
 from .parser.shaping_rule import TcShapingRuleParser
 
@@ -75,6 +80,7 @@ def parse_option():
     )
 
     parser.add_docker_group(is_add_srcdst=False)
+    parser.add_execution_backend_group()
 
     parser.parser.add_argument(
         "--color",
@@ -135,6 +141,10 @@ def export_settings(export_path, out_rules, in_rules):
 def extract_tc_params(options):
     dclient = None
     if options.use_docker:
+        from docker.errors import DockerException
+
+        from ._docker import DockerClient
+
         try:
             dclient = DockerClient(options.tc_command_output)
         except DockerException as e:
@@ -211,29 +221,34 @@ def main():
     options = parse_option()
 
     initialize_cli(options)
-    check_command_installation("tc")
 
-    if options.tc_command_output != TcCommandOutput.NOT_SET:
-        spr.SubprocessRunner.default_is_dry_run = True
+    with profile_context(Tc.Command.TCSHOW, options.profile_path, options.profile_format):
+        check_command_installation("tc")
 
-    tc_params = extract_tc_params(options)
-    command_history = "\n".join(spr.SubprocessRunner.get_history())
+        if options.tc_command_output != TcCommandOutput.NOT_SET:
+            spr.SubprocessRunner.default_is_dry_run = True
+        else:
+            set_execution_backend(options.backend)
 
-    if options.tc_command_output == TcCommandOutput.STDOUT:
-        print(command_history)
-        return 0
+        with device_state_cache_context():
+            tc_params = extract_tc_params(options)
+        command_history = "\n".join(get_command_journal().get_commands())
 
-    if options.tc_command_output == TcCommandOutput.SCRIPT:
-        write_tc_script(
-            Tc.Command.TCSHOW, command_history, filename_suffix="-".join(options.device)
-        )
-        return 0
+        if options.tc_command_output == TcCommandOutput.STDOUT:
+            print(command_history)
+            return 0
+
+        if options.tc_command_output == TcCommandOutput.SCRIPT:
+            write_tc_script(
+                Tc.Command.TCSHOW, command_history, filename_suffix="-".join(options.device)
+            )
+            return 0
 
-    logger.debug(f"command history\n{command_history}")
+        logger.debug(f"command history\n{command_history}")
 
-    print_tc(json.dumps(tc_params, ensure_ascii=False, indent=4), options.color)
+        print_tc(json.dumps(tc_params, ensure_ascii=False, indent=4), options.color)
 
-    return 0
+        return 0
 
 
 if __name__ == "__main__":
@@ -7,32 +7,34 @@ import re
 from typing import Optional
 
 import msgfy
-import subprocrunner as spr
-import typepy
 from humanreadable import ParameterError
 
 from ._common import (
-    find_bin_path,
+    command_batch_context,
     is_execute_tc_command,
     logging_context,
+    make_command_runner,
     run_command_helper,
-    validate_within_min_max,
 )
 from ._const import (
-    LIST_MANGLE_TABLE_OPTION,
+    FilterClassifier,
+    HtbLayout,
     ShapingAlgorithm,
     Tc,
     TcCommandOutput,
     TcSubCommand,
     TrafficDirection,
 )
-from ._error import NetworkInterfaceNotFoundError
-from ._iptables import IptablesMangleController, get_iptables_base_command
+from ._error import NetworkInterfaceNotFoundError, TcAlreadyExist
+from ._iptables import IptablesMangleController
+from ._journal import CommandKind, get_command_journal
+from ._kernel_module import load_module
 from ._logger import LogLevel, logger
 from ._netem_param import NetemParameter
 from ._network import sanitize_network, verify_network_interface
 from ._shaping_rule_finder import TcShapingRuleFinder
-from ._tc_command_helper import get_tc_base_command
+from ._tc_command_helper import get_device_qdisc_major_id, get_tc_base_command
+from ._tc_plan import TcCommandPlanner
 from .shaper.htb import HtbShaper
 from .shaper.tbf import TbfShaper
 
@@ -112,10 +114,22 @@ class TrafficControl:
     def is_add_shaping_rule(self):
         return self.__is_add_shaping_rule
 
+    @property
+    def is_hash_filter(self):
+        return self.__is_hash_filter
+
     @property
     def is_enable_iptables(self):
         return self.__is_enable_iptables
 
+    @property
+    def classifier(self):
+        return self.__classifier
+
+    @property
+    def htb_layout(self):
+        return self.__htb_layout
+
     @property
     def qdisc_major_id(self):
         return self.__qdisc_major_id
@@ -163,6 +177,9 @@ class TrafficControl:
         is_enable_iptables: bool = False,
         shaping_algorithm: ShapingAlgorithm = ShapingAlgorithm.HTB,
         tc_command_output=TcCommandOutput.NOT_SET,
+        is_hash_filter: bool = False,
+        classifier: FilterClassifier = FilterClassifier.U32,
+        htb_layout: HtbLayout = HtbLayout.FLAT,
     ):
         self.__device = device
 
@@ -181,40 +198,27 @@ class TrafficControl:
         self.__is_add_shaping_rule = is_add_shaping_rule
         self.__is_enable_iptables = is_enable_iptables
         self.__tc_command_output = tc_command_output
+        self.__is_hash_filter = is_hash_filter
+        self.__classifier = classifier
+        self.__htb_layout = htb_layout
+
+        self.__shaping_algorithm = shaping_algorithm
 
         self.__qdisc_major_id = self.__get_device_qdisc_major_id()
 
         self.__iptables_ctrl = IptablesMangleController(is_enable_iptables, self.ip_version)
 
-        self.__init_shaper(shaping_algorithm)
+        self.__init_shaper()
 
     def validate(self) -> None:
         verify_network_interface(self.device, self.__tc_command_output)
 
-        if self.__netem_param:
-            self.__netem_param.validate_netem_parameter()
-
-        self.__validate_src_network()
-        self.__validate_port()
-
-    def __validate_src_network(self) -> None:
-        if any(
-            [
-                typepy.is_null_string(self.src_network),
-                self.__shaper.algorithm_name == ShapingAlgorithm.HTB,
-            ]
-        ):
-            return
-
-        if not self.is_enable_iptables:
-            raise ParameterError(
-                "--iptables option required to use --src-network option",
-                value=self.is_enable_iptables,
-            )
+        self.__planner.validate()
 
     def sanitize(self):
         self.__dst_network = sanitize_network(self.dst_network, self.ip_version)
         self.__src_network = sanitize_network(self.src_network, self.ip_version)
+        self.__planner.sanitize()
 
     def get_tc_device(self):
         """
@@ -238,29 +242,11 @@ class TrafficControl:
         )
 
     def get_command_history(self):
-        def tc_command_filter(command):
-            if get_iptables_base_command():
-                if re.search(
-                    "^{:s} {:s}".format(
-                        get_iptables_base_command(), re.escape(LIST_MANGLE_TABLE_OPTION)
-                    ),
-                    command,
-                ):
-                    return False
-
-            if re.search("^{:s} .* show dev".format(find_bin_path("tc")), command):
-                return False
-
-            if re.search("^ip (netns exec |link show )", command):
-                return False
-
-            if find_bin_path("getcap"):
-                if re.search("^{:s}".format(find_bin_path("getcap")), command):
-                    return False
-
-            return True
+        """
+        :return: Executed commands that change configurations.
+        """
 
-        return filter(tc_command_filter, spr.SubprocessRunner.get_history())
+        return get_command_journal().get_commands(CommandKind.MUTATION)
 
     def make_srcdst_text(self):
         return "".join(
@@ -287,10 +273,18 @@ class TrafficControl:
             else:
                 self.__is_change_shaping_rule = False
                 self.__is_add_shaping_rule = True
+                self.__init_shaper()
+
+        try:
+            with command_batch_context():
+                if self.direction == TrafficDirection.INCOMING:
+                    load_module("ifb")
 
-        self.__setup_ifb()
+                return_code = self.__shaper.set_shaping()
+        except TcAlreadyExist:
+            return errno.EINVAL
 
-        return self.__shaper.set_shaping()
+        return return_code
 
     def delete_all_rules(self):
         result_list = []
@@ -318,9 +312,9 @@ class TrafficControl:
         """
 
         rule_finder = TcShapingRuleFinder(logger=logger, tc=self)
-        filter_param = rule_finder.find_filter_param()
+        filter_params = rule_finder.find_filter_params()
 
-        if not filter_param:
+        if not filter_params:
             message = f"shaping rule not found ({rule_finder.get_filter_string()})."
             if rule_finder.is_empty_filter_condition():
                 message += " you can delete all of the shaping rules with --all option."
@@ -328,23 +322,32 @@ class TrafficControl:
 
             return 1
 
-        logger.info(f"delete a shaping rule: {dict(filter_param)}")
-
-        filter_del_command = (
-            "{command:s} del dev {dev:s} protocol {protocol:s} "
-            "parent {parent:} handle {handle:s} prio {prio:} u32".format(
-                command=get_tc_base_command(TcSubCommand.FILTER),
-                dev=rule_finder.get_parsed_device(),
-                protocol=filter_param.get(Tc.Param.PROTOCOL),
-                parent="{:s}:".format(rule_finder.find_parent().split(":")[0]),
-                handle=filter_param.get(Tc.Param.FILTER_ID),
-                prio=filter_param.get(Tc.Param.PRIORITY),
+        logger.info(f"delete a shaping rule: {dict(filter_params[0])}")
+
+        device = rule_finder.get_parsed_device()
+        result = 0
+
+        # a rule consists of multiple filters when flower filters match ports:
+        # a filter for each L4 protocol. filters that hand off packets to buckets of
+        # hierarchical HTB layouts are shared among rules and are not deleted.
+        for filter_param in filter_params:
+            parent = "{:s}:".format(filter_param.get(Tc.Param.FLOW_ID).split(":")[0])
+            filter_del_command = " ".join(
+                [
+                    f"{get_tc_base_command(TcSubCommand.FILTER):s} del dev {device:s}",
+                    f"protocol {filter_param.get(Tc.Param.PROTOCOL):s}",
+                    f"parent {parent:s}",
+                    f"handle {filter_param.get(Tc.Param.FILTER_ID):s}",
+                    f"prio {filter_param.get(Tc.Param.PRIORITY)}",
+                    filter_param.get(Tc.Param.CLASSIFIER, FilterClassifier.U32.value),
+                ]
             )
-        )
 
-        result = run_command_helper(
-            command=filter_del_command, ignore_error_msg_regexp=None, notice_msg=None
-        )
+            return_code = run_command_helper(
+                command=filter_del_command, ignore_error_msg_regexp=None, notice_msg=None
+            )
+            if result == 0:
+                result = return_code
 
         rule_finder.clear()
         if not rule_finder.is_any_filter():
@@ -353,107 +356,43 @@ class TrafficControl:
 
         return result
 
-    def __init_shaper(self, shaping_algorithm: ShapingAlgorithm) -> None:
-        if shaping_algorithm == ShapingAlgorithm.HTB:
-            self.__shaper = HtbShaper(self)
-            return
-
-        if shaping_algorithm == ShapingAlgorithm.TBF:
-            self.__shaper = TbfShaper(self)
-            return
-
-        raise ParameterError(
-            "unknown shaping algorithm",
-            expected=list(ShapingAlgorithm),
-            value=shaping_algorithm,
-        )
-
-    def __validate_port(self):
-        validate_within_min_max(
-            "src_port", self.src_port, self.__MIN_PORT, self.__MAX_PORT, unit=None
-        )
-
-        validate_within_min_max(
-            "dst_port", self.dst_port, self.__MIN_PORT, self.__MAX_PORT, unit=None
-        )
-
-    def __get_device_qdisc_major_id(self):
-        import hashlib
-
-        base_device_hash = hashlib.md5(self.device.encode("latin-1")).hexdigest()[:3]
-        device_hash_prefix = "1"
-
-        return int(device_hash_prefix + base_device_hash, 16)
-
-    def __setup_ifb(self):
-        if self.direction != TrafficDirection.INCOMING:
-            return 0
-
-        if typepy.is_null_string(self.ifb_device):
-            return -1
-
-        return_code = 0
-        modprobe_proc = spr.SubprocessRunner("modprobe ifb")
-
-        try:
-            if modprobe_proc.run() != 0:
-                logger.error(modprobe_proc.stderr)
-        except spr.CommandError as e:
-            logger.debug(msgfy.to_debug_message(e))
-
-        if self.is_add_shaping_rule or self.is_change_shaping_rule:
-            notice_message = None
-        else:
-            notice_message = self.EXISTS_MSG_TEMPLATE.format(
-                "failed to add ip link: ip link already exists."
-            )
-
-        return_code |= run_command_helper(
-            "{:s} link add {:s} type ifb".format(find_bin_path("ip"), self.ifb_device),
-            ignore_error_msg_regexp=self.REGEXP_FILE_EXISTS,
-            notice_msg=notice_message,
+    def __init_shaper(self) -> None:
+        # the planner generates the commands that the shaper executes
+        self.__planner = TcCommandPlanner(
+            self.device,
+            direction=self.direction,
+            netem_param=self.netem_param,
+            dst_network=self.dst_network,
+            exclude_dst_network=self.exclude_dst_network,
+            src_network=self.src_network,
+            exclude_src_network=self.exclude_src_network,
+            dst_port=self.dst_port,
+            exclude_dst_port=self.exclude_dst_port,
+            src_port=self.src_port,
+            exclude_src_port=self.exclude_src_port,
+            is_ipv6=self.__is_ipv6,
+            is_change_shaping_rule=self.is_change_shaping_rule,
+            is_enable_iptables=self.is_enable_iptables,
+            shaping_algorithm=self.__shaping_algorithm,
+            is_hash_filter=self.is_hash_filter,
+            classifier=self.classifier,
+            htb_layout=self.htb_layout,
         )
 
-        return_code |= spr.SubprocessRunner(
-            "{:s} link set dev {:s} up".format(find_bin_path("ip"), self.ifb_device)
-        ).run()
-
-        base_command = f"{get_tc_base_command(TcSubCommand.QDISC):s} add"
-        if self.is_add_shaping_rule or self.is_change_shaping_rule:
-            notice_message = None
+        if self.__shaping_algorithm == ShapingAlgorithm.TBF:
+            self.__shaper = TbfShaper(self, self.__planner)
         else:
-            notice_message = self.EXISTS_MSG_TEMPLATE.format(
-                f"failed to '{base_command:s}': ingress qdisc already exists."
-            )
-        return_code |= run_command_helper(
-            f"{base_command:s} dev {self.device:s} ingress",
-            ignore_error_msg_regexp=self.REGEXP_FILE_EXISTS,
-            notice_msg=notice_message,
-        )
-
-        return_code |= spr.SubprocessRunner(
-            " ".join(
-                [
-                    f"{get_tc_base_command(TcSubCommand.FILTER):s} add",
-                    f"dev {self.device:s}",
-                    f"parent ffff: protocol {self.protocol:s} u32 match u32 0 0",
-                    f"flowid {self.__qdisc_major_id:x}:",
-                    "action mirred egress redirect",
-                    f"dev {self.ifb_device:s}",
-                ]
-            )
-        ).run()
+            self.__shaper = HtbShaper(self, self.__planner)
 
-        return return_code
+    def __get_device_qdisc_major_id(self):
+        return get_device_qdisc_major_id(self.device)
 
     def __delete_qdisc(self):
         logging_msg = f"delete {self.device} qdisc"
 
         with logging_context(logging_msg):
             returncode = run_command_helper(
-                "{:s} del dev {:s} root".format(
-                    get_tc_base_command(TcSubCommand.QDISC), self.device
-                ),
+                self.__planner.make_qdisc_delete_command(),
                 ignore_error_msg_regexp=re.compile(
                     "|".join(
                         [
@@ -477,9 +416,7 @@ class TrafficControl:
 
         with logging_context(logging_msg):
             returncode = run_command_helper(
-                "{:s} del dev {:s} ingress".format(
-                    get_tc_base_command(TcSubCommand.QDISC), self.device
-                ),
+                self.__planner.make_ingress_qdisc_delete_command(),
                 ignore_error_msg_regexp=re.compile(
                     "|".join(
                         [
@@ -512,15 +449,11 @@ class TrafficControl:
 
                 return errno.EPERM
 
-            commands = [
-                "{:s} del dev {:s} root".format(
-                    get_tc_base_command(TcSubCommand.QDISC), self.ifb_device
-                ),
-                "{:s} link set dev {:s} down".format(find_bin_path("ip"), self.ifb_device),
-                "{:s} link delete {:s} type ifb".format(find_bin_path("ip"), self.ifb_device),
+            returncodes = [
+                make_command_runner(command).run()
+                for command in self.__planner.make_ifb_delete_commands()
             ]
-
-            if all([spr.SubprocessRunner(command).run() != 0 for command in commands]):
+            if all(returncode != 0 for returncode in returncodes):
                 return 2
 
         logger.info(logging_msg)
@@ -0,0 +1,161 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+
+Generators of synthetic outputs of ``tc qdisc/class/filter show`` and
+``iptables -t mangle --line-numbers -L`` commands. The outputs have the same
+formats as configurations that set by ``tcset`` with ``num_rules`` rules.
+"""
+
+DEVICE = "eth0"
+QDISC_MAJOR_ID = "1f87"
+
+NUM_RULES_LIST = [10, 100, 1000, 10000, 100000]
+FILTER_TYPE_LIST = ["ipv4", "ipv6", "fwmark"]
+IP_VERSION_MAP = {"ipv4": 4, "ipv6": 6, "fwmark": 4}
+MARK_ID_OFFSET = 100
+
+
+def get_rounds(num_rules):
+    """
+    :return: Number of benchmark rounds that keep the run time of large dumps reasonable.
+    """
+
+    return min(100, max(1, 10000 // num_rules))
+
+
+def _get_classid(rule_idx):
+    # minor id 1 is used by the default class
+    return f"{QDISC_MAJOR_ID}:{rule_idx + 2:x}"
+
+
+def _get_netem_handle(rule_idx):
+    return f"{rule_idx + 0x2000:x}:"
+
+
+def make_qdisc_dump(num_rules):
+    lines = [
+        (
+            f"qdisc htb {QDISC_MAJOR_ID}: root refcnt 2 r2q 10 default 0x1 "
+            "direct_packets_stat 0 direct_qlen 1000"
+        )
+    ]
+
+    for i in range(num_rules):
+        lines.append(
+            f"qdisc netem {_get_netem_handle(i)} parent {_get_classid(i)} limit 1000 "
+            f"delay {i % 100 + 1}.0ms  1.0ms loss {i % 10}% duplicate 1% "
+            f"reorder 25% 50% corrupt 0.5%"
+        )
+
+    return "\n".join(lines)
+
+
+def make_class_dump(num_rules):
+    lines = [f"class htb {QDISC_MAJOR_ID}:1 root prio 0 rate 32Gbit ceil 32Gbit burst 0b cburst 0b"]
+
+    for i in range(num_rules):
+        rate = f"{i % 1000 + 1}Mbit"
+        lines.append(
+            f"class htb {_get_classid(i)} root leaf {_get_netem_handle(i)} prio 0 "
+            f"rate {rate} ceil {rate} burst 1600b cburst 1600b"
+        )
+
+    return "\n".join(lines)
+
+
+def _make_u32_filter_lines(protocol, rule_idx, match_lines):
+    pref = rule_idx // 0x800 + 1
+    fh = f"{0x800 + pref - 1:x}"
+    lines = []
+
+    if rule_idx % 0x800 == 0:
+        lines.extend(
+            [
+                f"filter parent {QDISC_MAJOR_ID}: protocol {protocol} pref {pref} u32 chain 0",
+                (
+                    f"filter parent {QDISC_MAJOR_ID}: protocol {protocol} pref {pref} u32 chain 0 "
+                    f"fh {fh}: ht divisor 1"
+                ),
+            ]
+        )
+
+    lines.append(
+        f"filter parent {QDISC_MAJOR_ID}: protocol {protocol} pref {pref} u32 chain 0 "
+        f"fh {fh}::{rule_idx % 0x800 + 0x800:x} order {rule_idx % 0x800 + 0x800:d} "
+        f"key ht {fh} bkt 0 flowid {_get_classid(rule_idx)} not_in_hw"
+    )
+    lines.extend(f"  {line}" for line in match_lines)
+
+    return lines
+
+
+def _get_port(rule_idx):
+    return rule_idx % 60000 + 1024
+
+
+def make_filter_dump(num_rules, filter_type="ipv4"):
+    """
+    :param str filter_type:
+        ``ipv4``/``ipv6``: u32 filters that match to destination networks and ports.
+        ``fwmark``: fw filters that match to marks of iptables mangle table.
+    """
+
+    lines = []
+
+    for i in range(num_rules):
+        if filter_type == "ipv4":
+            lines.extend(
+                _make_u32_filter_lines(
+                    "ip",
+                    i,
+                    [
+                        f"match 0a{i >> 8 & 0xFF:02x}{i & 0xFF:02x}00/ffffff00 at 16",
+                        f"match 0000{_get_port(i):04x}/0000ffff at 20",
+                    ],
+                )
+            )
+        elif filter_type == "ipv6":
+            lines.extend(
+                _make_u32_filter_lines(
+                    "ipv6",
+                    i,
+                    [
+                        "match 20010db8/ffffffff at 24",
+                        f"match {i:08x}/ffffffff at 28",
+                        f"match 0000{_get_port(i):04x}/0000ffff at 40",
+                    ],
+                )
+            )
+        elif filter_type == "fwmark":
+            pref = i + 1
+            lines.extend(
+                [
+                    f"filter parent {QDISC_MAJOR_ID}: protocol ip pref {pref} fw chain 0",
+                    (
+                        f"filter parent {QDISC_MAJOR_ID}: protocol ip pref {pref} fw chain 0 "
+                        f"handle 0x{i + MARK_ID_OFFSET:x} classid {_get_classid(i)}"
+                    ),
+                ]
+            )
+        else:
+            raise ValueError(f"unknown filter type: {filter_type}")
+
+    return "\n".join(lines)
+
+
+def make_mangle_dump(num_rules):
+    lines = [
+        "Chain PREROUTING (policy ACCEPT)",
+        "num  target     prot opt source               destination",
+        "",
+        "Chain OUTPUT (policy ACCEPT)",
+        "num  target     prot opt source               destination",
+    ]
+
+    for i in range(num_rules):
+        lines.append(
+            f"{i + 1:<4d} MARK       all  --  0.0.0.0/0            "
+            f"10.{i >> 8 & 0xFF:d}.{i & 0xFF:d}.0/24          MARK set 0x{i + MARK_ID_OFFSET:x}"
+        )
+
+    return "\n".join(lines)
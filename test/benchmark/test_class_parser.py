@@ -0,0 +1,29 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+
+from tcconfig.parser._class import TcClassParser
+from tcconfig.parser._store import HashRuleStore
+
+from .tc_dump import DEVICE, NUM_RULES_LIST, get_rounds, make_class_dump
+
+
+class Test_TcClassParser_parse:
+    @pytest.mark.parametrize(["num_rules"], [[num_rules] for num_rules in NUM_RULES_LIST])
+    def test_benchmark(self, benchmark, num_rules):
+        text = make_class_dump(num_rules)
+        parsers = []
+
+        def setup():
+            parsers.append(TcClassParser(HashRuleStore()))
+
+            return (parsers[-1],), {}
+
+        benchmark.pedantic(
+            lambda parser: parser.parse(DEVICE, text), setup=setup, rounds=get_rounds(num_rules)
+        )
+
+        # including the default class
+        assert len(parsers[-1].store.select_classes(DEVICE)) == num_rules + 1
@@ -0,0 +1,164 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+
+End-to-end benchmarks of tcset/tcshow/tcdel commands against devices that already have
+``num_rules`` shaping rules. tc/ip/iptables commands are substituted by the simulator,
+thus the benchmarks run without privileges and kernel modules.
+"""
+
+import shutil
+
+import pytest
+from subprocrunner import SubprocessRunner
+
+from tcconfig._common import find_bin_path
+from tcconfig._const import Tc
+from tcconfig._tc_command_helper import get_device_qdisc_major_id
+
+
+DEVICE = "eth0"
+
+# each execution of commands takes a few seconds even with a few rules
+E2E_NUM_RULES_LIST = [10, 100, 1000]
+INCREMENTAL_NUM_RULES_LIST = [10, 20]
+ROUNDS = 3
+
+
+def make_tcset_commands(num_rules):
+    """
+    :return:
+        tc commands (without the tc binary) that tcset executes to set ``num_rules`` rules
+        to the device.
+    """
+
+    major_id = f"{get_device_qdisc_major_id(DEVICE):x}"
+    commands = [
+        f"qdisc add dev {DEVICE:s} root handle {major_id:s}: htb default 1",
+        (
+            f"class add dev {DEVICE:s} parent {major_id:s}: classid {major_id:s}:1 htb "
+            "rate 32000000.0kbit"
+        ),
+    ]
+
+    for i in range(num_rules):
+        # tcset assigns decimal numbers to class minor ids
+        classid = f"{major_id:s}:{i + 2:d}"
+        commands.extend(
+            [
+                (
+                    f"class add dev {DEVICE:s} parent {major_id:s}: classid {classid:s} htb "
+                    "rate 1000.0Kbit ceil 1000.0Kbit burst 1600b cburst 1600b"
+                ),
+                (
+                    f"qdisc add dev {DEVICE:s} parent {classid:s} handle {i + 0x3000:x}: "
+                    "netem delay 10.0ms"
+                ),
+                (
+                    f"filter add dev {DEVICE:s} protocol ip parent {major_id:s}: prio 5 u32 "
+                    f"match ip dst 10.{i >> 8 & 0xFF:d}.{i & 0xFF:d}.0/24 match ip src 0.0.0.0/0 "
+                    f"match ip dport {i % 60000 + 1024:d} 0xffff flowid {classid:s}"
+                ),
+            ]
+        )
+
+    return commands
+
+
+@pytest.fixture
+def populated_simulator(simulator, tmp_path):
+    """
+    :return:
+        Function that sets rules to the simulator and returns a function that restores
+        the state of the simulator with the rules.
+    """
+
+    def populate(num_rules):
+        runner = SubprocessRunner(f"{find_bin_path('tc'):s} -batch -")
+        assert runner.run(input="\n".join(make_tcset_commands(num_rules)) + "\n") == 0
+
+        snapshot_path = tmp_path / f"snapshot_{num_rules:d}.json"
+        shutil.copyfile(simulator, snapshot_path)
+
+        def restore():
+            shutil.copyfile(snapshot_path, simulator)
+
+        return restore
+
+    return populate
+
+
+def run_command(command):
+    runner = SubprocessRunner(command)
+    assert runner.run() == 0, runner.stderr
+
+
+@pytest.mark.parametrize(["num_rules"], [[n] for n in E2E_NUM_RULES_LIST])
+def test_tcset_add(benchmark, populated_simulator, num_rules):
+    # the N+1-th rule: tcset reparses N existing rules to add a rule
+    restore = populated_simulator(num_rules)
+    command = [
+        Tc.Command.TCSET,
+        DEVICE,
+        "--add",
+        "--rate",
+        "1Mbps",
+        "--network",
+        "172.16.0.0/24",
+    ]
+
+    benchmark.pedantic(run_command, args=(command,), setup=restore, rounds=ROUNDS)
+
+
+@pytest.mark.parametrize(["num_rules"], [[n] for n in E2E_NUM_RULES_LIST])
+def test_tcshow(benchmark, populated_simulator, num_rules):
+    populated_simulator(num_rules)
+
+    benchmark.pedantic(run_command, args=([Tc.Command.TCSHOW, DEVICE],), rounds=ROUNDS)
+
+
+@pytest.mark.parametrize(["num_rules"], [[n] for n in E2E_NUM_RULES_LIST])
+def test_tcdel_id(benchmark, populated_simulator, num_rules):
+    restore = populated_simulator(num_rules)
+    command = [Tc.Command.TCDEL, DEVICE, "--id", "800::800"]
+
+    benchmark.pedantic(run_command, args=(command,), setup=restore, rounds=ROUNDS)
+
+
+@pytest.mark.parametrize(["num_rules"], [[n] for n in INCREMENTAL_NUM_RULES_LIST + [2000]])
+def test_tcset_rules_file(benchmark, simulator, tmp_path, num_rules):
+    # build up rules with a tcset execution: compare with test_tcset_add_incrementally
+    rules_file_path = tmp_path / "rules.jsonl"
+    rules_file_path.write_text(
+        "\n".join(
+            f'{{"network": "10.{i >> 8 & 0xFF:d}.{i & 0xFF:d}.0/24", "rate": "1Mbps"}}'
+            for i in range(num_rules)
+        )
+    )
+    command = [Tc.Command.TCSET, DEVICE, "--rules-file", str(rules_file_path)]
+
+    def setup():
+        simulator.unlink(missing_ok=True)
+
+    benchmark.pedantic(run_command, args=(command,), setup=setup, rounds=ROUNDS)
+
+
+@pytest.mark.parametrize(["num_rules"], [[n] for n in INCREMENTAL_NUM_RULES_LIST])
+def test_tcset_add_incrementally(benchmark, simulator, num_rules):
+    # total time to build up rules one 'tcset --add' at a time: O(N^2)
+    def build_rules():
+        simulator.unlink(missing_ok=True)
+
+        for i in range(num_rules):
+            run_command(
+                [
+                    Tc.Command.TCSET,
+                    DEVICE,
+                    "--add",
+                    "--rate",
+                    "1Mbps",
+                    "--network",
+                    f"10.0.{i:d}.0/24",
+                ]
+            )
+
+    benchmark.pedantic(build_rules, rounds=1)
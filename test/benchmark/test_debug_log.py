@@ -0,0 +1,83 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+
+import tcconfig._logger
+from tcconfig._logger import LogLevel, is_debug_enabled, logger, set_logger
+from tcconfig.parser._class import TcClassParser
+from tcconfig.parser._filter import TcFilterParser
+from tcconfig.parser._qdisc import TcQdiscParser
+from tcconfig.parser._store import HashRuleStore
+
+from .tc_dump import DEVICE, make_class_dump, make_filter_dump, make_qdisc_dump
+
+
+NUM_RULES = 1000
+
+PARSER_MAP = {
+    "qdisc": (lambda: TcQdiscParser(HashRuleStore()), make_qdisc_dump),
+    "class": (lambda: TcClassParser(HashRuleStore()), make_class_dump),
+    "filter": (lambda: TcFilterParser(HashRuleStore(), 4), make_filter_dump),
+}
+DEBUG_PARAMS = {"device": DEVICE, "classid": "1f87:2", "handle": "2000:", "rate": "1Mbit"}
+
+
+@pytest.fixture
+def log_level(request, monkeypatch):
+    """
+    Enable the logger with the log level. Messages are discarded by a sink that writes nothing,
+    so that the results show the cost of building debug messages.
+    """
+
+    log_level = request.param
+    monkeypatch.setattr(tcconfig._logger, "_is_logger_enabled", False)
+    monkeypatch.setattr(tcconfig._logger, "_is_debug_level", log_level == LogLevel.DEBUG)
+
+    logger.remove()
+    logger.add(lambda message: None, level=log_level)
+    set_logger(True)
+
+    yield log_level
+
+    set_logger(False)
+    logger.remove()
+
+
+class Test_debug_log_parse:
+    @pytest.mark.parametrize("log_level", [LogLevel.INFO, LogLevel.DEBUG], indirect=True)
+    @pytest.mark.parametrize(["parser_type"], [[parser_type] for parser_type in PARSER_MAP])
+    def test_benchmark(self, benchmark, log_level, parser_type):
+        make_parser, make_dump = PARSER_MAP[parser_type]
+        text = make_dump(NUM_RULES)
+
+        benchmark.pedantic(
+            lambda parser: parser.parse(DEVICE, text),
+            setup=lambda: ((make_parser(),), {}),
+            rounds=10,
+        )
+
+        assert is_debug_enabled() == (log_level == LogLevel.DEBUG)
+
+
+class Test_debug_log_call:
+    """
+    Per-call cost of a debug message within a parser loop at the INFO level.
+    """
+
+    @pytest.mark.parametrize("log_level", [LogLevel.INFO], indirect=True)
+    def test_benchmark_unguarded(self, benchmark, log_level):
+        params = DEBUG_PARAMS
+
+        benchmark(lambda: logger.debug(f"parse a qdisc entry: {params}"))
+
+    @pytest.mark.parametrize("log_level", [LogLevel.INFO], indirect=True)
+    def test_benchmark_guarded(self, benchmark, log_level):
+        params = DEBUG_PARAMS
+
+        def log():
+            if is_debug_enabled():
+                logger.debug(f"parse a qdisc entry: {params}")
+
+        benchmark(log)
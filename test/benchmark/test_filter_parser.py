@@ -0,0 +1,55 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+
+from tcconfig.parser._filter import TcFilterParser
+from tcconfig.parser._store import HashRuleStore
+
+from .tc_dump import (
+    DEVICE,
+    FILTER_TYPE_LIST,
+    IP_VERSION_MAP,
+    NUM_RULES_LIST,
+    get_rounds,
+    make_filter_dump,
+)
+
+
+class Test_TcFilterParser_lex:
+    @pytest.mark.parametrize(["num_filters"], [[1000], [10000], [100000]])
+    def test_benchmark(self, benchmark, num_filters):
+        lines = [line.strip() for line in make_filter_dump(num_filters).splitlines()]
+
+        results = benchmark(lambda: [TcFilterParser.lex(line) for line in lines])
+
+        assert (
+            len(
+                [
+                    line_type
+                    for line_type, _ in results
+                    if line_type == TcFilterParser.LineType.FILTER
+                ]
+            )
+            == num_filters
+        )
+
+
+class Test_TcFilterParser_parse:
+    @pytest.mark.parametrize(["filter_type"], [[filter_type] for filter_type in FILTER_TYPE_LIST])
+    @pytest.mark.parametrize(["num_rules"], [[num_rules] for num_rules in NUM_RULES_LIST])
+    def test_benchmark(self, benchmark, filter_type, num_rules):
+        text = make_filter_dump(num_rules, filter_type)
+        parsers = []
+
+        def setup():
+            parsers.append(TcFilterParser(HashRuleStore(), IP_VERSION_MAP[filter_type]))
+
+            return (parsers[-1],), {}
+
+        benchmark.pedantic(
+            lambda parser: parser.parse(DEVICE, text), setup=setup, rounds=get_rounds(num_rules)
+        )
+
+        assert parsers[-1].store.fetch_num_filters() == num_rules
@@ -0,0 +1,38 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+
+from tcconfig.parser._qdisc import TcQdiscParser
+from tcconfig.parser._store import HashRuleStore
+
+from .tc_dump import DEVICE, NUM_RULES_LIST, get_rounds, make_qdisc_dump
+
+
+class Test_TcQdiscParser_tokenize_line:
+    @pytest.mark.parametrize(["num_rules"], [[1000], [10000], [100000]])
+    def test_benchmark(self, benchmark, num_rules):
+        lines = make_qdisc_dump(num_rules).splitlines()
+
+        results = benchmark(lambda: [TcQdiscParser.tokenize_line(line) for line in lines])
+
+        assert len(results) == num_rules + 1
+
+
+class Test_TcQdiscParser_parse:
+    @pytest.mark.parametrize(["num_rules"], [[num_rules] for num_rules in NUM_RULES_LIST])
+    def test_benchmark(self, benchmark, num_rules):
+        text = make_qdisc_dump(num_rules)
+        parsers = []
+
+        def setup():
+            parsers.append(TcQdiscParser(HashRuleStore()))
+
+            return (parsers[-1],), {}
+
+        benchmark.pedantic(
+            lambda parser: parser.parse(DEVICE, text), setup=setup, rounds=get_rounds(num_rules)
+        )
+
+        assert len(parsers[-1].store.select_all_qdiscs()) == num_rules
@@ -0,0 +1,76 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+
+import tcconfig.parser.shaping_rule
+from tcconfig._const import TcCommandOutput, TcSubCommand, TrafficDirection
+from tcconfig._iptables import IptablesMangleController
+from tcconfig._logger import logger
+from tcconfig.parser.shaping_rule import TcShapingRuleParser
+
+from .tc_dump import (
+    DEVICE,
+    FILTER_TYPE_LIST,
+    IP_VERSION_MAP,
+    NUM_RULES_LIST,
+    get_rounds,
+    make_class_dump,
+    make_filter_dump,
+    make_mangle_dump,
+    make_qdisc_dump,
+)
+
+
+def setup_dumps(monkeypatch, num_rules, filter_type):
+    outputs = {
+        TcSubCommand.QDISC: make_qdisc_dump(num_rules),
+        TcSubCommand.CLASS: make_class_dump(num_rules),
+        TcSubCommand.FILTER: make_filter_dump(num_rules, filter_type),
+    }
+    mangle_output = make_mangle_dump(num_rules)
+
+    monkeypatch.setattr(
+        tcconfig.parser.shaping_rule,
+        "run_tc_show",
+        lambda subcommand, device, tc_command_output, is_json=False: outputs[subcommand],
+    )
+    monkeypatch.setattr(IptablesMangleController, "get_iptables", lambda self: mangle_output)
+
+
+class Test_TcShapingRuleParser_get_tc_parameter:
+    @pytest.mark.parametrize(
+        ["filter_type", "num_rules"],
+        [
+            [filter_type, num_rules]
+            for filter_type in FILTER_TYPE_LIST
+            for num_rules in NUM_RULES_LIST
+            # mangle table entries are looked up by a linear search for each fw filter
+            if filter_type != "fwmark" or num_rules <= 1000
+        ],
+    )
+    def test_benchmark(self, benchmark, monkeypatch, filter_type, num_rules):
+        setup_dumps(monkeypatch, num_rules, filter_type)
+        parsers = []
+
+        def setup():
+            # the parser does not execute tc commands to detect an ifb device
+            # with tc command outputs other than NOT_SET
+            parsers.append(
+                TcShapingRuleParser(
+                    device=DEVICE,
+                    ip_version=IP_VERSION_MAP[filter_type],
+                    logger=logger,
+                    tc_command_output=TcCommandOutput.STDOUT,
+                )
+            )
+
+            return (parsers[-1],), {}
+
+        results = benchmark.pedantic(
+            lambda parser: parser.get_tc_parameter(), setup=setup, rounds=get_rounds(num_rules)
+        )
+
+        assert len(results[DEVICE][TrafficDirection.OUTGOING]) == num_rules
+        assert results[DEVICE][TrafficDirection.INCOMING] == {}
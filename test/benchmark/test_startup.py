@@ -0,0 +1,80 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+
+Benchmarks of cold start times of tcset/tcdel/tcshow commands. Each round executes a new
+Python interpreter: import times of modules are not cached across rounds.
+Cumulative import times (``python -X importtime``) of top-level packages are recorded to
+the ``extra_info`` of the benchmarks.
+"""
+
+import re
+import sys
+
+import pytest
+from subprocrunner import SubprocessRunner
+
+from tcconfig._const import Tc
+
+
+ROUNDS = 5
+ENTRY_POINTS = [Tc.Command.TCSET, Tc.Command.TCDEL, Tc.Command.TCSHOW]
+
+# a line of -X importtime output: e.g.
+# import time:       123 |      45678 | simplesqlite
+_RE_IMPORT_TIME = re.compile(r"^import time:\s+\d+ \|\s+(?P<cumulative>\d+) \|(?P<name> *\S+)$")
+
+
+def run_command(command):
+    runner = SubprocessRunner(command)
+    assert runner.run() == 0, runner.stderr
+
+    return runner
+
+
+def parse_import_times(importtime_output):
+    """
+    :return: Dictionary of top-level packages and cumulative import times of them [ms].
+    """
+
+    import_times = {}
+    for line in importtime_output.splitlines():
+        match = _RE_IMPORT_TIME.search(line)
+        if match is None:
+            continue
+
+        name = match.group("name")
+        if name.startswith(" "):
+            # imported by other modules
+            continue
+
+        top_level = name.split(".")[0]
+        import_times[top_level] = (
+            import_times.get(top_level, 0) + int(match.group("cumulative")) / 1000
+        )
+
+    return import_times
+
+
+@pytest.mark.parametrize(["command"], [[command] for command in ENTRY_POINTS])
+def test_import(benchmark, command):
+    import_command = [sys.executable, "-X", "importtime", "-c", f"import tcconfig.{command:s}"]
+
+    runner = benchmark.pedantic(run_command, args=(import_command,), rounds=ROUNDS)
+
+    import_times = parse_import_times(runner.stderr)
+    benchmark.extra_info["import_ms"] = dict(
+        sorted(import_times.items(), key=lambda item: item[1], reverse=True)
+    )
+
+
+@pytest.mark.parametrize(["command"], [[command] for command in ENTRY_POINTS])
+def test_help(benchmark, command):
+    benchmark.pedantic(run_command, args=([command, "--help"],), rounds=ROUNDS)
+
+
+def test_tcset(benchmark, simulator):
+    benchmark.pedantic(
+        run_command,
+        args=([Tc.Command.TCSET, "eth0", "--delay", "10ms", "--overwrite"],),
+        rounds=ROUNDS,
+    )
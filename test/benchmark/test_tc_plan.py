@@ -0,0 +1,66 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+
+Benchmarks of generating commands for ``--tc-command``: the command planner versus
+the dry-run of ``TrafficControl``.
+"""
+
+import pytest
+import subprocrunner as spr
+
+import tcconfig._journal
+from tcconfig._const import TcCommandOutput, TrafficDirection
+from tcconfig._journal import CommandJournal
+from tcconfig._tc_plan import TcCommandPlanner, make_output_host_facts
+from tcconfig.traffic_control import TrafficControl
+
+from ..test_tc_plan import make_netem_param
+
+
+NUM_DEVICES = 100
+TC_KWARGS_LIST = [
+    {"direction": TrafficDirection.OUTGOING, "dst_network": "10.0.0.0/24", "dst_port": 80},
+    {"direction": TrafficDirection.INCOMING, "dst_network": "10.0.0.0/24", "dst_port": 80},
+]
+
+
+@pytest.fixture
+def dry_run(simulator, monkeypatch):
+    monkeypatch.setattr(spr.SubprocessRunner, "default_is_dry_run", True)
+    monkeypatch.setattr(tcconfig._journal, "_command_journal", CommandJournal())
+
+
+def make_devices():
+    return [f"veth{i:d}" for i in range(NUM_DEVICES)]
+
+
+@pytest.mark.parametrize(["tc_kwargs"], [[tc_kwargs] for tc_kwargs in TC_KWARGS_LIST])
+def test_planner(benchmark, dry_run, tc_kwargs):
+    def plan():
+        for device in make_devices():
+            planner = TcCommandPlanner(
+                device, netem_param=make_netem_param(bandwidth_rate="1Mbps"), **tc_kwargs
+            )
+            planner.validate()
+            planner.sanitize()
+            planner.make_set_commands(make_output_host_facts(planner.tc_device))
+
+    benchmark(plan)
+
+
+@pytest.mark.parametrize(["tc_kwargs"], [[tc_kwargs] for tc_kwargs in TC_KWARGS_LIST])
+def test_dry_run(benchmark, dry_run, tc_kwargs):
+    def run():
+        for device in make_devices():
+            tc = TrafficControl(
+                device,
+                netem_param=make_netem_param(bandwidth_rate="1Mbps"),
+                tc_command_output=TcCommandOutput.STDOUT,
+                **tc_kwargs,
+            )
+            tc.validate()
+            tc.sanitize()
+            tc.set_shaping_rule()
+            tc.get_command_history()
+
+    benchmark.pedantic(run, rounds=3)
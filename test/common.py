@@ -10,6 +10,8 @@ import humanreadable as hr
 from subprocrunner import SubprocessRunner
 from typepy import RealNumber
 
+from tcconfig._const import Tc
+
 
 DEADLINE_TIME = 3  # [sec]
 ASSERT_MARGIN = 0.5
@@ -48,6 +50,13 @@ def is_invalid_param(rate, delay, packet_loss, packet_duplicate, corrupt, reorde
     return is_invalid
 
 
+def run_tcshow(device, *args):
+    runner = SubprocessRunner([Tc.Command.TCSHOW, device, *args])
+    assert runner.run() == 0, runner.stderr
+
+    return json.loads(runner.stdout)
+
+
 def runner_helper(command):
     proc_runner = SubprocessRunner(command)
     proc_runner.run()
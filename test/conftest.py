@@ -1,5 +1,42 @@
+import pytest
+
+
 def pytest_addoption(parser):
     parser.addoption("--device", default=None)
     parser.addoption("--local-host", default="")
     parser.addoption("--dst-host", default="")
     parser.addoption("--dst-host-ex", default="")
+    parser.addoption(
+        "--run-benchmark", action="store_true", default=False, help="run benchmark tests."
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-benchmark"):
+        return
+
+    skip_benchmark = pytest.mark.skip(reason="need --run-benchmark option to run")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip_benchmark)
+
+
+@pytest.fixture
+def simulator(tmp_path, monkeypatch):
+    """
+    Substitute tc/ip/iptables commands with the simulator. Processes of tcconfig commands
+    that executed in the test inherit the environment variables.
+
+    :return: Path to the state file of the simulator.
+    """
+
+    from tcconfig._const import BIN_DIR_ENV_NAME
+
+    from .simulator import SIMULATOR_BIN_DIR, STATE_ENV_NAME
+
+    state_file_path = tmp_path / "simulator.json"
+    monkeypatch.setenv(BIN_DIR_ENV_NAME, SIMULATOR_BIN_DIR)
+    monkeypatch.setenv(STATE_ENV_NAME, str(state_file_path))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+    return state_file_path
@@ -0,0 +1,84 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+
+from tcconfig.parser._format import (
+    sprint_percentage,
+    sprint_rate,
+    sprint_tc_handle,
+    sprint_time,
+    sprint_u32_handle,
+)
+
+
+class Test_sprint_rate:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            [100, "800bit"],
+            [125000, "1Mbit"],
+            [187500, "1500Kbit"],
+            [312500, "2500Kbit"],
+            [4000000000, "32Gbit"],
+            [125, "1Kbit"],
+        ],
+    )
+    def test_normal(self, value, expected):
+        assert sprint_rate(value) == expected
+
+
+class Test_sprint_time:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            [10 * 1000**2, "10ms"],
+            [1500 * 1000, "1.5ms"],
+            [2500 * 1000**2, "2.5s"],
+            [200 * 1000, "200us"],
+            [500, "500ns"],
+        ],
+    )
+    def test_normal(self, value, expected):
+        assert sprint_time(value) == expected
+
+
+class Test_sprint_percentage:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            [0xFFFFFFFF, "100%"],
+            [round(0xFFFFFFFF * 0.05), "5%"],
+            [round(0xFFFFFFFF * 0.0001), "0.01%"],
+        ],
+    )
+    def test_normal(self, value, expected):
+        assert sprint_percentage(value) == expected
+
+
+class Test_sprint_tc_handle:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            [0x1A1A0000, "1a1a:"],
+            [0x1A1A0002, "1a1a:2"],
+            [0x0000FFF1, ":fff1"],
+            [0xFFFFFFFF, "root"],
+        ],
+    )
+    def test_normal(self, value, expected):
+        assert sprint_tc_handle(value) == expected
+
+
+class Test_sprint_u32_handle:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            [0x80000800, "800::800"],
+            [0x80000000, "800:"],
+            [0x8010100A, "801:1:a"],
+        ],
+    )
+    def test_normal(self, value, expected):
+        assert sprint_u32_handle(value) == expected
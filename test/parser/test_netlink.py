@@ -0,0 +1,67 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import struct
+
+import pytest
+
+from tcconfig.parser._netlink import unpack_nested_attrs, unpack_u32_keys
+
+
+def pack_u32_sel(keys):
+    sel = struct.pack("=BBBxHHhhI", 1, 0, len(keys), 0, 0, 0, 0, 0)
+    for value, mask, offset in keys:
+        sel += struct.pack(">II", mask, value) + struct.pack("=ii", offset, 0)
+
+    return sel
+
+
+def pack_attrs(attrs):
+    payload = b""
+    for attr_type, value in attrs:
+        payload += struct.pack("=HH", len(value) + 4, attr_type) + value
+        payload += b"\0" * (-len(payload) % 4)
+
+    return payload
+
+
+class Test_unpack_u32_keys:
+    @pytest.mark.parametrize(
+        ["keys"],
+        [
+            [[]],
+            [[(0x0A000000, 0xFF000000, 16), (0, 0, 12), (0x1F900050, 0xFFFFFFFF, 20)]],
+            [[(0x20010DB8, 0xFFFFFFFF, 24), (0, 0xFFFFFFFF, 28)]],
+        ],
+    )
+    def test_normal(self, keys):
+        assert unpack_u32_keys(pack_u32_sel(keys)) == keys
+
+
+class Test_unpack_nested_attrs:
+    @pytest.mark.parametrize(
+        ["attrs", "expected"],
+        [
+            [[], {}],
+            [
+                [
+                    (1, struct.pack("=I", 0x1A1A0002)),
+                    (9, b"\x06"),
+                    (12, bytes([192, 168, 0, 0])),
+                    (13, bytes([255, 255, 255, 0])),
+                    # nested flag bits are masked
+                    (0x8000 | 19, struct.pack(">H", 80)),
+                ],
+                {
+                    1: struct.pack("=I", 0x1A1A0002),
+                    9: b"\x06",
+                    12: bytes([192, 168, 0, 0]),
+                    13: bytes([255, 255, 255, 0]),
+                    19: struct.pack(">H", 80),
+                },
+            ],
+        ],
+    )
+    def test_normal(self, attrs, expected):
+        assert unpack_nested_attrs(pack_attrs(attrs)) == expected
@@ -4,7 +4,8 @@ import pytest
 
 import tcconfig
 import tcconfig.parser.shaping_rule
-from tcconfig._const import ShapingAlgorithm, TrafficDirection
+from tcconfig._common import device_state_cache_context, invalidate_device_state_cache
+from tcconfig._const import ShapingAlgorithm, TcCommandOutput, TrafficDirection
 from tcconfig._netem_param import NetemParameter
 from tcconfig.traffic_control import TrafficControl, delete_all_rules
 
@@ -16,6 +17,31 @@ def device_value(request):
     return request.config.getoption("--device")
 
 
+class Test_get_shaping_rule_parser:
+    @staticmethod
+    def get_parser(device="eth0", ip_version=4):
+        return tcconfig.parser.shaping_rule.get_shaping_rule_parser(
+            device=device,
+            ip_version=ip_version,
+            logger=NullLogger(),
+            tc_command_output=TcCommandOutput.STDOUT,
+        )
+
+    def test_normal(self):
+        assert self.get_parser() is not self.get_parser()
+
+        with device_state_cache_context():
+            rule_parser = self.get_parser()
+
+            assert self.get_parser() is rule_parser
+            assert self.get_parser(device="eth1") is not rule_parser
+            assert self.get_parser(ip_version=6) is not rule_parser
+
+            invalidate_device_state_cache()
+
+            assert self.get_parser() is not rule_parser
+
+
 class Test_TcShapingRuleParser:
     def test_normal(self, device_value):
         if device_value is None:
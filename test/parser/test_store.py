@@ -0,0 +1,163 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+from simplesqlite import connect_memdb
+
+from tcconfig.parser._model import Filter, Qdisc
+from tcconfig.parser._store import HashRuleStore, SqliteRuleStore
+
+
+DEVICE = "eth0"
+IFB_DEVICE = "ifb0"
+
+
+def make_store(store_type):
+    if store_type == "hash":
+        return HashRuleStore()
+
+    return SqliteRuleStore(connect_memdb())
+
+
+def make_filter(**kwargs):
+    params = {
+        "device": DEVICE,
+        "protocol": "ip",
+        "dst_network": "192.168.0.0/24",
+        "src_network": None,
+        "dst_port": None,
+        "src_port": None,
+    }
+    params.update(kwargs)
+
+    return Filter(**params)
+
+
+@pytest.fixture(params=["hash", "sqlite"])
+def store(request):
+    store = make_store(request.param)
+
+    for record in [
+        make_filter(filter_id="800::800", flowid="1f87:2", priority=1),
+        make_filter(filter_id="800::801", flowid="1f87:3", priority=2, dst_port=80),
+        make_filter(device=IFB_DEVICE, filter_id="800::800", flowid="1a1a:2", priority=1),
+        Filter(device=DEVICE, classid="1f87:4", handle="101"),
+    ]:
+        store.insert_filter(record)
+
+    for record in [
+        Qdisc(device=DEVICE, handle="1f87:", direct_qlen="1000"),
+        Qdisc(device=DEVICE, parent="1f87:2", handle="2007:", delay="10.0ms", limit="1000"),
+        Qdisc(device=DEVICE, parent="1f87:3", handle="2008:", loss="0.1%", limit=1000),
+        Qdisc(device=IFB_DEVICE, parent="1a1a:2", handle="1a9a:", rate="1M"),
+    ]:
+        store.insert_qdisc(record)
+
+    store.insert_classes(
+        [
+            {"device": DEVICE, "classid": "1f87:2", "rate": "1Mbps"},
+            {"device": DEVICE, "classid": "1f87:3", "rate": "2Mbps"},
+        ]
+    )
+    store.insert_classes([{"device": IFB_DEVICE, "classid": "1a1a:2", "rate": "3Mbps"}])
+
+    return store
+
+
+class Test_RuleStore_select_filters:
+    @pytest.mark.parametrize(
+        ["device", "filter_id", "expected"],
+        [
+            [None, None, ["1f87:2", "1f87:3", "1a1a:2", None]],
+            [DEVICE, None, ["1f87:2", "1f87:3", None]],
+            [IFB_DEVICE, None, ["1a1a:2"]],
+            [None, "800::800", ["1f87:2", "1a1a:2"]],
+            ["eth1", None, []],
+        ],
+    )
+    def test_normal(self, store, device, filter_id, expected):
+        assert [
+            record.flowid for record in store.select_filters(device=device, filter_id=filter_id)
+        ] == expected
+
+    def test_normal_type(self, store):
+        record = store.select_filters(device=DEVICE)[-1]
+
+        assert record.handle == 101
+        assert record.classid == "1f87:4"
+
+
+class Test_RuleStore_find_filters:
+    @pytest.mark.parametrize(
+        ["conditions", "expected"],
+        [
+            [{}, ["1f87:2"]],
+            [{"dst_port": 80}, ["1f87:3"]],
+            [{"dst_port": "80"}, ["1f87:3"]],
+            [{"dst_port": 8080}, []],
+            [{"dst_network": "192.168.1.0/24"}, []],
+            [{"device": IFB_DEVICE}, ["1a1a:2"]],
+            [{"protocol": "ipv6"}, []],
+        ],
+    )
+    def test_normal(self, store, conditions, expected):
+        params = make_filter(**conditions).as_dict()
+        params.setdefault("src_network", None)
+        params.setdefault("dst_port", None)
+        params.setdefault("src_port", None)
+
+        assert [record.flowid for record in store.find_filters(**params)] == expected
+
+
+class Test_RuleStore_select_qdiscs:
+    @pytest.mark.parametrize(
+        ["device", "parent", "expected"],
+        [
+            [DEVICE, "1f87:2", [("2007:", 1000)]],
+            [DEVICE, "1f87:3", [("2008:", 1000)]],
+            [DEVICE, None, [("1f87:", None)]],
+            [IFB_DEVICE, "1f87:2", []],
+        ],
+    )
+    def test_normal(self, store, device, parent, expected):
+        assert [
+            (record.handle, record.limit) for record in store.select_qdiscs(device, parent)
+        ] == expected
+
+    def test_normal_all(self, store):
+        assert [record.handle for record in store.select_all_qdiscs()] == [
+            "1f87:",
+            "2007:",
+            "2008:",
+            "1a9a:",
+        ]
+
+
+class Test_RuleStore_select_classes:
+    @pytest.mark.parametrize(
+        ["device", "classid_list", "expected"],
+        [
+            [DEVICE, None, ["1f87:2", "1f87:3"]],
+            [DEVICE, ["1f87:3", "1f87:2"], ["1f87:2", "1f87:3"]],
+            [DEVICE, ["1f87:3", None], ["1f87:3"]],
+            [IFB_DEVICE, ["1f87:2"], []],
+            [IFB_DEVICE, ["1a1a:2"], ["1a1a:2"]],
+        ],
+    )
+    def test_normal(self, store, device, classid_list, expected):
+        assert [
+            entry.get("classid") for entry in store.select_classes(device, classid_list)
+        ] == expected
+
+
+class Test_RuleStore_clear:
+    def test_normal(self, store):
+        assert store.fetch_num_filters() == 4
+
+        store.clear()
+
+        assert store.fetch_num_filters() == 0
+        assert store.select_filters() == []
+        assert store.select_all_qdiscs() == []
+        assert store.select_classes(DEVICE) == []
@@ -0,0 +1,19 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+
+from .netsim import STATE_ENV_NAME, SimulatorError, load_state, make_initial_state, save_state
+
+
+SIMULATOR_BIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin")
+
+__all__ = (
+    "SIMULATOR_BIN_DIR",
+    "STATE_ENV_NAME",
+    "SimulatorError",
+    "load_state",
+    "make_initial_state",
+    "save_state",
+)
@@ -0,0 +1,1541 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+
+Simulator of ``tc``/``ip``/``iptables`` commands for end-to-end tests and benchmarks
+that run without privileges and kernel modules.
+
+The state of network interfaces, qdiscs, classes, filters and iptables mangle table
+is kept in a JSON file (``TCCONFIG_SIMULATOR_STATE`` environment variable), and
+commands print the state in the same formats as iproute2 6.1/iptables 1.8.
+Only the subset of commands and parameters that tcconfig executes is supported.
+"""
+
+import ipaddress
+import json
+import os
+import re
+import sys
+import tempfile
+
+
+STATE_ENV_NAME = "TCCONFIG_SIMULATOR_STATE"
+IPROUTE2_VERSION = "iproute2-6.1.0"
+IPTABLES_VERSION = "v1.8.9 (legacy)"
+
+MANGLE_CHAINS = ("PREROUTING", "INPUT", "FORWARD", "OUTPUT", "POSTROUTING")
+
+_INGRESS_HANDLE = 0xFFFF0000
+_INGRESS_PARENT = 0xFFFFFFF1
+_AUTO_FILTER_PRIO = 0xC000
+_U32_FIRST_NODE_ID = 0x800
+_U32_MAX_NODE_ID = 0xFFF
+_FLOWER_ETH_TYPE_MAP = {"ip": "ipv4", "ipv6": "ipv6"}
+_FLOWER_PORT_IP_PROTOCOLS = ("tcp", "udp", "sctp")
+
+_RE_VALUE_UNIT = re.compile(r"^(?P<value>[\d.]+)(?P<unit>[a-zA-Z%]*)$")
+_RATE_UNIT_MAP = {
+    "bit": 1,
+    "kbit": 1000,
+    "mbit": 1000**2,
+    "gbit": 1000**3,
+    "tbit": 1000**4,
+    "bps": 8,
+    "kbps": 8 * 1000,
+    "mbps": 8 * 1000**2,
+    "gbps": 8 * 1000**3,
+}
+_TIME_UNIT_MAP = {
+    "s": 1000**3,
+    "sec": 1000**3,
+    "ms": 1000**2,
+    "msec": 1000**2,
+    "us": 1000,
+    "": 1000,
+}
+_SIZE_UNIT_MAP = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024**2, "mb": 1024**2}
+_U32_OFFSET_MAP = {
+    "ip": {"src": 12, "dst": 16, "port": 20},
+    "ip6": {"src": 8, "dst": 24, "port": 40},
+}
+
+
+class SimulatorError(Exception):
+    def __init__(self, message, returncode=2):
+        super().__init__(message)
+
+        self.returncode = returncode
+
+
+def _cannot_find_device(device):
+    return SimulatorError(f'Cannot find device "{device:s}"', returncode=1)
+
+
+def _rtnetlink_error(message):
+    return SimulatorError(f"RTNETLINK answers: {message:s}")
+
+
+def get_state_file_path():
+    return os.environ.get(STATE_ENV_NAME) or os.path.join(
+        tempfile.gettempdir(), "tcconfig-simulator.json"
+    )
+
+
+def make_initial_state(devices=("lo", "eth0")):
+    state = {"links": {}, "tc": {}, "mangle": {chain: [] for chain in MANGLE_CHAINS}}
+    for device in devices:
+        _add_link(state, device, "loopback" if device == "lo" else "ether", is_up=True)
+
+    return state
+
+
+def load_state():
+    try:
+        with open(get_state_file_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return make_initial_state()
+
+
+def save_state(state):
+    state_file_path = get_state_file_path()
+    tmp_file_path = f"{state_file_path:s}.{os.getpid():d}.tmp"
+
+    with open(tmp_file_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_file_path, state_file_path)
+
+
+def _dump_state(state):
+    return json.dumps(state, sort_keys=True)
+
+
+def _add_link(state, device, kind, is_up=False):
+    if device in state["links"]:
+        raise _rtnetlink_error("File exists")
+
+    ifindex = max([link["ifindex"] for link in state["links"].values()] + [0]) + 1
+    state["links"][device] = {
+        "ifindex": ifindex,
+        "kind": kind,
+        "mtu": 65536 if kind == "loopback" else 1500,
+        "is_up": is_up,
+    }
+    state["tc"][device] = {"qdiscs": [], "classes": [], "filters": []}
+
+
+def _get_tc_state(state, device):
+    if device not in state["links"]:
+        raise _cannot_find_device(device)
+
+    return state["tc"][device]
+
+
+def _split_value_unit(text):
+    match = _RE_VALUE_UNIT.search(text)
+    if match is None:
+        raise SimulatorError(f'Illegal value "{text:s}"', returncode=1)
+
+    return (float(match.group("value")), match.group("unit").lower())
+
+
+def _parse_by_unit(text, unit_map, default_unit):
+    value, unit = _split_value_unit(text)
+
+    try:
+        return int(value * unit_map[unit or default_unit])
+    except KeyError:
+        raise SimulatorError(f'Illegal unit "{text:s}"', returncode=1)
+
+
+def _parse_rate(text):
+    """
+    :return: Rate [bit/sec].
+    """
+
+    return _parse_by_unit(text, _RATE_UNIT_MAP, "bit")
+
+
+def _parse_time(text):
+    """
+    :return: Time [nsec].
+    """
+
+    return _parse_by_unit(text, _TIME_UNIT_MAP, "us")
+
+
+def _parse_size(text):
+    return _parse_by_unit(text, _SIZE_UNIT_MAP, "b")
+
+
+def _parse_percentage(text):
+    value, unit = _split_value_unit(text)
+    if unit not in ("", "%"):
+        raise SimulatorError(f'Illegal percentage "{text:s}"', returncode=1)
+
+    return value
+
+
+def _parse_handle(text):
+    if text == "root":
+        return None
+
+    major, _, minor = text.partition(":")
+
+    return (int(major or "0", 16) << 16) | int(minor or "0", 16)
+
+
+def _parse_u32_handle(text):
+    items = (text.split(":") + ["", ""])[:3]
+    htid, hash_value, node = (int(item or "0", 16) for item in items)
+
+    return (htid << 20) | (hash_value << 12) | node
+
+
+def sprint_rate(bit_per_sec):
+    units = ("", "K", "M", "G", "T")
+    unit_idx = 0
+
+    while unit_idx < len(units) - 1:
+        if bit_per_sec < 1000:
+            break
+        if bit_per_sec % 1000 != 0 and bit_per_sec < 1000**2:
+            break
+
+        bit_per_sec //= 1000
+        unit_idx += 1
+
+    return f"{bit_per_sec:d}{units[unit_idx]:s}bit"
+
+
+def sprint_time(nsec):
+    if nsec >= 1000**3:
+        return f"{nsec / 1000**3:.3g}s"
+    if nsec >= 1000**2:
+        return f"{nsec / 1000**2:.3g}ms"
+    if nsec >= 1000:
+        return f"{nsec / 1000:.3g}us"
+
+    return f"{nsec:d}ns"
+
+
+def sprint_handle(handle):
+    major = handle >> 16
+    minor = handle & 0xFFFF
+
+    if minor == 0:
+        return f"{major:x}:"
+
+    return f"{major:x}:{minor:x}"
+
+
+def _pop_options(arg_list, option_names, flag_names=()):
+    """
+    Pop leading '<name> <value>' pairs and flag names from a command argument list.
+    """
+
+    options = {}
+
+    while arg_list:
+        name = arg_list[0]
+
+        if name in flag_names:
+            options[name] = True
+            del arg_list[0]
+        elif name in option_names and len(arg_list) > 1:
+            options[name] = arg_list[1]
+            del arg_list[:2]
+        else:
+            break
+
+    return options
+
+
+def _to_param_map(param_list):
+    if len(param_list) % 2 != 0:
+        raise SimulatorError(f'What is "{param_list[-1]:s}"?', returncode=1)
+
+    return dict(zip(param_list[::2], param_list[1::2]))
+
+
+class _TcCommand:
+    def __init__(self, state):
+        self.__state = state
+
+    def execute(self, arg_list):
+        if not arg_list:
+            raise SimulatorError("Usage: tc [ OPTIONS ] OBJECT { COMMAND | help }", returncode=1)
+
+        tc_object, arg_list = arg_list[0], arg_list[1:]
+        verb = arg_list.pop(0) if arg_list else "show"
+        if verb == "list":
+            verb = "show"
+        elif verb == "delete":
+            verb = "del"
+
+        method = getattr(self, f"_{tc_object:s}_{verb:s}", None)
+        if method is None:
+            raise SimulatorError(
+                f'Command "{verb:s}" is unknown, try "tc {tc_object:s} help".', returncode=1
+            )
+
+        return method(arg_list)
+
+    # qdisc ------------------------------------------------------------------
+
+    def _qdisc_add(self, arg_list):
+        options = _pop_options(arg_list, ("dev", "parent", "handle"), ("root", "ingress"))
+        tc_state = _get_tc_state(self.__state, options.get("dev"))
+        qdiscs = tc_state["qdiscs"]
+
+        if options.get("ingress"):
+            if any(qdisc["handle"] == _INGRESS_HANDLE for qdisc in qdiscs):
+                raise _rtnetlink_error("File exists")
+
+            qdiscs.append({"kind": "ingress", "handle": _INGRESS_HANDLE, "parent": _INGRESS_PARENT})
+            return ""
+
+        if not arg_list:
+            raise SimulatorError("Unknown qdisc, kind is not specified", returncode=1)
+
+        kind, param_list = arg_list[0], arg_list[1:]
+        qdisc = {
+            "kind": kind,
+            "handle": _parse_handle(options.get("handle", "0:")),
+            "parent": None if options.get("root") else _parse_handle(options["parent"]),
+            "params": self.__parse_qdisc_params(kind, param_list),
+        }
+
+        if qdisc["parent"] is None:
+            if self.__find_root_qdisc(qdiscs) is not None:
+                raise _rtnetlink_error("File exists")
+        else:
+            if not self.__is_class_exists(tc_state, qdisc["parent"]):
+                raise _rtnetlink_error("No such file or directory")
+            if any(item["parent"] == qdisc["parent"] for item in qdiscs):
+                raise _rtnetlink_error("File exists")
+
+        if qdisc["handle"] == 0:
+            qdisc["handle"] = self.__make_qdisc_handle(qdiscs)
+        elif any(item["handle"] == qdisc["handle"] for item in qdiscs):
+            raise _rtnetlink_error("File exists")
+
+        qdiscs.append(qdisc)
+
+        return ""
+
+    def _qdisc_change(self, arg_list):
+        options = _pop_options(arg_list, ("dev", "parent", "handle"), ("root",))
+        qdiscs = _get_tc_state(self.__state, options.get("dev"))["qdiscs"]
+
+        if options.get("root"):
+            qdisc = self.__find_root_qdisc(qdiscs)
+        else:
+            qdisc = self.__find_qdisc(qdiscs, options)
+
+        if qdisc is None or qdisc["kind"] != arg_list[0]:
+            raise _rtnetlink_error("No such file or directory")
+
+        qdisc["params"] = self.__parse_qdisc_params(arg_list[0], arg_list[1:])
+
+        return ""
+
+    def _qdisc_replace(self, arg_list):
+        try:
+            return self._qdisc_change(list(arg_list))
+        except SimulatorError:
+            return self._qdisc_add(arg_list)
+
+    def _qdisc_del(self, arg_list):
+        options = _pop_options(arg_list, ("dev", "parent", "handle"), ("root", "ingress"))
+        tc_state = _get_tc_state(self.__state, options.get("dev"))
+        qdiscs = tc_state["qdiscs"]
+
+        if options.get("ingress"):
+            if not any(qdisc["handle"] == _INGRESS_HANDLE for qdisc in qdiscs):
+                raise _rtnetlink_error("Invalid argument")
+
+            self.__delete_qdisc_tree(tc_state, _INGRESS_HANDLE)
+            return ""
+
+        if options.get("root"):
+            qdisc = self.__find_root_qdisc(qdiscs)
+        else:
+            qdisc = self.__find_qdisc(qdiscs, options)
+
+        if qdisc is None:
+            raise _rtnetlink_error("No such file or directory")
+
+        self.__delete_qdisc_tree(tc_state, qdisc["handle"])
+
+        return ""
+
+    def _qdisc_show(self, arg_list):
+        options = _pop_options(arg_list, ("dev",))
+        qdiscs = _get_tc_state(self.__state, options.get("dev"))["qdiscs"]
+
+        root_qdisc = self.__find_root_qdisc(qdiscs)
+        lines = []
+        if root_qdisc is None:
+            lines.append("qdisc noqueue 0: root refcnt 2 ")
+
+        for qdisc in sorted(qdiscs, key=lambda item: item["handle"] == _INGRESS_HANDLE):
+            lines.append(self.__format_qdisc(qdisc))
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def __parse_qdisc_params(kind, param_list):
+        if kind == "htb":
+            param_map = _to_param_map(param_list)
+
+            return {
+                "default": int(param_map.get("default", "0"), 16),
+                "r2q": int(param_map.get("r2q", "10")),
+            }
+
+        if kind == "prio":
+            param_map = _to_param_map(param_list)
+
+            return {"bands": int(param_map.get("bands", "3"))}
+
+        if kind == "tbf":
+            param_map = _to_param_map(param_list)
+            burst = param_map.get("burst", param_map.get("buffer"))
+            if "rate" not in param_map or burst is None:
+                raise SimulatorError("tbf: rate and burst are required.", returncode=1)
+
+            return {
+                "rate": _parse_rate(param_map["rate"]),
+                "burst": _parse_size(burst),
+                "limit": _parse_size(param_map.get("limit", "0")),
+            }
+
+        if kind == "netem":
+            return _TcCommand.__parse_netem_params(param_list)
+
+        raise SimulatorError(
+            'Unknown qdisc "{:s}", hence option "{:s}" is unparsable'.format(
+                kind, " ".join(param_list)
+            ),
+            returncode=1,
+        )
+
+    @staticmethod
+    def __parse_netem_params(param_list):
+        params = {"limit": 1000}
+        idx = 0
+
+        while idx < len(param_list):
+            name = param_list[idx]
+            idx += 1
+
+            if name in ("loss", "duplicate", "corrupt", "reorder"):
+                if param_list[idx] == "random":
+                    idx += 1
+                params[name] = _parse_percentage(param_list[idx])
+                idx += 1
+            elif name == "delay":
+                params["delay"] = _parse_time(param_list[idx])
+                idx += 1
+
+                if idx < len(param_list) and param_list[idx][0].isdigit():
+                    params["jitter"] = _parse_time(param_list[idx])
+                    idx += 1
+            elif name == "distribution":
+                # distribution tables are not shown by tc
+                idx += 1
+            elif name == "limit":
+                params["limit"] = int(float(param_list[idx]))
+                idx += 1
+            elif name == "rate":
+                params["rate"] = _parse_rate(param_list[idx])
+                idx += 1
+            else:
+                raise SimulatorError(f'What is "{name:s}"?', returncode=1)
+
+        if params.get("reorder"):
+            if not params.get("delay"):
+                raise SimulatorError(
+                    "reordering not possible without specifying some delay", returncode=1
+                )
+
+            params["gap"] = 1
+
+        return params
+
+    @staticmethod
+    def __format_qdisc(qdisc):
+        kind = qdisc["kind"]
+        if kind == "ingress":
+            return "qdisc ingress ffff: parent ffff:fff1 ----------------"
+
+        items = [f"qdisc {kind:s} {sprint_handle(qdisc['handle']):s}"]
+        if qdisc["parent"] is None:
+            items.append("root refcnt 2")
+        else:
+            items.append(f"parent {sprint_handle(qdisc['parent']):s}")
+
+        params = qdisc["params"]
+        if kind == "htb":
+            items.append(
+                "r2q {:d} default 0x{:x} direct_packets_stat 0 direct_qlen 1000".format(
+                    params["r2q"], params["default"]
+                )
+            )
+        elif kind == "prio":
+            items.append(f"bands {params['bands']:d} priomap 1 2 2 2 1 2 0 0 1 1 1 1 1 1 1 1")
+        elif kind == "tbf":
+            items.append(
+                "rate {:s} burst {:d}b limit {:d}b".format(
+                    sprint_rate(params["rate"]), params["burst"], params["limit"]
+                )
+            )
+        elif kind == "netem":
+            items.append(f"limit {params['limit']:d}")
+            if params.get("delay"):
+                delay = f"delay {sprint_time(params['delay']):s}"
+                if params.get("jitter"):
+                    delay += f"  {sprint_time(params['jitter']):s}"
+                items.append(delay)
+            for name in ("loss", "duplicate", "reorder", "corrupt"):
+                if params.get(name):
+                    items.append(f"{name:s} {params[name]:g}%")
+            if params.get("rate"):
+                items.append(f"rate {sprint_rate(params['rate']):s}")
+            if params.get("gap"):
+                items.append(f"gap {params['gap']:d}")
+
+        return " ".join(items)
+
+    @staticmethod
+    def __find_root_qdisc(qdiscs):
+        for qdisc in qdiscs:
+            if qdisc["parent"] is None:
+                return qdisc
+
+        return None
+
+    @staticmethod
+    def __find_qdisc(qdiscs, options):
+        if "handle" in options:
+            handle = _parse_handle(options["handle"])
+            key = "handle"
+        elif "parent" in options:
+            handle = _parse_handle(options["parent"])
+            key = "parent"
+        else:
+            return None
+
+        for qdisc in qdiscs:
+            if qdisc[key] == handle:
+                return qdisc
+
+        return None
+
+    @staticmethod
+    def __make_qdisc_handle(qdiscs):
+        handle = 0x80010000
+        used_handle_set = {qdisc["handle"] for qdisc in qdiscs}
+        while handle in used_handle_set:
+            handle += 0x10000
+
+        return handle
+
+    @staticmethod
+    def __is_class_exists(tc_state, classid):
+        if any(tc_class["classid"] == classid for tc_class in tc_state["classes"]):
+            return True
+
+        # implicit classes of classful qdiscs: bands of prio and the child of netem
+        for qdisc in tc_state["qdiscs"]:
+            if qdisc["handle"] != classid & 0xFFFF0000:
+                continue
+
+            if qdisc["kind"] == "prio":
+                return 0 < classid & 0xFFFF <= qdisc["params"]["bands"]
+            if qdisc["kind"] == "netem":
+                return classid & 0xFFFF == 1
+
+        return False
+
+    @staticmethod
+    def __delete_qdisc_tree(tc_state, handle):
+        major_set = {handle & 0xFFFF0000}
+
+        # collect descendant qdiscs: parents of qdiscs are classes of the ancestor qdiscs
+        while True:
+            descendant_set = {
+                qdisc["handle"]
+                for qdisc in tc_state["qdiscs"]
+                if qdisc["parent"] is not None and qdisc["parent"] & 0xFFFF0000 in major_set
+            }
+            if descendant_set <= major_set:
+                break
+            major_set |= descendant_set
+
+        tc_state["qdiscs"] = [
+            qdisc for qdisc in tc_state["qdiscs"] if qdisc["handle"] not in major_set
+        ]
+        tc_state["classes"] = [
+            tc_class
+            for tc_class in tc_state["classes"]
+            if tc_class["classid"] & 0xFFFF0000 not in major_set
+        ]
+        tc_state["filters"] = [tp for tp in tc_state["filters"] if tp["parent"] not in major_set]
+
+    # class ------------------------------------------------------------------
+
+    def _class_add(self, arg_list):
+        options = _pop_options(arg_list, ("dev", "parent", "classid"), ("root",))
+        tc_state = _get_tc_state(self.__state, options.get("dev"))
+        tc_class = self.__make_class(tc_state, options, arg_list)
+
+        if any(item["classid"] == tc_class["classid"] for item in tc_state["classes"]):
+            raise _rtnetlink_error("File exists")
+
+        tc_state["classes"].append(tc_class)
+
+        return ""
+
+    def _class_change(self, arg_list):
+        options = _pop_options(arg_list, ("dev", "parent", "classid"), ("root",))
+        tc_state = _get_tc_state(self.__state, options.get("dev"))
+        tc_class = self.__make_class(tc_state, options, arg_list)
+
+        for idx, item in enumerate(tc_state["classes"]):
+            if item["classid"] == tc_class["classid"]:
+                tc_state["classes"][idx] = tc_class
+                return ""
+
+        raise _rtnetlink_error("No such file or directory")
+
+    def _class_replace(self, arg_list):
+        try:
+            return self._class_change(list(arg_list))
+        except SimulatorError:
+            return self._class_add(arg_list)
+
+    def _class_del(self, arg_list):
+        options = _pop_options(arg_list, ("dev", "parent", "classid"), ("root",))
+        tc_state = _get_tc_state(self.__state, options.get("dev"))
+        classid = _parse_handle(options.get("classid", "0:"))
+
+        for idx, item in enumerate(tc_state["classes"]):
+            if item["classid"] == classid:
+                del tc_state["classes"][idx]
+                for qdisc in tc_state["qdiscs"]:
+                    if qdisc["parent"] == classid:
+                        self.__delete_qdisc_tree(tc_state, qdisc["handle"])
+                        break
+                return ""
+
+        raise _rtnetlink_error("No such file or directory")
+
+    def _class_show(self, arg_list):
+        options = _pop_options(arg_list, ("dev",))
+        tc_state = _get_tc_state(self.__state, options.get("dev"))
+        leaf_map = {
+            qdisc["parent"]: qdisc["handle"]
+            for qdisc in tc_state["qdiscs"]
+            if qdisc["parent"] is not None
+        }
+        lines = []
+
+        for qdisc in tc_state["qdiscs"]:
+            if qdisc["kind"] == "prio":
+                classid_list = [
+                    qdisc["handle"] | band for band in range(1, qdisc["params"]["bands"] + 1)
+                ]
+            elif qdisc["kind"] == "netem" and qdisc["handle"] | 1 in leaf_map:
+                # the class of netem is shown only if the class has a child qdisc
+                classid_list = [qdisc["handle"] | 1]
+            else:
+                continue
+
+            for classid in classid_list:
+                line = "class {:s} {:s} parent {:s}".format(
+                    qdisc["kind"], sprint_handle(classid), sprint_handle(qdisc["handle"])
+                )
+                if classid in leaf_map:
+                    line += f" leaf {sprint_handle(leaf_map[classid]):s}"
+                lines.append(line + " ")
+
+        for tc_class in sorted(tc_state["classes"], key=lambda item: item["classid"]):
+            items = [f"class htb {sprint_handle(tc_class['classid']):s}"]
+            if tc_class["parent"] & 0xFFFF == 0:
+                items.append("root")
+            else:
+                items.append(f"parent {sprint_handle(tc_class['parent']):s}")
+            if tc_class["classid"] in leaf_map:
+                items.append(f"leaf {sprint_handle(leaf_map[tc_class['classid']]):s}")
+            items.append(
+                "prio 0 rate {:s} ceil {:s} burst {:d}b cburst {:d}b ".format(
+                    sprint_rate(tc_class["rate"]),
+                    sprint_rate(tc_class["ceil"]),
+                    tc_class["burst"],
+                    tc_class["cburst"],
+                )
+            )
+            lines.append(" ".join(items))
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def __make_class(tc_state, options, arg_list):
+        if not arg_list or arg_list[0] != "htb":
+            raise SimulatorError("Error: Qdisc class kind is not supported.", returncode=2)
+
+        classid = _parse_handle(options.get("classid", "0:"))
+        parent = _parse_handle(options.get("parent", "0:"))
+        if classid is None or parent is None:
+            raise _rtnetlink_error("Invalid argument")
+
+        htb_qdisc_set = {qdisc["handle"] for qdisc in tc_state["qdiscs"] if qdisc["kind"] == "htb"}
+        if classid & 0xFFFF0000 not in htb_qdisc_set or parent & 0xFFFF0000 not in htb_qdisc_set:
+            raise _rtnetlink_error("No such file or directory")
+
+        param_map = _to_param_map(arg_list[1:])
+        if "rate" not in param_map:
+            raise SimulatorError('"rate" is required.', returncode=1)
+
+        rate = _parse_rate(param_map["rate"])
+        burst = _parse_size(param_map.get("burst", "1600"))
+
+        return {
+            "classid": classid,
+            "parent": parent,
+            "rate": rate,
+            "ceil": _parse_rate(param_map["ceil"]) if "ceil" in param_map else rate,
+            "burst": burst,
+            "cburst": _parse_size(param_map["cburst"]) if "cburst" in param_map else burst,
+        }
+
+    # filter -----------------------------------------------------------------
+
+    def _filter_add(self, arg_list):
+        options = _pop_options(
+            arg_list, ("dev", "protocol", "parent", "prio", "pref", "handle"), ("root", "ingress")
+        )
+        tc_state = _get_tc_state(self.__state, options.get("dev"))
+        parent = self.__get_filter_parent(tc_state, options)
+        if parent is None or not any(qdisc["handle"] == parent for qdisc in tc_state["qdiscs"]):
+            raise SimulatorError(
+                "Error: Parent Qdisc doesn't exists.\nWe have an error talking to the kernel"
+            )
+
+        if not arg_list:
+            raise SimulatorError("Unknown filter, kind is not specified", returncode=1)
+
+        kind, param_list = arg_list[0], arg_list[1:]
+        protocol = options.get("protocol", "all")
+        prio = options.get("prio", options.get("pref"))
+        filters = tc_state["filters"]
+
+        if prio is None:
+            parent_prio_list = [tp["prio"] for tp in filters if tp["parent"] == parent]
+            prio = min(parent_prio_list) - 1 if parent_prio_list else _AUTO_FILTER_PRIO
+        else:
+            prio = int(prio)
+
+        tp = self.__find_tp(filters, parent, prio)
+        if tp is not None and (tp["kind"] != kind or tp["protocol"] != protocol):
+            raise _rtnetlink_error("Invalid argument")
+
+        if kind == "u32":
+            is_new_tp = tp is None
+            if is_new_tp:
+                # hash tables are allocated for each qdisc
+                htid_list = [item["htid"] for item in self.__get_u32_tps(filters, parent)]
+                tp = self.__add_tp(filters, parent, prio, protocol, kind)
+                tp["htid"] = max(htid_list + [0x7FF]) + 1
+                tp["tables"] = []
+
+            try:
+                if param_list[:1] == ["divisor"]:
+                    self.__add_u32_table(filters, tp, options.get("handle"), param_list)
+                    return ""
+
+                node = self.__make_u32_node(filters, tp, options.get("handle"), param_list)
+            except SimulatorError:
+                if is_new_tp:
+                    filters.remove(tp)
+                raise
+        elif kind == "flower":
+            node = self.__make_flower_node(protocol, param_list)
+            if tp is None:
+                tp = self.__add_tp(filters, parent, prio, protocol, kind)
+
+            handle_list = [item["handle"] for item in tp["nodes"]]
+            if "handle" in options:
+                node["handle"] = int(options["handle"], 0)
+            else:
+                node["handle"] = max(handle_list + [0]) + 1
+
+            if node["handle"] in handle_list or any(
+                item["keys"] == node["keys"] for item in tp["nodes"]
+            ):
+                raise _rtnetlink_error("File exists")
+        elif kind == "fw":
+            if "handle" not in options:
+                raise SimulatorError("Error: fw filter requires a handle.", returncode=2)
+
+            node = self.__make_fw_node(int(options["handle"], 0), param_list)
+            if tp is None:
+                tp = self.__add_tp(filters, parent, prio, protocol, kind)
+            elif any(item["handle"] == node["handle"] for item in tp["nodes"]):
+                raise _rtnetlink_error("File exists")
+        else:
+            raise SimulatorError(
+                'Unknown filter "{:s}", hence option "{:s}" is unparsable'.format(
+                    kind, " ".join(param_list)
+                ),
+                returncode=1,
+            )
+
+        tp["nodes"].append(node)
+
+        return ""
+
+    def _filter_del(self, arg_list):
+        options = _pop_options(
+            arg_list, ("dev", "protocol", "parent", "prio", "pref", "handle"), ("root", "ingress")
+        )
+        tc_state = _get_tc_state(self.__state, options.get("dev"))
+        parent = self.__get_filter_parent(tc_state, options)
+        prio = options.get("prio", options.get("pref"))
+        filters = tc_state["filters"]
+
+        if prio is None:
+            tc_state["filters"] = [tp for tp in filters if tp["parent"] != parent]
+            return ""
+
+        tp = self.__find_tp(filters, parent, int(prio))
+        if tp is None:
+            raise SimulatorError(
+                "Error: Filter with specified priority/protocol not found.\n"
+                "We have an error talking to the kernel"
+            )
+
+        if "handle" not in options:
+            filters.remove(tp)
+            return ""
+
+        if tp["kind"] == "u32":
+            handle = _parse_u32_handle(options["handle"])
+            node_list = [node for node in tp["nodes"] if self.__get_u32_handle(tp, node) != handle]
+        else:
+            handle = int(options["handle"], 0)
+            node_list = [node for node in tp["nodes"] if node["handle"] != handle]
+
+        if len(node_list) == len(tp["nodes"]):
+            raise _rtnetlink_error("No such file or directory")
+
+        tp["nodes"] = node_list
+
+        return ""
+
+    def _filter_show(self, arg_list):
+        options = _pop_options(
+            arg_list, ("dev", "protocol", "parent", "prio", "pref"), ("root", "ingress")
+        )
+        tc_state = _get_tc_state(self.__state, options.get("dev"))
+        parent = self.__get_filter_parent(tc_state, options)
+        lines = []
+
+        for tp in sorted(tc_state["filters"], key=lambda item: item["prio"]):
+            if tp["parent"] != parent:
+                continue
+
+            header = "filter parent {:s} protocol {:s} pref {:d} {:s} chain 0".format(
+                sprint_handle(parent), tp["protocol"], tp["prio"], tp["kind"]
+            )
+            lines.append(header + " ")
+
+            if tp["kind"] == "flower":
+                for node in tp["nodes"]:
+                    lines.extend(self.__format_flower_node(header, tp, node))
+                continue
+
+            if tp["kind"] == "fw":
+                for node in tp["nodes"]:
+                    lines.append(
+                        "{:s} handle 0x{:x} classid {:s} ".format(
+                            header, node["handle"], sprint_handle(node["classid"])
+                        )
+                    )
+                continue
+
+            # tables are listed from the newest one as same as the kernel
+            for table in tp.get("tables", [])[::-1] + [{"htid": tp["htid"], "divisor": 1}]:
+                lines.extend(self.__format_u32_table(header, tp, table))
+
+        return "\n".join(lines)
+
+    def _filter_get(self, arg_list):
+        options = _pop_options(
+            arg_list, ("dev", "protocol", "parent", "prio", "pref", "handle"), ("root", "ingress")
+        )
+        tc_state = _get_tc_state(self.__state, options.get("dev"))
+        parent = self.__get_filter_parent(tc_state, options)
+        prio = options.get("prio", options.get("pref"))
+        tp = None if prio is None else self.__find_tp(tc_state["filters"], parent, int(prio))
+        if tp is None or tp["kind"] != "u32" or "handle" not in options:
+            raise SimulatorError(
+                "Error: Filter with specified priority/protocol not found.\n"
+                "We have an error talking to the kernel"
+            )
+
+        header = "filter parent {:s} protocol {:s} pref {:d} {:s} chain 0".format(
+            sprint_handle(parent), tp["protocol"], tp["prio"], tp["kind"]
+        )
+        handle = _parse_u32_handle(options["handle"])
+
+        for table in tp.get("tables", []) + [{"htid": tp["htid"], "divisor": 1}]:
+            if handle == table["htid"] << 20:
+                return self.__format_u32_table(header, tp, table, is_nodes=False)[0]
+
+        for node in tp["nodes"]:
+            if self.__get_u32_handle(tp, node) == handle:
+                return "\n".join(self.__format_u32_node(header, tp, node))
+
+        raise SimulatorError(
+            "Error: Specified filter handle not found.\nWe have an error talking to the kernel"
+        )
+
+    @staticmethod
+    def __get_u32_tps(filters, parent):
+        return [tp for tp in filters if tp["parent"] == parent and tp["kind"] == "u32"]
+
+    @staticmethod
+    def __get_u32_handle(tp, node):
+        return (node.get("htid", tp["htid"]) << 20) | (node.get("bucket", 0) << 12) | node["node"]
+
+    def __find_u32_table(self, filters, parent, htid):
+        for tp in self.__get_u32_tps(filters, parent):
+            if tp["htid"] == htid:
+                return {"htid": htid, "divisor": 1}
+
+            for table in tp.get("tables", []):
+                if table["htid"] == htid:
+                    return table
+
+        return None
+
+    def __add_u32_table(self, filters, tp, handle, param_list):
+        param_map = _to_param_map(param_list)
+        divisor = int(param_map["divisor"], 0)
+        if not 1 <= divisor <= 0x100:
+            raise _rtnetlink_error("Invalid argument")
+
+        if handle is None:
+            htid = 1
+            while self.__find_u32_table(filters, tp["parent"], htid) is not None:
+                htid += 1
+        else:
+            htid = _parse_u32_handle(handle) >> 20
+            if self.__find_u32_table(filters, tp["parent"], htid) is not None:
+                raise _rtnetlink_error("File exists")
+
+        tp.setdefault("tables", []).append({"htid": htid, "divisor": divisor})
+
+    def __format_u32_table(self, header, tp, table, is_nodes=True):
+        htid = table["htid"]
+        lines = [f"{header:s} fh {htid:x}: ht divisor {table['divisor']:d} "]
+        if not is_nodes:
+            return lines
+
+        nodes = [node for node in tp["nodes"] if node.get("htid", tp["htid"]) == htid]
+        for node in sorted(nodes, key=lambda item: (item.get("bucket", 0), item["node"])):
+            lines.extend(self.__format_u32_node(header, tp, node))
+
+        return lines
+
+    @staticmethod
+    def __format_u32_node(header, tp, node):
+        htid = node.get("htid", tp["htid"])
+        bucket = node.get("bucket", 0)
+
+        if node.get("link") is not None:
+            target = "link {:x}:".format(node["link"])
+        else:
+            target = "*flowid {:s}".format(sprint_handle(node["flowid"]))
+
+        lines = [
+            "{:s} fh {:x}:{:s}:{:x} order {:d} key ht {:x} bkt {:x} {:s} not_in_hw ".format(
+                header,
+                htid,
+                f"{bucket:x}" if bucket else "",
+                node["node"],
+                node["node"],
+                htid,
+                bucket,
+                target,
+            )
+        ]
+        lines.extend(
+            f"  match {value:08x}/{mask:08x} at {offset:d}" for value, mask, offset in node["keys"]
+        )
+        if node.get("hashkey"):
+            lines.append("    hash mask {:08x} at {:d} ".format(*node["hashkey"]))
+        if node.get("redirect"):
+            lines.extend(
+                [
+                    "\taction order 1: mirred (Egress Redirect to device {:s}) stolen".format(
+                        node["redirect"]
+                    ),
+                    " \tindex 1 ref 1 bind 1",
+                    "",
+                ]
+            )
+
+        return lines
+
+    @staticmethod
+    def __get_filter_parent(tc_state, options):
+        if options.get("root") or options.get("ingress"):
+            # the handle of 'root' (ffff:ffff) is considered as the ingress qdisc: ffff:
+            return _INGRESS_HANDLE
+
+        if "parent" in options:
+            return _parse_handle(options["parent"])
+
+        for qdisc in tc_state["qdiscs"]:
+            if qdisc["parent"] is None:
+                return qdisc["handle"]
+
+        return None
+
+    @staticmethod
+    def __find_tp(filters, parent, prio):
+        for tp in filters:
+            if tp["parent"] == parent and tp["prio"] == prio:
+                return tp
+
+        return None
+
+    @staticmethod
+    def __add_tp(filters, parent, prio, protocol, kind):
+        tp = {"parent": parent, "prio": prio, "protocol": protocol, "kind": kind, "nodes": []}
+        filters.append(tp)
+
+        return tp
+
+    def __make_u32_node(self, filters, tp, handle, param_list):
+        key_list = []
+        node = {
+            "htid": tp["htid"],
+            "bucket": 0,
+            "flowid": None,
+            "keys": key_list,
+            "link": None,
+            "hashkey": None,
+            "redirect": None,
+        }
+        idx = 0
+
+        while idx < len(param_list):
+            token = param_list[idx]
+
+            if token == "match":
+                idx = self.__parse_u32_match(param_list, idx + 1, key_list)
+            elif token in ("flowid", "classid"):
+                node["flowid"] = _parse_handle(param_list[idx + 1])
+                idx += 2
+            elif token == "ht":
+                ht = _parse_u32_handle(param_list[idx + 1])
+                node["htid"] = ht >> 20
+                node["bucket"] = (ht >> 12) & 0xFF
+                idx += 2
+            elif token == "link":
+                node["link"] = _parse_u32_handle(param_list[idx + 1]) >> 20
+                idx += 2
+            elif param_list[idx : idx + 2] == ["hashkey", "mask"] and param_list[
+                idx + 3 : idx + 4
+            ] == ["at"]:
+                node["hashkey"] = [int(param_list[idx + 2], 16), int(param_list[idx + 4])]
+                idx += 5
+            elif param_list[idx : idx + 4] == ["action", "mirred", "egress", "redirect"]:
+                device = param_list[idx + 5]
+                if device not in self.__state["links"]:
+                    raise _cannot_find_device(device)
+
+                node["redirect"] = device
+                idx += 6
+            else:
+                raise SimulatorError(f'What is "{token:s}"?', returncode=1)
+
+        if node["flowid"] is None and node["link"] is None:
+            raise _rtnetlink_error("Invalid argument")
+
+        table = self.__find_u32_table(filters, tp["parent"], node["htid"])
+        if table is None or node["bucket"] >= table["divisor"]:
+            raise _rtnetlink_error("Invalid argument")
+        if node["link"] is not None and self.__find_u32_table(
+            filters, tp["parent"], node["link"]
+        ) in (None, table):
+            raise _rtnetlink_error("Invalid argument")
+
+        # node ids are allocated for each bucket
+        node_id_set = {
+            item["node"]
+            for item in tp["nodes"]
+            if (item.get("htid", tp["htid"]), item.get("bucket", 0))
+            == (node["htid"], node["bucket"])
+        }
+
+        if handle is not None:
+            node_id = _parse_u32_handle(handle) & 0xFFF
+            if node_id in node_id_set:
+                raise _rtnetlink_error("File exists")
+        else:
+            node_id = _U32_FIRST_NODE_ID
+            while node_id in node_id_set:
+                node_id += 1
+            if node_id > _U32_MAX_NODE_ID:
+                raise _rtnetlink_error("No space left on device")
+
+        node["node"] = node_id
+
+        return node
+
+    @staticmethod
+    def __parse_u32_match(param_list, idx, key_list):
+        """
+        Parse a ``match`` selector of a u32 filter to 32 bit keys as same as tc: keys that
+        have the same offset are merged into a key.
+
+        :return: Index of the next token.
+        """
+
+        def pack_key(value, mask, offset):
+            for key in key_list:
+                if key[2] != offset:
+                    continue
+                if key[1] & mask and (key[0] ^ value) & key[1] & mask:
+                    raise SimulatorError("Conflicting key", returncode=1)
+
+                key[0] |= value
+                key[1] |= mask
+                return
+
+            key_list.append([value & mask, mask, offset])
+
+        selector = param_list[idx]
+
+        if selector == "u32":
+            value, mask = int(param_list[idx + 1], 0), int(param_list[idx + 2], 0)
+            offset = 0
+            idx += 3
+            if idx + 1 < len(param_list) and param_list[idx] == "at":
+                offset = int(param_list[idx + 1])
+                idx += 2
+            pack_key(value, mask, offset)
+
+            return idx
+
+        if selector not in _U32_OFFSET_MAP:
+            raise SimulatorError(f"Illegal match: {selector:s}", returncode=1)
+
+        offset_map = _U32_OFFSET_MAP[selector]
+        field = param_list[idx + 1]
+
+        if field in ("src", "dst"):
+            network = ipaddress.ip_network(param_list[idx + 2], strict=False)
+            address = network.network_address.packed
+            netmask = network.netmask.packed
+
+            for i in range(0, len(address), 4):
+                mask = int.from_bytes(netmask[i : i + 4], "big")
+                if mask == 0 and network.version == 6:
+                    break
+
+                pack_key(int.from_bytes(address[i : i + 4], "big"), mask, offset_map[field] + i)
+
+            return idx + 3
+
+        if field in ("sport", "dport"):
+            shift = 16 if field == "sport" else 0
+            pack_key(
+                int(param_list[idx + 2], 0) << shift,
+                int(param_list[idx + 3], 0) << shift,
+                offset_map["port"],
+            )
+
+            return idx + 4
+
+        raise SimulatorError(f"Illegal match: {selector:s} {field:s}", returncode=1)
+
+    @staticmethod
+    def __make_flower_node(protocol, param_list):
+        if len(param_list) % 2 != 0:
+            raise SimulatorError(f'What is "{param_list[-1]:s}"?', returncode=1)
+
+        node = {"classid": None, "keys": {}}
+        keys = node["keys"]
+
+        for name, value in zip(param_list[::2], param_list[1::2]):
+            if name in ("classid", "flowid"):
+                node["classid"] = _parse_handle(value)
+            elif name in ("dst_ip", "src_ip"):
+                network = ipaddress.ip_network(value, strict=False)
+                if _FLOWER_ETH_TYPE_MAP.get(protocol) != f"ipv{network.version:d}":
+                    raise SimulatorError('Illegal "eth_type" for ip address', returncode=1)
+
+                keys[name] = str(network)
+            elif name == "ip_proto":
+                keys[name] = value
+            elif name in ("dst_port", "src_port"):
+                if keys.get("ip_proto") not in _FLOWER_PORT_IP_PROTOCOLS:
+                    raise SimulatorError(f'Illegal "ip_proto" for {name:s}', returncode=1)
+
+                keys[name] = int(value)
+            else:
+                raise SimulatorError(f'What is "{name:s}"?', returncode=1)
+
+        if node["classid"] is None:
+            raise _rtnetlink_error("Invalid argument")
+
+        return node
+
+    @staticmethod
+    def __format_flower_node(header, tp, node):
+        keys = node["keys"]
+        lines = [
+            "{:s} handle 0x{:x} classid {:s} ".format(
+                header, node["handle"], sprint_handle(node["classid"])
+            ),
+            "  eth_type {:s}".format(_FLOWER_ETH_TYPE_MAP.get(tp["protocol"], tp["protocol"])),
+        ]
+
+        if "ip_proto" in keys:
+            lines.append("  ip_proto {:s}".format(keys["ip_proto"]))
+
+        for name in ("dst_ip", "src_ip"):
+            if name not in keys:
+                continue
+
+            # host addresses are displayed without prefix length
+            network = ipaddress.ip_network(keys[name])
+            if network.prefixlen == network.max_prefixlen:
+                lines.append(f"  {name:s} {network.network_address}")
+            else:
+                lines.append(f"  {name:s} {network}")
+
+        for name in ("dst_port", "src_port"):
+            if name in keys:
+                lines.append(f"  {name:s} {keys[name]:d}")
+
+        lines.append("  not_in_hw")
+
+        return lines
+
+    @staticmethod
+    def __make_fw_node(handle, param_list):
+        param_map = _to_param_map(param_list)
+        classid = param_map.get("classid", param_map.get("flowid"))
+        if classid is None:
+            raise _rtnetlink_error("Invalid argument")
+
+        return {"handle": handle, "classid": _parse_handle(classid)}
+
+
+class _IpCommand:
+    def __init__(self, state, is_oneline=False, is_details=False):
+        self.__state = state
+        self.__is_oneline = is_oneline
+        self.__is_details = is_details
+
+    def execute(self, arg_list):
+        if not arg_list or arg_list[0] not in ("link", "l"):
+            raise SimulatorError(
+                'Object "{}" is unknown, try "ip help".'.format(arg_list[0] if arg_list else ""),
+                returncode=1,
+            )
+
+        verb = arg_list[1] if len(arg_list) > 1 else "show"
+        arg_list = arg_list[2:]
+        links = self.__state["links"]
+
+        if verb == "add":
+            param_map = _to_param_map(arg_list[1:])
+            _add_link(self.__state, arg_list[0], param_map.get("type", "ether"))
+            return ""
+
+        if arg_list and arg_list[0] == "dev":
+            del arg_list[0]
+
+        if verb == "set":
+            device = arg_list[0]
+            if device not in links:
+                raise _cannot_find_device(device)
+
+            for item in arg_list[1:]:
+                if item in ("up", "down"):
+                    links[device]["is_up"] = item == "up"
+            return ""
+
+        if verb in ("delete", "del"):
+            device = arg_list[0]
+            if device not in links:
+                raise _cannot_find_device(device)
+
+            del links[device]
+            del self.__state["tc"][device]
+            return ""
+
+        if verb in ("show", "list", "ls"):
+            if arg_list:
+                if arg_list[0] not in links:
+                    raise SimulatorError(f'Device "{arg_list[0]:s}" does not exist.', returncode=1)
+                devices = arg_list[:1]
+            else:
+                devices = sorted(links, key=lambda name: links[name]["ifindex"])
+
+            return "\n".join(self.__format_link(device) for device in devices)
+
+        raise SimulatorError(f'Command "{verb:s}" is unknown, try "ip link help".', returncode=1)
+
+    def __format_link(self, device):
+        link = self.__state["links"][device]
+        flags = ["LOOPBACK" if link["kind"] == "loopback" else "BROADCAST", "NOARP"]
+        if link["is_up"]:
+            flags.extend(["UP", "LOWER_UP"])
+        qdisc = "htb" if self.__state["tc"][device]["qdiscs"] else "noqueue"
+        link_type = "loopback" if link["kind"] == "loopback" else "ether"
+        separator = "\\    " if self.__is_oneline else "\n    "
+
+        line = (
+            "{ifindex:d}: {name:s}: <{flags:s}> mtu {mtu:d} qdisc {qdisc:s} state {state:s} "
+            "mode DEFAULT group default qlen 1000{sep:s}link/{link_type:s} "
+            "00:00:00:00:00:00 brd ff:ff:ff:ff:ff:ff"
+        ).format(
+            ifindex=link["ifindex"],
+            name=device,
+            flags=",".join(flags),
+            mtu=link["mtu"],
+            qdisc=qdisc,
+            state="UNKNOWN" if link["is_up"] else "DOWN",
+            sep=separator,
+            link_type=link_type,
+        )
+        if self.__is_details:
+            kind = "" if link["kind"] in ("loopback", "ether") else f" {link['kind']:s}"
+            line += (
+                f" promiscuity 0 minmtu 0 maxmtu 0{kind:s} numtxqueues 1 numrxqueues 1 "
+                "gso_max_size 65536 gso_max_segs 65535"
+            )
+
+        return line
+
+
+class _IptablesCommand:
+    def __init__(self, state):
+        self.__state = state
+
+    def execute(self, arg_list):
+        if "-V" in arg_list or "--version" in arg_list:
+            return f"iptables {IPTABLES_VERSION:s}"
+
+        options = {}
+        idx = 0
+        while idx < len(arg_list):
+            name = arg_list[idx]
+            if name in ("--line-numbers", "-n", "-v"):
+                options[name] = True
+                idx += 1
+            elif name in ("-L", "-F", "-D") and (
+                idx + 1 >= len(arg_list) or arg_list[idx + 1].startswith("-")
+            ):
+                options[name] = None
+                idx += 1
+            elif name == "-D" and idx + 2 < len(arg_list) and arg_list[idx + 2].isdigit():
+                options[name] = (arg_list[idx + 1], int(arg_list[idx + 2]))
+                idx += 3
+            else:
+                options[name] = arg_list[idx + 1] if idx + 1 < len(arg_list) else None
+                idx += 2
+
+        chains = self.__get_chains(options.get("-t", "filter"))
+
+        if "-A" in options:
+            return self.__append(chains, options)
+
+        if "-D" in options:
+            chain, line_number = options["-D"]
+            entry_list = self.__get_chain(chains, chain)
+            if not 0 < line_number <= len(entry_list):
+                raise SimulatorError("iptables: Index of deletion too big.", returncode=1)
+
+            del entry_list[line_number - 1]
+            return ""
+
+        if "-F" in options:
+            for chain in [options["-F"]] if options["-F"] else list(chains):
+                self.__get_chain(chains, chain).clear()
+            return ""
+
+        if "-L" in options:
+            chain_list = [options["-L"]] if options["-L"] else list(chains)
+            return self.__format_chains(
+                chains, chain_list, options.get("--line-numbers"), options.get("-n")
+            )
+
+        raise SimulatorError("iptables: no command specified", returncode=2)
+
+    def __get_chains(self, table):
+        if table == "mangle":
+            return self.__state["mangle"]
+
+        # tables other than the mangle table are always empty
+        return {chain: [] for chain in ("INPUT", "FORWARD", "OUTPUT")}
+
+    @staticmethod
+    def __get_chain(chains, chain):
+        if chain not in chains:
+            raise SimulatorError("iptables: No chain/target/match by that name.", returncode=1)
+
+        return chains[chain]
+
+    def __append(self, chains, options):
+        if options.get("-j") != "MARK" or "--set-mark" not in options:
+            raise SimulatorError("iptables: only MARK target is supported.", returncode=2)
+
+        self.__get_chain(chains, options["-A"]).append(
+            {
+                "protocol": options.get("-p", "all"),
+                "source": str(ipaddress.ip_network(options.get("-s", "0.0.0.0/0"), strict=False)),
+                "destination": str(
+                    ipaddress.ip_network(options.get("-d", "0.0.0.0/0"), strict=False)
+                ),
+                "mark": int(options["--set-mark"], 0),
+            }
+        )
+
+        return ""
+
+    @staticmethod
+    def __format_chains(chains, chain_list, is_line_numbers, is_numeric):
+        def to_address(network):
+            # addresses are printed as names without -n option
+            if network == "0.0.0.0/0" and not is_numeric:
+                return "anywhere"
+
+            return network
+
+        header = "target     prot opt source               destination         "
+        if is_line_numbers:
+            header = "num  " + header
+
+        blocks = []
+        for chain in chain_list:
+            lines = [f"Chain {chain:s} (policy ACCEPT)", header]
+            for line_number, entry in enumerate(chains[chain], start=1):
+                line = "{:<10s} {:<4s} --  {:<20s} {:<20s} MARK set 0x{:x}".format(
+                    "MARK",
+                    entry["protocol"],
+                    to_address(entry["source"]),
+                    to_address(entry["destination"]),
+                    entry["mark"],
+                )
+                if is_line_numbers:
+                    line = f"{line_number:<4d} {line:s}"
+                lines.append(line)
+            blocks.append("\n".join(lines))
+
+        return "\n\n".join(blocks)
+
+
+def _run_batch(execute, is_force, input_file):
+    """
+    Execute commands in the batch mode of iproute2 (``-batch``).
+    """
+
+    output_list = []
+    returncode = 0
+
+    for line_no, line in enumerate(input_file, start=1):
+        arg_list = line.split()
+        if not arg_list or arg_list[0].startswith("#"):
+            continue
+
+        try:
+            output = execute(arg_list)
+        except SimulatorError as e:
+            sys.stdout.write("".join(output_list))
+            output_list = []
+            sys.stdout.flush()
+            sys.stderr.write(f"{e}\nCommand failed -:{line_no:d}\n")
+            returncode = 1
+            if not is_force:
+                break
+            continue
+
+        if output:
+            output_list.append(output + "\n")
+
+    sys.stdout.write("".join(output_list))
+
+    return returncode
+
+
+def main(program, arg_list):
+    """
+    Entry point of the simulated commands.
+
+    :param str program: Simulated command name: ``tc``, ``ip`` or ``iptables``.
+    :return: Return code of the command.
+    """
+
+    arg_list = list(arg_list)
+
+    if program in ("tc", "ip") and arg_list[:1] == ["-V"]:
+        print(f"{program:s} utility, {IPROUTE2_VERSION:s}")
+        return 0
+
+    option_set = set()
+    batch_file = None
+    while arg_list and arg_list[0].startswith("-") and program != "iptables":
+        option = arg_list.pop(0)
+        if option == "-batch":
+            batch_file = arg_list.pop(0)
+        elif option in ("-force", "-o", "-oneline", "-d", "-details"):
+            option_set.add(option.lstrip("-")[0])
+        else:
+            # e.g. JSON outputs (-j) are not supported
+            sys.stderr.write(f'Option "{option:s}" is unknown, try "{program:s} -help".\n')
+            return 255
+
+    state = load_state()
+    orig_state = _dump_state(state)
+    if program == "tc":
+        execute = _TcCommand(state).execute
+    elif program == "ip":
+        execute = _IpCommand(
+            state, is_oneline="o" in option_set, is_details="d" in option_set
+        ).execute
+    elif program == "iptables":
+        execute = _IptablesCommand(state).execute
+    else:
+        raise ValueError(f"unknown program: {program}")
+
+    if batch_file is not None:
+        if batch_file == "-":
+            returncode = _run_batch(execute, "f" in option_set, sys.stdin)
+        else:
+            with open(batch_file) as f:
+                returncode = _run_batch(execute, "f" in option_set, f)
+    else:
+        try:
+            output = execute(arg_list)
+        except SimulatorError as e:
+            sys.stderr.write(f"{e}\n")
+            return e.returncode
+
+        if output:
+            print(output)
+        returncode = 0
+
+    if _dump_state(state) != orig_state:
+        save_state(state)
+
+    return returncode
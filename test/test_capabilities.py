@@ -0,0 +1,128 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import errno
+import struct
+
+import pytest
+
+import tcconfig._capabilities
+from tcconfig._capabilities import (
+    _parse_file_capabilities,
+    _read_file_capabilities,
+    has_execution_authority,
+)
+
+
+NET_ADMIN = 1 << 12
+NET_RAW = 1 << 13
+
+
+def make_xattr(magic_etc, permitted_lo, permitted_hi=None):
+    if permitted_hi is None:
+        return struct.pack("<III", magic_etc, permitted_lo, 0)
+
+    return struct.pack("<IIIII", magic_etc, permitted_lo, 0, permitted_hi, 0)
+
+
+class Test_parse_file_capabilities:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            # setcap cap_net_raw,cap_net_admin+ep
+            [
+                b"\x01\x00\x00\x02\x000\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00",
+                NET_ADMIN | NET_RAW,
+            ],
+            # setcap cap_net_admin=p: not effective
+            [
+                b"\x00\x00\x00\x02\x00\x10\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00",
+                0,
+            ],
+            [make_xattr(0x01000001, NET_ADMIN), NET_ADMIN],
+            [make_xattr(0x03000001, NET_RAW, 0x1), NET_RAW | (1 << 32)],
+        ],
+    )
+    def test_normal(self, value, expected):
+        assert _parse_file_capabilities(value) == expected
+
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            [b"", ValueError],
+            [make_xattr(0x02000001, NET_ADMIN), ValueError],
+        ],
+    )
+    def test_exception(self, value, expected):
+        with pytest.raises(expected):
+            _parse_file_capabilities(value)
+
+
+class Test_read_file_capabilities:
+    @pytest.mark.parametrize(
+        ["error_no", "expected"],
+        [
+            [errno.ENODATA, 0],
+            [errno.EOPNOTSUPP, None],
+        ],
+    )
+    def test_error(self, monkeypatch, error_no, expected):
+        def getxattr(path, attribute):
+            raise OSError(error_no, "error")
+
+        monkeypatch.setattr(tcconfig._capabilities.os, "getxattr", getxattr)
+
+        assert _read_file_capabilities("/usr/sbin/tc") == expected
+
+
+class Test_has_execution_authority:
+    @pytest.mark.parametrize(
+        ["xattr_value", "expected"],
+        [
+            [make_xattr(0x02000001, NET_ADMIN | NET_RAW, 0), True],
+            [make_xattr(0x02000001, NET_ADMIN, 0), False],
+            [make_xattr(0x02000000, NET_ADMIN | NET_RAW, 0), False],
+        ],
+    )
+    def test_normal_non_root(self, monkeypatch, xattr_value, expected):
+        getxattr_calls = []
+
+        def getxattr(path, attribute):
+            getxattr_calls.append(path)
+            return xattr_value
+
+        def getcap(bin_path, capabilities):
+            raise AssertionError("getcap must not be executed")
+
+        monkeypatch.setattr(tcconfig._capabilities, "_execution_authority_cache", {})
+        monkeypatch.setattr(tcconfig._capabilities.os, "getuid", lambda: 1000)
+        monkeypatch.setattr(tcconfig._capabilities.os, "getxattr", getxattr)
+        monkeypatch.setattr(tcconfig._capabilities, "_has_capabilies", getcap)
+        monkeypatch.setattr(tcconfig._capabilities, "_read_process_capabilities", lambda name: 0)
+
+        assert has_execution_authority("iptables") == expected
+        assert has_execution_authority("iptables") == expected
+        assert len(getxattr_calls) == 1
+
+    def test_normal_ambient(self, monkeypatch):
+        monkeypatch.setattr(tcconfig._capabilities, "_execution_authority_cache", {})
+        monkeypatch.setattr(tcconfig._capabilities.os, "getuid", lambda: 1000)
+        monkeypatch.setattr(tcconfig._capabilities, "_read_file_capabilities", lambda path: 0)
+        monkeypatch.setattr(
+            tcconfig._capabilities,
+            "_read_process_capabilities",
+            lambda name: NET_ADMIN if name == "CapAmb" else 0,
+        )
+
+        assert has_execution_authority("tc")
+        assert not has_execution_authority("ip")
+
+    def test_normal_simulator(self, monkeypatch, simulator):
+        monkeypatch.setattr(tcconfig._capabilities, "_execution_authority_cache", {})
+        monkeypatch.setattr(tcconfig._capabilities.os, "getuid", lambda: 1000)
+        monkeypatch.setattr(tcconfig._capabilities, "_read_file_capabilities", lambda path: 0)
+        monkeypatch.setattr(tcconfig._capabilities, "_read_process_capabilities", lambda name: 0)
+
+        assert has_execution_authority("tc")
+        assert has_execution_authority("iptables")
@@ -0,0 +1,108 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+import stat
+from textwrap import dedent
+
+import pytest
+
+from tcconfig._command_batch import BatchCommandRunner, CommandBatch
+
+
+@pytest.fixture
+def fake_tc(tmp_path):
+    # emulate 'tc -batch -': stop at the first line that contains 'fail'
+    bin_path = tmp_path / "tc"
+    bin_path.write_text(
+        dedent(
+            """\
+            #!/bin/sh
+            line_no=0
+            while read -r line; do
+                line_no=$((line_no + 1))
+                echo "$line" >> "$0.log"
+                case "$line" in
+                    *fail*)
+                        echo "RTNETLINK answers: File exists" >&2
+                        echo "Command failed -:$line_no" >&2
+                        exit 1;;
+                esac
+            done
+            """
+        )
+    )
+    bin_path.chmod(bin_path.stat().st_mode | stat.S_IEXEC)
+
+    return str(bin_path)
+
+
+def read_executed_lines(bin_path):
+    log_path = bin_path + ".log"
+    if not os.path.exists(log_path):
+        return []
+
+    with open(log_path) as f:
+        return f.read().splitlines()
+
+
+class Test_CommandBatch:
+    def test_normal(self, fake_tc):
+        result_list = []
+        batch = CommandBatch()
+
+        for args in ("qdisc add a", "qdisc add fail", "class add b"):
+            batch.add(
+                f"{fake_tc} {args}",
+                lambda returncode, stderr, args=args: result_list.append(
+                    (args, returncode, stderr)
+                ),
+            )
+
+        assert read_executed_lines(fake_tc) == []
+
+        batch.flush()
+
+        assert read_executed_lines(fake_tc) == ["qdisc add a", "qdisc add fail", "class add b"]
+        assert result_list == [
+            ("qdisc add a", 0, ""),
+            ("qdisc add fail", 1, "RTNETLINK answers: File exists"),
+            ("class add b", 0, ""),
+        ]
+
+    def test_exception(self, fake_tc):
+        def raise_error(returncode, stderr):
+            if returncode != 0:
+                raise RuntimeError(stderr)
+
+        batch = CommandBatch()
+        for args in ("qdisc add fail", "class add b"):
+            batch.add(f"{fake_tc} {args}", raise_error)
+
+        with pytest.raises(RuntimeError):
+            batch.flush()
+
+        batch.flush()
+
+        assert read_executed_lines(fake_tc) == ["qdisc add fail"]
+
+
+class Test_BatchCommandRunner:
+    def test_normal(self, fake_tc):
+        batch = CommandBatch()
+        runners = [
+            BatchCommandRunner(batch, f"{fake_tc} {args}")
+            for args in ("qdisc add a", "qdisc add fail")
+        ]
+
+        for runner in runners:
+            assert runner.run() == 0
+            assert runner.returncode is None
+
+        batch.flush()
+
+        assert [(runner.returncode, runner.stderr) for runner in runners] == [
+            (0, ""),
+            (1, "RTNETLINK answers: File exists"),
+        ]
@@ -0,0 +1,154 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pyroute2
+import pytest
+from subprocrunner import SubprocessRunner
+
+import tcconfig._device_inventory
+from tcconfig._common import device_state_cache_context, find_bin_path, get_device_inventory
+from tcconfig._device_inventory import DeviceInventory
+from tcconfig._device_state_cache import DeviceStateCache
+
+
+class FakeLink(dict):
+    def __init__(self, index, attrs):
+        super().__init__(index=index)
+        self.__attrs = attrs
+
+    def get_attr(self, name):
+        return self.__attrs.get(name)
+
+
+class FakeIPRoute:
+    num_dumps = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def get_links(self):
+        FakeIPRoute.num_dumps += 1
+
+        return [
+            FakeLink(1, {"IFLA_IFNAME": "lo"}),
+            FakeLink(2, {"IFLA_IFNAME": "eth0"}),
+            FakeLink(3, {"IFLA_IFNAME": "ifb6157"}),
+        ]
+
+
+@pytest.fixture
+def fake_iproute(monkeypatch, tmp_path):
+    # sysfs not available: devices are loaded by netlink link dumps
+    FakeIPRoute.num_dumps = 0
+    monkeypatch.setattr(tcconfig._device_inventory, "_SYSFS_NET_DIR", str(tmp_path / "none"))
+    monkeypatch.setattr(pyroute2, "IPRoute", FakeIPRoute)
+
+    return FakeIPRoute
+
+
+@pytest.fixture
+def fake_sysfs(monkeypatch, tmp_path):
+    for name in ["lo", "eth0"]:
+        (tmp_path / name).mkdir()
+
+    monkeypatch.setattr(tcconfig._device_inventory, "_SYSFS_NET_DIR", str(tmp_path))
+
+
+class Test_DeviceInventory_has_device:
+    @pytest.mark.parametrize(
+        ["device", "expected"], [["lo", True], ["eth0", True], ["eth1", False]]
+    )
+    def test_normal(self, fake_iproute, device, expected):
+        inventory = DeviceInventory()
+
+        assert inventory.has_device(device) == expected
+        assert inventory.has_device(device) == expected
+        assert fake_iproute.num_dumps == 1
+
+
+class Test_DeviceInventory_sysfs:
+    @pytest.mark.parametrize(
+        ["device", "expected"], [["lo", True], ["eth0", True], ["eth1", False]]
+    )
+    def test_normal(self, fake_sysfs, device, expected):
+        assert DeviceInventory().has_device(device) == expected
+
+    @pytest.mark.parametrize(["device"], [[""], [".."], ["../net"]])
+    def test_abnormal(self, fake_sysfs, device):
+        assert not DeviceInventory().has_device(device)
+
+    def test_normal_device_names(self, fake_sysfs):
+        assert DeviceInventory().get_device_names() == ["eth0", "lo"]
+
+
+class Test_DeviceInventory_simulator:
+    def test_normal(self, simulator):
+        runner = SubprocessRunner(f"{find_bin_path('ip'):s} link add ifb6157 type ifb")
+        assert runner.run() == 0
+
+        inventory = DeviceInventory()
+
+        assert inventory.get_device_names() == ["lo", "eth0", "ifb6157"]
+        assert inventory.has_device("ifb6157")
+        assert not inventory.has_device("ifb0")
+        assert inventory.get_speed("eth0") is None
+
+
+class Test_DeviceInventory_get_speed:
+    def test_normal(self, monkeypatch):
+        read_devices = []
+
+        def read_iface_speed(device):
+            read_devices.append(device)
+            return 1000
+
+        monkeypatch.setattr(tcconfig._device_inventory, "_read_iface_speed", read_iface_speed)
+        inventory = DeviceInventory()
+
+        assert inventory.get_speed("eth0") == 1000
+        assert inventory.get_speed("eth0") == 1000
+        assert read_devices == ["eth0"]
+
+    def test_exception(self, monkeypatch):
+        def read_iface_speed(device):
+            raise OSError()
+
+        monkeypatch.setattr(tcconfig._device_inventory, "_read_iface_speed", read_iface_speed)
+
+        assert DeviceInventory().get_speed("eth0") is None
+
+
+class Test_get_device_inventory:
+    def test_normal(self, fake_iproute):
+        with device_state_cache_context():
+            assert get_device_inventory().has_device("eth0")
+            assert get_device_inventory().has_device("lo")
+
+        assert fake_iproute.num_dumps == 1
+
+    def test_normal_out_of_context(self, fake_iproute):
+        assert get_device_inventory() is not get_device_inventory()
+
+
+class Test_DeviceStateCache_invalidate:
+    @pytest.mark.parametrize(
+        ["command", "expected"],
+        [
+            ["/usr/sbin/tc qdisc del dev eth0 root", 1],
+            ["/usr/sbin/tc -batch -", 1],
+            ["/usr/sbin/ip link add ifb6157 type ifb", 2],
+            [None, 2],
+        ],
+    )
+    def test_normal(self, fake_iproute, command, expected):
+        cache = DeviceStateCache()
+
+        cache.device_inventory.has_device("eth0")
+        cache.invalidate(command)
+        cache.device_inventory.has_device("eth0")
+
+        assert fake_iproute.num_dumps == expected
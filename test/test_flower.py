@@ -0,0 +1,146 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+from subprocrunner import SubprocessRunner
+
+from tcconfig._common import find_bin_path
+from tcconfig._const import Tc
+from tcconfig._flower import make_flower_keys_list
+
+from .common import print_test_result, run_tcshow
+
+
+DEVICE = "eth0"
+
+
+class Test_make_flower_keys_list:
+    @pytest.mark.parametrize(
+        ["ip_version", "kwargs", "expected"],
+        [
+            [4, {}, [[]]],
+            [4, {"dst_network": "0.0.0.0/0", "src_network": "0.0.0.0/0"}, [[]]],
+            [
+                4,
+                {"dst_network": "192.168.0.0/24", "src_network": "10.0.0.0/8"},
+                [["dst_ip", "192.168.0.0/24", "src_ip", "10.0.0.0/8"]],
+            ],
+            [6, {"dst_network": "2001:db8::/64"}, [["dst_ip", "2001:db8::/64"]]],
+            [
+                4,
+                {"dst_network": "192.168.0.1/32", "dst_port": 80, "src_port": "1234"},
+                [
+                    [
+                        "dst_ip",
+                        "192.168.0.1/32",
+                        "ip_proto",
+                        "tcp",
+                        "dst_port",
+                        "80",
+                        "src_port",
+                        "1234",
+                    ],
+                    [
+                        "dst_ip",
+                        "192.168.0.1/32",
+                        "ip_proto",
+                        "udp",
+                        "dst_port",
+                        "80",
+                        "src_port",
+                        "1234",
+                    ],
+                ],
+            ],
+        ],
+    )
+    def test_normal(self, ip_version, kwargs, expected):
+        assert make_flower_keys_list(ip_version, **kwargs) == expected
+
+
+class Test_tcset_flower:
+    def test_normal(self, simulator):
+        for option in [
+            ["--rate", "1Mbps", "--network", "192.168.1.5", "--exclude-dst-network", "10.1.0.0/16"],
+            ["--add", "--rate", "2Mbps", "--network", "10.0.0.0/8", "--port", "80"],
+            ["--add", "--ipv6", "--rate", "3Mbps", "--network", "2001:db8::/64"],
+        ]:
+            runner = SubprocessRunner([Tc.Command.TCSET, DEVICE, "--classifier", "flower"] + option)
+            assert runner.run() == 0, runner.stderr
+
+        expected = {
+            DEVICE: {
+                "outgoing": {
+                    "dst_network=10.1.0.0/16, protocol=ip": {
+                        "filter_id": "0x1",
+                        "rate": "32Gbps",
+                    },
+                    "dst_network=192.168.1.5/32, protocol=ip": {
+                        "filter_id": "0x2",
+                        "limit": 1000,
+                        "rate": "1Mbps",
+                    },
+                    # a rule with ports consists of filters for TCP and UDP
+                    "dst_network=10.0.0.0/8, dst_port=80, protocol=ip": {
+                        "filter_id": "0x3",
+                        "limit": 1000,
+                        "rate": "2Mbps",
+                    },
+                    # addresses of IPv6 filters are not shown without --ipv6 option
+                    "protocol=ipv6": {
+                        "filter_id": "0x5",
+                        "limit": 1000,
+                        "rate": "3Mbps",
+                    },
+                },
+                "incoming": {},
+            }
+        }
+        actual = run_tcshow(DEVICE)
+        print_test_result(expected=expected, actual=actual)
+        assert actual == expected
+
+        actual = run_tcshow(DEVICE, "--ipv6")
+        assert actual[DEVICE]["outgoing"]["dst_network=2001:db8::/64, protocol=ipv6"] == {
+            "filter_id": "0x5",
+            "limit": 1000,
+            "rate": "3Mbps",
+        }
+
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--classifier", "flower", "--change"]
+            + ["--rate", "5Mbps", "--network", "192.168.1.5"]
+        )
+        assert runner.run() == 0, runner.stderr
+        expected[DEVICE]["outgoing"]["dst_network=192.168.1.5/32, protocol=ip"]["rate"] = "5Mbps"
+        assert run_tcshow(DEVICE) == expected
+
+        runner = SubprocessRunner([Tc.Command.TCDEL, DEVICE, "--id", "0x3"])
+        assert runner.run() == 0, runner.stderr
+        del expected[DEVICE]["outgoing"]["dst_network=10.0.0.0/8, dst_port=80, protocol=ip"]
+        assert run_tcshow(DEVICE) == expected
+
+        # filters of both of TCP and UDP are deleted
+        runner = SubprocessRunner(f"{find_bin_path('tc'):s} filter show dev {DEVICE:s}")
+        assert runner.run() == 0, runner.stderr
+        assert "dst_port 80" not in runner.stdout
+
+        runner = SubprocessRunner(
+            [Tc.Command.TCDEL, DEVICE, "--ipv6", "--network", "2001:db8::/64"]
+        )
+        assert runner.run() == 0, runner.stderr
+        del expected[DEVICE]["outgoing"]["protocol=ipv6"]
+        assert run_tcshow(DEVICE) == expected
+
+        runner = SubprocessRunner([Tc.Command.TCDEL, DEVICE, "--all"])
+        assert runner.run() == 0, runner.stderr
+        assert run_tcshow(DEVICE) == {DEVICE: {"outgoing": {}, "incoming": {}}}
+
+    def test_exception(self, simulator):
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--classifier", "flower", "--hash-filter"]
+            + ["--rate", "1Mbps", "--network", "192.168.1.5"]
+        )
+
+        assert runner.run() != 0
@@ -0,0 +1,265 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+from subprocrunner import SubprocessRunner
+
+from tcconfig._common import find_bin_path
+from tcconfig._const import HtbLayout, Tc
+from tcconfig._htb_layout import (
+    NUM_BUCKETS,
+    extract_bucket_tables,
+    extract_buckets,
+    extract_handoff_slots,
+    get_bucket,
+    get_bucket_of_bucket_class,
+    get_bucket_of_rule_class,
+    make_bucket_classid,
+    make_bucket_table_commands,
+    make_bucket_table_option,
+    make_bucket_table_query_command,
+    make_handoff_slot_command,
+    make_handoff_table_commands,
+)
+
+from .common import print_test_result, run_tcshow
+
+
+DEVICE = "eth0"
+FILTER_COMMAND = "tc filter add dev eth0 protocol ip parent b026: prio 5"
+ROOT_FILTER_COMMAND = "tc filter add dev eth0 protocol ip parent 1a1a: prio 7"
+
+
+class Test_get_bucket:
+    @pytest.mark.parametrize(
+        ["layout", "ip_version", "dst_network", "expected"],
+        [
+            [HtbLayout.PREFIX, 4, "192.168.0.1/32", 0x28],
+            [HtbLayout.PREFIX, 4, "192.168.255.0/24", 0x28],
+            [HtbLayout.PREFIX, 4, "10.1.0.2/32", 0x1],
+            [HtbLayout.PREFIX, 6, "2001:db8::1/128", 0x38],
+            [HtbLayout.HASH, 4, "192.168.0.2/32", 0x2],
+            [HtbLayout.HASH, 4, "192.168.0.67/32", 0x3],
+            [HtbLayout.HASH, 6, "2001:db8::5/128", 0x5],
+            # packets of the destinations may be placed into different buckets
+            [HtbLayout.PREFIX, 4, "10.0.0.0/8", None],
+            [HtbLayout.PREFIX, 6, "2001:db8::/16", None],
+            [HtbLayout.HASH, 4, "192.168.0.0/24", None],
+            [HtbLayout.HASH, 4, None, None],
+            [HtbLayout.FLAT, 4, "192.168.0.1/32", None],
+        ],
+    )
+    def test_normal(self, layout, ip_version, dst_network, expected):
+        assert get_bucket(layout, ip_version, dst_network) == expected
+
+    @pytest.mark.parametrize(
+        ["layout", "ip_version"],
+        [[HtbLayout.HASH, 4], [HtbLayout.HASH, 6], [HtbLayout.PREFIX, 4], [HtbLayout.PREFIX, 6]],
+    )
+    def test_normal_range(self, layout, ip_version):
+        networks = (
+            [f"10.{i:d}.0.{i:d}/32" for i in range(256)]
+            if ip_version == 4
+            else [f"2001:{i:x}::{i:x}/128" for i in range(256)]
+        )
+
+        for network in networks:
+            assert 0 <= get_bucket(layout, ip_version, network) < NUM_BUCKETS
+
+        # rules of different networks are distributed to all of the buckets
+        assert len({get_bucket(layout, ip_version, network) for network in networks}) == (
+            NUM_BUCKETS
+        )
+
+
+class Test_bucket_ids:
+    @pytest.mark.parametrize(
+        ["classid", "expected_bucket_class", "expected_rule_class"],
+        [
+            ["1a1a:b026", 0x26, None],
+            ["b026:2", None, 0x26],
+            ["b03f:b03f", 0x3F, 0x3F],
+            ["1a1a:2", None, None],
+            ["1a1a:b040", None, None],
+            [None, None, None],
+            ["invalid", None, None],
+        ],
+    )
+    def test_normal(self, classid, expected_bucket_class, expected_rule_class):
+        assert get_bucket_of_bucket_class(classid) == expected_bucket_class
+        assert get_bucket_of_rule_class(classid) == expected_rule_class
+
+    def test_normal_extract(self):
+        assert make_bucket_classid(0x1A1A, 0x26) == "1a1a:b026"
+        assert extract_buckets(
+            [
+                {Tc.Param.CLASS_ID: "1a1a:1"},
+                {Tc.Param.CLASS_ID: "1a1a:b026"},
+                {Tc.Param.CLASS_ID: "b026:2"},
+                {Tc.Param.CLASS_ID: "1a1a:b001"},
+            ]
+        ) == [0x1, 0x26]
+
+
+class Test_make_commands:
+    def test_normal(self):
+        assert make_bucket_table_commands(FILTER_COMMAND, 0x26, "ip") == [
+            f"{FILTER_COMMAND:s} handle b26: u32 divisor 1",
+            f"{FILTER_COMMAND:s} u32 link b26: match u32 0 0",
+        ]
+        assert make_bucket_table_option(0x26, "ip") == "ht b26:"
+        assert make_bucket_table_option(0x26, "ipv6") == "ht b66:"
+
+    def test_normal_handoff(self):
+        assert make_handoff_table_commands(ROOT_FILTER_COMMAND, HtbLayout.PREFIX, 4) == [
+            f"{ROOT_FILTER_COMMAND:s} handle b80: u32 divisor 64",
+            f"{ROOT_FILTER_COMMAND:s} u32 link b80: hashkey mask 0x003f0000 at 16 match u32 0 0",
+        ]
+        assert make_handoff_table_commands(ROOT_FILTER_COMMAND, HtbLayout.HASH, 6)[1] == (
+            f"{ROOT_FILTER_COMMAND:s} u32 link b83: hashkey mask 0x0000003f at 36 match u32 0 0"
+        )
+        assert make_handoff_slot_command(
+            ROOT_FILTER_COMMAND, HtbLayout.PREFIX, 4, 0x1A1A, 0x26
+        ) == (
+            f"{ROOT_FILTER_COMMAND:s} handle b80:26:1 u32 ht b80:26: match u32 0 0 flowid 1a1a:b026"
+        )
+
+    def test_normal_extract(self):
+        assert extract_bucket_tables(
+            "filter parent b026: protocol ip pref 5 u32 chain 0 fh b26: ht divisor 1 \n"
+            "filter parent b026: protocol ip pref 5 u32 chain 0 fh 800: ht divisor 1 \n"
+            "filter parent b001: protocol ipv6 pref 6 u32 chain 0 fh b41: ht divisor 1 "
+        ) == [(0x1, "ipv6"), (0x26, "ip")]
+        assert extract_handoff_slots(["b80:26:1", "b83::1", "800::800", "b28::800", None]) == [
+            (0xB80, 0x26),
+            (0xB83, 0x0),
+        ]
+
+    def test_normal_query(self, simulator):
+        assert make_bucket_table_query_command(DEVICE, 0x26, "ip", 5) == (
+            f"{find_bin_path('tc'):s} filter get dev eth0 parent b026: protocol ip prio 5 "
+            "handle b26: u32"
+        )
+
+
+class Test_tcset_htb_layout:
+    def test_normal(self, simulator):
+        for option in [
+            ["--rate", "1Mbps", "--network", "192.168.0.1"],
+            ["--add", "--rate", "2Mbps", "--network", "192.168.0.2"],
+            ["--add", "--delay", "10ms", "--network", "10.1.0.2", "--port", "80"],
+        ]:
+            runner = SubprocessRunner([Tc.Command.TCSET, DEVICE, "--htb-layout", "prefix"] + option)
+            assert runner.run() == 0, runner.stderr
+
+        # rules of other layouts can not be added to the device
+        for layout in ["flat", "hash"]:
+            runner = SubprocessRunner(
+                [Tc.Command.TCSET, DEVICE, "--add", "--rate", "3Mbps", "--network", "10.0.0.1"]
+                + ["--htb-layout", layout]
+            )
+            assert runner.run() != 0
+            assert "different HTB layout" in runner.stderr
+
+        # a rule of a network that is not placed into a bucket is set to the root qdisc
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--add", "--rate", "3Mbps", "--network", "10.0.0.0/8"]
+            + ["--htb-layout", "prefix"]
+        )
+        assert runner.run() == 0, runner.stderr
+
+        expected = {
+            DEVICE: {
+                "outgoing": {
+                    "dst_network=10.0.0.0/8, protocol=ip": {
+                        "filter_id": "801::800",
+                        "limit": 1000,
+                        "rate": "3Mbps",
+                    },
+                    "dst_network=192.168.0.1/32, protocol=ip": {
+                        "filter_id": "b28::800",
+                        "limit": 1000,
+                        "rate": "1Mbps",
+                    },
+                    "dst_network=192.168.0.2/32, protocol=ip": {
+                        "filter_id": "b28::801",
+                        "limit": 1000,
+                        "rate": "2Mbps",
+                    },
+                    "dst_network=10.1.0.2/32, dst_port=80, protocol=ip": {
+                        "filter_id": "b01::800",
+                        "delay": "10ms",
+                        "limit": 1000,
+                        "rate": "32Gbps",
+                    },
+                },
+                "incoming": {},
+            }
+        }
+        actual = run_tcshow(DEVICE)
+        print_test_result(expected=expected, actual=actual)
+        assert actual == expected
+
+        # the hash table of a bucket is linked only once
+        runner = SubprocessRunner(
+            f"{find_bin_path('tc'):s} filter show dev {DEVICE:s} parent b028:"
+        )
+        assert runner.run() == 0, runner.stderr
+        assert runner.stdout.count("link b28:") == 1
+
+        # the root qdisc hands off packets to the buckets with a hash table:
+        # a filter for each bucket instead of each rule
+        runner = SubprocessRunner(f"{find_bin_path('tc'):s} filter show dev {DEVICE:s}")
+        assert runner.run() == 0, runner.stderr
+        assert runner.stdout.count("link b80:") == 1
+        assert runner.stdout.count("hash mask 003f0000 at 16") == 1
+        assert runner.stdout.count("flowid 1a1a:b028") == 1
+        assert runner.stdout.count("flowid 1a1a:b001") == 1
+
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--change", "--delay", "5ms", "--network", "192.168.0.2"]
+        )
+        assert runner.run() == 0, runner.stderr
+        expected[DEVICE]["outgoing"]["dst_network=192.168.0.2/32, protocol=ip"] = {
+            "filter_id": "b28::801",
+            "delay": "5ms",
+            "limit": 1000,
+            "rate": "32Gbps",
+        }
+        assert run_tcshow(DEVICE) == expected
+
+        runner = SubprocessRunner([Tc.Command.TCDEL, DEVICE, "--network", "192.168.0.1"])
+        assert runner.run() == 0, runner.stderr
+        del expected[DEVICE]["outgoing"]["dst_network=192.168.0.1/32, protocol=ip"]
+        assert run_tcshow(DEVICE) == expected
+
+        runner = SubprocessRunner([Tc.Command.TCDEL, DEVICE, "--id", "b01::800"])
+        assert runner.run() == 0, runner.stderr
+        del expected[DEVICE]["outgoing"]["dst_network=10.1.0.2/32, dst_port=80, protocol=ip"]
+        assert run_tcshow(DEVICE) == expected
+
+        # filters that hand off packets to the buckets are shared among rules
+        runner = SubprocessRunner(f"{find_bin_path('tc'):s} filter show dev {DEVICE:s}")
+        assert runner.run() == 0, runner.stderr
+        assert runner.stdout.count("flowid 1a1a:b0") == 2
+
+        runner = SubprocessRunner([Tc.Command.TCDEL, DEVICE, "--all"])
+        assert runner.run() == 0, runner.stderr
+        assert run_tcshow(DEVICE) == {DEVICE: {"outgoing": {}, "incoming": {}}}
+
+    @pytest.mark.parametrize(
+        ["options"],
+        [
+            [["--shaping-algo", "tbf"]],
+            [["--classifier", "flower"]],
+            [["--iptables"]],
+        ],
+    )
+    def test_exception(self, simulator, options):
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--delay", "10ms", "--htb-layout", "hash"] + options
+        )
+
+        assert runner.run() != 0
+        assert run_tcshow(DEVICE) == {DEVICE: {"outgoing": {}, "incoming": {}}}
@@ -0,0 +1,94 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+
+from tcconfig._error import ClassIdExhaustedError, QdiscIdExhaustedError
+from tcconfig._id_allocator import (
+    MAX_CLASS_MINOR_ID,
+    MAX_QDISC_MAJOR_ID,
+    ClassMinorIdAllocator,
+    QdiscMajorIdAllocator,
+    extract_class_minor_ids,
+)
+
+
+class Test_extract_class_minor_ids:
+    @pytest.mark.parametrize(
+        ["class_params", "qdisc_major_id", "expected"],
+        [
+            [
+                [
+                    {"classid": "1a1a:1"},
+                    {"classid": "1a1a:40"},
+                    {"classid": "1b1b:2"},
+                    {"classid": "1a1a:ff"},
+                    {},
+                ],
+                0x1A1A,
+                [1, 40],
+            ],
+            [[], 0x1A1A, []],
+        ],
+    )
+    def test_normal(self, class_params, qdisc_major_id, expected):
+        assert extract_class_minor_ids(class_params, qdisc_major_id) == expected
+
+
+class Test_ClassMinorIdAllocator:
+    @pytest.mark.parametrize(
+        ["used_ids", "count", "min_id", "expected"],
+        [
+            [[], 3, 2, [2, 3, 4]],
+            [[1, 2, 3, 5], 3, 2, [4, 6, 7]],
+            [[1, 2, 3, 5], 1, 5, [6]],
+            [[0, 1, 2, MAX_CLASS_MINOR_ID + 1], 1, 0, [3]],
+            [[2], 0, 2, []],
+        ],
+    )
+    def test_normal(self, used_ids, count, min_id, expected):
+        allocator = ClassMinorIdAllocator(used_ids)
+
+        assert allocator.allocate_many(count, min_id) == expected
+
+    def test_normal_allocate(self):
+        allocator = ClassMinorIdAllocator([1, 3])
+
+        assert [allocator.allocate() for _ in range(3)] == [2, 4, 5]
+        assert allocator.num_free_ids == MAX_CLASS_MINOR_ID - 5
+
+    def test_exception(self):
+        allocator = ClassMinorIdAllocator([1, 2, 4], max_id=5)
+
+        with pytest.raises(ClassIdExhaustedError):
+            allocator.allocate_many(3, 2)
+
+        # no ids are allocated by the failed allocation
+        assert allocator.allocate_many(2, 2) == [3, 5]
+
+        with pytest.raises(ClassIdExhaustedError):
+            allocator.allocate()
+
+
+class Test_QdiscMajorIdAllocator:
+    @pytest.mark.parametrize(
+        ["used_ids", "base_id", "expected"],
+        [
+            [[], 0x2000, 0x2000],
+            [[0x2000, 0x2001], 0x2000, 0x2002],
+            [[MAX_QDISC_MAJOR_ID], MAX_QDISC_MAJOR_ID, 0x1],
+            [[0x1, 0x2], MAX_QDISC_MAJOR_ID + 1, 0x3],
+        ],
+    )
+    def test_normal(self, used_ids, base_id, expected):
+        assert QdiscMajorIdAllocator(used_ids).allocate(base_id) == expected
+
+    def test_exception(self):
+        allocator = QdiscMajorIdAllocator(range(2, MAX_QDISC_MAJOR_ID + 1))
+
+        assert allocator.num_free_ids == 1
+        assert allocator.allocate(0x2000) == 0x1
+
+        with pytest.raises(QdiscIdExhaustedError):
+            allocator.allocate(0x2000)
@@ -0,0 +1,121 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+
+import pytest
+
+import tcconfig._iproute2
+from tcconfig._iproute2 import Iproute2Features, get_iproute2_features
+
+
+FAKE_IPROUTE2_TEMPLATE = """#!/bin/sh
+echo "$@" >> {log_path}
+case "$1" in
+    -V) echo "{name} utility, {version}, libbpf 1.1.2" ;;
+    -j) echo '[{{"kind":"noqueue","handle":"0:","root":true,"refcnt":2,"options":{{}}}}]' ;;
+    -force) cat > /dev/null ;;
+    *) echo "Usage: ... $5" >&2; exit 1 ;;
+esac
+"""
+
+
+@pytest.fixture
+def fake_iproute2(tmp_path, monkeypatch):
+    def make_fake_iproute2(version, names=("tc", "ip")):
+        bin_paths = {}
+        for name in names:
+            bin_path = tmp_path / name
+            bin_path.write_text(
+                FAKE_IPROUTE2_TEMPLATE.format(
+                    log_path=tmp_path / "executed", name=name, version=version
+                )
+            )
+            bin_path.chmod(0o755)
+            bin_paths[name] = str(bin_path)
+
+        return bin_paths
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(tcconfig._iproute2, "_iproute2_features", None)
+    monkeypatch.setattr(
+        tcconfig._iproute2, "find_bin_path", lambda command: str(tmp_path / command)
+    )
+
+    return make_fake_iproute2
+
+
+def count_executions(tmp_path):
+    try:
+        with open(tmp_path / "executed") as f:
+            return len(f.readlines())
+    except FileNotFoundError:
+        return 0
+
+
+class Test_get_iproute2_features:
+    @pytest.mark.parametrize(
+        ["version", "expected_version", "expected_fixed"],
+        [
+            ["iproute2-6.1.0", (6, 1, 0), False],
+            ["iproute2-6.15.0", (6, 15, 0), True],
+            ["iproute2-ss170905", None, False],
+        ],
+    )
+    def test_normal(self, fake_iproute2, version, expected_version, expected_fixed):
+        fake_iproute2(version)
+
+        features = get_iproute2_features()
+
+        assert features.tc_version == expected_version
+        assert features.ip_version == expected_version
+        assert features.is_json_output_supported
+        assert features.is_batch_supported
+        assert features.is_flower_supported
+        assert features.is_clsact_supported
+        assert features.is_burst_rounding_fixed == expected_fixed
+
+    def test_normal_cache(self, tmp_path, monkeypatch, fake_iproute2):
+        bin_paths = fake_iproute2("iproute2-6.1.0")
+
+        assert get_iproute2_features().tc_version == (6, 1, 0)
+        num_probes = count_executions(tmp_path)
+        assert num_probes > 0
+        assert os.path.isfile(tmp_path / "cache" / "tcconfig" / "iproute2.json")
+
+        # features are loaded from the cache file in another process
+        monkeypatch.setattr(tcconfig._iproute2, "_iproute2_features", None)
+        assert get_iproute2_features().tc_version == (6, 1, 0)
+        assert count_executions(tmp_path) == num_probes
+
+        # probe again when the binary is updated
+        fake_iproute2("iproute2-6.15.0", names=["tc"])
+        stat = os.stat(bin_paths["tc"])
+        os.utime(bin_paths["tc"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        monkeypatch.setattr(tcconfig._iproute2, "_iproute2_features", None)
+
+        features = get_iproute2_features()
+        assert features.tc_version == (6, 15, 0)
+        assert features.ip_version == (6, 1, 0)
+
+    def test_normal_broken_cache(self, tmp_path, fake_iproute2):
+        fake_iproute2("iproute2-6.1.0")
+        cache_file_path = tmp_path / "cache" / "tcconfig" / "iproute2.json"
+        cache_file_path.parent.mkdir(parents=True)
+        cache_file_path.write_text("{")
+
+        assert get_iproute2_features().tc_version == (6, 1, 0)
+
+
+class Test_Iproute2Features:
+    @pytest.mark.parametrize(
+        ["tc_features", "ip_features", "expected"],
+        [
+            [{"batch": True}, {"batch": True}, True],
+            [{"batch": True}, {"batch": False}, False],
+            [{}, {}, False],
+        ],
+    )
+    def test_normal_batch(self, tc_features, ip_features, expected):
+        assert Iproute2Features(tc_features, ip_features).is_batch_supported == expected
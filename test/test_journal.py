@@ -0,0 +1,103 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+
+import tcconfig._journal
+from tcconfig._journal import CommandJournal, CommandKind, JournaledRunner
+
+
+@pytest.fixture
+def journal(monkeypatch):
+    journal = CommandJournal()
+    monkeypatch.setattr(tcconfig._journal, "_command_journal", journal)
+
+    return journal
+
+
+class Test_CommandJournal:
+    def test_normal(self):
+        journal = CommandJournal()
+        journal.record("tc qdisc show dev eth0", CommandKind.QUERY, duration=0.5)
+        journal.record("tc qdisc add dev eth0 root htb", CommandKind.MUTATION, duration=1.0)
+        journal.record("tc qdisc del dev eth0 root", CommandKind.MUTATION, returncode=2)
+
+        assert len(journal) == 3
+        assert journal.get_commands(CommandKind.MUTATION) == [
+            "tc qdisc add dev eth0 root htb",
+            "tc qdisc del dev eth0 root",
+        ]
+        assert journal.get_commands(CommandKind.QUERY) == ["tc qdisc show dev eth0"]
+        assert journal.num_executions == 3
+        assert journal.num_failures == 1
+        assert journal.total_exec_time == 1.5
+
+        journal.clear()
+
+        assert len(journal) == 0
+        assert journal.num_executions == 0
+        assert journal.num_failures == 0
+        assert journal.total_exec_time == 0
+
+    @pytest.mark.parametrize(
+        ["size", "num_records", "expected"],
+        [
+            [3, 5, ["2", "3", "4"]],
+            [3, 2, ["0", "1"]],
+            [None, 5, ["0", "1", "2", "3", "4"]],
+        ],
+    )
+    def test_normal_ring_buffer(self, size, num_records, expected):
+        journal = CommandJournal(size)
+        for i in range(num_records):
+            journal.record(str(i), CommandKind.MUTATION, returncode=1)
+
+        assert journal.size == size
+        assert journal.get_commands() == expected
+        # counters include discarded entries
+        assert journal.num_executions == num_records
+        assert journal.num_failures == num_records
+
+    def test_normal_resize(self):
+        journal = CommandJournal(5)
+        for i in range(5):
+            journal.record(str(i), CommandKind.QUERY)
+
+        journal.resize(2)
+        assert journal.get_commands() == ["3", "4"]
+
+        journal.resize(None)
+        journal.record("5", CommandKind.QUERY)
+        assert journal.get_commands() == ["3", "4", "5"]
+
+
+class Test_JournaledRunner:
+    @pytest.mark.parametrize(
+        ["command", "kind", "expected_returncode"],
+        [
+            ["echo test", CommandKind.QUERY, 0],
+            [["sh", "-c", "exit 3"], CommandKind.MUTATION, 3],
+        ],
+    )
+    def test_normal(self, journal, command, kind, expected_returncode):
+        runner = JournaledRunner(command, kind, dry_run=False)
+
+        assert runner.run() == expected_returncode
+        assert runner.returncode == expected_returncode
+
+        entries = journal.get_entries()
+        assert len(entries) == 1
+        assert entries[0].command == runner.command_str
+        assert entries[0].kind == kind
+        assert entries[0].returncode == expected_returncode
+        assert entries[0].duration > 0
+        assert journal.num_failures == (1 if expected_returncode else 0)
+
+    def test_normal_dry_run(self, journal):
+        runner = JournaledRunner(
+            "tc qdisc add dev eth0 root htb", CommandKind.MUTATION, dry_run=True
+        )
+
+        assert runner.run() == 0
+        assert journal.get_commands(CommandKind.MUTATION) == ["tc qdisc add dev eth0 root htb"]
@@ -0,0 +1,95 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+from typing import ClassVar
+
+import pytest
+
+import tcconfig._kernel_module
+from tcconfig._kernel_module import is_module_loaded, load_module
+
+
+@pytest.fixture
+def sys_module_dir(tmp_path, monkeypatch):
+    sys_module_dir = tmp_path / "module"
+    (sys_module_dir / "sch_htb").mkdir(parents=True)
+
+    monkeypatch.setattr(tcconfig._kernel_module, "_SYS_MODULE_DIR", str(sys_module_dir))
+    monkeypatch.setattr(tcconfig._kernel_module, "_loaded_module_set", set())
+    monkeypatch.setattr(tcconfig._kernel_module, "_read_builtin_modules", lambda: {"sch_tbf"})
+
+    return sys_module_dir
+
+
+class FakeModprobeRunner:
+    default_is_dry_run = False
+    executed_commands: ClassVar[list] = []
+
+    @property
+    def returncode(self):
+        return 0
+
+    def __init__(self, command):
+        self.__command = command
+
+    def run(self):
+        self.executed_commands.append(self.__command)
+        return 0
+
+
+class Test_is_module_loaded:
+    @pytest.mark.parametrize(
+        ["name", "expected"],
+        [
+            ["sch_htb", True],
+            ["sch_tbf", True],
+            ["sch_netem", False],
+        ],
+    )
+    def test_normal(self, sys_module_dir, name, expected):
+        assert is_module_loaded(name) == expected
+
+    def test_normal_cache(self, sys_module_dir):
+        assert is_module_loaded("sch_htb")
+
+        (sys_module_dir / "sch_htb").rmdir()
+
+        assert is_module_loaded("sch_htb")
+
+    def test_normal_no_sysfs(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(tcconfig._kernel_module, "_SYS_MODULE_DIR", str(tmp_path / "none"))
+        monkeypatch.setattr(tcconfig._kernel_module, "_loaded_module_set", set())
+
+        assert is_module_loaded("sch_netem") is None
+
+    def test_normal_simulator(self, tmp_path, monkeypatch, simulator):
+        monkeypatch.setattr(tcconfig._kernel_module, "_SYS_MODULE_DIR", str(tmp_path / "none"))
+        monkeypatch.setattr(tcconfig._kernel_module, "_loaded_module_set", set())
+
+        assert is_module_loaded("sch_netem")
+
+
+class Test_load_module:
+    @pytest.mark.parametrize(
+        ["name", "expected"],
+        [
+            ["sch_htb", []],
+            ["ifb", ["modprobe ifb"]],
+        ],
+    )
+    def test_normal(self, sys_module_dir, monkeypatch, name, expected):
+        FakeModprobeRunner.executed_commands = []
+        monkeypatch.setattr(tcconfig._kernel_module.spr, "SubprocessRunner", FakeModprobeRunner)
+
+        assert load_module(name) == 0
+        assert FakeModprobeRunner.executed_commands == expected
+
+    def test_normal_dry_run(self, sys_module_dir, monkeypatch):
+        FakeModprobeRunner.executed_commands = []
+        monkeypatch.setattr(tcconfig._kernel_module.spr, "SubprocessRunner", FakeModprobeRunner)
+        monkeypatch.setattr(FakeModprobeRunner, "default_is_dry_run", True)
+
+        # output the command even if the module already loaded
+        assert load_module("sch_htb") == 0
+        assert FakeModprobeRunner.executed_commands == ["modprobe sch_htb"]
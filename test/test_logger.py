@@ -0,0 +1,47 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+
+import tcconfig._logger
+from tcconfig._logger import LogLevel, is_debug_enabled, logger, set_log_level, set_logger
+
+
+@pytest.fixture
+def restore_logger(monkeypatch):
+    monkeypatch.setattr(tcconfig._logger, "_is_logger_enabled", False)
+    monkeypatch.setattr(tcconfig._logger, "_is_debug_level", True)
+
+    yield
+
+    set_logger(False)
+    logger.remove()
+
+
+class Test_is_debug_enabled:
+    @pytest.mark.parametrize(
+        ["log_level", "expected"],
+        [
+            [LogLevel.DEBUG, True],
+            ["TRACE", True],
+            [LogLevel.INFO, False],
+            ["ERROR", False],
+            [LogLevel.QUIET, False],
+        ],
+    )
+    def test_normal_log_level(self, restore_logger, log_level, expected):
+        set_log_level(log_level)
+
+        assert is_debug_enabled() == expected
+
+    def test_normal_set_logger(self, restore_logger):
+        set_logger(True)
+        assert is_debug_enabled()
+
+        set_log_level(LogLevel.INFO)
+        set_logger(False)
+        assert not is_debug_enabled()
+
+        set_logger(True)
+        assert not is_debug_enabled()
@@ -0,0 +1,233 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+
+from tcconfig._netlink import (
+    UnsupportedCommandError,
+    to_byte_per_sec,
+    to_tc_handle,
+    to_u32_handle,
+    translate_command,
+)
+
+
+def get_ifindex(device):
+    return {"eth0": 2, "ifb6157": 10}[device]
+
+
+class Test_to_tc_handle:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            ["1a1a:", 0x1A1A0000],
+            ["1a1a:252", 0x1A1A0252],
+            ["ffff:", 0xFFFF0000],
+            ["root", 0xFFFFFFFF],
+        ],
+    )
+    def test_normal(self, value, expected):
+        assert to_tc_handle(value) == expected
+
+
+class Test_to_u32_handle:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            ["800::800", 0x80000800],
+            ["800::801", 0x80000801],
+            ["801:1:a", 0x8010100A],
+        ],
+    )
+    def test_normal(self, value, expected):
+        assert to_u32_handle(value) == expected
+
+
+class Test_to_byte_per_sec:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            ["1000.0Kbit", 125000],
+            ["32000000.0kbit", 4000000000],
+            ["10Mbit", 1250000],
+        ],
+    )
+    def test_normal(self, value, expected):
+        assert to_byte_per_sec(value) == expected
+
+    @pytest.mark.parametrize(["value"], [["10MB"], ["abc"]])
+    def test_exception(self, value):
+        with pytest.raises(UnsupportedCommandError):
+            to_byte_per_sec(value)
+
+
+class Test_translate_command:
+    @pytest.mark.parametrize(
+        ["command", "expected"],
+        [
+            [
+                "/sbin/tc qdisc add dev eth0 root handle 1a1a: htb default 1",
+                ("tc", ("add", "htb", 2, 0x1A1A0000), {"default": 1}),
+            ],
+            [
+                (
+                    "/sbin/tc qdisc add dev eth0 parent 1a1a:2 handle 2ff3: netem "
+                    "loss 0.1% delay 10.0ms 2.0ms limit 10000"
+                ),
+                (
+                    "tc",
+                    ("add", "netem", 2, 0x2FF30000),
+                    {
+                        "parent": 0x1A1A0002,
+                        "loss": 0.1,
+                        "delay": 10000,
+                        "jitter": 2000,
+                        "limit": 10000,
+                    },
+                ),
+            ],
+            [
+                "/sbin/tc qdisc add dev eth0 ingress",
+                ("tc", ("add", "ingress", 2, 0xFFFF0000), {}),
+            ],
+            [
+                "/sbin/tc qdisc del dev eth0 root",
+                ("tc", ("del",), {"index": 2, "handle": 0, "parent": 0xFFFFFFFF}),
+            ],
+            [
+                "/sbin/tc qdisc del dev eth0 ingress",
+                ("tc", ("del",), {"index": 2, "handle": 0xFFFF0000, "parent": 0xFFFFFFF1}),
+            ],
+            [
+                (
+                    "/sbin/tc class add dev eth0 parent 1a1a: classid 1a1a:2 htb "
+                    "rate 1000.0Kbit ceil 1000.0Kbit burst 1600b cburst 1600b"
+                ),
+                (
+                    "tc",
+                    ("add-class", "htb", 2, 0x1A1A0002),
+                    {
+                        "parent": 0x1A1A0000,
+                        "rate": 125000,
+                        "ceil": 125000,
+                        "burst": 1600,
+                        "cburst": 1600,
+                    },
+                ),
+            ],
+            [
+                (
+                    "/sbin/tc filter add dev eth0 protocol ip parent 1a1a: prio 5 u32 "
+                    "match ip dst 192.168.0.0/24 match ip src 0.0.0.0/0 "
+                    "match ip sport 80 0xffff match ip dport 8080 0xffff flowid 1a1a:2"
+                ),
+                (
+                    "tc",
+                    ("add-filter", "u32", 2),
+                    {
+                        "parent": 0x1A1A0000,
+                        "prio": 5,
+                        "protocol": 0x0800,
+                        "target": 0x1A1A0002,
+                        "keys": [
+                            "0xc0a80000/0xffffff00+16",
+                            "0x0/0x0+12",
+                            "0x501f90/0xffffffff+20",
+                        ],
+                    },
+                ),
+            ],
+            [
+                (
+                    "/sbin/tc filter add dev eth0 protocol ipv6 parent 1a1a: prio 6 u32 "
+                    "match ip6 dst 2001:db8::/64 flowid 1a1a:3"
+                ),
+                (
+                    "tc",
+                    ("add-filter", "u32", 2),
+                    {
+                        "parent": 0x1A1A0000,
+                        "prio": 6,
+                        "protocol": 0x86DD,
+                        "target": 0x1A1A0003,
+                        "keys": ["0x20010db8/0xffffffff+24", "0x0/0xffffffff+28"],
+                    },
+                ),
+            ],
+            [
+                (
+                    "/sbin/tc filter add dev eth0 parent ffff: protocol ip u32 match u32 0 0 "
+                    "flowid 1a1a: action mirred egress redirect dev ifb6157"
+                ),
+                (
+                    "tc",
+                    ("add-filter", "u32", 2),
+                    {
+                        "parent": 0xFFFF0000,
+                        "prio": 0,
+                        "protocol": 0x0800,
+                        "target": 0x1A1A0000,
+                        "keys": ["0x0/0x0+0"],
+                        "action": {
+                            "kind": "mirred",
+                            "direction": "egress",
+                            "action": "redirect",
+                            "ifindex": 10,
+                        },
+                    },
+                ),
+            ],
+            [
+                "/sbin/tc filter del dev eth0 protocol ip parent 1a1a: handle 800::801 prio 5 u32",
+                (
+                    "tc",
+                    ("del-filter",),
+                    {
+                        "index": 2,
+                        "parent": 0x1A1A0000,
+                        "handle": 0x80000801,
+                        "info": 0x50008,
+                    },
+                ),
+            ],
+            [
+                "/sbin/ip link add ifb6157 type ifb",
+                ("link", ("add",), {"ifname": "ifb6157", "kind": "ifb"}),
+            ],
+            [
+                "/sbin/ip link set dev ifb6157 up",
+                ("link", ("set",), {"index": 10, "state": "up"}),
+            ],
+            [
+                "/sbin/ip link delete ifb6157 type ifb",
+                ("link", ("del",), {"index": 10}),
+            ],
+        ],
+    )
+    def test_normal(self, command, expected):
+        assert translate_command(command, get_ifindex) == expected
+
+    @pytest.mark.parametrize(
+        ["command"],
+        [
+            ["/sbin/tc qdisc add dev eth0 root handle 1a1a: prio"],
+            ["/sbin/tc qdisc add dev eth0 parent 1a1a:1 handle 20: tbf rate 1Mbit"],
+            [
+                (
+                    "/sbin/tc qdisc add dev eth0 parent 1a1a:2 handle 2ff3: netem "
+                    "delay 10.0ms 2.0ms distribution normal"
+                )
+            ],
+            [
+                (
+                    "/sbin/tc filter add dev eth0 protocol ip parent 1a1a: prio 5 u32 "
+                    "match ip dport 80 0xffff flowid 1a1a:2"
+                )
+            ],
+            ["/sbin/iptables -t mangle -L"],
+        ],
+    )
+    def test_exception(self, command):
+        with pytest.raises(UnsupportedCommandError):
+            translate_command(command, get_ifindex)
@@ -88,7 +88,7 @@ class Test_get_upper_limit_rate:
         if device_option is None:
             pytest.skip("device option is null")
 
-        monkeypatch.setattr("tcconfig._network._read_iface_speed", lambda x: speed)
+        monkeypatch.setattr("tcconfig._device_inventory._read_iface_speed", lambda x: speed)
 
         assert get_upper_limit_rate(device_option).kilo_bps == expected
 
@@ -97,7 +97,7 @@ class Test_get_upper_limit_rate:
         if device_option is None:
             pytest.skip("device option is null")
 
-        monkeypatch.setattr("tcconfig._network._read_iface_speed", lambda x: speed)
+        monkeypatch.setattr("tcconfig._device_inventory._read_iface_speed", lambda x: speed)
 
         assert get_upper_limit_rate(device_option) == expected
 
@@ -109,7 +109,7 @@ class Test_get_upper_limit_rate:
         if device_option is None:
             pytest.skip("device option is null")
 
-        monkeypatch.setattr("tcconfig._network._read_iface_speed", self.raise_ioerror)
+        monkeypatch.setattr("tcconfig._device_inventory._read_iface_speed", self.raise_ioerror)
 
         assert get_upper_limit_rate(device_option) == _get_iproute2_upper_limite_rate()
 
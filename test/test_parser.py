@@ -3,7 +3,6 @@
 """
 
 import pytest
-from simplesqlite import connect_memdb
 
 import tcconfig.parser._filter
 import tcconfig.parser._qdisc
@@ -11,6 +10,7 @@ import tcconfig.parser.shaping_rule
 from tcconfig._const import Tc
 from tcconfig.parser._class import TcClassParser
 from tcconfig.parser._model import Filter, Qdisc
+from tcconfig.parser._store import HashRuleStore
 
 from .common import print_test_result
 
@@ -20,22 +20,22 @@ DEVICE = "eth0"
 
 @pytest.fixture
 def filter_parser_ipv4():
-    return tcconfig.parser._filter.TcFilterParser(connect_memdb(), ip_version=4)
+    return tcconfig.parser._filter.TcFilterParser(HashRuleStore(), ip_version=4)
 
 
 @pytest.fixture
 def filter_parser_ipv6():
-    return tcconfig.parser._filter.TcFilterParser(connect_memdb(), ip_version=6)
+    return tcconfig.parser._filter.TcFilterParser(HashRuleStore(), ip_version=6)
 
 
 @pytest.fixture
 def qdisc_parser():
-    return tcconfig.parser._qdisc.TcQdiscParser(connect_memdb())
+    return tcconfig.parser._qdisc.TcQdiscParser(HashRuleStore())
 
 
 @pytest.fixture
 def class_parser():
-    return TcClassParser(connect_memdb())
+    return TcClassParser(HashRuleStore())
 
 
 def six_b(s):
@@ -286,10 +286,8 @@ filter parent 120a: protocol ipv6 pref 6 u32 chain 0 fh 801::800 order 2048 key
         ids=lambda i: f"Test_TcFilterParser_parse_filter_ipv4_{i}",
     )
     def test_normal(self, test_id, filter_parser_ipv4, value, expected):
-        Filter.attach(filter_parser_ipv4.con)
-        Filter.create()
         filter_parser_ipv4.parse(DEVICE, value)
-        actual = [f for f in Filter().select()]
+        actual = filter_parser_ipv4.store.select_filters()
 
         assert actual == expected, test_id
 
@@ -439,15 +437,197 @@ filter parent 1f87: protocol ipv6 pref 1 u32 fh 800::802 order 2050 key ht 800 b
         ids=lambda i: f"Test_TcFilterParser_parse_filter_ipv6_{i}",
     )
     def test_normal(self, test_id, filter_parser_ipv6, value, expected):
-        Filter.attach(filter_parser_ipv6.con)
-        Filter.create()
         filter_parser_ipv6.parse(DEVICE, value)
-        actual = [f for f in Filter().select()]
+        actual = filter_parser_ipv6.store.select_filters()
 
         print(f"test_id={test_id}\n     got={actual}\nexpected={expected}")
         assert actual == expected
 
 
+class Test_TcFilterParser_parse_filter_flower:
+    FLOWER_OUTPUT = six_b(
+        """filter parent 1a1a: protocol ip pref 1 flower chain 0
+filter parent 1a1a: protocol ip pref 1 flower chain 0 handle 0x1 classid 1a1a:1
+  eth_type ipv4
+  dst_ip 10.1.0.0/16
+  not_in_hw
+filter parent 1a1a: protocol ip pref 5 flower chain 0
+filter parent 1a1a: protocol ip pref 5 flower chain 0 handle 0x2 classid 1a1a:2
+  eth_type ipv4
+  dst_ip 192.168.0.10
+  not_in_hw
+filter parent 1a1a: protocol ip pref 5 flower chain 0 handle 0x3 classid 1a1a:3
+  eth_type ipv4
+  ip_proto tcp
+  dst_ip 192.168.0.0/24
+  src_ip 10.0.0.0/8
+  dst_port 80
+  src_port 1234
+  not_in_hw
+filter parent 1a1a: protocol ipv6 pref 6 flower chain 0
+filter parent 1a1a: protocol ipv6 pref 6 flower chain 0 handle 0x4 classid 1a1a:4
+  eth_type ipv6
+  ip_proto udp
+  dst_ip 2001:db8::/64
+  dst_port 53
+  not_in_hw"""
+    )
+
+    @pytest.mark.parametrize(
+        ["ip_version", "expected"],
+        [
+            [
+                4,
+                [
+                    Filter(
+                        device=DEVICE,
+                        filter_id="0x1",
+                        flowid="1a1a:1",
+                        protocol="ip",
+                        priority=1,
+                        src_network="0.0.0.0/0",
+                        dst_network="10.1.0.0/16",
+                        classifier="flower",
+                    ),
+                    Filter(
+                        device=DEVICE,
+                        filter_id="0x2",
+                        flowid="1a1a:2",
+                        protocol="ip",
+                        priority=5,
+                        src_network="0.0.0.0/0",
+                        dst_network="192.168.0.10/32",
+                        classifier="flower",
+                    ),
+                    Filter(
+                        device=DEVICE,
+                        filter_id="0x3",
+                        flowid="1a1a:3",
+                        protocol="ip",
+                        priority=5,
+                        src_network="10.0.0.0/8",
+                        dst_network="192.168.0.0/24",
+                        src_port=1234,
+                        dst_port=80,
+                        classifier="flower",
+                    ),
+                    Filter(
+                        device=DEVICE,
+                        filter_id="0x4",
+                        flowid="1a1a:4",
+                        protocol="ipv6",
+                        priority=6,
+                        src_network="0.0.0.0/0",
+                        dst_network="0.0.0.0/0",
+                        dst_port=53,
+                        classifier="flower",
+                    ),
+                ],
+            ],
+            [
+                6,
+                [
+                    Filter(
+                        device=DEVICE,
+                        filter_id="0x1",
+                        flowid="1a1a:1",
+                        protocol="ip",
+                        priority=1,
+                        src_network="::/0",
+                        dst_network="::/0",
+                        classifier="flower",
+                    ),
+                    Filter(
+                        device=DEVICE,
+                        filter_id="0x2",
+                        flowid="1a1a:2",
+                        protocol="ip",
+                        priority=5,
+                        src_network="::/0",
+                        dst_network="::/0",
+                        classifier="flower",
+                    ),
+                    Filter(
+                        device=DEVICE,
+                        filter_id="0x3",
+                        flowid="1a1a:3",
+                        protocol="ip",
+                        priority=5,
+                        src_network="::/0",
+                        dst_network="::/0",
+                        src_port=1234,
+                        dst_port=80,
+                        classifier="flower",
+                    ),
+                    Filter(
+                        device=DEVICE,
+                        filter_id="0x4",
+                        flowid="1a1a:4",
+                        protocol="ipv6",
+                        priority=6,
+                        src_network="::/0",
+                        dst_network="2001:db8::/64",
+                        dst_port=53,
+                        classifier="flower",
+                    ),
+                ],
+            ],
+        ],
+    )
+    def test_normal(self, ip_version, expected):
+        filter_parser = tcconfig.parser._filter.TcFilterParser(HashRuleStore(), ip_version)
+        filter_parser.parse(DEVICE, self.FLOWER_OUTPUT)
+        actual = filter_parser.store.select_filters()
+
+        print_test_result(expected=expected, actual=actual)
+        assert actual == expected
+
+
+class Test_TcFilterParser_lex:
+    LineType = tcconfig.parser._filter.TcFilterParser.LineType
+
+    @pytest.mark.parametrize(
+        ["line", "expected"],
+        [
+            [
+                (
+                    "filter parent 1: protocol ip pref 1 u32 chain 0 fh 800::800 order 2048 "
+                    "key ht 800 bkt 0 *flowid 1:1 not_in_hw"
+                ),
+                (
+                    LineType.FILTER,
+                    {"flowid": "1:1", "protocol": "ip", "pref": "1", "fh": "800::800"},
+                ),
+            ],
+            [
+                "filter parent 1: protocol ip pref 1 fw chain 0 handle 0x65 classid 1:1",
+                (LineType.MANGLE_MARK, {"handle": "0x65", "classid": "1:1"}),
+            ],
+            [
+                "filter parent 1: protocol ip pref 5 flower chain 0 handle 0x1 classid 1:2",
+                (
+                    LineType.FLOWER,
+                    {"flowid": "1:2", "protocol": "ip", "pref": "5", "fh": "0x1"},
+                ),
+            ],
+            ["match 0a000000/ff000000 at 16", (LineType.MATCH, ("0a000000", "ff000000", 16))],
+            ["dst_ip 10.0.0.0/8", (LineType.FLOWER_KEY, ("dst_ip", "10.0.0.0/8"))],
+            ["dst_port 80", (LineType.FLOWER_KEY, ("dst_port", "80"))],
+            [
+                "filter parent 1: protocol ip pref 1 u32 fh 800: ht divisor 1",
+                (LineType.OTHER, None),
+            ],
+            [
+                "action order 1: mirred (Egress Redirect to device ifb0) stolen",
+                (LineType.OTHER, None),
+            ],
+            ["match IP protocol 6", (LineType.OTHER, None)],
+        ],
+    )
+    def test_normal(self, line, expected):
+        assert tcconfig.parser._filter.TcFilterParser.lex(line) == expected
+
+
 class Test_TcFilterParser_parse_incoming_device:
     @pytest.mark.parametrize(
         ["value", "expected"],
@@ -588,14 +768,102 @@ qdisc netem 2008: parent 1f87:3 limit 1000 delay 0.5s  1.0ms loss 5%
                     ),
                 ],
             ],
+            [
+                six_b(
+                    """
+qdisc netem 2008: parent 1f87:3 limit 1000 delay 50ms  1ms loss 5% duplicate 1% reorder 25% 50% corrupt 0.5% rate 1Mbit gap 1
+qdisc netem 2009: parent 1f87:4 limit 1000 delay 10ms loss state p13 5
+qdisc tbf 20: parent 1a1a:1 rate 1500Kbit burst 1600b lat 50.0ms
+qdisc ingress ffff: parent ffff:fff1 ----------------
+"""
+                ),
+                [
+                    Qdisc(
+                        **{
+                            Tc.Param.DEVICE: DEVICE,
+                            "delay": "50ms",
+                            "delay-distro": "1ms",
+                            "loss": "5%",
+                            "duplicate": "1%",
+                            "reorder": "25%",
+                            "corrupt": "0.5%",
+                            "rate": "1M",
+                            Tc.Param.HANDLE: "2008:",
+                            Tc.Param.PARENT: "1f87:3",
+                            "limit": 1000,
+                        }
+                    ),
+                    Qdisc(
+                        **{
+                            Tc.Param.DEVICE: DEVICE,
+                            "delay": "10ms",
+                            Tc.Param.HANDLE: "2009:",
+                            Tc.Param.PARENT: "1f87:4",
+                            "limit": 1000,
+                        }
+                    ),
+                    Qdisc(**{Tc.Param.DEVICE: DEVICE, "rate": "1500K"}),
+                ],
+            ],
         ],
         ids=lambda i: f"Test_TcQdiscParser_parse_{i}",
     )
     def test_normal(self, qdisc_parser, value, expected):
-        Qdisc.attach(qdisc_parser.con)
-        Qdisc.create()
         qdisc_parser.parse(DEVICE, value)
-        actual = [qdisc for qdisc in Qdisc.select()]
+        actual = qdisc_parser.store.select_all_qdiscs()
+
+        assert actual == expected
+
+
+class Test_TcQdiscParser_parse_json:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            [
+                """[{"kind":"htb","handle":"1f87:","root":true,"refcnt":2,"options":{"r2q":10,
+                "default":"0x1","direct_packets_stat":0,"direct_qlen":1000}},
+                {"kind":"netem","handle":"2007:","parent":"1f87:2","options":{"limit":1000,
+                "delay":{"delay":0.005,"jitter":0,"correlation":0},"ecn":false,"gap":0}},
+                {"kind":"netem","handle":"2008:","parent":"1f87:3","options":{"limit":1000,
+                "delay":{"delay":0.05,"jitter":0.001,"correlation":0},
+                "loss-random":{"loss":0.05,"correlation":0},
+                "rate":{"rate":125000,"packetoverhead":0,"cellsize":0,"celloverhead":0},
+                "ecn":false,"gap":0}}]""",
+                [
+                    Qdisc(
+                        **{
+                            Tc.Param.DEVICE: DEVICE,
+                            "delay": "5ms",
+                            Tc.Param.HANDLE: "2007:",
+                            Tc.Param.PARENT: "1f87:2",
+                            "limit": 1000,
+                        }
+                    ),
+                    Qdisc(
+                        **{
+                            Tc.Param.DEVICE: DEVICE,
+                            "delay": "50ms",
+                            "loss": "5%",
+                            "delay-distro": "1ms",
+                            "rate": "1M",
+                            Tc.Param.HANDLE: "2008:",
+                            Tc.Param.PARENT: "1f87:3",
+                            "limit": 1000,
+                        }
+                    ),
+                ],
+            ],
+            [
+                """[{"kind":"tbf","handle":"20:","parent":"1a1a:1","options":{"rate":187500,
+                "burst":1600,"lat":50000}}]""",
+                [Qdisc(**{Tc.Param.DEVICE: DEVICE, "rate": "1500K"})],
+            ],
+            ["[]", []],
+        ],
+    )
+    def test_normal(self, qdisc_parser, value, expected):
+        qdisc_parser.parse(DEVICE, value)
+        actual = qdisc_parser.store.select_all_qdiscs()
 
         assert actual == expected
 
@@ -656,3 +924,32 @@ class htb 120a:2 root leaf 2518: prio rate 200Kbit ceil 200Kbit burst 25Kb cburs
         )
 
         assert actual == expected
+
+
+class Test_TcClassParser_parse_json:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            [
+                """[{"class":"htb","handle":"120a:1","root":true,"prio":0,"rate":4000000000,
+                "ceil":4000000000,"burst":0,"cburst":0},
+                {"class":"htb","handle":"120a:2","root":true,"leaf":"2518:","prio":0,
+                "rate":25000,"ceil":25000,"burst":25000,"cburst":25000}]""",
+                [
+                    {
+                        TcClassParser.Key.DEVICE: "eth0",
+                        TcClassParser.Key.CLASS_ID: "120a:1",
+                        TcClassParser.Key.RATE: "32Gbps",
+                    },
+                    {
+                        TcClassParser.Key.DEVICE: "eth0",
+                        TcClassParser.Key.CLASS_ID: "120a:2",
+                        TcClassParser.Key.RATE: "200Kbps",
+                    },
+                ],
+            ],
+            ["[]", []],
+        ],
+    )
+    def test_normal(self, class_parser, value, expected):
+        assert class_parser.parse(DEVICE, value) == expected
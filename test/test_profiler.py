@@ -0,0 +1,139 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import json
+
+import pytest
+import subprocrunner as spr
+from subprocrunner import SubprocessRunner
+
+from tcconfig._common import logging_context
+from tcconfig._const import ProfileFormat, Tc
+from tcconfig._profiler import (
+    Profiler,
+    SpanCategory,
+    get_profiler,
+    profile_context,
+    profile_span,
+)
+
+
+class Test_Profiler:
+    def test_normal(self):
+        profiler = Profiler("test")
+
+        outer_span = profiler.span("outer", SpanCategory.PHASE)
+        inner_span = profiler.span("inner", SpanCategory.SUBPROCESS, command="tc")
+        with outer_span, inner_span as span_args:
+            span_args["returncode"] = 0
+
+        assert [(span.name, span.category, span.depth) for span in profiler.spans] == [
+            ("outer", "phase", 0),
+            ("inner", "subprocess", 1),
+        ]
+        outer, inner = profiler.spans
+        assert outer.start <= inner.start
+        assert outer.duration >= inner.duration
+        assert inner.args == {"command": "tc", "returncode": 0}
+
+    def test_normal_report(self):
+        profiler = Profiler("test")
+
+        for name in ("a", "b"):
+            with profiler.span(name, SpanCategory.PARSE):
+                pass
+
+        report = profiler.to_report()
+
+        assert report["name"] == "test"
+        assert report["summary"]["parse"]["count"] == 2
+        assert [span["name"] for span in report["spans"]] == ["a", "b"]
+        assert report["total_ms"] >= report["summary"]["parse"]["total_ms"]
+
+    def test_normal_trace_events(self):
+        profiler = Profiler("test")
+
+        with profiler.span("a", SpanCategory.QUERY, query="SELECT 1"):
+            pass
+
+        events = profiler.to_trace_events()["traceEvents"]
+
+        assert events[0]["ph"] == "M"
+        assert events[1]["name"] == "a"
+        assert events[1]["cat"] == "query"
+        assert events[1]["ph"] == "X"
+        assert events[1]["args"] == {"query": "SELECT 1"}
+
+
+class Test_profile_span:
+    def test_normal_out_of_context(self):
+        with profile_span("a", SpanCategory.PHASE, key="value") as span_args:
+            assert span_args == {"key": "value"}
+
+        assert get_profiler() is None
+
+
+class Test_profile_context:
+    @pytest.mark.parametrize(
+        ["output_format", "key"],
+        [
+            [ProfileFormat.JSON, "spans"],
+            [ProfileFormat.TRACE_EVENT, "traceEvents"],
+        ],
+    )
+    def test_normal(self, tmp_path, output_format, key):
+        output_path = str(tmp_path / "profile.json")
+        original_run = spr.SubprocessRunner.run
+
+        with profile_context("test", output_path, output_format.value):
+            assert get_profiler() is not None
+
+            with logging_context("phase"):
+                SubprocessRunner("echo test").run()
+
+        assert get_profiler() is None
+        assert spr.SubprocessRunner.run is original_run
+
+        with open(output_path) as f:
+            report = json.load(f)
+
+        assert {(span["name"], span.get("cat", span.get("category"))) for span in report[key]} >= {
+            ("test", "command"),
+            ("phase", "phase"),
+            ("echo", "subprocess"),
+        }
+
+    def test_normal_no_output_path(self):
+        with profile_context("test", None):
+            assert get_profiler() is None
+
+
+class Test_profile_option:
+    def test_normal(self, simulator, tmp_path):
+        output_path = str(tmp_path / "profile.json")
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, "eth0", "--rate", "1Mbps", "--profile", output_path]
+        )
+        assert runner.run() == 0, runner.stderr
+
+        with open(output_path) as f:
+            report = json.load(f)
+
+        phase_names = [span["name"] for span in report["spans"] if span["category"] == "phase"]
+        assert "plan the shaping rule" in phase_names
+        assert "apply the shaping rule" in phase_names
+
+        subprocess_spans = [span for span in report["spans"] if span["category"] == "subprocess"]
+        assert subprocess_spans
+        for span in subprocess_spans:
+            assert {"command", "returncode"} <= set(span["args"])
+
+        runner = SubprocessRunner([Tc.Command.TCSHOW, "eth0", "--profile", output_path])
+        assert runner.run() == 0, runner.stderr
+
+        with open(output_path) as f:
+            report = json.load(f)
+
+        assert report["name"] == Tc.Command.TCSHOW
+        assert report["summary"]["parse"]["count"] > 0
@@ -0,0 +1,351 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+from humanreadable import ParameterError
+from subprocrunner import SubprocessRunner
+
+from tcconfig._common import find_bin_path
+from tcconfig._const import HtbLayout, Tc
+from tcconfig._rule_set import TcRuleSet, load_rules
+from tcconfig._tc_plan import TcCommandPlanner
+
+from .common import print_test_result, run_tcshow
+
+
+DEVICE = "eth0"
+
+
+class Test_load_rules:
+    @pytest.mark.parametrize(
+        ["filename", "content", "expected"],
+        [
+            [
+                "rules.jsonl",
+                (
+                    '{"network": "192.168.0.0/24", "rate": "10Mbps", "delay": "10ms"}\n'
+                    "\n"
+                    "# comment\n"
+                    '{"dst_network": "10.0.0.1", "port": "80", "loss": 1}'
+                ),
+                [
+                    {
+                        "dst_network": "192.168.0.0/24",
+                        "bandwidth_rate": "10Mbps",
+                        "latency_time": "10ms",
+                    },
+                    {"dst_network": "10.0.0.1", "dst_port": 80, "packet_loss_rate": 1},
+                ],
+            ],
+            [
+                "rules.csv",
+                "network,src-port,rate,delay\n192.168.0.0/24,,10Mbps,10ms\n 10.0.0.1 ,1234,,",
+                [
+                    {
+                        "dst_network": "192.168.0.0/24",
+                        "bandwidth_rate": "10Mbps",
+                        "latency_time": "10ms",
+                    },
+                    {"dst_network": "10.0.0.1", "src_port": 1234},
+                ],
+            ],
+        ],
+    )
+    def test_normal(self, tmp_path, filename, content, expected):
+        file_path = tmp_path / filename
+        file_path.write_text(content)
+
+        assert load_rules(str(file_path)) == expected
+
+    @pytest.mark.parametrize(
+        ["filename", "content"],
+        [
+            ["rules.jsonl", '{"network": "192.168.0.0/24", "unknown": 1}'],
+            ["rules.jsonl", '{"network": "192.168.0.0/24", "port": "http"}'],
+            ["rules.jsonl", '{"network": "192.168.0.0/24"'],
+            ["rules.jsonl", '["192.168.0.0/24"]'],
+            ["rules.csv", "network,rate\n192.168.0.0/24,1Mbps,10ms"],
+        ],
+    )
+    def test_exception(self, tmp_path, filename, content):
+        file_path = tmp_path / filename
+        file_path.write_text(content)
+
+        with pytest.raises(ParameterError):
+            load_rules(str(file_path))
+
+
+class Test_TcRuleSet_validate:
+    @pytest.mark.parametrize(
+        ["htb_layout", "max_rules"],
+        [
+            [HtbLayout.FLAT, 9998],
+            # limited by the major ids of netem qdiscs:
+            # ids except for 0:, ffff:, the root qdisc and the bucket qdiscs
+            [HtbLayout.HASH, 0x10000 - 2 - 1 - 64],
+        ],
+    )
+    def test_normal(self, htb_layout, max_rules):
+        planners = [
+            TcCommandPlanner(
+                DEVICE, dst_network=f"10.{i >> 8:d}.{i & 0xFF:d}.1", htb_layout=htb_layout
+            )
+            for i in range(max_rules + 1)
+        ]
+
+        TcRuleSet(DEVICE, planners[:-1], "outgoing", False, None).validate()
+
+        with pytest.raises(ParameterError, match=f"up to {max_rules:d} rules"):
+            TcRuleSet(DEVICE, planners, "outgoing", False, None).validate()
+
+
+class Test_tcset_rules_file:
+    def test_normal(self, simulator, tmp_path):
+        rules_file_path = tmp_path / "rules.jsonl"
+        rules_file_path.write_text(
+            '{"network": "192.168.0.0/24", "rate": "10Mbps"}\n'
+            '{"network": "192.168.1.0/24", "port": 80, "rate": "5Mbps", "loss": 1}\n'
+            '{"network": "192.168.2.5"}'
+        )
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(rules_file_path), "--delay", "10ms"]
+        )
+        assert runner.run() == 0, runner.stderr
+
+        # rules of a CSV file in addition to the existing rules
+        csv_file_path = tmp_path / "rules.csv"
+        csv_file_path.write_text("network,rate\n10.0.0.0/8,1Mbps\n")
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(csv_file_path), "--add"]
+        )
+        assert runner.run() == 0, runner.stderr
+
+        expected = {
+            DEVICE: {
+                "outgoing": {
+                    "dst_network=192.168.0.0/24, protocol=ip": {
+                        "filter_id": "800::800",
+                        "delay": "10ms",
+                        "limit": 1000,
+                        "rate": "10Mbps",
+                    },
+                    "dst_network=192.168.1.0/24, dst_port=80, protocol=ip": {
+                        "filter_id": "800::801",
+                        "delay": "10ms",
+                        "loss": "1%",
+                        "limit": 1000,
+                        "rate": "5Mbps",
+                    },
+                    "dst_network=192.168.2.5/32, protocol=ip": {
+                        "filter_id": "800::802",
+                        "delay": "10ms",
+                        "limit": 1000,
+                        "rate": "32Gbps",
+                    },
+                    "dst_network=10.0.0.0/8, protocol=ip": {
+                        "filter_id": "800::803",
+                        "limit": 1000,
+                        "rate": "1Mbps",
+                    },
+                },
+                "incoming": {},
+            }
+        }
+        actual = run_tcshow(DEVICE)
+        print_test_result(expected=expected, actual=actual)
+        assert actual == expected
+
+        # rules that already exist
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(csv_file_path), "--add"]
+        )
+        assert runner.run() != 0
+        assert run_tcshow(DEVICE) == expected
+
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(csv_file_path), "--overwrite"]
+        )
+        assert runner.run() == 0, runner.stderr
+        assert run_tcshow(DEVICE) == {
+            DEVICE: {
+                "outgoing": {
+                    "dst_network=10.0.0.0/8, protocol=ip": {
+                        "filter_id": "800::800",
+                        "limit": 1000,
+                        "rate": "1Mbps",
+                    },
+                },
+                "incoming": {},
+            }
+        }
+
+    def test_normal_htb_layout(self, simulator, tmp_path):
+        rules_file_path = tmp_path / "rules.jsonl"
+        rules_file_path.write_text(
+            '{"network": "192.168.0.1", "rate": "10Mbps"}\n'
+            '{"network": "192.168.0.2", "port": 80, "rate": "5Mbps"}\n'
+            '{"network": "10.1.0.2", "delay": "10ms"}'
+        )
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(rules_file_path)]
+            + ["--htb-layout", "prefix", "--loss", "1"]
+        )
+        assert runner.run() == 0, runner.stderr
+
+        # rules to the existing bucket
+        csv_file_path = tmp_path / "rules.csv"
+        csv_file_path.write_text("network,rate\n192.168.1.0/24,1Mbps\n")
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(csv_file_path)]
+            + ["--htb-layout", "prefix", "--add"]
+        )
+        assert runner.run() == 0, runner.stderr
+
+        expected = {
+            DEVICE: {
+                "outgoing": {
+                    "dst_network=192.168.0.1/32, protocol=ip": {
+                        "filter_id": "b28::800",
+                        "loss": "1%",
+                        "limit": 1000,
+                        "rate": "10Mbps",
+                    },
+                    "dst_network=192.168.0.2/32, dst_port=80, protocol=ip": {
+                        "filter_id": "b28::801",
+                        "loss": "1%",
+                        "limit": 1000,
+                        "rate": "5Mbps",
+                    },
+                    "dst_network=10.1.0.2/32, protocol=ip": {
+                        "filter_id": "b01::800",
+                        "delay": "10ms",
+                        "loss": "1%",
+                        "limit": 1000,
+                        "rate": "32Gbps",
+                    },
+                    "dst_network=192.168.1.0/24, protocol=ip": {
+                        "filter_id": "b28::802",
+                        "limit": 1000,
+                        "rate": "1Mbps",
+                    },
+                },
+                "incoming": {},
+            }
+        }
+        actual = run_tcshow(DEVICE)
+        print_test_result(expected=expected, actual=actual)
+        assert actual == expected
+
+        # the root qdisc hands off packets with a filter for each bucket
+        runner = SubprocessRunner(f"{find_bin_path('tc'):s} filter show dev {DEVICE:s}")
+        assert runner.run() == 0, runner.stderr
+        assert runner.stdout.count("link b80:") == 1
+        assert runner.stdout.count("flowid 1a1a:b0") == 2
+
+    @pytest.mark.parametrize(
+        ["layout", "other_layout"],
+        [["prefix", "hash"], ["prefix", "flat"], ["flat", "hash"]],
+    )
+    def test_exception_htb_layout(self, simulator, tmp_path, layout, other_layout):
+        rules_file_path = tmp_path / "rules.jsonl"
+        rules_file_path.write_text('{"network": "192.168.0.1", "rate": "10Mbps"}')
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(rules_file_path)]
+            + ["--htb-layout", layout]
+        )
+        assert runner.run() == 0, runner.stderr
+        expected = run_tcshow(DEVICE)
+
+        # rules of a different layout can not be added to the device
+        rules_file_path.write_text('{"network": "192.168.1.1", "rate": "1Mbps"}')
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(rules_file_path)]
+            + ["--htb-layout", other_layout, "--add"]
+        )
+        assert runner.run() != 0
+        assert "different HTB layout" in runner.stderr
+        assert run_tcshow(DEVICE) == expected
+
+        # the existing rules are replaced with --overwrite option
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(rules_file_path)]
+            + ["--htb-layout", other_layout, "--overwrite"]
+        )
+        assert runner.run() == 0, runner.stderr
+        assert list(run_tcshow(DEVICE)[DEVICE]["outgoing"]) == [
+            "dst_network=192.168.1.1/32, protocol=ip"
+        ]
+
+    def test_normal_empty_qdisc(self, simulator, tmp_path):
+        # the root qdisc of tcconfig without classes
+        runner = SubprocessRunner(
+            f"{find_bin_path('tc'):s} qdisc add dev {DEVICE:s} root handle 1a1a: htb default 1"
+        )
+        assert runner.run() == 0, runner.stderr
+
+        rules_file_path = tmp_path / "rules.jsonl"
+        rules_file_path.write_text('{"network": "10.0.0.1", "rate": "1Mbps"}')
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(rules_file_path), "--add"]
+        )
+        assert runner.run() == 0, runner.stderr
+
+        runner = SubprocessRunner(f"{find_bin_path('tc'):s} class show dev {DEVICE:s}")
+        assert runner.run() == 0, runner.stderr
+        assert "class htb 1a1a:1 root" in runner.stdout
+        assert run_tcshow(DEVICE) == {
+            DEVICE: {
+                "outgoing": {
+                    "dst_network=10.0.0.1/32, protocol=ip": {
+                        "filter_id": "800::800",
+                        "limit": 1000,
+                        "rate": "1Mbps",
+                    },
+                },
+                "incoming": {},
+            }
+        }
+
+    @pytest.mark.parametrize(["options"], [[["--add"]], [[]]])
+    def test_exception_foreign_qdisc(self, simulator, tmp_path, options):
+        qdisc_show_command = f"{find_bin_path('tc'):s} qdisc show dev {DEVICE:s}"
+        runner = SubprocessRunner(
+            f"{find_bin_path('tc'):s} qdisc add dev {DEVICE:s} root handle 1: prio"
+        )
+        assert runner.run() == 0, runner.stderr
+        runner = SubprocessRunner(qdisc_show_command)
+        assert runner.run() == 0, runner.stderr
+        expected = runner.stdout
+
+        rules_file_path = tmp_path / "rules.jsonl"
+        rules_file_path.write_text('{"network": "10.0.0.1", "rate": "1Mbps"}')
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(rules_file_path)] + options
+        )
+        assert runner.run() != 0
+
+        runner = SubprocessRunner(qdisc_show_command)
+        assert runner.run() == 0, runner.stderr
+        assert runner.stdout == expected
+
+    @pytest.mark.parametrize(
+        ["content", "options"],
+        [
+            # duplicated rules
+            ['{"network": "10.0.0.1", "rate": "1Mbps"}\n{"network": "10.0.0.1/32"}', []],
+            ['{"network": "10.0.0.1", "rate": "1Mbps"}', ["--change"]],
+            ['{"network": "10.0.0.1", "rate": "1Mbps"}', ["--shaping-algo", "tbf"]],
+            ['{"network": "10.0.0.1"}', []],
+            ["", []],
+        ],
+    )
+    def test_exception(self, simulator, tmp_path, content, options):
+        rules_file_path = tmp_path / "rules.jsonl"
+        rules_file_path.write_text(content)
+        runner = SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rules-file", str(rules_file_path)] + options
+        )
+
+        assert runner.run() != 0
+        assert run_tcshow(DEVICE) == {DEVICE: {"outgoing": {}, "incoming": {}}}
@@ -0,0 +1,185 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+
+import pytest
+from subprocrunner import SubprocessRunner
+
+from tcconfig._common import find_bin_path
+from tcconfig._const import Tc
+
+from .common import print_test_result, run_tcshow
+from .simulator import SIMULATOR_BIN_DIR
+
+
+DEVICE = "eth0"
+
+
+def run_simulator(command):
+    program, args = command.split(maxsplit=1)
+    runner = SubprocessRunner(f"{find_bin_path(program):s} {args:s}")
+    runner.run()
+
+    return runner
+
+
+class Test_find_bin_path:
+    @pytest.mark.parametrize(["command"], [["tc"], ["ip"], ["iptables"]])
+    def test_normal(self, simulator, command):
+        assert find_bin_path(command) == os.path.join(SIMULATOR_BIN_DIR, command)
+
+    def test_normal_not_substituted(self, simulator):
+        assert not find_bin_path("getcap").startswith(SIMULATOR_BIN_DIR)
+
+
+class Test_simulator_filter:
+    @pytest.mark.parametrize(
+        ["match", "expected"],
+        [
+            [
+                (
+                    "match ip dst 10.0.0.0/24 match ip src 0.0.0.0/0 "
+                    "match ip sport 1234 0xffff match ip dport 80 0xffff"
+                ),
+                [
+                    "  match 0a000000/ffffff00 at 16",
+                    "  match 00000000/00000000 at 12",
+                    "  match 04d20050/ffffffff at 20",
+                ],
+            ],
+            [
+                "match ip6 dst 2001:db8::/64 match ip6 src ::/0",
+                ["  match 20010db8/ffffffff at 24", "  match 00000000/ffffffff at 28"],
+            ],
+        ],
+    )
+    def test_normal(self, simulator, match, expected):
+        for command in [
+            f"tc qdisc add dev {DEVICE:s} root handle 1a1a: htb default 1",
+            f"tc class add dev {DEVICE:s} parent 1a1a: classid 1a1a:2 htb rate 1Mbit",
+            (
+                f"tc filter add dev {DEVICE:s} protocol ip parent 1a1a: prio 5 u32 {match:s} "
+                "flowid 1a1a:2"
+            ),
+        ]:
+            assert run_simulator(command).returncode == 0
+
+        output = run_simulator(f"tc filter show dev {DEVICE:s}").stdout.splitlines()
+
+        assert output[:2] == [
+            "filter parent 1a1a: protocol ip pref 5 u32 chain 0 ",
+            "filter parent 1a1a: protocol ip pref 5 u32 chain 0 fh 800: ht divisor 1 ",
+        ]
+        assert output[3:] == expected
+
+    @pytest.mark.parametrize(
+        ["command", "expected"],
+        [
+            [f"tc qdisc del dev {DEVICE:s} root", "RTNETLINK answers: No such file or directory"],
+            [f"tc qdisc del dev {DEVICE:s} ingress", "RTNETLINK answers: Invalid argument"],
+            ["tc qdisc show dev eth1", 'Cannot find device "eth1"'],
+            ["ip link set dev eth1 up", 'Cannot find device "eth1"'],
+            [f"ip link add {DEVICE:s} type ifb", "RTNETLINK answers: File exists"],
+            ["iptables -t mangle -D PREROUTING 1", "iptables: Index of deletion too big."],
+        ],
+    )
+    def test_exception(self, simulator, command, expected):
+        runner = run_simulator(command)
+
+        assert runner.returncode != 0
+        assert runner.stderr.strip() == expected
+
+
+class Test_simulator_u32_hash:
+    def test_normal(self, simulator):
+        filter_command = f"tc filter add dev {DEVICE:s} protocol ip parent 1a1a: prio 4"
+        query_command = (
+            f"tc filter get dev {DEVICE:s} parent 1a1a: protocol ip prio 4 handle 1: u32"
+        )
+
+        for command in [
+            f"tc qdisc add dev {DEVICE:s} root handle 1a1a: htb default 1",
+            f"tc class add dev {DEVICE:s} parent 1a1a: classid 1a1a:2 htb rate 1Mbit",
+        ]:
+            assert run_simulator(command).returncode == 0
+
+        assert run_simulator(query_command).returncode != 0
+
+        for command in [
+            f"{filter_command:s} handle 1: u32 divisor 256",
+            f"{filter_command:s} u32 link 1: hashkey mask 0x0000ff00 at 16 match u32 0 0",
+            f"{filter_command:s} handle 101: u32 divisor 256",
+            (
+                f"{filter_command:s} handle 1:1:1 u32 ht 1:1: link 101: "
+                "hashkey mask 0x000000ff at 16 match u32 0 0"
+            ),
+            f"{filter_command:s} u32 ht 101:5: match ip dst 192.168.1.5/32 flowid 1a1a:2",
+        ]:
+            runner = run_simulator(command)
+            assert runner.returncode == 0, runner.stderr
+
+        assert run_simulator(query_command).returncode == 0
+
+        runner = run_simulator(f"{filter_command:s} handle 101: u32 divisor 256")
+        assert runner.returncode != 0
+        assert runner.stderr.strip() == "RTNETLINK answers: File exists"
+
+        output = run_simulator(f"tc filter show dev {DEVICE:s}").stdout.splitlines()
+
+        assert (
+            "filter parent 1a1a: protocol ip pref 4 u32 chain 0 fh 101:5:800 order 2048 "
+            "key ht 101 bkt 5 *flowid 1a1a:2 not_in_hw " in output
+        )
+        assert "    hash mask 000000ff at 16 " in output
+
+
+class Test_tcset_simulator:
+    def test_normal(self, simulator):
+        for option in [
+            ["--delay", "10ms", "--network", "192.168.0.0/24", "--port", "80"],
+            ["--add", "--rate", "2Mbps", "--loss", "1%", "--src-port", "1234"],
+            ["--direction", "incoming", "--rate", "500Kbps", "--network", "10.0.0.0/8"],
+        ]:
+            runner = SubprocessRunner([Tc.Command.TCSET, DEVICE] + option)
+            assert runner.run() == 0, runner.stderr
+
+        expected = {
+            DEVICE: {
+                "outgoing": {
+                    "dst_network=192.168.0.0/24, dst_port=80, protocol=ip": {
+                        "filter_id": "800::800",
+                        "delay": "10ms",
+                        "limit": 1000,
+                        "rate": "32Gbps",
+                    },
+                    "src_port=1234, protocol=ip": {
+                        "filter_id": "800::801",
+                        "loss": "1%",
+                        "limit": 1000,
+                        "rate": "2Mbps",
+                    },
+                },
+                "incoming": {
+                    "dst_network=10.0.0.0/8, protocol=ip": {
+                        "filter_id": "800::800",
+                        "limit": 1000,
+                        "rate": "500Kbps",
+                    },
+                },
+            }
+        }
+        actual = run_tcshow(DEVICE)
+        print_test_result(expected=expected, actual=actual)
+        assert actual == expected
+
+        runner = SubprocessRunner([Tc.Command.TCDEL, DEVICE, "--id", "800::801"])
+        assert runner.run() == 0, runner.stderr
+        del expected[DEVICE]["outgoing"]["src_port=1234, protocol=ip"]
+        assert run_tcshow(DEVICE) == expected
+
+        runner = SubprocessRunner([Tc.Command.TCDEL, DEVICE, "--all"])
+        assert runner.run() == 0, runner.stderr
+        assert run_tcshow(DEVICE) == {DEVICE: {"outgoing": {}, "incoming": {}}}
+        assert "ifb" not in run_simulator("ip link show").stdout
@@ -0,0 +1,79 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import json
+import sys
+
+import pytest
+from subprocrunner import SubprocessRunner
+
+
+# packages that take long time to load: should be loaded only by paths that require them
+HEAVY_PACKAGES = ("docker", "pyparsing", "pyroute2", "simplesqlite")
+
+_SCRIPT_TEMPLATE = """
+import json, runpy, sys
+sys.argv = {argv}
+try:
+    runpy.run_module("tcconfig.{module}", run_name="__main__")
+except SystemExit:
+    pass
+finally:
+    print(json.dumps([name for name in {packages} if name in sys.modules]), file=sys.stderr)
+"""
+
+
+def load_heavy_packages(module, args, packages=HEAVY_PACKAGES):
+    script = _SCRIPT_TEMPLATE.format(argv=[module] + args, module=module, packages=packages)
+    runner = SubprocessRunner([sys.executable, "-c", script])
+    runner.run()
+
+    return set(json.loads(runner.stderr.strip().splitlines()[-1]))
+
+
+class Test_lazy_import:
+    @pytest.mark.parametrize(
+        ["module", "expected"],
+        [
+            ["tcset", set()],
+            ["tcdel", set()],
+            # tcshow always parses shaping rules with simplesqlite
+            ["tcshow", {"simplesqlite"}],
+        ],
+    )
+    def test_normal_import(self, module, expected):
+        assert load_heavy_packages(module, ["--version"]) == expected
+
+    @pytest.mark.parametrize(
+        ["module", "args", "expected"],
+        [
+            ["tcset", ["eth0", "--rate", "1Mbps", "--delay", "10ms"], set()],
+            ["tcset", ["eth0", "--delay", "10ms", "--direction", "incoming"], set()],
+            ["tcdel", ["eth0", "--all"], set()],
+            [
+                "tcset",
+                ["eth0", "--delay", "10ms", "--add", "--network", "10.0.0.0/24"],
+                {"simplesqlite"},
+            ],
+            ["tcshow", ["eth0"], {"simplesqlite"}],
+        ],
+    )
+    def test_normal_run(self, simulator, module, args, expected):
+        assert load_heavy_packages(module, args) == expected
+
+    @pytest.mark.parametrize(
+        ["module", "args"],
+        [
+            ["tcset", ["eth0", "--rate", "1Mbps", "--network", "10.0.0.0/24", "--tc-command"]],
+            ["tcset", ["eth0", "--delay", "10ms", "--direction", "incoming", "--tc-command"]],
+            ["tcdel", ["eth0", "--all", "--tc-command"]],
+        ],
+    )
+    def test_normal_tc_command(self, simulator, module, args):
+        # commands are generated without executing tc: chardet (imported by the first call of
+        # typepy string checks) is not required either once iproute2 features are cached
+        packages = HEAVY_PACKAGES + ("chardet",)
+        load_heavy_packages(module, args, packages)
+
+        assert load_heavy_packages(module, args, packages) == set()
@@ -2,11 +2,27 @@
 .. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
 """
 
+from textwrap import dedent
+
 import pytest
+from subprocrunner import SubprocessRunner
 
 import tcconfig._common
-from tcconfig._const import TcSubCommand
-from tcconfig._tc_command_helper import get_tc_base_command
+import tcconfig._iproute2
+import tcconfig._tc_command_helper
+from tcconfig._common import (
+    device_state_cache_context,
+    get_device_state_cache,
+    make_command_runner,
+)
+from tcconfig._const import Tc, TcCommandOutput, TcSubCommand
+from tcconfig._tc_command_helper import (
+    get_tc_base_command,
+    is_json_output_supported,
+    run_tc_filter_show_batch,
+    run_tc_show,
+    run_tc_show_batch,
+)
 
 
 class Test_get_tc_base_command:
@@ -29,3 +45,136 @@ class Test_get_tc_base_command:
     def test_exception(self, subcommand, expected):
         with pytest.raises(expected):
             get_tc_base_command(subcommand)
+
+
+class Test_run_tc_show:
+    @pytest.fixture
+    def fake_tc(self, tmp_path, monkeypatch):
+        # print the number of executions
+        bin_path = tmp_path / "tc"
+        bin_path.write_text(f"#!/bin/sh\necho run >> {tmp_path}/log\nwc -l < {tmp_path}/log\n")
+        bin_path.chmod(0o755)
+        monkeypatch.setattr(tcconfig._tc_command_helper, "find_bin_path", lambda _: str(bin_path))
+
+    def test_normal_cache(self, fake_tc):
+        def run():
+            return run_tc_show(TcSubCommand.QDISC, "lo", TcCommandOutput.NOT_SET).strip()
+
+        assert run() == "1"
+        assert run() == "2"
+
+        with device_state_cache_context():
+            assert run() == "3"
+            assert run() == "3"
+            assert run_tc_show(TcSubCommand.CLASS, "lo", TcCommandOutput.NOT_SET).strip() == "4"
+
+            make_command_runner("tc qdisc add dev lo root netem")
+            assert run() == "5"
+            assert run() == "5"
+
+        assert get_device_state_cache() is None
+        assert run() == "6"
+
+
+class Test_run_tc_show_batch:
+    STDOUT = dedent(
+        """\
+        filter parent ffff: protocol ip pref 49152 u32 chain 0
+        filter parent ffff: protocol ip pref 49152 u32 chain 0 fh 800::800 order 2048 key ht 800 bkt 0 *flowid 180d: not_in_hw
+          match 00000000/00000000 at 0
+        \taction order 1: mirred (Egress Redirect to device ifb6157) stolen
+        \tindex 1 ref 1 bind 1
+
+        qdisc htb 180d: root refcnt 2 r2q 10 default 0x1 direct_packets_stat 0 direct_qlen 32
+        qdisc ingress ffff: parent ffff:fff1 ----------------
+        class htb 180d:1 root prio 0 rate 32Gbit ceil 32Gbit burst 0b cburst 0b
+        qdisc noqueue 0: root refcnt 2
+        """
+    )
+    STDERR = dedent(
+        """\
+        Cannot find device "ifb6157"
+        Command failed -:5
+        Cannot find device "ifb6157"
+        Command failed -:6
+        Cannot find device "ifb6157"
+        Command failed -:7
+        """
+    )
+
+    @pytest.fixture
+    def fake_tc(self, tmp_path, monkeypatch):
+        (tmp_path / "stdout").write_text(self.STDOUT)
+        (tmp_path / "stderr").write_text(self.STDERR)
+        bin_path = tmp_path / "tc"
+        bin_path.write_text(
+            f"#!/bin/sh\ncat > /dev/null\ncat {tmp_path}/stdout\ncat {tmp_path}/stderr >&2\nexit 1\n"
+        )
+        bin_path.chmod(0o755)
+        monkeypatch.setattr(tcconfig._tc_command_helper, "find_bin_path", lambda _: str(bin_path))
+
+    def test_normal(self, fake_tc):
+        outputs = run_tc_show_batch(
+            [
+                (TcSubCommand.FILTER, "dev eth0 root"),
+                (TcSubCommand.QDISC, "dev eth0"),
+                (TcSubCommand.CLASS, "dev eth0"),
+                (TcSubCommand.FILTER, "dev eth0"),
+                (TcSubCommand.QDISC, "dev ifb6157"),
+                (TcSubCommand.CLASS, "dev ifb6157"),
+                (TcSubCommand.FILTER, "dev ifb6157"),
+                (TcSubCommand.QDISC, "dev lo"),
+            ]
+        )
+
+        assert len(outputs) == 8
+        assert outputs[0].splitlines()[3].endswith("Egress Redirect to device ifb6157) stolen")
+        assert outputs[1].splitlines() == [
+            "qdisc htb 180d: root refcnt 2 r2q 10 default 0x1 direct_packets_stat 0 direct_qlen 32",
+            "qdisc ingress ffff: parent ffff:fff1 ----------------",
+        ]
+        assert (
+            outputs[2] == "class htb 180d:1 root prio 0 rate 32Gbit ceil 32Gbit burst 0b cburst 0b"
+        )
+        assert outputs[3] == ""
+        assert outputs[4:7] == [None, None, None]
+        assert outputs[7] == "qdisc noqueue 0: root refcnt 2"
+
+
+class Test_is_json_output_supported:
+    @pytest.mark.parametrize(
+        ["stdout", "expected"],
+        [
+            ['[{"kind":"noqueue","handle":"0:","root":true,"refcnt":2,"options":{}}]', True],
+            ["qdisc noqueue 0: root refcnt 2", False],
+        ],
+    )
+    def test_normal(self, tmp_path, monkeypatch, stdout, expected):
+        bin_path = tmp_path / "tc"
+        bin_path.write_text(f"#!/bin/sh\necho '{stdout}'\n")
+        bin_path.chmod(0o755)
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+        monkeypatch.setattr(tcconfig._iproute2, "find_bin_path", lambda _: str(bin_path))
+        monkeypatch.setattr(tcconfig._iproute2, "_iproute2_features", None)
+
+        assert is_json_output_supported() == expected
+
+
+class Test_run_tc_filter_show_batch:
+    def test_normal(self, simulator):
+        for network in ["192.168.0.1", "10.1.0.2"]:
+            runner = SubprocessRunner(
+                [Tc.Command.TCSET, "eth0", "--htb-layout", "prefix", "--add"]
+                + ["--rate", "1Mbps", "--network", network]
+            )
+            assert runner.run() == 0, runner.stderr
+
+        output = run_tc_filter_show_batch("eth0", ["b028:", "b001:"])
+
+        assert "fh b28::800" in output
+        assert "fh b01::800" in output
+        # filters of the root qdisc are not included
+        assert "parent 1a1a:" not in output
+
+    def test_normal_empty(self):
+        assert run_tc_filter_show_batch("eth0", []) == ""
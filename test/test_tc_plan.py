@@ -0,0 +1,555 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import re
+
+import humanreadable as hr
+import pytest
+import subprocrunner as spr
+from humanreadable import ParameterError
+
+import tcconfig._iproute2
+import tcconfig._journal
+from tcconfig._common import find_bin_path
+from tcconfig._const import (
+    FilterClassifier,
+    HtbLayout,
+    ShapingAlgorithm,
+    Tc,
+    TcCommandOutput,
+    TrafficDirection,
+)
+from tcconfig._error import QdiscIdExhaustedError
+from tcconfig._journal import CommandJournal
+from tcconfig._netem_param import NetemParameter
+from tcconfig._tc_plan import (
+    HostFacts,
+    PlanState,
+    PlanStep,
+    TcCommandPlanner,
+    make_output_host_facts,
+    read_host_facts,
+)
+from tcconfig.traffic_control import TrafficControl
+
+
+DEVICE = "eth0"
+
+
+def make_netem_param(**kwargs):
+    # default values of tcset options
+    params = {
+        "latency_time": "0ms",
+        "latency_distro_time": "0ms",
+        "packet_loss_rate": 0,
+        "packet_duplicate_rate": 0,
+        "corruption_rate": 0,
+        "reordering_rate": 0,
+        "packet_limit_count": 0,
+    }
+    params.update(kwargs)
+
+    return NetemParameter(DEVICE, **params)
+
+
+@pytest.fixture
+def dry_run(simulator, monkeypatch):
+    monkeypatch.setattr(spr.SubprocessRunner, "default_is_dry_run", True)
+    monkeypatch.setattr(tcconfig._journal, "_command_journal", CommandJournal(None))
+
+
+def make_executed_commands(netem_kwargs, tc_kwargs, is_overwrite):
+    """
+    :return: Commands that ``TrafficControl`` executes in dry-run (``--tc-command``).
+    """
+
+    tc = TrafficControl(
+        DEVICE,
+        netem_param=make_netem_param(**netem_kwargs),
+        tc_command_output=TcCommandOutput.STDOUT,
+        **tc_kwargs,
+    )
+    tc.validate()
+    tc.sanitize()
+
+    if is_overwrite:
+        tc.delete_all_rules()
+
+    assert tc.set_shaping_rule() == 0
+
+    return tc.get_command_history()
+
+
+def make_planned_commands(netem_kwargs, tc_kwargs, is_overwrite):
+    planner = TcCommandPlanner(DEVICE, netem_param=make_netem_param(**netem_kwargs), **tc_kwargs)
+    planner.validate()
+    planner.sanitize()
+
+    return planner.make_set_commands(read_host_facts(planner.tc_device), is_overwrite=is_overwrite)
+
+
+class Test_TcCommandPlanner_make_set_commands:
+    @pytest.mark.parametrize(
+        ["netem_kwargs", "tc_kwargs", "is_overwrite"],
+        [
+            [{"bandwidth_rate": "1Mbps"}, {"direction": TrafficDirection.OUTGOING}, False],
+            [{"bandwidth_rate": "1Mbps"}, {"direction": TrafficDirection.INCOMING}, True],
+            [
+                {"latency_time": "10ms", "latency_distro_time": "2ms", "packet_loss_rate": "1%"},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "dst_network": "192.168.0.0/24",
+                    "dst_port": 80,
+                    "src_port": 1000,
+                },
+                False,
+            ],
+            [
+                {"bandwidth_rate": "10Mbps", "mtu": 9000, "burst": 20000},
+                {"direction": TrafficDirection.OUTGOING, "is_ipv6": True, "dst_network": "::1"},
+                False,
+            ],
+            [
+                {"latency_time": "10ms"},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "exclude_dst_network": "192.168.0.0/24",
+                    "exclude_src_network": "10.0.0.0/8",
+                    "exclude_dst_port": "22",
+                    "exclude_src_port": "8080",
+                },
+                False,
+            ],
+            [
+                {"bandwidth_rate": "1Mbps"},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "dst_network": "10.0.0.0/24",
+                    "src_network": "10.0.1.0/24",
+                    "is_enable_iptables": True,
+                },
+                True,
+            ],
+            [
+                {"bandwidth_rate": "1Mbps"},
+                {"direction": TrafficDirection.INCOMING, "is_change_shaping_rule": True},
+                False,
+            ],
+            [
+                {"latency_time": "10ms"},
+                {"direction": TrafficDirection.OUTGOING, "shaping_algorithm": ShapingAlgorithm.TBF},
+                False,
+            ],
+            [
+                {"bandwidth_rate": "1Mbps"},
+                {
+                    "direction": TrafficDirection.INCOMING,
+                    "dst_network": "10.0.0.0/8",
+                    "shaping_algorithm": ShapingAlgorithm.TBF,
+                },
+                False,
+            ],
+            [
+                {"bandwidth_rate": "1Mbps"},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "is_enable_iptables": True,
+                    "shaping_algorithm": ShapingAlgorithm.TBF,
+                },
+                False,
+            ],
+            [
+                {"bandwidth_rate": "1Mbps", "mtu": 1500},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "is_change_shaping_rule": True,
+                    "shaping_algorithm": ShapingAlgorithm.TBF,
+                },
+                False,
+            ],
+            [
+                {"bandwidth_rate": "1Mbps"},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "dst_network": "192.168.1.5",
+                    "dst_port": 80,
+                    "is_hash_filter": True,
+                },
+                True,
+            ],
+            [
+                {"latency_time": "10ms"},
+                {
+                    "direction": TrafficDirection.INCOMING,
+                    "dst_network": "192.168.1.0/24",
+                    "is_hash_filter": True,
+                },
+                False,
+            ],
+            [
+                {"bandwidth_rate": "1Mbps"},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "dst_network": "10.0.0.1",
+                    "is_hash_filter": True,
+                    "shaping_algorithm": ShapingAlgorithm.TBF,
+                },
+                False,
+            ],
+            [
+                {"bandwidth_rate": "1Mbps"},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "dst_network": "192.168.0.0/24",
+                    "dst_port": 80,
+                    "exclude_dst_network": "192.168.0.1",
+                    "exclude_src_port": "22",
+                    "classifier": FilterClassifier.FLOWER,
+                },
+                True,
+            ],
+            [
+                {"latency_time": "10ms"},
+                {
+                    "direction": TrafficDirection.INCOMING,
+                    "is_ipv6": True,
+                    "dst_network": "2001:db8::/64",
+                    "classifier": FilterClassifier.FLOWER,
+                },
+                False,
+            ],
+            [
+                {"bandwidth_rate": "1Mbps"},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "classifier": FilterClassifier.FLOWER,
+                    "shaping_algorithm": ShapingAlgorithm.TBF,
+                },
+                False,
+            ],
+            [
+                {"bandwidth_rate": "1Mbps"},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "dst_network": "192.168.0.0/24",
+                    "dst_port": 80,
+                    "exclude_dst_network": "192.168.0.1",
+                    "htb_layout": HtbLayout.PREFIX,
+                },
+                True,
+            ],
+            [
+                {"latency_time": "10ms"},
+                {
+                    "direction": TrafficDirection.INCOMING,
+                    "dst_network": "192.168.1.5",
+                    "is_hash_filter": True,
+                    "htb_layout": HtbLayout.HASH,
+                },
+                False,
+            ],
+            [
+                {"latency_time": "10ms"},
+                {
+                    "direction": TrafficDirection.OUTGOING,
+                    "is_ipv6": True,
+                    "dst_network": "2001:db8::/64",
+                    "htb_layout": HtbLayout.HASH,
+                },
+                False,
+            ],
+        ],
+    )
+    def test_normal(self, dry_run, netem_kwargs, tc_kwargs, is_overwrite):
+        expected = make_executed_commands(netem_kwargs, tc_kwargs, is_overwrite)
+
+        assert make_planned_commands(netem_kwargs, tc_kwargs, is_overwrite) == expected
+
+    def test_normal_no_execution(self, dry_run):
+        planner = TcCommandPlanner(
+            DEVICE,
+            direction=TrafficDirection.INCOMING,
+            netem_param=make_netem_param(latency_time="10ms"),
+        )
+        planner.sanitize()
+
+        commands = planner.make_set_commands(read_host_facts(planner.tc_device))
+
+        # modprobe is output even if the module loaded on the host
+        assert commands[:2] == [
+            "modprobe ifb",
+            f"{find_bin_path('ip'):s} link add ifb6682 type ifb",
+        ]
+        assert tcconfig._journal.get_command_journal().num_executions == 0
+
+    @pytest.mark.parametrize(
+        ["netem_kwargs", "tc_kwargs", "expected"],
+        [
+            [{}, {}, ParameterError],
+            [{"latency_time": "10ms"}, {"src_port": 65536}, ParameterError],
+            [{"latency_time": "10ms"}, {"src_network": "10.0.0.0/8"}, ParameterError],
+            [
+                {"latency_time": "10ms"},
+                {"is_hash_filter": True, "classifier": FilterClassifier.FLOWER},
+                ParameterError,
+            ],
+            [
+                {"latency_time": "10ms"},
+                {"htb_layout": HtbLayout.HASH, "classifier": FilterClassifier.FLOWER},
+                ParameterError,
+            ],
+            [
+                {"latency_time": "10ms"},
+                {"htb_layout": HtbLayout.PREFIX, "shaping_algorithm": ShapingAlgorithm.TBF},
+                ParameterError,
+            ],
+        ],
+    )
+    def test_exception_validate(self, netem_kwargs, tc_kwargs, expected):
+        planner = TcCommandPlanner(
+            DEVICE, netem_param=make_netem_param(**netem_kwargs), **tc_kwargs
+        )
+
+        with pytest.raises(expected):
+            planner.validate()
+
+
+class Test_make_output_host_facts:
+    @pytest.mark.parametrize(
+        ["iproute2_version", "expected"],
+        [[None, False], ["6.14.0", False], ["6.15", True], ["7.0.0", True]],
+    )
+    def test_normal(self, monkeypatch, iproute2_version, expected):
+        def get_iproute2_features():
+            pytest.fail("iproute2 of the local host is probed")
+
+        monkeypatch.setattr(tcconfig._iproute2, "get_iproute2_features", get_iproute2_features)
+
+        host_facts = make_output_host_facts(DEVICE, iproute2_version)
+
+        assert host_facts.is_burst_rounding_fixed == expected
+
+    @pytest.mark.parametrize(["iproute2_version"], [["6.x"], ["ss170905"]])
+    def test_exception(self, iproute2_version):
+        with pytest.raises(ParameterError):
+            make_output_host_facts(DEVICE, iproute2_version)
+
+
+class Test_tcset_tc_command:
+    @pytest.mark.parametrize(
+        ["options", "expected_burst"],
+        [
+            [[], True],
+            [["--iproute2-version", "6.14.0"], True],
+            [["--iproute2-version", "6.15.0"], False],
+        ],
+    )
+    def test_normal(self, simulator, monkeypatch, tmp_path, options, expected_burst):
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+        runner = spr.SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rate", "1Mbps", "--tc-command"] + options
+        )
+
+        assert runner.run() == 0, runner.stderr
+        assert ("burst" in runner.stdout) == expected_burst
+        # the output does not depend on iproute2 of the local host
+        assert not (tmp_path / "tcconfig").exists()
+
+    def test_exception(self, simulator):
+        runner = spr.SubprocessRunner(
+            [Tc.Command.TCSET, DEVICE, "--rate", "1Mbps", "--tc-command"]
+            + ["--iproute2-version", "latest"]
+        )
+
+        assert runner.run() != 0
+
+
+class Test_TcCommandPlanner_make_set_steps:
+    HOST_FACTS = HostFacts(upper_limit_rate=hr.BitsPerSecond("1Gbps"), is_burst_rounding_fixed=True)
+
+    def test_normal(self, dry_run):
+        planner = TcCommandPlanner(
+            DEVICE,
+            netem_param=make_netem_param(bandwidth_rate="1Mbps"),
+            dst_network="192.168.0.1",
+            is_enable_iptables=True,
+        )
+        planner.sanitize()
+
+        steps = planner.make_set_steps(
+            self.HOST_FACTS, PlanState(class_minor_ids=[1, 2], mark_ids=[101])
+        )
+
+        assert [step for step, _command in steps] == [
+            PlanStep.ROOT_QDISC,
+            PlanStep.DEFAULT_CLASS,
+            PlanStep.RATE,
+            PlanStep.NETEM,
+            PlanStep.MANGLE,
+            PlanStep.FILTER,
+        ]
+        # the default class is limited by the upper limit rate of the host facts
+        assert steps[1][1].endswith("classid 1a1a:1 htb rate 1000000.0kbit")
+        # burst sizes are decided by tc if tc rounds the sizes correctly
+        assert steps[2][1].endswith("classid 1a1a:3 htb rate 1000.0Kbit ceil 1000.0Kbit")
+        assert "--set-mark 102" in steps[4][1]
+        assert steps[5][1].endswith("handle 102 fw flowid 1a1a:3")
+
+    def test_normal_change(self, dry_run):
+        planner = TcCommandPlanner(
+            DEVICE,
+            netem_param=make_netem_param(latency_time="5ms"),
+            is_change_shaping_rule=True,
+        )
+        planner.sanitize()
+
+        steps = planner.make_set_steps(
+            self.HOST_FACTS, PlanState(), classid="1a1a:4", netem_handle="2000:"
+        )
+
+        assert [step for step, _command in steps] == [PlanStep.RATE, PlanStep.NETEM]
+        assert "class change dev eth0 parent 1a1a: classid 1a1a:4 htb" in steps[0][1]
+        assert "qdisc change dev eth0 parent 1a1a:4 handle 2000: netem" in steps[1][1]
+
+
+class Test_TcCommandPlanner_make_rule_steps:
+    def test_normal(self, dry_run):
+        plan_state = PlanState(class_minor_ids=[1, 2, 4], qdisc_major_ids=[0x2496])
+        commands = []
+
+        for dst_network in ("192.168.1.5", "192.168.1.6", "192.168.2.5"):
+            planner = TcCommandPlanner(
+                DEVICE,
+                netem_param=make_netem_param(latency_time="10ms"),
+                dst_network=dst_network,
+                is_hash_filter=True,
+            )
+            planner.sanitize()
+            commands.extend(
+                command
+                for _step, command in planner.make_rule_steps(
+                    read_host_facts(planner.tc_device), plan_state
+                )
+            )
+
+        assert re.findall(r"classid (\S+) htb", "\n".join(commands)) == [
+            "1a1a:3",
+            "1a1a:5",
+            "1a1a:6",
+        ]
+        # netem qdiscs of the same parameters
+        assert re.findall(r"handle (\S+) netem", "\n".join(commands)) == [
+            "2495:",
+            "2497:",
+            "2498:",
+        ]
+        # hash tables are added once
+        assert sum("divisor" in command for command in commands) == 3
+
+    def test_normal_htb_layout(self, dry_run):
+        plan_state = PlanState(class_minor_ids=[1])
+        commands = []
+
+        for dst_network in ("192.168.0.1", "192.168.0.2", "10.1.0.2", "10.0.0.0/8"):
+            planner = TcCommandPlanner(
+                DEVICE,
+                netem_param=make_netem_param(latency_time="10ms"),
+                dst_network=dst_network,
+                htb_layout=HtbLayout.PREFIX,
+            )
+            planner.sanitize()
+            commands.extend(
+                command
+                for _step, command in planner.make_rule_steps(
+                    read_host_facts(planner.tc_device), plan_state
+                )
+            )
+
+        root_filter_commands = [command for command in commands if "parent 1a1a: " in command]
+        # the hash table that hands off packets to buckets is added once, and
+        # a filter is added for each bucket instead of each rule
+        assert [
+            command.split("prio ", 1)[1] for command in root_filter_commands if "filter" in command
+        ] == [
+            "7 handle b80: u32 divisor 64",
+            "7 u32 link b80: hashkey mask 0x003f0000 at 16 match u32 0 0",
+            "7 handle b80:28:1 u32 ht b80:28: match u32 0 0 flowid 1a1a:b028",
+            "7 handle b80:1:1 u32 ht b80:1: match u32 0 0 flowid 1a1a:b001",
+            # the rule of the network that is not placed into a bucket
+            "5 u32 match ip dst 10.0.0.0/8 match ip src 0.0.0.0/0 flowid 1a1a:2",
+        ]
+
+    def test_exception(self):
+        planner = TcCommandPlanner(
+            DEVICE,
+            netem_param=make_netem_param(latency_time="10ms"),
+            shaping_algorithm=ShapingAlgorithm.TBF,
+        )
+
+        with pytest.raises(ParameterError):
+            planner.make_rule_steps(read_host_facts(DEVICE), PlanState())
+
+
+class Test_PlanState:
+    def test_normal(self):
+        plan_state = PlanState(
+            class_minor_ids=[1, 2, 3, 5], qdisc_major_ids=[0x2000], flower_handles=[1, 7]
+        )
+
+        assert [plan_state.allocate_class_minor_id(2) for _ in range(3)] == [4, 6, 7]
+        assert plan_state.allocate_class_minor_ids(2) == [8, 9]
+        assert plan_state.allocate_qdisc_major_id(0x2000) == 0x2001
+        assert plan_state.allocate_qdisc_major_id(0x2000) == 0x2002
+        assert plan_state.allocate_qdisc_major_id(0x3000) == 0x3000
+        assert plan_state.allocate_flower_handle() == 8
+        assert plan_state.allocate_mark_id() == 101
+        assert plan_state.add_hash_table(None)
+        assert plan_state.add_hash_table(1)
+        assert not plan_state.add_hash_table(None)
+        assert not plan_state.is_qdisc_exist
+
+    def test_normal_bucket(self):
+        plan_state = PlanState(
+            class_minor_ids=[1, 2],
+            bucket_class_minor_ids={3: [2, 3]},
+            bucket_tables=[(3, "ip")],
+            handoff_slots=[(0xB80, 3)],
+        )
+
+        assert plan_state.allocate_class_minor_id(2, bucket=3) == 4
+        assert plan_state.allocate_class_minor_id(2, bucket=5) == 2
+        assert plan_state.allocate_class_minor_id(2) == 3
+        assert not plan_state.add_bucket(3)
+        assert plan_state.add_bucket(5)
+        assert not plan_state.add_bucket(5)
+        assert not plan_state.add_bucket_table(3, "ip")
+        assert plan_state.add_bucket_table(3, "ipv6")
+        assert not plan_state.add_handoff_table(0xB80)
+        assert plan_state.add_handoff_table(0xB81)
+        assert not plan_state.add_handoff_slot(0xB80, 3)
+        assert plan_state.add_handoff_slot(0xB80, 5)
+
+    def test_normal_qdisc_major_id(self):
+        plan_state = PlanState(qdisc_major_ids=[0x1A1A, 0xFFFE])
+        num_free_ids = plan_state.num_free_qdisc_major_ids
+
+        # major ids of bucket qdiscs are reserved
+        assert plan_state.allocate_qdisc_major_id(0xB03F) == 0xB040
+        # ids are allocated from the smallest id after the largest id
+        assert plan_state.allocate_qdisc_major_id(0xFFFE) == 0x1
+        assert plan_state.num_free_qdisc_major_ids == num_free_ids - 2
+
+    def test_exception_qdisc_major_id(self):
+        plan_state = PlanState(qdisc_major_ids=range(0x10000))
+
+        with pytest.raises(QdiscIdExhaustedError):
+            plan_state.allocate_qdisc_major_id(0x2000)
+
+
+class Test_TcCommandPlanner_make_delete_commands:
+    def test_normal(self, dry_run):
+        TrafficControl(DEVICE, tc_command_output=TcCommandOutput.STDOUT).delete_all_rules()
+        expected = tcconfig._journal.get_command_journal().get_commands()
+
+        assert TcCommandPlanner(DEVICE).make_delete_commands() == expected
@@ -21,7 +21,7 @@ class Test_tcset_iface_speed:
             pytest.skip("device option is null")
 
         for tc_target in [device_option]:
-            monkeypatch.setattr("tcconfig._network._read_iface_speed", lambda x: speed)
+            monkeypatch.setattr("tcconfig._device_inventory._read_iface_speed", lambda x: speed)
 
             runner = SubprocessRunner(
                 [Tc.Command.TCSET, tc_target, "--rate", "1kbps", "--overwrite"]
@@ -41,7 +41,7 @@ class Test_tcset_iface_speed:
             pytest.skip("device option is null")
 
         for tc_target in [device_option]:
-            monkeypatch.setattr("tcconfig._network._read_iface_speed", lambda x: "1")
+            monkeypatch.setattr("tcconfig._device_inventory._read_iface_speed", lambda x: "1")
 
             runner = SubprocessRunner([Tc.Command.TCSET, tc_target, "--rate", rate, "--overwrite"])
             assert runner.run() == 0, (
@@ -59,7 +59,7 @@ class Test_tcset_iface_speed:
             pytest.skip("device option is null")
 
         for tc_target in [device_option]:
-            monkeypatch.setattr("tcconfig._network._read_iface_speed", lambda x: "1")
+            monkeypatch.setattr("tcconfig._device_inventory._read_iface_speed", lambda x: "1")
 
             runner = SubprocessRunner(
                 " ".join([Tc.Command.TCSET, tc_target, "--rate", rate, "--overwrite"])
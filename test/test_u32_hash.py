@@ -0,0 +1,126 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import pytest
+from subprocrunner import SubprocessRunner
+
+from tcconfig._common import find_bin_path
+from tcconfig._const import Tc
+from tcconfig._u32_hash import (
+    get_hash_key,
+    make_hash_bucket_option,
+    make_hash_table_query_command,
+    make_octet3_table_commands,
+    make_octet4_table_commands,
+)
+
+from .common import print_test_result, run_tcshow
+
+
+DEVICE = "eth0"
+FILTER_COMMAND = "tc filter add dev eth0 protocol ip parent 1a1a: prio 4"
+
+
+class Test_get_hash_key:
+    @pytest.mark.parametrize(
+        ["dst_network", "ip_version", "expected"],
+        [
+            ["192.168.1.5", 4, (1, 5)],
+            ["10.0.255.16/32", 4, (255, 16)],
+            ["192.168.1.0/24", 4, None],
+            ["2001:db8::1", 6, None],
+            [None, 4, None],
+            ["", 4, None],
+            ["invalid", 4, None],
+        ],
+    )
+    def test_normal(self, dst_network, ip_version, expected):
+        assert get_hash_key(dst_network, ip_version) == expected
+
+
+class Test_make_commands:
+    def test_normal(self):
+        assert make_octet3_table_commands(FILTER_COMMAND) == [
+            f"{FILTER_COMMAND:s} handle 1: u32 divisor 256",
+            f"{FILTER_COMMAND:s} u32 link 1: hashkey mask 0x0000ff00 at 16 match u32 0 0",
+        ]
+        assert make_octet4_table_commands(FILTER_COMMAND, 0x1F) == [
+            f"{FILTER_COMMAND:s} handle 11f: u32 divisor 256",
+            (
+                f"{FILTER_COMMAND:s} handle 1:1f:1 u32 ht 1:1f: link 11f: "
+                "hashkey mask 0x000000ff at 16 match u32 0 0"
+            ),
+        ]
+        assert make_hash_bucket_option(0x1F, 0xA0) == "ht 11f:a0:"
+
+    def test_normal_query(self, simulator):
+        tc_bin_path = find_bin_path("tc")
+
+        assert (
+            make_hash_table_query_command(DEVICE, "1a1a:", "ip")
+            == f"{tc_bin_path:s} filter get dev eth0 parent 1a1a: protocol ip prio 4 handle 1: u32"
+        )
+
+
+class Test_tcset_hash_filter:
+    def test_normal(self, simulator):
+        for option in [
+            ["--rate", "1Mbps", "--network", "192.168.1.5"],
+            ["--add", "--rate", "2Mbps", "--network", "192.168.1.6"],
+            ["--add", "--rate", "3Mbps", "--network", "192.168.2.5"],
+            ["--add", "--rate", "4Mbps", "--network", "192.168.3.0/24"],
+        ]:
+            runner = SubprocessRunner([Tc.Command.TCSET, DEVICE, "--hash-filter"] + option)
+            assert runner.run() == 0, runner.stderr
+
+        expected = {
+            DEVICE: {
+                "outgoing": {
+                    "dst_network=192.168.2.5/32, protocol=ip": {
+                        "filter_id": "102:5:800",
+                        "limit": 1000,
+                        "rate": "3Mbps",
+                    },
+                    "dst_network=192.168.1.5/32, protocol=ip": {
+                        "filter_id": "101:5:800",
+                        "limit": 1000,
+                        "rate": "1Mbps",
+                    },
+                    "dst_network=192.168.1.6/32, protocol=ip": {
+                        "filter_id": "101:6:800",
+                        "limit": 1000,
+                        "rate": "2Mbps",
+                    },
+                    # not a host address: added as a non-hashed filter
+                    "dst_network=192.168.3.0/24, protocol=ip": {
+                        "filter_id": "801::800",
+                        "limit": 1000,
+                        "rate": "4Mbps",
+                    },
+                },
+                "incoming": {},
+            }
+        }
+        actual = run_tcshow(DEVICE)
+        print_test_result(expected=expected, actual=actual)
+        assert actual == expected
+
+        # the first level table is linked only once
+        runner = SubprocessRunner(f"{find_bin_path('tc'):s} filter show dev {DEVICE:s}")
+        assert runner.run() == 0, runner.stderr
+        assert runner.stdout.count("link 1:") == 1
+
+        runner = SubprocessRunner([Tc.Command.TCDEL, DEVICE, "--network", "192.168.1.6"])
+        assert runner.run() == 0, runner.stderr
+        del expected[DEVICE]["outgoing"]["dst_network=192.168.1.6/32, protocol=ip"]
+        assert run_tcshow(DEVICE) == expected
+
+        runner = SubprocessRunner([Tc.Command.TCDEL, DEVICE, "--id", "102:5:800"])
+        assert runner.run() == 0, runner.stderr
+        del expected[DEVICE]["outgoing"]["dst_network=192.168.2.5/32, protocol=ip"]
+        assert run_tcshow(DEVICE) == expected
+
+        runner = SubprocessRunner([Tc.Command.TCDEL, DEVICE, "--all"])
+        assert runner.run() == 0, runner.stderr
+        assert run_tcshow(DEVICE) == {DEVICE: {"outgoing": {}, "incoming": {}}}